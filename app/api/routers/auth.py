@@ -78,13 +78,11 @@ def _client_info(request: Request):
     response_model=dict,
     summary="Login (local o Google) con payload flexible",
     description="Detecta si es login local (email+password) o Google (email+google_id).",
+    # Rate limit por IP
+    dependencies=[Depends(rate_limit.limit_by_ip("/auth/login"))],
 )
 def login(payload: dict, request: Request):
     try:
-        # Rate limit por IP
-        ip = request.client.host if request.client else ""
-        if not rate_limit.allow((ip, "/auth/login")):
-            raise HTTPException(status_code=429, detail="Demasiados intentos, espera un momento")
         ip, ua = _client_info(request)
         if "password" in payload:
             lp = LoginLocalPayload(**payload)
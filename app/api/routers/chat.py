@@ -1,7 +1,9 @@
 """
 Endpoints para chat conversacional (conversations/messages).
 """
-from fastapi import APIRouter, HTTPException, status, Query, Header, Request, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request, UploadFile, File, Form
+import asyncio
+import json
 import logging
 from typing import Optional
 from app.api.schemas.chat import (
@@ -15,6 +17,7 @@ from app.api.schemas.chat import (
 )
 from app.repositories.conversations_repo import (
     insert_conversation,
+    insert_conversation_async,
     list_conversations as repo_list_conversations,
     update_conversation_meta as repo_update_conversation,
     get_conversation as repo_get_conversation,
@@ -22,15 +25,22 @@ from app.repositories.conversations_repo import (
 )
 from app.repositories.messages_repo import (
     insert_message,
-    list_messages as repo_list_messages,
+    insert_message_async,
+    InvalidCursor,
+    append_turn_async,
+    append_turn_deferred_async,
+    insert_message_deferred,
+    insert_message_deferred_async,
+    list_recent_messages_async,
+    list_messages_page,
     delete_by_conversation as repo_delete_msgs_by_conv,
 )
 from app.repositories.files_repo_r2 import upload_uploadfile_to_r2
 from app.repositories.auth_repo import get_user_by_id
-from app.services.note_service import insert_note as insert_note_doc
+from app.services.note_service import insert_note as insert_note_doc, insert_note_deferred, insert_note_deferred_async
 from fastapi.responses import StreamingResponse
 from app.core.config import settings
-from app.core import rate_limit
+from app.core import profiling, rate_limit
 from app.api.deps import get_current_user_loose as get_current_user
 from time import monotonic
 from app.services import ask_service
@@ -166,18 +176,33 @@ async def create_message_with_upload(
     "/messages",
     response_model=dict,
     summary="Listar mensajes",
-    description="Lista mensajes por conversación, usuario o sesión.",
+    description=(
+        "Lista mensajes por conversación, usuario o sesión, paginados por cursor y en orden cronológico. "
+        "Sin cursor devuelve la página más reciente; `before` trae la página anterior y `after` los mensajes nuevos. "
+        "La respuesta incluye los cursores `before`/`after` de la página y `has_more`."
+    ),
 )
 def get_messages(
     conversation_id: Optional[str] = Query(default=None),
     user_id: Optional[str] = Query(default=None),
     session_id: Optional[str] = Query(default=None),
+    limit: Optional[int] = Query(default=None, ge=1, le=200),
+    before: Optional[str] = Query(default=None),
+    after: Optional[str] = Query(default=None),
 ):
     if not conversation_id and not user_id and not session_id:
         raise HTTPException(status_code=400, detail="conversation_id, user_id o session_id es requerido")
     try:
-        items = repo_list_messages(conversation_id=conversation_id, user_id=user_id, session_id=session_id)
-        return {"messages": items}
+        return list_messages_page(
+            conversation_id=conversation_id,
+            user_id=user_id,
+            session_id=session_id,
+            limit=limit or settings.chat_messages_page_size,
+            before=before,
+            after=after,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudieron listar los mensajes: {e}")
 
@@ -253,33 +278,19 @@ def patch_conversation(conversation_id: str, payload: ConversationUpdate, reques
         raise HTTPException(status_code=500, detail=f"No se pudo actualizar la conversación: {e}")
 
 
-@router.post(
-    "/ask",
-    status_code=status.HTTP_201_CREATED,
-    response_model=dict,
-    summary="Preguntar (tool-calling + LLM)",
-    description="Orquesta tools (horario/hora) y genera respuesta del asistente.",
-)
-def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[str] = Header(default=None)):
-    """
-    Orquesta la interacción de chat:
-      - Crea conversación si falta (opcional)
-      - Inserta mensaje del usuario
-      - Genera respuesta con IA (usa contexto académico del usuario)
-      - Inserta mensaje del asistente
-      - Devuelve ambos mensajes y el id de la conversación
+def _chat_caller(route: str, guest_rate_setting: str, auth_rate_setting: str):
+    """Dependencia de /chat/ask*: resuelve invitado/usuario, session_id, rate limit y tamaño del prompt.
+
+    Devuelve {"user", "mode", "session_id"}. El límite se aplica tras validar el token,
+    para que un user_id ajeno no consuma la cuota de otro usuario.
     """
-    try:
-        t0 = monotonic()
-        conversation_id = payload.conversation_id
-        # Determina modelo efectivo
-        effective_model = payload.model or (settings.openai_model_primary if settings.openai_api_key else f"ollama:{settings.ollama_model}")
-        # Guest/Auth mode
+
+    async def _dep(payload: ChatAskPayload, request: Request, x_session_id: Optional[str] = Header(default=None)) -> dict:
         user = None
         # Si se envía user_id, requiere Auth y coincidencia
         if payload.user_id:
             auth_header = request.headers.get("authorization")
-            current = get_current_user(authorization=auth_header)
+            current = await asyncio.to_thread(get_current_user, authorization=auth_header)
             if str(current.get("_id")) != str(payload.user_id):
                 raise HTTPException(status_code=403, detail="user_id no coincide con el token")
             user = current
@@ -291,20 +302,57 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
                 # permite operar, pero sugiere al front guardarlo
                 import uuid
                 session_id = str(uuid.uuid4())
-            if not rate_limit.allow((session_id, "/chat/ask"), limit=settings.chat_guest_rate_per_min, window_seconds=60):
-                raise HTTPException(status_code=429, detail="Demasiadas solicitudes (invitado). Intenta más tarde.")
+            await rate_limit.enforce_async(
+                (session_id, route),
+                limit=getattr(settings, guest_rate_setting),
+                detail="Demasiadas solicitudes (invitado). Intenta más tarde.",
+            )
             if len(payload.content or "") > settings.chat_prompt_max_chars_guest:
                 raise HTTPException(status_code=413, detail="Prompt demasiado largo para invitado")
         else:
             uid_key = f"user:{payload.user_id}:{request.client.host if request.client else ''}"
-            if not rate_limit.allow((uid_key, "/chat/ask"), limit=settings.chat_auth_rate_per_min, window_seconds=60):
-                raise HTTPException(status_code=429, detail="Demasiadas solicitudes. Intenta más tarde.")
+            await rate_limit.enforce_async((uid_key, route), limit=getattr(settings, auth_rate_setting))
             if len(payload.content or "") > settings.chat_prompt_max_chars_auth:
                 raise HTTPException(status_code=413, detail="Prompt demasiado largo")
+        return {"user": user, "mode": mode, "session_id": session_id}
+
+    return _dep
+
+
+@router.post(
+    "/ask",
+    status_code=status.HTTP_201_CREATED,
+    response_model=dict,
+    summary="Preguntar (tool-calling + LLM)",
+    description="Orquesta tools (horario/hora) y genera respuesta del asistente.",
+)
+async def chat_ask(
+    payload: ChatAskPayload,
+    request: Request,
+    caller: dict = Depends(_chat_caller("/chat/ask", "chat_guest_rate_per_min", "chat_auth_rate_per_min")),
+):
+    """
+    Orquesta la interacción de chat:
+      - Crea conversación si falta (opcional)
+      - Inserta mensaje del usuario
+      - Genera respuesta con IA (usa contexto académico del usuario)
+      - Inserta mensaje del asistente
+      - Devuelve ambos mensajes y el id de la conversación
+
+    Es async: Mongo y el modelo se esperan sin retener un hilo del pool.
+    """
+    try:
+        t0 = monotonic()
+        conversation_id = payload.conversation_id
+        # Determina modelo efectivo
+        effective_model = payload.model or (settings.openai_model_primary if settings.openai_api_key else f"ollama:{settings.ollama_model}")
+        user = caller["user"]
+        mode = caller["mode"]
+        session_id = caller["session_id"]
         if not conversation_id:
             if not payload.create_if_missing:
                 raise HTTPException(status_code=400, detail="conversation_id requerido cuando create_if_missing=false")
-            conversation_id = insert_conversation({
+            conversation_id = await insert_conversation_async({
                 "user_id": payload.user_id,
                 "model": effective_model,
                 "title": payload.content[:80] if payload.content else "",
@@ -312,30 +360,41 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
                 "mode": mode,
             })
 
-        # Historial (N últimos mensajes) antes de insertar el mensaje actual
+        # Historial (N últimos mensajes, sólo role/content) antes de insertar el mensaje actual;
+        # una conversación recién creada no tiene mensajes
         history_msgs = []
-        try:
-            prev = repo_list_messages(conversation_id=conversation_id)
-            if prev:
-                n = max(0, int(settings.chat_history_n))
-                history_msgs = prev[-n:]
-        except Exception:
-            history_msgs = []
+        if payload.conversation_id:
+            try:
+                history_msgs = await list_recent_messages_async(conversation_id, max(0, int(settings.chat_history_n)))
+            except Exception:
+                history_msgs = []
 
-        # Mensaje del usuario
-        user_msg_id = insert_message({
+        # Mensaje del usuario (se guarda junto con la respuesta, ver `append_turn_*`)
+        user_doc = {
             "conversation_id": conversation_id,
             "user_id": payload.user_id,
             "role": "user",
             "content": payload.content,
             "attachments": [],
             "session_id": session_id,
-        })
+        }
 
         # Contexto por email (si existe)
         email = str(user.get("email")) if (user and user.get("email")) else ""
 
-        ans = ask_service.ask(email or "", payload.content, history=history_msgs)
+        try:
+            ans = await ask_service.ask_async(email or "", payload.content, history=history_msgs)
+        except Exception:
+            # Sin respuesta: conserva al menos la pregunta del usuario
+            try:
+                if settings.write_behind_enabled:
+                    await insert_message_deferred_async(user_doc)
+                else:
+                    await insert_message_async(user_doc)
+            except Exception:
+                pass
+            raise
+        tokens_in, tokens_out = _answer_tokens()
         base_text = ans.get("respuesta") or "Sin respuesta"
         followup = (ans.get("followup") or "").strip()
         # Construye texto visible para UI (sin citas; opcionalmente agrega follow-up)
@@ -347,8 +406,9 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
         if ans.get("offer_code"):
             citations_out.append({"offer": ans.get("offer_code")})
 
-        # Mensaje del asistente
-        asst_msg_id = insert_message({
+        # Turno completo: usuario + asistente en un insert_many y un update de la conversación.
+        # Con write-behind los ids se generan aquí y la escritura sale del camino de respuesta.
+        asst_doc = {
             "conversation_id": conversation_id,
             "user_id": payload.user_id,
             "role": "assistant",
@@ -356,7 +416,13 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
             "attachments": attachments_out,
             "citations": citations_out,
             "session_id": session_id,
-        })
+            "tokens_input": tokens_in,
+            "tokens_output": tokens_out,
+        }
+        if settings.write_behind_enabled:
+            user_msg_id, asst_msg_id = await append_turn_deferred_async(user_doc, asst_doc)
+        else:
+            user_msg_id, asst_msg_id = await append_turn_async(user_doc, asst_doc)
 
         out = ChatAskOut(
             conversation_id=conversation_id,
@@ -381,8 +447,8 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
                 attachments=attachments_out,
                 citations=citations_out,
                 model_snapshot=effective_model,
-                tokens_input=None,
-                tokens_output=None,
+                tokens_input=tokens_in,
+                tokens_output=tokens_out,
                 error=None,
                 created_at="",
             ),
@@ -393,7 +459,7 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
         # Guardado opcional como nota
         if payload.save_note:
             try:
-                insert_note_doc({
+                note = {
                     "user_id": payload.user_id,
                     "title": payload.note_title or (payload.content[:80] if payload.content else "Nota de chat"),
                     "body": answer_text,
@@ -401,13 +467,18 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
                     "status": "active",
                     "source": "assistant",
                     "related_conversation_id": conversation_id,
-                })
+                }
+                if settings.write_behind_enabled:
+                    await insert_note_deferred_async(note)
+                else:
+                    await asyncio.to_thread(insert_note_doc, note)
             except Exception:
                 pass
 
         dt_ms = int((monotonic() - t0) * 1000)
         # Log sencillo
-        _log.info("/chat/ask mode=%s model=%s latency_ms=%s", mode, effective_model, dt_ms)
+        trace = profiling.current()
+        _log.info("/chat/ask mode=%s model=%s latency_ms=%s stages: %s", mode, effective_model, dt_ms, trace.summary() if trace else "")
         enriched = {
             "came_from": ans.get("came_from"),
             "citation": ans.get("citation"),
@@ -426,40 +497,26 @@ def chat_ask(payload: ChatAskPayload, request: Request, x_session_id: Optional[s
 @router.post(
     "/ask/stream",
     summary="Preguntar con streaming (SSE)",
-    description="Emite la respuesta del asistente en chunks (Server‑Sent Events).",
+    description="Emite la respuesta del asistente conforme el modelo la genera (Server‑Sent Events).",
 )
-def chat_ask_stream(payload: ChatAskPayload, request: Request, x_session_id: Optional[str] = Header(default=None)):
+def chat_ask_stream(
+    payload: ChatAskPayload,
+    request: Request,
+    caller: dict = Depends(_chat_caller("/chat/ask/stream", "chat_guest_stream_rate_per_min", "chat_auth_stream_rate_per_min")),
+):
     """
-    Variante con SSE (Server-Sent Events). Emite el texto del asistente en `data:` por chunks.
-    Al finalizar, inserta el mensaje del asistente completo y opcionalmente una nota.
+    Variante con SSE (Server-Sent Events). Emite el texto del asistente en `data:` por chunks:
+    en las ramas RAG/LLM los fragmentos llegan del proveedor (por oración, ya limpios);
+    las respuestas locales completas se parten en `chat_stream_chunk_chars`.
+    Al finalizar, inserta el mensaje del asistente completo y opcionalmente una nota,
+    y registra el tiempo al primer fragmento (ttft_ms) y la latencia total.
     """
     try:
         t0 = monotonic()
         conversation_id = payload.conversation_id
         effective_model = payload.model or (settings.openai_model_primary if settings.openai_api_key else f"ollama:{settings.ollama_model}")
-        user = None
-        if payload.user_id:
-            auth_header = request.headers.get("authorization")
-            current = get_current_user(authorization=auth_header)
-            if str(current.get("_id")) != str(payload.user_id):
-                raise HTTPException(status_code=403, detail="user_id no coincide con el token")
-            user = current
-        mode = "auth" if user else "guest"
-        session_id = payload.session_id or x_session_id
-        if mode == "guest":
-            if not session_id:
-                import uuid
-                session_id = str(uuid.uuid4())
-            if not rate_limit.allow((session_id, "/chat/ask/stream"), limit=settings.chat_guest_stream_rate_per_min, window_seconds=60):
-                raise HTTPException(status_code=429, detail="Demasiadas solicitudes (invitado). Intenta más tarde.")
-            if len(payload.content or "") > settings.chat_prompt_max_chars_guest:
-                raise HTTPException(status_code=413, detail="Prompt demasiado largo para invitado")
-        else:
-            uid_key = f"user:{payload.user_id}:{request.client.host if request.client else ''}"
-            if not rate_limit.allow((uid_key, "/chat/ask/stream"), limit=settings.chat_auth_stream_rate_per_min, window_seconds=60):
-                raise HTTPException(status_code=429, detail="Demasiadas solicitudes. Intenta más tarde.")
-            if len(payload.content or "") > settings.chat_prompt_max_chars_auth:
-                raise HTTPException(status_code=413, detail="Prompt demasiado largo")
+        mode = caller["mode"]
+        session_id = caller["session_id"]
         if not conversation_id:
             if not payload.create_if_missing:
                 raise HTTPException(status_code=400, detail="conversation_id requerido cuando create_if_missing=false")
@@ -471,8 +528,8 @@ def chat_ask_stream(payload: ChatAskPayload, request: Request, x_session_id: Opt
                 "mode": mode,
             })
 
-        # Inserta mensaje del usuario
-        insert_message({
+        # Inserta mensaje del usuario (encolado: la escritura no retrasa el stream)
+        insert_message_deferred({
             "conversation_id": conversation_id,
             "user_id": payload.user_id,
             "role": "user",
@@ -481,7 +538,6 @@ def chat_ask_stream(payload: ChatAskPayload, request: Request, x_session_id: Opt
             "session_id": session_id,
         })
 
-        # Prepara respuesta completa (sin streaming real del proveedor, se chunkea localmente)
         email = None
         try:
             u = get_user_by_id(payload.user_id)
@@ -490,59 +546,129 @@ def chat_ask_stream(payload: ChatAskPayload, request: Request, x_session_id: Opt
         except Exception:
             pass
 
-        ans = ask_service.ask(email or "", payload.content)
-        base_text = (ans.get("respuesta") or "Sin respuesta").strip()
-        followup = (ans.get("followup") or "").strip()
-        full_text = base_text
-        if followup:
-            full_text += f"\n{followup}"
-        attachments_out = ans.get("attachments") or []
-
         def _gen():
-            # Envia “open”
+            # Envia “open” de inmediato; la respuesta se calcula dentro del stream
             yield "event: open\n" + "data: {}\n\n"
-            if getattr(settings, "chat_stream_single_event", False):
-                # Un solo evento con todo el texto
-                yield f"data: {full_text}\n\n"
-            else:
-                # Chunks configurables (por defecto 400)
-                size = max(80, int(settings.chat_stream_chunk_chars))
-                for i in range(0, len(full_text), size):
-                    chunk = full_text[i : i + size]
-                    yield f"data: {chunk}\n\n"
-            yield "event: end\n" + "data: {}\n\n"
-
-        # Tras crear el generador, persiste el mensaje completo del asistente (no bloquea streaming)
-        try:
-            insert_message({
-                "conversation_id": conversation_id,
-                "user_id": payload.user_id,
-                "role": "assistant",
-                "content": full_text,
-                "attachments": attachments_out,
-                "session_id": session_id,
-            })
-            if payload.save_note:
-                try:
-                    insert_note_doc({
-                        "user_id": payload.user_id,
-                        "title": payload.note_title or (payload.content[:80] if payload.content else "Nota de chat"),
-                        "body": full_text,
-                        "tags": [str(t).strip().lower() for t in (payload.note_tags or [])],
-                        "status": "active",
-                        "source": "assistant",
-                        "related_conversation_id": conversation_id,
-                    })
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-        resp = StreamingResponse(_gen(), media_type="text/event-stream")
-        dt_ms = int((monotonic() - t0) * 1000)
-        _log.info("/chat/ask/stream mode=%s model=%s latency_ms=%s", mode, effective_model, dt_ms)
-        return resp
+            single = bool(getattr(settings, "chat_stream_single_event", False))
+            parts: list[str] = []
+            ttft_ms: Optional[int] = None
+            attachments_out: list = []
+            citations_out: list = []
+            error: Optional[str] = None
+            full_text = ""
+            try:
+                ans = ask_service.ask(email or "", payload.content, stream=True)
+                if ans.get("stream") is not None:
+                    # Streaming real: reenvía fragmentos conforme los produce el proveedor
+                    for piece in ans["stream"]:
+                        if ttft_ms is None:
+                            ttft_ms = int((monotonic() - t0) * 1000)
+                        parts.append(piece)
+                        if not single:
+                            yield _sse_data(piece)
+                    base_text = (ans.get("respuesta") or "".join(parts)).strip() or "Sin respuesta"
+                else:
+                    # Ramas locales (respuesta completa): chunks configurables (por defecto 400)
+                    base_text = (ans.get("respuesta") or "Sin respuesta").strip()
+                    ttft_ms = int((monotonic() - t0) * 1000)
+                    parts.append(base_text)
+                    if not single:
+                        size = max(80, int(settings.chat_stream_chunk_chars))
+                        for i in range(0, len(base_text), size):
+                            yield _sse_data(base_text[i : i + size])
+                followup = (ans.get("followup") or "").strip()
+                full_text = base_text
+                if followup:
+                    full_text += f"\n{followup}"
+                    if not single:
+                        yield _sse_data(f"\n{followup}")
+                if single:
+                    # Un solo evento con todo el texto
+                    yield _sse_data(full_text)
+                attachments_out = ans.get("attachments") or []
+                if ans.get("offer_code"):
+                    citations_out.append({"offer": ans.get("offer_code")})
+            except Exception as e:
+                _log.exception("/chat/ask/stream falló durante el stream")
+                error = str(e)
+                yield "event: error\n" + _sse_data(json.dumps({"detail": "No se pudo completar la respuesta"}))
+            finally:
+                # Persiste el mensaje completo del asistente una vez terminado el stream
+                total_ms = int((monotonic() - t0) * 1000)
+                trace = profiling.current()
+                tokens_in, tokens_out = _answer_tokens()
+                _log.info(
+                    "/chat/ask/stream mode=%s model=%s ttft_ms=%s latency_ms=%s tokens=%s/%s stages: %s",
+                    mode, effective_model, ttft_ms, total_ms, tokens_in, tokens_out, trace.summary() if trace else "",
+                )
+                _persist_stream_answer(
+                    payload, conversation_id, session_id,
+                    full_text or "".join(parts).strip(), attachments_out, citations_out, error,
+                    tokens=(tokens_in, tokens_out),
+                )
+            yield "event: end\n" + _sse_data(json.dumps({
+                "ttft_ms": ttft_ms, "latency_ms": total_ms, "tokens_input": tokens_in, "tokens_output": tokens_out,
+            }))
+
+        return StreamingResponse(_gen(), media_type="text/event-stream")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo procesar la pregunta (stream): {e}")
+
+
+def _sse_data(text: str) -> str:
+    """Arma un evento SSE `data:`; cada línea del texto va en su propio campo."""
+    return "".join(f"data: {line}\n" for line in str(text).split("\n")) + "\n"
+
+
+def _answer_tokens() -> tuple:
+    """Tokens de LLM (prompt, completion) consumidos en esta petición, o (None, None) si no hubo."""
+    trace = profiling.current()
+    if trace is None or not (trace.tokens_input or trace.tokens_output):
+        return None, None
+    return trace.tokens_input, trace.tokens_output
+
+
+def _persist_stream_answer(
+    payload: ChatAskPayload,
+    conversation_id: str,
+    session_id: Optional[str],
+    full_text: str,
+    attachments_out: list,
+    citations_out: list,
+    error: Optional[str],
+    *,
+    tokens: tuple = (None, None),
+) -> None:
+    """Guarda el mensaje del asistente (y nota opcional) al terminar el stream."""
+    if not full_text and not error:
+        return
+    try:
+        insert_message_deferred({
+            "conversation_id": conversation_id,
+            "user_id": payload.user_id,
+            "role": "assistant",
+            "content": full_text,
+            "attachments": attachments_out,
+            "citations": citations_out,
+            "session_id": session_id,
+            "error": {"message": error} if error else None,
+            "tokens_input": tokens[0],
+            "tokens_output": tokens[1],
+        })
+        if payload.save_note and full_text and not error:
+            try:
+                insert_note_deferred({
+                    "user_id": payload.user_id,
+                    "title": payload.note_title or (payload.content[:80] if payload.content else "Nota de chat"),
+                    "body": full_text,
+                    "tags": [str(t).strip().lower() for t in (payload.note_tags or [])],
+                    "status": "active",
+                    "source": "assistant",
+                    "related_conversation_id": conversation_id,
+                })
+            except Exception:
+                pass
+    except Exception:
+        pass
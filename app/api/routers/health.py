@@ -1,12 +1,15 @@
 """Health y debug (sin auth), salidas simples."""
-from fastapi import APIRouter, status
+from fastapi import APIRouter, HTTPException, Response, status
 from datetime import datetime
 from zoneinfo import ZoneInfo
-import requests
 
+from app.core import metrics, profiling
 from app.core.config import settings
 from app.infrastructure.db.mongo import get_db
+from app.infrastructure.db.write_queue import write_queue
 from app.infrastructure.ai.ollama_client import ollama_ask
+from app.infrastructure.http.client import get_session, pool_stats
+from app.services.ask_service import intent_stats
 
 
 router = APIRouter(tags=["Health"])  # no prefix to keep paths stable
@@ -49,7 +52,7 @@ def debug_status():
 
     if settings.ollama_configured:
         try:
-            r = requests.get(f"{settings.ollama_url}/api/tags", timeout=3)
+            r = get_session("ollama").get(f"{settings.ollama_url}/api/tags", timeout=3)
             r.raise_for_status()
             data = r.json() if r.content else {}
             out["ollama_reachable"] = True
@@ -64,6 +67,58 @@ def debug_status():
     return out
 
 
+@router.get(
+    "/_debug/http",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas de los pools HTTP",
+    description="Conexiones activas/ociosas, peticiones y tasa de reutilización por pool y host.",
+)
+def debug_http():
+    return pool_stats()
+
+
+@router.get(
+    "/_debug/intents",
+    status_code=status.HTTP_200_OK,
+    summary="Métricas del ruteo de intención",
+    description="Aciertos por intención y latencia por etapa (normalización, handlers y LLM) de /chat/ask.",
+)
+def debug_intents():
+    return intent_stats()
+
+
+@router.get(
+    "/metrics",
+    summary="Métricas (formato Prometheus)",
+    description="Peticiones y latencia por ruta, llamadas/tokens de LLM y embeddings, Mongo, cachés y rate limit.",
+    response_class=Response,
+)
+def metrics_endpoint():
+    if not getattr(settings, "metrics_enabled", True):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@router.get(
+    "/_debug/timings",
+    status_code=status.HTTP_200_OK,
+    summary="Histogramas de latencia por etapa",
+    description="Conteo, suma, p50/p95/p99 estimados y buckets acumulados (ms) de cada etapa medida (ask, rag, llm, tools, mongo).",
+)
+def debug_timings():
+    return profiling.histograms()
+
+
+@router.get(
+    "/_debug/write_queue",
+    status_code=status.HTTP_200_OK,
+    summary="Estado de la cola de escritura diferida",
+    description="Profundidad, capacidad, vaciados, escrituras en línea y operaciones descartadas.",
+)
+def debug_write_queue():
+    return write_queue.stats()
+
+
 @router.get(
     "/_debug/ollama",
     status_code=status.HTTP_200_OK,
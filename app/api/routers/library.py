@@ -11,6 +11,7 @@ from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form, Bod
 from fastapi.responses import RedirectResponse
 
 from app.repositories.library_repo import get_document, insert_document, update_document_tags
+from app.repositories.library_chunk_repo import set_chunks_meta
 from app.repositories.library_asset_repo import (
     search_assets,
     get_asset,
@@ -361,6 +362,8 @@ def update_doc_tags(doc_id: str, payload: dict = Body(..., description="{ tags:
         ok = update_document_tags(doc_id, tags_list)
         if not ok:
             raise HTTPException(status_code=404, detail="Documento no encontrado o sin cambios")
+        # Mantiene sincronizadas las tags desnormalizadas en los chunks RAG
+        set_chunks_meta(doc_id, {"tags": [t.lower() for t in tags_list]})
         return {"message": "ok", "id": doc_id, "tags": tags_list}
     except HTTPException:
         raise
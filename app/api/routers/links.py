@@ -3,10 +3,13 @@ from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Optional, Dict
 import requests
 from urllib.parse import urlparse
 
+from app.infrastructure.http.client import get_session
+
 
 router = APIRouter(prefix="/links", tags=["Links"])
 
@@ -67,7 +70,7 @@ def preview(u: str = Query(..., description="URL a previsualizar")):
         if c and (now - int(c.get("_ts", 0)) < _TTL_SECONDS):
             return {k: v for k, v in c.items() if k != "_ts"}
         # Descarga HTML con timeout conservador y UA genérico
-        r = requests.get(url, timeout=6, headers={
+        r = get_session("links").get(url, timeout=6, headers={
             "User-Agent": "Mozilla/5.0 (AURA Link Preview)"
         })
         r.raise_for_status()
@@ -105,11 +108,18 @@ def fetch_image(u: str = Query(..., description="URL absoluta de la imagen")):
     if not url:
         raise HTTPException(status_code=400, detail="URL no válida")
     try:
-        r = requests.get(url, timeout=8, stream=True, headers={
+        r = get_session("links").get(url, timeout=8, stream=True, headers={
             "User-Agent": "Mozilla/5.0 (AURA Link Preview)"
         })
+        if not r.ok:
+            r.close()
         r.raise_for_status()
         ctype = r.headers.get("Content-Type", "image/jpeg")
-        return StreamingResponse(r.raw, media_type=ctype)
+        # Al terminar (o cortar) el envío se cierra la respuesta y la conexión vuelve al pool
+        return StreamingResponse(
+            r.iter_content(chunk_size=64 * 1024),
+            media_type=ctype,
+            background=BackgroundTask(r.close),
+        )
     except requests.RequestException as e:
         raise HTTPException(status_code=502, detail=f"No se pudo obtener la imagen: {e}")
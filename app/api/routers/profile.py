@@ -31,7 +31,7 @@ def get_my_profile(user=Depends(get_current_user)):
 def patch_my_profile(payload: UserProfileUpdate, user=Depends(get_current_user)):
     try:
         data = payload.model_dump(exclude_none=True)
-        new_profile = profile_service.update_my_profile(str(user["_id"]), data)
+        new_profile = profile_service.update_my_profile(str(user["_id"]), data, email=user.get("email"))
         return {"message": "ok", "profile": new_profile}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo actualizar el perfil: {e}")
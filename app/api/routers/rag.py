@@ -8,18 +8,21 @@ from fastapi import APIRouter, HTTPException, Query
 from app.core.config import settings
 
 from app.services.rag_ingest_service import ingest_document
-from app.repositories.library_repo import list_active_documents
+from app.services.rag_job_service import start_ingest_job
+from app.repositories.rag_job_repo import get_job, list_jobs
 from app.services.rag_search_service import answer_with_rag
 from app.repositories.library_chunk_repo import delete_by_doc_id, delete_by_title
+from app.infrastructure.ai import embedding_cache
+from app.services import rag_answer_cache, rag_semantic_cache
 
 
 router = APIRouter(prefix="/rag", tags=["RAG"])
 
 
 @router.post("/ingest/{doc_id}", summary="Ingestar un documento (PDF/TXT/DOCX/XLSX/CSV/MD)")
-def ingest_one(doc_id: str):
+def ingest_one(doc_id: str, force: bool = Query(False, description="Re-embeber aunque el contenido no haya cambiado")):
     try:
-        res = ingest_document(doc_id)
+        res = ingest_document(doc_id, force=force)
         return {"message": "ok", **res}
     except HTTPException:
         raise
@@ -30,20 +33,29 @@ def ingest_one(doc_id: str):
         raise HTTPException(status_code=500, detail=f"No se pudo ingestar: {e}")
 
 
-@router.post("/ingest-all", summary="Ingestar todos los documentos activos (lote)")
-def ingest_all(limit: int = Query(100, ge=1, le=1000)):
+@router.post("/ingest-all", status_code=202, summary="Ingestar todos los documentos activos (job en segundo plano)")
+def ingest_all(limit: int = Query(100, ge=1, le=1000), force: bool = Query(False)):
     try:
-        docs = list_active_documents(limit=limit)
-        results = []
-        for d in docs:
-            try:
-                r = ingest_document(d["id"])  # type: ignore
-                results.append({"id": d["id"], **r})
-            except Exception as e:  # pragma: no cover
-                results.append({"id": d.get("id"), "error": str(e)})
-        return {"message": "ok", "count": len(results), "results": results}
+        job = start_ingest_job(limit=limit, force=force)
+        return {"message": "accepted", **job}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"No se pudo ingestar en lote: {e}")
+        raise HTTPException(status_code=500, detail=f"No se pudo iniciar la ingesta en lote: {e}")
+
+
+@router.get("/jobs", summary="Últimos jobs de ingesta")
+def rag_jobs(limit: int = Query(20, ge=1, le=100)):
+    try:
+        return {"message": "ok", "jobs": list_jobs(limit=limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo listar jobs: {e}")
+
+
+@router.get("/jobs/{job_id}", summary="Estado y progreso por documento de un job de ingesta")
+def rag_job_status(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return {"message": "ok", "job": job}
 
 
 @router.get("/search", summary="Búsqueda RAG con respuesta redactada (sin fuentes)")
@@ -71,3 +83,43 @@ def rag_delete_chunks_by_title(title: str, regex: bool = Query(False, descriptio
         return {"message": "ok", "deleted": n}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo eliminar: {e}")
+
+
+@router.get("/embeddings/cache", summary="Estadísticas de la caché de embeddings")
+def rag_embed_cache_stats():
+    return {"message": "ok", **embedding_cache.stats()}
+
+
+@router.delete("/embeddings/cache", summary="Vaciar la caché de embeddings")
+def rag_embed_cache_clear(persistent: bool = Query(False, description="Si es true, también vacía la colección en Mongo")):
+    try:
+        res = embedding_cache.clear(persistent=persistent)
+        return {"message": "ok", "cleared": res}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo vaciar la caché: {e}")
+
+
+@router.get("/cache", summary="Estadísticas de la caché de respuestas RAG")
+def rag_answer_cache_stats():
+    return {"message": "ok", **rag_answer_cache.stats()}
+
+
+@router.delete("/cache", summary="Vaciar la caché de respuestas RAG")
+def rag_answer_cache_clear():
+    try:
+        return {"message": "ok", "cleared": rag_answer_cache.clear()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo vaciar la caché: {e}")
+
+
+@router.get("/semantic-cache", summary="Estadísticas de la caché semántica de respuestas RAG")
+def rag_semantic_cache_stats():
+    return {"message": "ok", **rag_semantic_cache.stats()}
+
+
+@router.delete("/semantic-cache", summary="Vaciar la caché semántica de respuestas RAG")
+def rag_semantic_cache_clear():
+    try:
+        return {"message": "ok", "cleared": rag_semantic_cache.clear()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudo vaciar la caché: {e}")
@@ -0,0 +1,90 @@
+"""Caché en memoria LRU con TTL opcional y contadores de aciertos.
+
+Thread-safe (un lock por instancia). Pensada para cachés de proceso pequeñas:
+embeddings de consultas, metadatos de documentos, respuestas, etc.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_MISSING = object()
+# Cachés con nombre (para métricas): nombre → instancia
+_registry: "Dict[str, LRUCache]" = {}
+
+
+class LRUCache:
+    """Mapa acotado: expulsa el menos usado al superar `maxsize`.
+
+    - `ttl_seconds`: vida por defecto de cada entrada (None = sin expiración).
+    - `hits`/`misses` se cuentan en `get`.
+    - `name`: si se indica, la caché aparece en `registered()` (métricas).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: Optional[float] = None, *, name: Optional[str] = None) -> None:
+        if name:
+            _registry[name] = self
+        self.maxsize = max(1, int(maxsize))
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float | None, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item  # type: ignore[misc]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = (time.monotonic() + float(ttl)) if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+        return n
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def registered() -> Dict[str, LRUCache]:
+    """Cachés creadas con `name`, para exportar sus contadores."""
+    return dict(_registry)
@@ -121,6 +121,230 @@ class Settings(BaseSettings):
         validation_alias=AliasChoices("AURA_RAG_K", "RAG_K"),
     )
 
+    # RAG vector backend: "atlas" ($search knnBeta) o "local" (índice NumPy en memoria)
+    rag_vector_backend: str = Field(
+        "atlas",
+        validation_alias=AliasChoices("AURA_RAG_VECTOR_BACKEND", "RAG_VECTOR_BACKEND"),
+    )
+    # Si el índice local no está disponible, consulta Atlas en su lugar
+    rag_vector_atlas_fallback: bool = Field(
+        True,
+        validation_alias=AliasChoices("AURA_RAG_VECTOR_ATLAS_FALLBACK", "RAG_VECTOR_ATLAS_FALLBACK"),
+    )
+    # Cada cuántos segundos verificar cambios del corpus hechos por otros workers (0 = nunca)
+    rag_local_index_refresh_seconds: int = Field(
+        300,
+        validation_alias=AliasChoices("AURA_RAG_LOCAL_INDEX_REFRESH", "RAG_LOCAL_INDEX_REFRESH"),
+    )
+    # Codificación de library_chunk.embedding: auto | array | float32 | float16 | int8
+    # ("auto" = float16 con el índice local, array con Atlas knnBeta)
+    rag_embedding_format: str = Field(
+        "auto",
+        validation_alias=AliasChoices("AURA_RAG_EMBEDDING_FORMAT", "RAG_EMBEDDING_FORMAT"),
+    )
+    # Recuperación híbrida: $text (índice txt_chunk_text) + vectorial fusionados por RRF
+    rag_hybrid_enabled: bool = Field(
+        True,
+        validation_alias=AliasChoices("AURA_RAG_HYBRID_ENABLED", "RAG_HYBRID_ENABLED"),
+    )
+    # Candidatos por lista (léxica y vectorial) antes de fusionar
+    rag_hybrid_candidates: int = Field(
+        30,
+        validation_alias=AliasChoices("AURA_RAG_HYBRID_CANDIDATES", "RAG_HYBRID_CANDIDATES"),
+    )
+    # Constante k de reciprocal rank fusion: score = Σ 1 / (k + rango)
+    rag_rrf_k: int = Field(
+        60,
+        validation_alias=AliasChoices("AURA_RAG_RRF_K", "RAG_RRF_K"),
+    )
+
+    # Multi-consulta: la pregunta y sus reformulaciones se embeben en una sola llamada,
+    # se buscan a la vez y se fusionan por score (en vez de una consulta concatenada)
+    rag_multi_query: bool = Field(
+        True,
+        validation_alias=AliasChoices("AURA_RAG_MULTI_QUERY", "RAG_MULTI_QUERY"),
+    )
+    # Máximo de variantes por pregunta (la primera es la pregunta sin sinónimos)
+    rag_multi_query_max: int = Field(
+        4,
+        validation_alias=AliasChoices("AURA_RAG_MULTI_QUERY_MAX", "RAG_MULTI_QUERY_MAX"),
+    )
+    # Sólo recupera chunks vigentes hoy (meta.scope del documento); los que no tienen scope siempre entran
+    rag_filter_valid_today: bool = Field(
+        True,
+        validation_alias=AliasChoices("AURA_RAG_FILTER_VALID_TODAY", "RAG_FILTER_VALID_TODAY"),
+    )
+
+    # Caché de embeddings: LRU en memoria (entradas) + colección Mongo opcional con TTL
+    embed_cache_size: int = Field(
+        2048,
+        validation_alias=AliasChoices("AURA_EMBED_CACHE_SIZE", "EMBED_CACHE_SIZE"),
+    )
+    embed_cache_mongo: bool = Field(
+        False,
+        validation_alias=AliasChoices("AURA_EMBED_CACHE_MONGO", "EMBED_CACHE_MONGO"),
+    )
+    embed_cache_ttl_seconds: int = Field(
+        30 * 24 * 3600,
+        validation_alias=AliasChoices("AURA_EMBED_CACHE_TTL", "EMBED_CACHE_TTL"),
+    )
+
+    # Embeddings en ingesta: lotes acotados por tokens estimados/ítems, en paralelo y con reintentos
+    embed_batch_max_tokens: int = Field(
+        60000,
+        validation_alias=AliasChoices("AURA_EMBED_BATCH_MAX_TOKENS", "EMBED_BATCH_MAX_TOKENS"),
+    )
+    embed_batch_max_items: int = Field(
+        128,
+        validation_alias=AliasChoices("AURA_EMBED_BATCH_MAX_ITEMS", "EMBED_BATCH_MAX_ITEMS"),
+    )
+    embed_workers: int = Field(
+        4,
+        validation_alias=AliasChoices("AURA_EMBED_WORKERS", "EMBED_WORKERS"),
+    )
+    embed_max_retries: int = Field(
+        5,
+        validation_alias=AliasChoices("AURA_EMBED_MAX_RETRIES", "EMBED_MAX_RETRIES"),
+    )
+
+    # Jobs de ingesta en segundo plano: hilos por etapa (descarga/extracción/embeddings) y profundidad de cola
+    rag_job_workers: int = Field(
+        2,
+        validation_alias=AliasChoices("AURA_RAG_JOB_WORKERS", "RAG_JOB_WORKERS"),
+    )
+    rag_job_queue_size: int = Field(
+        4,
+        validation_alias=AliasChoices("AURA_RAG_JOB_QUEUE_SIZE", "RAG_JOB_QUEUE_SIZE"),
+    )
+    # Un job activo sin latido (updated_at) en este tiempo se da por interrumpido al arrancar
+    rag_job_stale_seconds: int = Field(
+        300,
+        validation_alias=AliasChoices("AURA_RAG_JOB_STALE_SECONDS", "RAG_JOB_STALE_SECONDS"),
+    )
+
+    # Pools HTTP compartidos (Ollama, previews de enlaces, descargas de ingesta)
+    http_pool_maxsize: int = Field(
+        10,
+        validation_alias=AliasChoices("AURA_HTTP_POOL_MAXSIZE", "HTTP_POOL_MAXSIZE"),
+    )
+    http_pool_hosts: int = Field(
+        10,
+        validation_alias=AliasChoices("AURA_HTTP_POOL_HOSTS", "HTTP_POOL_HOSTS"),
+    )
+    http_pool_block: bool = Field(
+        False,
+        validation_alias=AliasChoices("AURA_HTTP_POOL_BLOCK", "HTTP_POOL_BLOCK"),
+    )
+    http_retries: int = Field(
+        2,
+        validation_alias=AliasChoices("AURA_HTTP_RETRIES", "HTTP_RETRIES"),
+    )
+    http_backoff_seconds: float = Field(
+        0.3,
+        validation_alias=AliasChoices("AURA_HTTP_BACKOFF_SECONDS", "HTTP_BACKOFF_SECONDS"),
+    )
+    http_connect_timeout_seconds: float = Field(
+        5.0,
+        validation_alias=AliasChoices("AURA_HTTP_CONNECT_TIMEOUT_SECONDS", "HTTP_CONNECT_TIMEOUT_SECONDS"),
+    )
+    http_read_timeout_seconds: float = Field(
+        30.0,
+        validation_alias=AliasChoices("AURA_HTTP_READ_TIMEOUT_SECONDS", "HTTP_READ_TIMEOUT_SECONDS"),
+    )
+
+    # Caché de respuestas RAG (clave: consulta normalizada + versión del corpus + día)
+    rag_answer_cache_enabled: bool = Field(
+        True,
+        validation_alias=AliasChoices("AURA_RAG_ANSWER_CACHE_ENABLED", "RAG_ANSWER_CACHE_ENABLED"),
+    )
+    rag_answer_cache_size: int = Field(
+        512,
+        validation_alias=AliasChoices("AURA_RAG_ANSWER_CACHE_SIZE", "RAG_ANSWER_CACHE_SIZE"),
+    )
+    rag_answer_cache_ttl_seconds: int = Field(
+        6 * 3600,
+        validation_alias=AliasChoices("AURA_RAG_ANSWER_CACHE_TTL_SECONDS", "RAG_ANSWER_CACHE_TTL_SECONDS"),
+    )
+    # Caché semántica de respuestas RAG: off | shadow (sólo mide y audita) | on (sirve aciertos)
+    rag_semantic_cache: str = Field(
+        "shadow",
+        validation_alias=AliasChoices("AURA_RAG_SEMANTIC_CACHE", "RAG_SEMANTIC_CACHE"),
+    )
+    # Coseno mínimo entre preguntas para reutilizar la respuesta
+    rag_semantic_cache_threshold: float = Field(
+        0.95,
+        validation_alias=AliasChoices("AURA_RAG_SEMANTIC_CACHE_THRESHOLD", "RAG_SEMANTIC_CACHE_THRESHOLD"),
+    )
+    rag_semantic_cache_size: int = Field(
+        1024,
+        validation_alias=AliasChoices("AURA_RAG_SEMANTIC_CACHE_SIZE", "RAG_SEMANTIC_CACHE_SIZE"),
+    )
+    rag_semantic_cache_ttl_seconds: int = Field(
+        6 * 3600,
+        validation_alias=AliasChoices("AURA_RAG_SEMANTIC_CACHE_TTL_SECONDS", "RAG_SEMANTIC_CACHE_TTL_SECONDS"),
+    )
+    # Fracción de aciertos servidos que se re-recuperan en segundo plano para detectar falsos aciertos
+    rag_semantic_cache_audit_rate: float = Field(
+        0.05,
+        validation_alias=AliasChoices("AURA_RAG_SEMANTIC_CACHE_AUDIT_RATE", "RAG_SEMANTIC_CACHE_AUDIT_RATE"),
+    )
+    # Fracción mínima de la evidencia cacheada que debe reaparecer para no marcar falso acierto
+    rag_semantic_cache_audit_min_overlap: float = Field(
+        0.5,
+        validation_alias=AliasChoices("AURA_RAG_SEMANTIC_CACHE_AUDIT_MIN_OVERLAP", "RAG_SEMANTIC_CACHE_AUDIT_MIN_OVERLAP"),
+    )
+    # Cada cuánto se relee la versión del corpus de Mongo (cambios hechos por otros workers)
+    rag_corpus_version_check_seconds: float = Field(
+        5.0,
+        validation_alias=AliasChoices("AURA_RAG_CORPUS_VERSION_CHECK_SECONDS", "RAG_CORPUS_VERSION_CHECK_SECONDS"),
+    )
+
+    # Caché de título/tags por documento usada al armar prompts RAG
+    rag_doc_meta_cache_size: int = Field(
+        4096,
+        validation_alias=AliasChoices("AURA_RAG_DOC_META_CACHE_SIZE", "RAG_DOC_META_CACHE_SIZE"),
+    )
+    rag_doc_meta_cache_ttl_seconds: int = Field(
+        600,
+        validation_alias=AliasChoices("AURA_RAG_DOC_META_CACHE_TTL_SECONDS", "RAG_DOC_META_CACHE_TTL_SECONDS"),
+    )
+
+    # Backend del rate limit: "memory" (por proceso) o "mongo" (compartido entre workers/nodos)
+    rate_limit_backend: str = Field(
+        "memory",
+        validation_alias=AliasChoices("AURA_RATE_LIMIT_BACKEND", "RATE_LIMIT_BACKEND"),
+    )
+
+    # Perfilado por petición (spans de etapa + histogramas)
+    timing_enabled: bool = Field(default=True, validation_alias=AliasChoices("AURA_TIMING_ENABLED", "TIMING_ENABLED"))
+    # Cabecera Server-Timing: off | request (si el cliente envía X-Debug-Timing: 1) | always
+    timing_header: str = Field(default="off", validation_alias=AliasChoices("AURA_TIMING_HEADER", "TIMING_HEADER"))
+    # Loggea el desglose por etapa de peticiones más lentas que esto (0 = nunca)
+    timing_slow_request_ms: int = Field(default=3000, validation_alias=AliasChoices("AURA_TIMING_SLOW_REQUEST_MS", "TIMING_SLOW_REQUEST_MS"))
+
+    # Endpoint /metrics (formato Prometheus)
+    metrics_enabled: bool = Field(default=True, validation_alias=AliasChoices("AURA_METRICS_ENABLED", "METRICS_ENABLED"))
+
+    # Tamaño de página por defecto de GET /chat/messages (máx. 200)
+    chat_messages_page_size: int = Field(default=50, validation_alias=AliasChoices("AURA_CHAT_MESSAGES_PAGE_SIZE", "CHAT_MESSAGES_PAGE_SIZE"))
+
+    # Cola de escritura diferida (mensajes/notas del chat fuera del camino de respuesta)
+    write_behind_enabled: bool = Field(default=True, validation_alias=AliasChoices("AURA_WRITE_BEHIND_ENABLED", "WRITE_BEHIND_ENABLED"))
+    write_behind_capacity: int = Field(default=10000, validation_alias=AliasChoices("AURA_WRITE_BEHIND_CAPACITY", "WRITE_BEHIND_CAPACITY"))
+    write_behind_batch_size: int = Field(default=200, validation_alias=AliasChoices("AURA_WRITE_BEHIND_BATCH_SIZE", "WRITE_BEHIND_BATCH_SIZE"))
+    write_behind_flush_ms: int = Field(default=200, validation_alias=AliasChoices("AURA_WRITE_BEHIND_FLUSH_MS", "WRITE_BEHIND_FLUSH_MS"))
+    write_behind_retries: int = Field(default=3, validation_alias=AliasChoices("AURA_WRITE_BEHIND_RETRIES", "WRITE_BEHIND_RETRIES"))
+
+    # Contexto de usuario (perfil/timetable/bloques) cacheado por proceso; 0 = sin caché
+    user_context_ttl_seconds: int = Field(default=60, validation_alias=AliasChoices("AURA_USER_CONTEXT_TTL_SECONDS", "USER_CONTEXT_TTL_SECONDS"))
+    user_context_cache_size: int = Field(default=1024, validation_alias=AliasChoices("AURA_USER_CONTEXT_CACHE_SIZE", "USER_CONTEXT_CACHE_SIZE"))
+
+    # Índice de horarios en memoria: cada cuánto se revisa la versión en app_state (s)
+    timetable_index_check_seconds: float = Field(default=5.0, validation_alias=AliasChoices("AURA_TIMETABLE_INDEX_CHECK_SECONDS", "TIMETABLE_INDEX_CHECK_SECONDS"))
+
+    # Índice de asuetos (calendar_holiday) en memoria: cada cuánto se revisa su versión (s)
+    holiday_index_check_seconds: float = Field(default=30.0, validation_alias=AliasChoices("AURA_HOLIDAY_INDEX_CHECK_SECONDS", "HOLIDAY_INDEX_CHECK_SECONDS"))
+
     # Chat history window (n últimos mensajes)
     chat_history_n: int = Field(
         8,
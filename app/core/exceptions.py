@@ -23,7 +23,7 @@ def register_exception_handlers(app: FastAPI) -> None:
         rid = _req_id(request)
         if rid:
             body["request_id"] = rid
-        return JSONResponse(status_code=exc.status_code, content=body)
+        return JSONResponse(status_code=exc.status_code, content=body, headers=getattr(exc, "headers", None))
 
     @app.exception_handler(RequestValidationError)
     async def _validation_handler(request: Request, exc: RequestValidationError):
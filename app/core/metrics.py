@@ -0,0 +1,253 @@
+"""
+Métricas de la aplicación en formato de exposición de Prometheus (texto 0.0.4).
+
+Sin dependencias externas: contadores e histogramas con etiquetas en memoria
+(por proceso; con varios workers, Prometheus agrega por instancia).
+
+Qué se exporta (`GET /metrics`):
+- Peticiones HTTP por ruta (plantilla, no la URL concreta), método y status; latencia.
+- Llamadas a LLM por proveedor/modelo/resultado, latencia y tokens (prompt/completion,
+  tomados de `resp.usage` en OpenAI y de `prompt_eval_count`/`eval_count` en Ollama).
+- Llamadas de embeddings, tamaño de lote, latencia y tokens.
+- Rechazos del rate limit por ruta.
+- Al momento del scrape: etapas de `app.core.profiling` (incluye `mongo.<comando>`)
+  y contadores de las cachés LRU registradas con nombre.
+
+Los tokens de LLM también se suman a la `Trace` de la petición en curso, de donde
+el chat llena `tokens_input`/`tokens_output` del mensaje del asistente.
+"""
+from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from app.core import profiling
+from app.core.cache import registered as registered_caches
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_num(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # clave → [conteos por bucket..., +Inf], suma
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(c), t[0]) for k, (c, t) in self._values.items())
+        lines = self.header()
+        for key, counts, total in items:
+            acc = 0
+            for le, c in zip(list(self.buckets) + [float("inf")], counts):
+                acc += c
+                le_label = 'le="%s"' % _num(le)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le_label)} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {acc}")
+        return lines
+
+
+_REGISTRY: List[_Metric] = []
+_collectors: List[Callable[[], List[str]]] = []
+
+HTTP_REQUESTS = Counter("aura_http_requests_total", "Peticiones HTTP atendidas.", ("method", "route", "status"))
+HTTP_LATENCY = Histogram("aura_http_request_duration_seconds", "Latencia de peticiones HTTP (hasta el primer byte en streaming).", ("method", "route"))
+LLM_CALLS = Counter("aura_llm_calls_total", "Llamadas a modelos de chat.", ("provider", "model", "outcome"))
+LLM_LATENCY = Histogram("aura_llm_request_duration_seconds", "Latencia de llamadas a modelos de chat.", ("provider", "model"))
+LLM_TOKENS = Counter("aura_llm_tokens_total", "Tokens consumidos por modelos de chat.", ("provider", "model", "type"))
+EMBED_CALLS = Counter("aura_embedding_calls_total", "Llamadas al proveedor de embeddings.", ("provider", "model", "outcome"))
+EMBED_LATENCY = Histogram("aura_embedding_request_duration_seconds", "Latencia de llamadas de embeddings.", ("provider", "model"))
+EMBED_BATCH = Histogram("aura_embedding_batch_size", "Textos por llamada de embeddings.", ("provider", "model"), buckets=BATCH_BUCKETS)
+EMBED_TOKENS = Counter("aura_embedding_tokens_total", "Tokens enviados al proveedor de embeddings.", ("provider", "model"))
+RATE_LIMITED = Counter("aura_rate_limit_rejections_total", "Peticiones rechazadas por rate limit (429).", ("route",))
+
+
+def register_collector(fn: Callable[[], List[str]]) -> None:
+    """Agrega una función que produce líneas de exposición al momento del scrape."""
+    _collectors.append(fn)
+
+
+def usage_tokens(usage: Any) -> Tuple[int, int]:
+    """(prompt, completion) desde `resp.usage` de OpenAI o un dict equivalente."""
+    if usage is None:
+        return 0, 0
+    get = usage.get if isinstance(usage, dict) else (lambda k, d=None: getattr(usage, k, d))
+    return int(get("prompt_tokens", 0) or 0), int(get("completion_tokens", 0) or 0)
+
+
+class _Call:
+    __slots__ = ("usage",)
+
+    def __init__(self) -> None:
+        self.usage: Any = None
+
+
+@contextmanager
+def llm_call(provider: str, model: str, *, kind: str = "chat", batch: int = 0) -> Iterator[_Call]:
+    """Mide una llamada al proveedor; asigna `call.usage = resp.usage` dentro del bloque.
+
+    `kind="embedding"` alimenta las métricas de embeddings (con `batch` = nº de textos).
+    Un generador abandonado a medias (stream cancelado) cuenta como `cancelled`.
+    """
+    call = _Call()
+    t0 = perf_counter()
+    outcome = "error"
+    try:
+        yield call
+        outcome = "ok"
+    except GeneratorExit:
+        outcome = "cancelled"
+        raise
+    finally:
+        elapsed = perf_counter() - t0
+        prompt, completion = usage_tokens(call.usage)
+        if kind == "embedding":
+            EMBED_CALLS.inc(provider=provider, model=model, outcome=outcome)
+            EMBED_LATENCY.observe(elapsed, provider=provider, model=model)
+            EMBED_BATCH.observe(batch, provider=provider, model=model)
+            if prompt:
+                EMBED_TOKENS.inc(prompt, provider=provider, model=model)
+        else:
+            LLM_CALLS.inc(provider=provider, model=model, outcome=outcome)
+            LLM_LATENCY.observe(elapsed, provider=provider, model=model)
+            if prompt:
+                LLM_TOKENS.inc(prompt, provider=provider, model=model, type="prompt")
+            if completion:
+                LLM_TOKENS.inc(completion, provider=provider, model=model, type="completion")
+            trace = profiling.current()
+            if trace is not None and (prompt or completion):
+                trace.add_tokens(prompt, completion)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    HTTP_REQUESTS.inc(method=method, route=route, status=status)
+    HTTP_LATENCY.observe(seconds, method=method, route=route)
+
+
+def _stage_lines() -> List[str]:
+    stages = profiling.histograms()
+    out: List[str] = []
+    for metric, label, pick in (
+        ("aura_stage_duration_seconds", "stage", lambda n: not n.startswith("mongo.")),
+        ("aura_mongo_command_duration_seconds", "command", lambda n: n.startswith("mongo.")),
+    ):
+        names = [n for n in stages if pick(n)]
+        if not names:
+            continue
+        out += [f"# HELP {metric} Duración por etapa medida con app.core.profiling.", f"# TYPE {metric} histogram"]
+        for name in names:
+            h = stages[name]
+            value = name[len("mongo."):] if label == "command" else name
+            for le, acc in h["buckets"]:
+                le_label = 'le="%s"' % ("+Inf" if le == "+Inf" else _num(float(le) / 1000.0))
+                out.append(f"{metric}_bucket{_labels((label,), (value,), le_label)} {acc}")
+            out.append(f"{metric}_sum{_labels((label,), (value,))} {_num(round(h['sum_ms'] / 1000.0, 6))}")
+            out.append(f"{metric}_count{_labels((label,), (value,))} {h['count']}")
+    return out
+
+
+def _cache_lines() -> List[str]:
+    caches = registered_caches()
+    if not caches:
+        return []
+    out: List[str] = []
+    for metric, kind, doc, field in (
+        ("aura_cache_hits_total", "counter", "Aciertos de caché en memoria.", "hits"),
+        ("aura_cache_misses_total", "counter", "Fallos de caché en memoria.", "misses"),
+        ("aura_cache_evictions_total", "counter", "Expulsiones por tamaño.", "evictions"),
+        ("aura_cache_entries", "gauge", "Entradas en la caché.", "size"),
+    ):
+        out += [f"# HELP {metric} {doc}", f"# TYPE {metric} {kind}"]
+        for name, cache in sorted(caches.items()):
+            out.append(f"{metric}{_labels(('cache',), (name,))} {cache.stats()[field]}")
+    return out
+
+
+register_collector(_stage_lines)
+register_collector(_cache_lines)
+
+
+def render() -> str:
+    """Texto de exposición con todas las métricas registradas."""
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines += m.render()
+    for fn in _collectors:
+        try:
+            lines += fn()
+        except Exception:
+            continue
+    return "\n".join(lines) + "\n"
@@ -8,6 +8,7 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from app.core import metrics, profiling
 from app.core.config import settings
 
 
@@ -15,8 +16,17 @@ class RequestIdMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         rid = request.headers.get("X-Request-Id") or uuid.uuid4().hex
         request.state.request_id = rid
-        response = await call_next(request)
+        # Traza de etapas de la petición (ver app.core.profiling)
+        trace, token = profiling.start_trace(rid)
+        request.state.trace = trace
+        try:
+            response = await call_next(request)
+        finally:
+            profiling.end_trace(token)
         response.headers["X-Request-Id"] = rid
+        if profiling.header_wanted(request.headers):
+            # En respuestas en streaming sólo incluye las etapas previas al primer byte
+            response.headers["Server-Timing"] = trace.server_timing()
         return response
 
 
@@ -40,6 +50,13 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             if status is None:
                 status = 0
             self.log.info("method=%s path=%s status=%s latency_ms=%s request_id=%s", method, path, status, dt_ms, rid)
+            # Plantilla de la ruta (p.ej. /chat/conversations/{id}) para acotar etiquetas
+            route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+            metrics.observe_request(method, route, status, time.perf_counter() - start)
+            slow_ms = int(getattr(settings, "timing_slow_request_ms", 0) or 0)
+            trace = getattr(request.state, "trace", None)
+            if trace is not None and slow_ms > 0 and dt_ms >= slow_ms:
+                self.log.warning("slow request path=%s latency_ms=%s request_id=%s stages: %s", path, dt_ms, rid, trace.summary())
 
 
 def add_middlewares(app: FastAPI) -> None:
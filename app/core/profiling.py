@@ -0,0 +1,247 @@
+"""
+Perfilado ligero por petición: spans de etapa y histogramas agregados.
+
+Cada petición HTTP abre una `Trace` (ligada al request id de `RequestIdMiddleware`)
+en una `ContextVar`; `span("rag.embed")` / `@timed("llm.chat")` miden una etapa y la
+suman a la traza vigente y al histograma global de esa etapa. Sin traza activa
+(CLIs, scripts) sólo se alimenta el histograma.
+
+La `ContextVar` se copia a los hilos de `asyncio.to_thread`/threadpool y a las
+tareas de la petición; como todos comparten el mismo objeto `Trace`, las etapas
+medidas ahí también cuentan.
+
+Las consultas a Mongo se miden con un `CommandListener` (`mongo.<comando>`) en
+lugar de instrumentar cada repositorio.
+
+Salidas:
+- `Server-Timing` en la respuesta (según `TIMING_HEADER`: off | request | always;
+  con `request` sólo si el cliente envía `X-Debug-Timing: 1`).
+- Log con el desglose si la petición supera `TIMING_SLOW_REQUEST_MS`.
+- `histograms()` para el endpoint de métricas.
+"""
+from __future__ import annotations
+
+import functools
+import inspect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.core.config import settings
+
+# Límites superiores (ms) de los buckets; el último es +Inf implícito
+BUCKETS_MS: Tuple[float, ...] = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Trace:
+    """Etapas medidas durante una petición (nombre → ms acumulados y veces)."""
+
+    __slots__ = ("request_id", "started", "tokens_input", "tokens_output", "_stages", "_lock")
+
+    def __init__(self, request_id: str = "") -> None:
+        self.request_id = request_id
+        self.started = perf_counter()
+        # Tokens de LLM consumidos durante la petición (ver app.core.metrics)
+        self.tokens_input = 0
+        self.tokens_output = 0
+        self._stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            st = self._stages.get(name)
+            if st is None:
+                self._stages[name] = [ms, 1]
+            else:
+                st[0] += ms
+                st[1] += 1
+
+    def add_tokens(self, prompt: int, completion: int) -> None:
+        with self._lock:
+            self.tokens_input += int(prompt or 0)
+            self.tokens_output += int(completion or 0)
+
+    def elapsed_ms(self) -> float:
+        return (perf_counter() - self.started) * 1000.0
+
+    def stages(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {k: {"ms": round(v[0], 2), "count": int(v[1])} for k, v in self._stages.items()}
+
+    def summary(self) -> str:
+        """Texto compacto para logs: `rag.embed=12.3ms mongo.find=4.1ms(x3)`."""
+        parts = []
+        for name, st in sorted(self.stages().items(), key=lambda kv: -kv[1]["ms"]):
+            n = st["count"]
+            parts.append(f"{name}={st['ms']}ms" + (f"(x{n})" if n > 1 else ""))
+        return " ".join(parts)
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera `Server-Timing` (etapas hasta ahora + total)."""
+        parts = []
+        for name, st in self.stages().items():
+            item = f"{name};dur={st['ms']}"
+            if st["count"] > 1:
+                item += f';desc="x{st["count"]}"'
+            parts.append(item)
+        parts.append(f"total;dur={round(self.elapsed_ms(), 2)}")
+        return ", ".join(parts)
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        i = 0
+        for i, le in enumerate(BUCKETS_MS):
+            if ms <= le:
+                break
+        else:
+            i = len(BUCKETS_MS)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        """Estimación por interpolación lineal dentro del bucket (como `histogram_quantile`)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            upper = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+            if c and seen + c >= rank:
+                return min(lower + (upper - lower) * ((rank - seen) / c), self.max_ms)
+            seen += c
+            lower = upper
+        return self.max_ms
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("aura_trace", default=None)
+_hist: Dict[str, _Histogram] = {}
+_hist_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "timing_enabled", True))
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def start_trace(request_id: str = "") -> Tuple[Trace, Token]:
+    trace = Trace(request_id)
+    return trace, _current.set(trace)
+
+
+def end_trace(token: Token) -> None:
+    _current.reset(token)
+
+
+def record(name: str, ms: float) -> None:
+    """Suma `ms` a la etapa `name` de la traza vigente y a su histograma."""
+    if not enabled():
+        return
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, ms)
+    with _hist_lock:
+        h = _hist.get(name)
+        if h is None:
+            h = _hist[name] = _Histogram()
+        h.observe(ms)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Mide el bloque como etapa `name` (también si lanza excepción)."""
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (perf_counter() - t0) * 1000.0)
+
+
+def timed(name: str) -> Callable:
+    """Decorador equivalente a `span` para funciones sync o async."""
+
+    def deco(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def _async(*args: Any, **kwargs: Any) -> Any:
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return _async
+
+        @functools.wraps(fn)
+        def _sync(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return fn(*args, **kwargs)
+        return _sync
+
+    return deco
+
+
+def histograms() -> Dict[str, Any]:
+    """Histograma por etapa: buckets acumulados, suma, conteo y p50/p95/p99 estimados."""
+    out: Dict[str, Any] = {}
+    with _hist_lock:
+        for name in sorted(_hist):
+            h = _hist[name]
+            cumulative, acc = [], 0
+            for le, c in zip(list(BUCKETS_MS) + ["+Inf"], h.counts):
+                acc += c
+                cumulative.append([le, acc])
+            out[name] = {
+                "count": h.count,
+                "sum_ms": round(h.sum_ms, 2),
+                "avg_ms": round(h.sum_ms / h.count, 2) if h.count else 0.0,
+                "max_ms": round(h.max_ms, 2),
+                "p50_ms": round(h.quantile(0.50), 2),
+                "p95_ms": round(h.quantile(0.95), 2),
+                "p99_ms": round(h.quantile(0.99), 2),
+                "buckets": cumulative,
+            }
+    return out
+
+
+def reset() -> None:
+    with _hist_lock:
+        _hist.clear()
+
+
+def header_wanted(headers: Any) -> bool:
+    """Si la respuesta debe llevar `Server-Timing` según `TIMING_HEADER`."""
+    mode = str(getattr(settings, "timing_header", "off") or "off").lower()
+    if mode == "always":
+        return True
+    if mode == "request":
+        return str(headers.get("X-Debug-Timing") or "").strip().lower() in {"1", "true", "yes"}
+    return False
+
+
+class MongoTimingListener(monitoring.CommandListener):
+    """Registra cada comando de Mongo como etapa `mongo.<comando>`."""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        record(f"mongo.{event.command_name}", event.duration_micros / 1000.0)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        record(f"mongo.{event.command_name}", event.duration_micros / 1000.0)
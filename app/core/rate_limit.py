@@ -1,14 +1,198 @@
 """
-Rate limit muy simple en memoria (por identificador + ruta).
+Rate limit por identificador + ruta con backends intercambiables (GCRA).
+
+GCRA ("generic cell rate algorithm"): cada clave guarda un único instante teórico
+de llegada (`tat`). Con `limit` intentos por `window_seconds`, cada intento avanza
+`tat` en `window/limit` y se rechaza si `tat` supera `now + window - window/limit`.
+Equivale a un token bucket con ráfaga `limit`, en O(1) y con un solo float por clave.
+
+Backends (`RATE_LIMIT_BACKEND`):
+- `memory`: dict ordenado por último uso; las claves cuyo `tat` ya pasó (estado
+  idéntico a "sin clave") se expulsan al vuelo. Límite por proceso.
+- `mongo`: colección `rate_limit` con actualización atómica (pipeline) e índice TTL
+  sobre `expires_at`; el límite se comparte entre workers y nodos. Si Mongo falla,
+  se usa el backend en memoria.
 
 Uso típico:
 - Invitado por sesión: allow((session_id, "/chat/ask"), limit=10, window_seconds=60)
 - Usuario autenticado: allow((f"user:{user_id}:{ip}", "/chat/ask"), limit=30, window_seconds=60)
+- Como dependencia FastAPI: `dependencies=[Depends(limit_by_ip("/auth/login", limit=5))]`
 """
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from time import time
-from typing import Dict, Tuple
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from app.core import metrics
+from app.core.config import settings
+
+_log = logging.getLogger("aura.rate_limit")
+
+COLL = "rate_limit"
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    retry_after: float = 0.0
+
+
+def _params(limit: int, window_seconds: float) -> Tuple[float, float]:
+    """Intervalo de emisión y tolerancia de ráfaga para `limit` por `window_seconds`."""
+    limit = max(1, int(limit))
+    interval = float(window_seconds) / limit
+    return interval, float(window_seconds) - interval
+
+
+class MemoryRateLimiter:
+    """GCRA en memoria con expulsión de claves inactivas (O(1) amortizado)."""
+
+    def __init__(self) -> None:
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> Decision:
+        interval, tau = _params(limit, window_seconds)
+        now = time()
+        with self._lock:
+            self._evict(now)
+            tat = max(self._tat.get(key, now), now)
+            if tat - now > tau:
+                return Decision(False, tat - tau - now)
+            self._tat[key] = tat + interval
+            self._tat.move_to_end(key)
+        return Decision(True)
+
+    def _evict(self, now: float) -> None:
+        # El frente es la clave usada hace más tiempo; si su tat ya pasó, no aporta estado
+        while self._tat:
+            if next(iter(self._tat.values())) > now:
+                break
+            self._tat.popitem(last=False)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tat.clear()
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+
+class MongoRateLimiter:
+    """GCRA compartido en Mongo: un documento por clave actualizado atómicamente."""
+
+    @staticmethod
+    def _pipeline(now: float, interval: float, tau: float) -> list:
+        return [
+            {"$set": {"_tat": {"$max": [{"$ifNull": ["$tat", now]}, now]}}},
+            {"$set": {"allowed": {"$lte": [{"$subtract": ["$_tat", now]}, tau]}}},
+            {"$set": {"tat": {"$cond": ["$allowed", {"$add": ["$_tat", interval]}, "$_tat"]}}},
+            # Cuando `tat` pasa, el documento equivale a no tenerlo: el TTL lo borra
+            {"$set": {"expires_at": {"$toDate": {"$multiply": ["$tat", 1000]}}}},
+            {"$unset": "_tat"},
+        ]
+
+    @staticmethod
+    def _decision(doc: Optional[dict], now: float, tau: float) -> Decision:
+        doc = doc or {}
+        if doc.get("allowed", True):
+            return Decision(True)
+        return Decision(False, float(doc.get("tat") or now) - tau - now)
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> Decision:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        from app.infrastructure.db.mongo import get_db
+
+        interval, tau = _params(limit, window_seconds)
+        now = time()
+        coll = get_db()[COLL]
+        for attempt in range(2):
+            try:
+                doc = coll.find_one_and_update(
+                    {"_id": key},
+                    self._pipeline(now, interval, tau),
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    projection={"allowed": 1, "tat": 1},
+                )
+                return self._decision(doc, now, tau)
+            except DuplicateKeyError:
+                # Dos upserts simultáneos de una clave nueva: el segundo reintenta como update
+                if attempt:
+                    raise
+        return Decision(True)
 
-BUCKET: Dict[Tuple[str, str], list[float]] = {}
+    async def hit_async(self, key: str, limit: int, window_seconds: float) -> Decision:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        from app.infrastructure.db.mongo import get_async_db
+
+        interval, tau = _params(limit, window_seconds)
+        now = time()
+        coll = get_async_db()[COLL]
+        for attempt in range(2):
+            try:
+                doc = await coll.find_one_and_update(
+                    {"_id": key},
+                    self._pipeline(now, interval, tau),
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    projection={"allowed": 1, "tat": 1},
+                )
+                return self._decision(doc, now, tau)
+            except DuplicateKeyError:
+                if attempt:
+                    raise
+        return Decision(True)
+
+
+_memory = MemoryRateLimiter()
+_mongo = MongoRateLimiter()
+
+
+def _use_mongo() -> bool:
+    return str(getattr(settings, "rate_limit_backend", "memory") or "memory").lower() == "mongo"
+
+
+def _key_str(key: Tuple[str, str]) -> str:
+    ident, route = key
+    return f"{route}|{ident}"
+
+
+def _counted(key: Tuple[str, str], d: Decision) -> Decision:
+    if not d.allowed:
+        metrics.RATE_LIMITED.inc(route=key[1])
+    return d
+
+
+def hit(key: Tuple[str, str], limit: int = 5, window_seconds: int = 60) -> Decision:
+    """Registra un intento y devuelve la decisión (con `retry_after` en segundos si se rechaza)."""
+    k = _key_str(key)
+    if _use_mongo():
+        try:
+            return _counted(key, _mongo.hit(k, limit, window_seconds))
+        except Exception as e:
+            _log.warning("rate_limit (mongo) no disponible, usando memoria: %s", e)
+    return _counted(key, _memory.hit(k, limit, window_seconds))
+
+
+async def hit_async(key: Tuple[str, str], limit: int = 5, window_seconds: int = 60) -> Decision:
+    """Variante async de `hit` (el backend Mongo usa el cliente async)."""
+    k = _key_str(key)
+    if _use_mongo():
+        try:
+            return _counted(key, await _mongo.hit_async(k, limit, window_seconds))
+        except Exception as e:
+            _log.warning("rate_limit (mongo) no disponible, usando memoria: %s", e)
+    return _counted(key, _memory.hit(k, limit, window_seconds))
 
 
 def allow(key: Tuple[str, str], limit: int = 5, window_seconds: int = 60) -> bool:
@@ -18,14 +202,7 @@ def allow(key: Tuple[str, str], limit: int = 5, window_seconds: int = 60) -> boo
     limit: máximo de intentos dentro de la ventana
     window_seconds: ventana de tiempo en segundos
     """
-    now = time()
-    q = BUCKET.setdefault(key, [])
-    # elimina timestamps fuera de ventana
-    q[:] = [t for t in q if now - t < window_seconds]
-    if len(q) >= limit:
-        return False
-    q.append(now)
-    return True
+    return hit(key, limit=limit, window_seconds=window_seconds).allowed
 
 
 def allow_key(route: str, identifier: str, limit: int = 5, window_seconds: int = 60) -> bool:
@@ -33,6 +210,38 @@ def allow_key(route: str, identifier: str, limit: int = 5, window_seconds: int =
     return allow((identifier, route), limit=limit, window_seconds=window_seconds)
 
 
+def _too_many(decision: Decision, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+    )
+
+
+def enforce(key: Tuple[str, str], limit: int, window_seconds: int = 60, detail: str = "Demasiadas solicitudes. Intenta más tarde.") -> None:
+    """Como `allow`, pero lanza 429 (con `Retry-After`) si se excede el límite."""
+    d = hit(key, limit=limit, window_seconds=window_seconds)
+    if not d.allowed:
+        raise _too_many(d, detail)
+
+
+async def enforce_async(key: Tuple[str, str], limit: int, window_seconds: int = 60, detail: str = "Demasiadas solicitudes. Intenta más tarde.") -> None:
+    d = await hit_async(key, limit=limit, window_seconds=window_seconds)
+    if not d.allowed:
+        raise _too_many(d, detail)
+
+
+def limit_by_ip(route: str, limit: int = 5, window_seconds: int = 60, detail: str = "Demasiados intentos, espera un momento") -> Callable:
+    """Dependencia FastAPI: limita por IP del cliente en `route`."""
+
+    async def _dep(request: Request) -> None:
+        ip = request.client.host if request.client else ""
+        await enforce_async((ip, route), limit=limit, window_seconds=window_seconds, detail=detail)
+
+    return _dep
+
+
 def reset() -> None:
-    """Limpia el bucket (útil en tests o reinicios)."""
-    BUCKET.clear()
+    """Limpia el estado en memoria (útil en tests o reinicios)."""
+    _memory.reset()
+
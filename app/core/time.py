@@ -8,8 +8,6 @@ from datetime import datetime
 from typing import Optional
 from zoneinfo import ZoneInfo
 
-from app.infrastructure.db.mongo import get_db
-
 
 CODE_TO_SPANISH_DAY = {
     "mon": "Lunes",
@@ -31,8 +29,10 @@ def get_user_tz(email: Optional[str]) -> Optional[str]:
     if not email:
         return None
     try:
-        u = get_db()["user"].find_one({"email": email}, {"profile": 1}) or {}
-        return ((u.get("profile") or {}).get("tz")) or None
+        # Perfil compartido/cacheado con el resto de la petición
+        from app.services.user_context import user_context
+
+        return user_context(email).tz
     except Exception:
         return None
 
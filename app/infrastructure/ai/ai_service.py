@@ -1,9 +1,18 @@
-"""Cliente LLM de alto nivel (OpenAI → fallback → Ollama)."""
+"""Cliente LLM de alto nivel (OpenAI → fallback → Ollama).
+
+Por defecto nunca lanza: si ningún proveedor responde devuelve `UNAVAILABLE_TEXT`.
+Con `strict=True` lanza `LLMUnavailable` (y, en streaming, también si el stream se
+corta a medias), para que quien cachea o tiene otro respaldo distinga el fallo.
+"""
+from time import perf_counter
+from typing import Iterator
 from openai import BadRequestError
 import logging
 from app.core.config import settings
-from app.infrastructure.ai.openai_client import get_openai
-from app.infrastructure.ai.ollama_client import ollama_ask
+from app.core.metrics import llm_call
+from app.core.profiling import record, timed
+from app.infrastructure.ai.openai_client import get_async_openai, get_openai
+from app.infrastructure.ai.ollama_client import ollama_ask, ollama_ask_async, ollama_ask_stream
 
 SYSTEM_PROMPT = (
     "Eres AURA, asistente institucional de la Universidad Autónoma de Baja California Sur. "
@@ -16,6 +25,30 @@ SYSTEM_PROMPT = (
 )
 
 
+UNAVAILABLE_TEXT = "Aura (local): no pude consultar el modelo."
+EMPTY_TEXT = "Sin respuesta."
+
+
+class LLMUnavailable(RuntimeError):
+    """Ningún proveedor generó la respuesta completa (sólo con `strict=True`)."""
+
+
+def _history_messages(history: list[dict] | None) -> list[dict]:
+    """Mapea historial simple (user/assistant) a mensajes previos."""
+    history_msgs = []
+    try:
+        for m in (history or [])[-20:]:  # límite defensivo
+            r = str(m.get("role") or "").lower()
+            if r in {"user", "assistant"}:
+                c = str(m.get("content") or "").strip()
+                if c:
+                    history_msgs.append({"role": r, "content": c})
+    except Exception:
+        history_msgs = []
+    return history_msgs
+
+
+@timed("llm.chat")
 def ask_llm(
     question: str,
     context: str = "",
@@ -27,25 +60,18 @@ def ask_llm(
     presence_penalty: float | None = None,
     frequency_penalty: float | None = None,
     max_tokens: int | None = None,
+    strict: bool = False,
 ) -> str:
     """
     Estrategia:
       1) OpenAI (modelo primario)
       2) OpenAI (fallback)
       3) Ollama local (si no hay API key o si OpenAI falla)
+
+    Si todo falla devuelve `UNAVAILABLE_TEXT`, o lanza `LLMUnavailable` con `strict=True`.
     """
     user_prompt = f"Contexto:\n{context}\n---\nPregunta: {question}"
-    # Mapea historial simple (user/assistant) a mensajes previos
-    history_msgs = []
-    try:
-        for m in (history or [])[-20:]:  # límite defensivo
-            r = str(m.get("role") or "").lower()
-            if r in {"user", "assistant"}:
-                c = str(m.get("content") or "").strip()
-                if c:
-                    history_msgs.append({"role": r, "content": c})
-    except Exception:
-        history_msgs = []
+    history_msgs = _history_messages(history)
     oa = get_openai()
     sys_prompt = system or SYSTEM_PROMPT
     temp = settings.chat_temperature if temperature is None else float(temperature)
@@ -55,26 +81,9 @@ def ask_llm(
 
     if oa:
         try:
-            resp = oa.chat.completions.create(
-                model=settings.openai_model_primary,
-                messages=(
-                    [{"role": "system", "content": sys_prompt}] + history_msgs + [
-                        {"role": "user", "content": user_prompt}
-                    ]
-                ),
-                temperature=temp,
-                top_p=tp,
-                presence_penalty=pres,
-                frequency_penalty=freq,
-                max_tokens=max_tokens,
-            )
-            out = (resp.choices[0].message.content or "").strip()
-            return out or "Sin respuesta."
-        except BadRequestError:
-            # Fallback de modelo
-            try:
+            with llm_call("openai", settings.openai_model_primary) as call:
                 resp = oa.chat.completions.create(
-                    model=settings.openai_model_fallback,
+                    model=settings.openai_model_primary,
                     messages=(
                         [{"role": "system", "content": sys_prompt}] + history_msgs + [
                             {"role": "user", "content": user_prompt}
@@ -86,8 +95,29 @@ def ask_llm(
                     frequency_penalty=freq,
                     max_tokens=max_tokens,
                 )
+                call.usage = getattr(resp, "usage", None)
+            out = (resp.choices[0].message.content or "").strip()
+            return out or EMPTY_TEXT
+        except BadRequestError:
+            # Fallback de modelo
+            try:
+                with llm_call("openai", settings.openai_model_fallback) as call:
+                    resp = oa.chat.completions.create(
+                        model=settings.openai_model_fallback,
+                        messages=(
+                            [{"role": "system", "content": sys_prompt}] + history_msgs + [
+                                {"role": "user", "content": user_prompt}
+                            ]
+                        ),
+                        temperature=temp,
+                        top_p=tp,
+                        presence_penalty=pres,
+                        frequency_penalty=freq,
+                        max_tokens=max_tokens,
+                    )
+                    call.usage = getattr(resp, "usage", None)
                 out = (resp.choices[0].message.content or "").strip()
-                return out or "Sin respuesta."
+                return out or EMPTY_TEXT
             except Exception:
                 pass
         except Exception:
@@ -102,8 +132,178 @@ def ask_llm(
                 temperature=temp,
                 timeout=settings.ollama_timeout_seconds,
             )
-            or "Sin respuesta."
+            or EMPTY_TEXT
+        )
+    except Exception as e:
+        logging.getLogger("aura.ai").exception("Fallo en Ollama fallback: %s", e)
+        if strict:
+            raise LLMUnavailable(str(e)) from e
+        return UNAVAILABLE_TEXT
+
+
+def ask_llm_stream(
+    question: str,
+    context: str = "",
+    history: list[dict] | None = None,
+    *,
+    system: str | None = None,
+    temperature: float | None = None,
+    top_p: float | None = None,
+    presence_penalty: float | None = None,
+    frequency_penalty: float | None = None,
+    max_tokens: int | None = None,
+    strict: bool = False,
+) -> Iterator[str]:
+    """Variante de `ask_llm` que emite el texto conforme el proveedor lo genera.
+
+    Misma estrategia de respaldo (modelo primario → fallback → Ollama), pero sólo
+    mientras no se haya emitido nada: un corte a mitad de respuesta termina el stream
+    (con `strict=True` lanza `LLMUnavailable`, igual que si todo falla).
+    """
+    user_prompt = f"Contexto:\n{context}\n---\nPregunta: {question}"
+    history_msgs = _history_messages(history)
+    oa = get_openai()
+    sys_prompt = system or SYSTEM_PROMPT
+    temp = settings.chat_temperature if temperature is None else float(temperature)
+    tp = settings.chat_top_p if top_p is None else float(top_p)
+    pres = settings.chat_presence_penalty if presence_penalty is None else float(presence_penalty)
+    freq = settings.chat_frequency_penalty if frequency_penalty is None else float(frequency_penalty)
+    log = logging.getLogger("aura.ai")
+    t0 = perf_counter()
+
+    emitted = False
+    if oa:
+        for model in (settings.openai_model_primary, settings.openai_model_fallback):
+            try:
+                with llm_call("openai", model) as call:
+                    stream = oa.chat.completions.create(
+                        model=model,
+                        messages=(
+                            [{"role": "system", "content": sys_prompt}] + history_msgs + [
+                                {"role": "user", "content": user_prompt}
+                            ]
+                        ),
+                        temperature=temp,
+                        top_p=tp,
+                        presence_penalty=pres,
+                        frequency_penalty=freq,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        # El último evento (sin choices) trae el uso de tokens
+                        stream_options={"include_usage": True},
+                    )
+                    for event in stream:
+                        if getattr(event, "usage", None):
+                            call.usage = event.usage
+                        delta = event.choices[0].delta.content if event.choices else None
+                        if delta:
+                            if not emitted:
+                                record("llm.stream_ttft", (perf_counter() - t0) * 1000.0)
+                            emitted = True
+                            yield delta
+                if not emitted:
+                    yield EMPTY_TEXT
+                return
+            except BadRequestError as e:
+                if emitted:
+                    if strict:
+                        raise LLMUnavailable(str(e)) from e
+                    return
+                # Fallback de modelo
+                continue
+            except Exception as e:
+                if emitted:
+                    log.warning("Stream OpenAI interrumpido: %s", e)
+                    if strict:
+                        raise LLMUnavailable(str(e)) from e
+                    return
+                break
+
+    # 3) → Ollama (sin key o error en OpenAI)
+    try:
+        for piece in ollama_ask_stream(
+            sys_prompt,
+            user_prompt,
+            temperature=temp,
+            timeout=settings.ollama_timeout_seconds,
+        ):
+            if not emitted:
+                record("llm.stream_ttft", (perf_counter() - t0) * 1000.0)
+            emitted = True
+            yield piece
+        if not emitted:
+            yield EMPTY_TEXT
+    except Exception as e:
+        log.exception("Fallo en Ollama fallback (stream): %s", e)
+        if strict:
+            raise LLMUnavailable(str(e)) from e
+        if not emitted:
+            yield UNAVAILABLE_TEXT
+
+
+@timed("llm.chat")
+async def ask_llm_async(
+    question: str,
+    context: str = "",
+    history: list[dict] | None = None,
+    *,
+    system: str | None = None,
+    temperature: float | None = None,
+    top_p: float | None = None,
+    presence_penalty: float | None = None,
+    frequency_penalty: float | None = None,
+    max_tokens: int | None = None,
+    strict: bool = False,
+) -> str:
+    """Variante async de `ask_llm` (AsyncOpenAI → fallback → Ollama vía httpx)."""
+    user_prompt = f"Contexto:\n{context}\n---\nPregunta: {question}"
+    history_msgs = _history_messages(history)
+    oa = get_async_openai()
+    sys_prompt = system or SYSTEM_PROMPT
+    temp = settings.chat_temperature if temperature is None else float(temperature)
+    tp = settings.chat_top_p if top_p is None else float(top_p)
+    pres = settings.chat_presence_penalty if presence_penalty is None else float(presence_penalty)
+    freq = settings.chat_frequency_penalty if frequency_penalty is None else float(frequency_penalty)
+
+    if oa:
+        for model in (settings.openai_model_primary, settings.openai_model_fallback):
+            try:
+                with llm_call("openai", model) as call:
+                    resp = await oa.chat.completions.create(
+                        model=model,
+                        messages=(
+                            [{"role": "system", "content": sys_prompt}] + history_msgs + [
+                                {"role": "user", "content": user_prompt}
+                            ]
+                        ),
+                        temperature=temp,
+                        top_p=tp,
+                        presence_penalty=pres,
+                        frequency_penalty=freq,
+                        max_tokens=max_tokens,
+                    )
+                    call.usage = getattr(resp, "usage", None)
+                out = (resp.choices[0].message.content or "").strip()
+                return out or EMPTY_TEXT
+            except BadRequestError:
+                # Fallback de modelo
+                continue
+            except Exception:
+                break
+
+    # 3) → Ollama (sin key o error en OpenAI)
+    try:
+        return (
+            await ollama_ask_async(
+                sys_prompt,
+                user_prompt,
+                temperature=temp,
+                timeout=settings.ollama_timeout_seconds,
+            )
+            or EMPTY_TEXT
         )
     except Exception as e:
         logging.getLogger("aura.ai").exception("Fallo en Ollama fallback: %s", e)
-        return "Aura (local): no pude consultar el modelo."
+        if strict:
+            raise LLMUnavailable(str(e)) from e
+        return UNAVAILABLE_TEXT
@@ -0,0 +1,123 @@
+"""Caché de embeddings en dos niveles: LRU en memoria + Mongo (opcional).
+
+Clave: sha256 de (modelo, dims, texto normalizado). El nivel Mongo
+(`embedding_cache`) guarda el vector con `expires_at` (índice TTL) y un
+contador `hits` por entrada; sirve entre reinicios y entre workers.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import unicodedata
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.infrastructure.db.mongo import get_db
+
+COLL = "embedding_cache"
+
+_log = logging.getLogger("aura.embeddings.cache")
+_mem = LRUCache(maxsize=max(1, int(getattr(settings, "embed_cache_size", 2048) or 1)), name="embedding")
+_counters = {"mongo_hits": 0, "mongo_misses": 0, "mongo_errors": 0}
+
+
+def normalize_text(text: str) -> str:
+    s = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", s).strip().lower()
+
+
+def cache_key(text: str, model: str | None = None, dims: int | None = None) -> str:
+    m = model or settings.openai_embeddings_model
+    d = int(dims or settings.openai_embeddings_dims)
+    raw = f"{m}|{d}|{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _mongo_enabled() -> bool:
+    return bool(getattr(settings, "embed_cache_mongo", False))
+
+
+def get_many(keys: List[str]) -> Dict[str, list[float]]:
+    """Busca claves en memoria y luego en Mongo. Devuelve {key: vector}."""
+    found: Dict[str, list[float]] = {}
+    pending: List[str] = []
+    for k in keys:
+        v = _mem.get(k)
+        if v is not None:
+            found[k] = v
+        else:
+            pending.append(k)
+    if not pending or not _mongo_enabled():
+        return found
+    try:
+        coll = get_db()[COLL]
+        now = datetime.now(timezone.utc)
+        rows = list(coll.find({"_id": {"$in": pending}, "expires_at": {"$gt": now}}, {"vector": 1}))
+        hit_ids = []
+        for r in rows:
+            vec = [float(x) for x in (r.get("vector") or [])]
+            if vec:
+                found[r["_id"]] = vec
+                _mem.set(r["_id"], vec)
+                hit_ids.append(r["_id"])
+        _counters["mongo_hits"] += len(hit_ids)
+        _counters["mongo_misses"] += len(pending) - len(hit_ids)
+        if hit_ids:
+            coll.update_many({"_id": {"$in": hit_ids}}, {"$inc": {"hits": 1}, "$set": {"last_hit_at": now}})
+    except Exception as e:
+        _counters["mongo_errors"] += 1
+        _log.warning("embedding_cache (mongo) no disponible: %s", e)
+    return found
+
+
+def put_many(items: Dict[str, list[float]]) -> None:
+    """Guarda vectores nuevos en memoria y (si aplica) en Mongo."""
+    for k, v in items.items():
+        _mem.set(k, v)
+    if not items or not _mongo_enabled():
+        return
+    try:
+        now = datetime.now(timezone.utc)
+        ttl = int(getattr(settings, "embed_cache_ttl_seconds", 0) or 0)
+        expires = now + timedelta(seconds=ttl) if ttl > 0 else datetime.max.replace(tzinfo=timezone.utc)
+        ops = [
+            UpdateOne(
+                {"_id": k},
+                {
+                    "$set": {"vector": v, "expires_at": expires},
+                    "$setOnInsert": {
+                        "model": settings.openai_embeddings_model,
+                        "dims": int(settings.openai_embeddings_dims),
+                        "hits": 0,
+                        "created_at": now,
+                    },
+                },
+                upsert=True,
+            )
+            for k, v in items.items()
+        ]
+        get_db()[COLL].bulk_write(ops, ordered=False)
+    except Exception as e:
+        _counters["mongo_errors"] += 1
+        _log.warning("No se pudo persistir embedding_cache: %s", e)
+
+
+def stats() -> Dict[str, object]:
+    out: Dict[str, object] = {"memory": _mem.stats(), "mongo_enabled": _mongo_enabled(), **_counters}
+    return out
+
+
+def clear(*, persistent: bool = False) -> Dict[str, int]:
+    """Vacía el nivel en memoria y, si `persistent`, también la colección."""
+    out = {"memory": _mem.clear(), "mongo": 0}
+    if persistent:
+        try:
+            out["mongo"] = int(get_db()[COLL].delete_many({}).deleted_count)
+        except Exception as e:
+            _log.warning("No se pudo vaciar embedding_cache: %s", e)
+    return out
@@ -1,34 +1,219 @@
 """Helpers para generar embeddings con OpenAI.
 
 Usa el cliente singleton definido en `openai_client`. Lanza errores claros
-si no hay configuración de OpenAI.
+si no hay configuración de OpenAI. Las llamadas pasan por la caché de
+embeddings (`embedding_cache`): sólo se envían al proveedor los textos que faltan.
+
+`embed_texts_batched` es la variante para ingesta: empaqueta textos en lotes
+acotados por tokens estimados e ítems, los envía en paralelo sobre un pool
+compartido y reintenta con backoff ante rate limit / errores transitorios.
 """
 from __future__ import annotations
 
-from typing import List
-from app.infrastructure.ai.openai_client import get_openai
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import openai
+from app.infrastructure.ai.openai_client import get_async_openai, get_openai
+from app.infrastructure.ai import embedding_cache
 from app.core.config import settings
+from app.core.metrics import llm_call
+
+
+def _embed_remote(texts: List[str]) -> List[list[float]]:
+    """Llamada directa al proveedor (sin caché)."""
+    client = get_openai()
+    if client is None:
+        raise RuntimeError("OpenAI client no disponible")
+
+    # OpenAI acepta lote de strings directamente
+    with llm_call("openai", settings.openai_embeddings_model, kind="embedding", batch=len(texts)) as call:
+        resp = client.embeddings.create(
+            model=settings.openai_embeddings_model,
+            input=texts,
+        )
+        call.usage = getattr(resp, "usage", None)
+    # Asegura orden
+    data = sorted(resp.data, key=lambda d: d.index)
+    return [list(d.embedding) for d in data]
 
 
-def embed_texts(texts: List[str]) -> List[list[float]]:
+async def _embed_remote_async(texts: List[str]) -> List[list[float]]:
+    client = get_async_openai()
+    if client is None:
+        raise RuntimeError("OpenAI client no disponible")
+    with llm_call("openai", settings.openai_embeddings_model, kind="embedding", batch=len(texts)) as call:
+        resp = await client.embeddings.create(
+            model=settings.openai_embeddings_model,
+            input=texts,
+        )
+        call.usage = getattr(resp, "usage", None)
+    data = sorted(resp.data, key=lambda d: d.index)
+    return [list(d.embedding) for d in data]
+
+
+def embed_texts(texts: List[str], *, use_cache: bool = True) -> List[list[float]]:
     """Genera embeddings para una lista de textos.
 
-    Devuelve una lista paralela de vectores (list[float]).
+    Devuelve una lista paralela de vectores (list[float]). Con `use_cache`,
+    resuelve primero desde la caché y embebe sólo los textos faltantes
+    (deduplicados), conservando el orden de entrada.
     """
     if not settings.openai_api_key:
         raise RuntimeError("OpenAI no configurado para embeddings")
     if not texts:
         return []
-    client = get_openai()
-    if client is None:
-        raise RuntimeError("OpenAI client no disponible")
+    if not use_cache:
+        return _embed_remote(list(texts))
 
-    # OpenAI acepta lote de strings directamente
-    resp = client.embeddings.create(
-        model=settings.openai_embeddings_model,
-        input=texts,
+    keys = [embedding_cache.cache_key(t) for t in texts]
+    found = embedding_cache.get_many(list(dict.fromkeys(keys)))
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        vectors = _embed_remote(list(missing.values()))
+        fresh = dict(zip(missing.keys(), vectors))
+        embedding_cache.put_many(fresh)
+        found.update(fresh)
+    return [found[k] for k in keys]
+
+
+
+async def embed_texts_async(texts: List[str]) -> List[list[float]]:
+    """Variante async de `embed_texts` (misma caché; el nivel Mongo va en un hilo)."""
+    if not settings.openai_api_key:
+        raise RuntimeError("OpenAI no configurado para embeddings")
+    if not texts:
+        return []
+    keys = [embedding_cache.cache_key(t) for t in texts]
+    uniq = list(dict.fromkeys(keys))
+    if settings.embed_cache_mongo:
+        found = await asyncio.to_thread(embedding_cache.get_many, uniq)
+    else:
+        found = embedding_cache.get_many(uniq)
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        vectors = await _embed_remote_async(list(missing.values()))
+        fresh = dict(zip(missing.keys(), vectors))
+        if settings.embed_cache_mongo:
+            await asyncio.to_thread(embedding_cache.put_many, fresh)
+        else:
+            embedding_cache.put_many(fresh)
+        found.update(fresh)
+    return [found[k] for k in keys]
+
+_log = logging.getLogger("aura.embeddings")
+
+# Errores que vale la pena reintentar (cuota/red/5xx del proveedor)
+_RETRYABLE = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    """Pool acotado y compartido por todas las ingestas del proceso."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = max(1, int(settings.embed_workers or 1))
+                _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aura-embed")
+    return _pool
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata de tokens (~4 caracteres por token)."""
+    return max(1, (len(text or "") + 3) // 4)
+
+
+def pack_batches(texts: List[str], *, max_tokens: int, max_items: int) -> List[Tuple[int, int, int]]:
+    """Agrupa índices consecutivos en lotes. Devuelve [(inicio, fin, tokens)]."""
+    batches: List[Tuple[int, int, int]] = []
+    start, tokens = 0, 0
+    for i, t in enumerate(texts):
+        n = estimate_tokens(t)
+        if i > start and (tokens + n > max_tokens or i - start >= max_items):
+            batches.append((start, i, tokens))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts), tokens))
+    return batches
+
+
+def _embed_with_retry(texts: List[str]) -> List[list[float]]:
+    retries = max(0, int(settings.embed_max_retries or 0))
+    delay = 1.0
+    for attempt in range(retries + 1):
+        try:
+            return _embed_remote(texts)
+        except _RETRYABLE as e:
+            if attempt >= retries:
+                raise
+            # Respeta Retry-After si el proveedor lo envía
+            wait = delay
+            try:
+                ra = e.response.headers.get("retry-after") if getattr(e, "response", None) is not None else None  # type: ignore[attr-defined]
+                if ra:
+                    wait = max(wait, float(ra))
+            except Exception:
+                pass
+            wait = min(wait, 30.0) * (1 + random.random() * 0.25)
+            _log.warning("Embeddings: reintento %d/%d en %.1fs (%s)", attempt + 1, retries, wait, type(e).__name__)
+            time.sleep(wait)
+            delay *= 2
+    raise RuntimeError("unreachable")
+
+
+def embed_texts_batched(texts: List[str]) -> Tuple[List[list[float]], Dict[str, float]]:
+    """Embeddings para lotes grandes (ingesta). Sin caché de consultas.
+
+    Devuelve (vectores en el orden de entrada, métricas del proceso).
+    """
+    if not settings.openai_api_key:
+        raise RuntimeError("OpenAI no configurado para embeddings")
+    stats: Dict[str, float] = {"batches": 0, "tokens_est": 0, "embed_ms": 0.0, "chunks_per_s": 0.0, "tokens_per_s": 0.0}
+    if not texts:
+        return [], stats
+
+    batches = pack_batches(
+        texts,
+        max_tokens=max(1, int(settings.embed_batch_max_tokens)),
+        max_items=max(1, int(settings.embed_batch_max_items)),
     )
-    # Asegura orden
-    vectors: List[list[float]] = [list(d.embedding) for d in resp.data]
-    return vectors
+    t0 = time.perf_counter()
+    if len(batches) == 1:
+        vectors = _embed_with_retry(list(texts))
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(_embed_with_retry, list(texts[a:b])) for (a, b, _n) in batches]
+        vectors = []
+        for f in futures:
+            vectors.extend(f.result())
+    elapsed = max(1e-6, time.perf_counter() - t0)
 
+    tokens = sum(n for (_a, _b, n) in batches)
+    stats.update(
+        batches=len(batches),
+        tokens_est=tokens,
+        embed_ms=round(elapsed * 1000, 1),
+        chunks_per_s=round(len(texts) / elapsed, 2),
+        tokens_per_s=round(tokens / elapsed, 1),
+    )
+    return vectors, stats
@@ -1,6 +1,21 @@
 """Cliente HTTP mínimo para Ollama (chat y helper ask)."""
-import requests
+import json
+from typing import Iterator
+
+import httpx
 from app.core.config import settings
+from app.core.metrics import llm_call
+from app.infrastructure.http.client import get_async_client, get_session
+
+
+def _get_async_http() -> httpx.AsyncClient:
+    return get_async_client("ollama", base_url=settings.ollama_url)
+
+
+def _usage(data: dict) -> dict:
+    """Tokens reportados por Ollama en la respuesta final."""
+    return {"prompt_tokens": data.get("prompt_eval_count") or 0, "completion_tokens": data.get("eval_count") or 0}
+
 
 def ollama_chat(messages: list[dict], temperature: float = 0.2, timeout: int | None = None) -> str:
     """
@@ -8,18 +23,68 @@ def ollama_chat(messages: list[dict], temperature: float = 0.2, timeout: int | N
     messages: [{"role":"system","content":"..."}, {"role":"user","content":"..."}]
     Retorna el texto de la respuesta (string limpio).
     """
-    r = requests.post(
+    with llm_call("ollama", settings.ollama_model) as call:
+        r = get_session("ollama").post(
+            f"{settings.ollama_url}/api/chat",
+            json={
+                "model": settings.ollama_model,
+                "messages": messages,
+                "stream": False,
+                "options": {"temperature": temperature},
+            },
+            timeout=timeout or settings.ollama_timeout_seconds,
+        )
+        r.raise_for_status()
+        data = r.json()
+        call.usage = _usage(data)
+    return ((data.get("message") or {}).get("content") or "").strip()
+
+
+def ollama_chat_stream(messages: list[dict], temperature: float = 0.2, timeout: int | None = None) -> Iterator[str]:
+    """
+    Variante de `ollama_chat` con `stream: true`.
+    Ollama responde NDJSON (un objeto por línea); se emite cada fragmento de texto en cuanto llega.
+    """
+    with llm_call("ollama", settings.ollama_model) as call, get_session("ollama").post(
         f"{settings.ollama_url}/api/chat",
         json={
             "model": settings.ollama_model,
             "messages": messages,
-            "stream": False,
+            "stream": True,
             "options": {"temperature": temperature},
         },
         timeout=timeout or settings.ollama_timeout_seconds,
-    )
-    r.raise_for_status()
-    data = r.json()
+        stream=True,
+    ) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            data = json.loads(line)
+            piece = (data.get("message") or {}).get("content") or ""
+            if piece:
+                yield piece
+            if data.get("done"):
+                call.usage = _usage(data)
+                break
+
+
+async def ollama_chat_async(messages: list[dict], temperature: float = 0.2, timeout: int | None = None) -> str:
+    """Variante async de `ollama_chat` (httpx): la espera no ocupa un hilo."""
+    with llm_call("ollama", settings.ollama_model) as call:
+        r = await _get_async_http().post(
+            "/api/chat",
+            json={
+                "model": settings.ollama_model,
+                "messages": messages,
+                "stream": False,
+                "options": {"temperature": temperature},
+            },
+            timeout=timeout or settings.ollama_timeout_seconds,
+        )
+        r.raise_for_status()
+        data = r.json()
+        call.usage = _usage(data)
     return ((data.get("message") or {}).get("content") or "").strip()
 
 
@@ -35,3 +100,27 @@ def ollama_ask(system: str, user: str, temperature: float = 0.2, timeout: int |
         temperature=temperature,
         timeout=timeout or settings.ollama_timeout_seconds,
     )
+
+
+def ollama_ask_stream(system: str, user: str, temperature: float = 0.2, timeout: int | None = None) -> Iterator[str]:
+    """Atajo de `ollama_ask` con streaming."""
+    return ollama_chat_stream(
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=temperature,
+        timeout=timeout or settings.ollama_timeout_seconds,
+    )
+
+
+async def ollama_ask_async(system: str, user: str, temperature: float = 0.2, timeout: int | None = None) -> str:
+    """Atajo async de `ollama_ask`."""
+    return await ollama_chat_async(
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=temperature,
+        timeout=timeout or settings.ollama_timeout_seconds,
+    )
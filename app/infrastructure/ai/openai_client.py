@@ -1,10 +1,11 @@
 # app/infrastructure/ai/openai_client.py
 """Cliente singleton de OpenAI (crea si hay API key en settings)."""
 from typing import Optional
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from app.core.config import settings
 
 _client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
 
 def get_openai() -> Optional[OpenAI]:
     """
@@ -20,3 +21,16 @@ def get_openai() -> Optional[OpenAI]:
 
     _client = OpenAI(api_key=settings.openai_api_key)
     return _client
+
+
+def get_async_openai() -> Optional[AsyncOpenAI]:
+    """Variante async de `get_openai` (para rutas async del chat)."""
+    global _async_client
+    if _async_client is not None:
+        return _async_client
+
+    if not settings.openai_api_key:
+        return None
+
+    _async_client = AsyncOpenAI(api_key=settings.openai_api_key)
+    return _async_client
@@ -7,16 +7,19 @@ hacemos una segunda pasada para que el asistente forme la respuesta final.
 """
 from __future__ import annotations
 
+import asyncio
 from typing import Optional, Any, Dict, List
 from openai import BadRequestError
 
 from app.core.config import settings
-from app.infrastructure.ai.openai_client import get_openai
+from app.core.metrics import llm_call
+from app.core.profiling import span, timed
+from app.infrastructure.ai.openai_client import get_async_openai, get_openai
 from app.services.schedule_service import get_schedule_answer, get_schedule_payload
 from app.services.library_service import search_document_answer
 from app.core.time import now_text
 from app.services import profile_service
-from app.infrastructure.db.mongo import get_db
+from app.services.user_context import user_context
 
 
 def _parse_args(s: Optional[str]) -> Dict[str, Any]:
@@ -30,103 +33,96 @@ def _parse_args(s: Optional[str]) -> Dict[str, Any]:
         return {}
 
 
-def answer_with_tools(user_email: str, question: str, academic_context: str, history: List[Dict[str, Any]] | None = None) -> Optional[Dict[str, Any]]:
-    """
-    Devuelve texto final si OpenAI decide usar tool-calling o responde directamente.
-    Si no hay cliente o algo falla, retorna None para que el caller haga fallback.
-    """
-    oa = get_openai()
-    if not oa:
-        return None
+_SYS_PROMPT = (
+    "Eres Aura, asistente académico de la UABCS (Estilo C: institucional, cordial y profesional). "
+    "Decides si usar herramientas. "
+    "Primero puedes consultar la hora actual con get_now para anclarte a la fecha y zona horaria del alumno. "
+    "Para preguntas de horarios (qué clase me toca, qué materias tengo hoy, lunes, mañana, ahorita), usa get_schedule. "
+    "Para solicitudes de documentos/formatos/plantillas/cartas/solicitudes (PDF o Word), usa get_document con una breve descripción del documento. "
+    "Si falta especificar el día/momento o el tipo de documento, pide una aclaración breve y luego usa el tool correspondiente. "
+    "Si el alumno proporciona o pide guardar datos de perfil (nombre, carrera, semestre, turno, grupo), usa update_profile SOLO si el usuario está autenticado y confirma explícitamente. "
+    "Si no está autenticado, explica que no puedes guardar pero podrás usar los datos en esta conversación. "
+    "Responde en español, claro y conciso (1–2 oraciones). Si no hay información suficiente, dilo."
+)
 
-    sys_prompt = (
-        "Eres Aura, asistente académico de la UABCS (Estilo C: institucional, cordial y profesional). "
-        "Decides si usar herramientas. "
-        "Primero puedes consultar la hora actual con get_now para anclarte a la fecha y zona horaria del alumno. "
-        "Para preguntas de horarios (qué clase me toca, qué materias tengo hoy, lunes, mañana, ahorita), usa get_schedule. "
-        "Para solicitudes de documentos/formatos/plantillas/cartas/solicitudes (PDF o Word), usa get_document con una breve descripción del documento. "
-        "Si falta especificar el día/momento o el tipo de documento, pide una aclaración breve y luego usa el tool correspondiente. "
-        "Si el alumno proporciona o pide guardar datos de perfil (nombre, carrera, semestre, turno, grupo), usa update_profile SOLO si el usuario está autenticado y confirma explícitamente. "
-        "Si no está autenticado, explica que no puedes guardar pero podrás usar los datos en esta conversación. "
-        "Responde en español, claro y conciso (1–2 oraciones). Si no hay información suficiente, dilo."
-    )
-
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "get_schedule",
-                "description": "Consulta el horario del alumno y devuelve las clases para un momento indicado.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "when": {
-                            "type": "string",
-                            "enum": ["now", "today", "tomorrow", "day"],
-                            "description": "Momento a consultar: ahora, hoy, mañana o un día específico",
-                        },
-                        "day_name": {
-                            "type": "string",
-                            "description": "Nombre del día en español cuando when='day' (lunes..sábado)",
-                        },
+_TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_schedule",
+            "description": "Consulta el horario del alumno y devuelve las clases para un momento indicado.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "when": {
+                        "type": "string",
+                        "enum": ["now", "today", "tomorrow", "day"],
+                        "description": "Momento a consultar: ahora, hoy, mañana o un día específico",
+                    },
+                    "day_name": {
+                        "type": "string",
+                        "description": "Nombre del día en español cuando when='day' (lunes..sábado)",
                     },
-                    "required": ["when"],
-                    "additionalProperties": False,
                 },
+                "required": ["when"],
+                "additionalProperties": False,
             },
         },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_now",
-                "description": "Obtiene la fecha y hora actuales en la zona horaria del alumno.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "tz": {"type": "string", "description": "Zona horaria IANA opcional; si falta, se usa la del perfil"}
-                    },
-                    "required": [],
-                    "additionalProperties": False,
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_now",
+            "description": "Obtiene la fecha y hora actuales en la zona horaria del alumno.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "tz": {"type": "string", "description": "Zona horaria IANA opcional; si falta, se usa la del perfil"}
                 },
+                "required": [],
+                "additionalProperties": False,
             },
         },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_document",
-                "description": "Busca un documento institucional (ej. formatos, PDFs) y devuelve el mejor match con enlace",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string", "description": "Descripción del documento a buscar (ej. carta presentación prácticas)"},
-                    },
-                    "required": ["query"],
-                    "additionalProperties": False,
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_document",
+            "description": "Busca un documento institucional (ej. formatos, PDFs) y devuelve el mejor match con enlace",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Descripción del documento a buscar (ej. carta presentación prácticas)"},
                 },
+                "required": ["query"],
+                "additionalProperties": False,
             },
         },
-        {
-            "type": "function",
-            "function": {
-                "name": "update_profile",
-                "description": "Actualiza el perfil del alumno con los datos proporcionados (requiere usuario autenticado)",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "full_name": {"type": "string", "description": "Nombre completo"},
-                        "major": {"type": "string", "description": "Carrera/Programa (ej. IDS)"},
-                        "semester": {"type": "integer", "description": "Semestre (1-9)"},
-                        "shift": {"type": "string", "description": "Turno (TM/TV)"},
-                        "group": {"type": "string", "description": "Grupo (opcional)"},
-                        "tz": {"type": "string", "description": "Zona horaria IANA (opcional)"},
-                    },
-                    "required": [],
-                    "additionalProperties": False,
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_profile",
+            "description": "Actualiza el perfil del alumno con los datos proporcionados (requiere usuario autenticado)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "full_name": {"type": "string", "description": "Nombre completo"},
+                    "major": {"type": "string", "description": "Carrera/Programa (ej. IDS)"},
+                    "semester": {"type": "integer", "description": "Semestre (1-9)"},
+                    "shift": {"type": "string", "description": "Turno (TM/TV)"},
+                    "group": {"type": "string", "description": "Grupo (opcional)"},
+                    "tz": {"type": "string", "description": "Zona horaria IANA (opcional)"},
                 },
+                "required": [],
+                "additionalProperties": False,
             },
         },
-    ]
+    },
+]
+
 
+def _build_messages(question: str, academic_context: str, history: List[Dict[str, Any]] | None) -> List[Dict[str, Any]]:
     # Mapea historial simple (user/assistant) a mensajes previos
     history_msgs: List[Dict[str, Any]] = []
     try:
@@ -139,37 +135,30 @@ def answer_with_tools(user_email: str, question: str, academic_context: str, his
     except Exception:
         history_msgs = []
 
-    messages: List[Dict[str, Any]] = (
-        [{"role": "system", "content": sys_prompt},
+    return (
+        [{"role": "system", "content": _SYS_PROMPT},
          {"role": "system", "content": f"Contexto académico breve:\n{academic_context}"}]
         + history_msgs
         + [{"role": "user", "content": question}]
     )
 
-    def call(model: str, msgs):
-        return oa.chat.completions.create(
-            model=model,
-            messages=msgs,
-            tools=tools,
-            tool_choice="auto",
-            temperature=settings.chat_temperature,
-            top_p=settings.chat_top_p,
-            presence_penalty=settings.chat_presence_penalty,
-            frequency_penalty=settings.chat_frequency_penalty,
-        )
 
-    try:
-        first = call(settings.openai_model_primary, messages)
-    except BadRequestError:
-        first = call(settings.openai_model_fallback, messages)
-    except Exception:
-        return None
+def _call_kwargs(model: str, msgs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return dict(
+        model=model,
+        messages=msgs,
+        tools=_TOOLS,
+        tool_choice="auto",
+        temperature=settings.chat_temperature,
+        top_p=settings.chat_top_p,
+        presence_penalty=settings.chat_presence_penalty,
+        frequency_penalty=settings.chat_frequency_penalty,
+    )
 
-    msg = first.choices[0].message
-    # Si el modelo decidió responder directamente
-    if not getattr(msg, "tool_calls", None):
-        return {"answer": (msg.content or "").strip() or "", "origin": "assistant"}
 
+@timed("tools.exec")
+def _run_tool_calls(user_email: str, msg: Any) -> Dict[str, Any]:
+    """Ejecuta los tools solicitados por el modelo (I/O síncrono a Mongo/servicios)."""
     # Ejecuta tool(s) solicitados. Para `get_schedule` podemos devolver
     # la respuesta directa. Si sólo se invoca `get_now`, hacemos una
     # segunda pasada para permitir una acción posterior.
@@ -226,8 +215,7 @@ def answer_with_tools(user_email: str, question: str, academic_context: str, his
         elif tc.function and tc.function.name == "update_profile":
             args = _parse_args(getattr(tc.function, "arguments", None))
             # Valida usuario por email; si no existe, devolver error amigable
-            db = get_db()
-            u = db["user"].find_one({"email": user_email.lower()})
+            u = user_context(user_email).user
             if not u:
                 content = "No puedo guardar tu perfil sin un usuario autenticado."
             else:
@@ -242,7 +230,7 @@ def answer_with_tools(user_email: str, question: str, academic_context: str, his
                         payload["semester"] = int(args.get("semester"))
                     except Exception:
                         pass
-                new_profile = profile_service.update_my_profile(str(u["_id"]), payload)
+                new_profile = profile_service.update_my_profile(str(u["_id"]), payload, email=user_email)
                 content = __import__("json").dumps({"message": "ok", "profile": new_profile})
                 profile_updated = True
             tool_messages.append({
@@ -251,41 +239,141 @@ def answer_with_tools(user_email: str, question: str, academic_context: str, his
                 "name": "update_profile",
                 "content": content,
             })
+    return {
+        "tool_messages": tool_messages,
+        "called_schedule": called_schedule,
+        "called_document": called_document,
+        "profile_updated": profile_updated,
+        "schedule_text_out": schedule_text_out,
+        "schedule_payload": schedule_payload,
+    }
+
+
+def _schedule_shortcut(run: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     # Si el modelo solicitó get_schedule, respondemos de forma determinista sin segunda pasada
-    if called_schedule and schedule_text_out is not None:
+    if run["called_schedule"] and run["schedule_text_out"] is not None:
         origin = "tool:get_schedule"
-        out: Dict[str, Any] = {"answer": schedule_text_out, "origin": origin, "schedule": schedule_payload}
-        if profile_updated:
+        out: Dict[str, Any] = {"answer": run["schedule_text_out"], "origin": origin, "schedule": run["schedule_payload"]}
+        if run["profile_updated"]:
             out["offer_code"] = "profile_updated"
         return out
+    return None
+
+
+def _second_pass_messages(messages: List[Dict[str, Any]], msg: Any, run: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return (
+        messages
+        + [{"role": "assistant", "content": msg.content or "", "tool_calls": msg.tool_calls}]
+        + run["tool_messages"]
+    )
+
+
+def _final_answer(second: Any, run: Dict[str, Any]) -> Dict[str, Any]:
+    tool_messages = run["tool_messages"]
+    msg2 = second.choices[0].message
+    out_text = (msg2.content or "").strip() or tool_messages[-1]["content"]
+    origin = "tool:get_schedule" if run["called_schedule"] else ("tool:get_document" if run["called_document"] else "tool")
+    out: Dict[str, Any] = {"answer": out_text, "origin": origin, "schedule": run["schedule_payload"]}
+    if run["profile_updated"]:
+        out["offer_code"] = "profile_updated"
+    return out
+
+
+def answer_with_tools(user_email: str, question: str, academic_context: str, history: List[Dict[str, Any]] | None = None) -> Optional[Dict[str, Any]]:
+    """
+    Devuelve texto final si OpenAI decide usar tool-calling o responde directamente.
+    Si no hay cliente o algo falla, retorna None para que el caller haga fallback.
+    """
+    oa = get_openai()
+    if not oa:
+        return None
+
+    messages = _build_messages(question, academic_context, history)
+
+    def call(model: str, msgs):
+        with llm_call("openai", model) as c:
+            resp = oa.chat.completions.create(**_call_kwargs(model, msgs))
+            c.usage = getattr(resp, "usage", None)
+        return resp
+
+    try:
+        with span("tools.first_pass"):
+            try:
+                first = call(settings.openai_model_primary, messages)
+            except BadRequestError:
+                first = call(settings.openai_model_fallback, messages)
+    except Exception:
+        return None
+
+    msg = first.choices[0].message
+    # Si el modelo decidió responder directamente
+    if not getattr(msg, "tool_calls", None):
+        return {"answer": (msg.content or "").strip() or "", "origin": "assistant"}
+
+    run = _run_tool_calls(user_email, msg)
+    shortcut = _schedule_shortcut(run)
+    if shortcut:
+        return shortcut
 
     # Siempre hacer segunda pasada para que el modelo redacte la respuesta final
-    if tool_messages:
+    if run["tool_messages"]:
         try:
-            second = call(
-                settings.openai_model_primary,
-                messages
-                + [{"role": "assistant", "content": msg.content or "", "tool_calls": msg.tool_calls}]
-                + tool_messages,
-            )
-        except BadRequestError:
-            second = call(
-                settings.openai_model_fallback,
-                messages
-                + [{"role": "assistant", "content": msg.content or "", "tool_calls": msg.tool_calls}]
-                + tool_messages,
-            )
+            with span("tools.second_pass"):
+                try:
+                    second = call(settings.openai_model_primary, _second_pass_messages(messages, msg, run))
+                except BadRequestError:
+                    second = call(settings.openai_model_fallback, _second_pass_messages(messages, msg, run))
         except Exception:
             # Regresa contenido del último tool como fallback (texto)
-            return {"answer": tool_messages[-1]["content"], "origin": "tool"}
-
-        msg2 = second.choices[0].message
-        out_text = (msg2.content or "").strip() or tool_messages[-1]["content"]
-        origin = "tool:get_schedule" if called_schedule else ("tool:get_document" if called_document else "tool")
-        out: Dict[str, Any] = {"answer": out_text, "origin": origin, "schedule": schedule_payload}
-        if profile_updated:
-            out["offer_code"] = "profile_updated"
-        return out
+            return {"answer": run["tool_messages"][-1]["content"], "origin": "tool"}
+        return _final_answer(second, run)
 
     # Sin tools: respuesta directa
     return {"answer": (msg.content or "").strip() or "", "origin": "assistant"}
+
+
+async def answer_with_tools_async(user_email: str, question: str, academic_context: str, history: List[Dict[str, Any]] | None = None) -> Optional[Dict[str, Any]]:
+    """Variante async de `answer_with_tools`: llamadas al modelo con AsyncOpenAI;
+    la ejecución de tools (consultas cortas a Mongo) corre en un hilo."""
+    oa = get_async_openai()
+    if not oa:
+        return None
+
+    messages = _build_messages(question, academic_context, history)
+
+    async def call(model: str, msgs):
+        with llm_call("openai", model) as c:
+            resp = await oa.chat.completions.create(**_call_kwargs(model, msgs))
+            c.usage = getattr(resp, "usage", None)
+        return resp
+
+    try:
+        with span("tools.first_pass"):
+            try:
+                first = await call(settings.openai_model_primary, messages)
+            except BadRequestError:
+                first = await call(settings.openai_model_fallback, messages)
+    except Exception:
+        return None
+
+    msg = first.choices[0].message
+    if not getattr(msg, "tool_calls", None):
+        return {"answer": (msg.content or "").strip() or "", "origin": "assistant"}
+
+    run = await asyncio.to_thread(_run_tool_calls, user_email, msg)
+    shortcut = _schedule_shortcut(run)
+    if shortcut:
+        return shortcut
+
+    if run["tool_messages"]:
+        try:
+            with span("tools.second_pass"):
+                try:
+                    second = await call(settings.openai_model_primary, _second_pass_messages(messages, msg, run))
+                except BadRequestError:
+                    second = await call(settings.openai_model_fallback, _second_pass_messages(messages, msg, run))
+        except Exception:
+            return {"answer": run["tool_messages"][-1]["content"], "origin": "tool"}
+        return _final_answer(second, run)
+
+    return {"answer": (msg.content or "").strip() or "", "origin": "assistant"}
@@ -8,6 +8,7 @@ from __future__ import annotations
 from typing import Any, Dict, List
 import logging
 from pymongo.errors import PyMongoError
+from pymongo.operations import SearchIndexModel
 from app.infrastructure.db.mongo import get_db
 from app.core.config import settings
 
@@ -55,6 +56,23 @@ def _ensure_indexes(name: str, indexes: List[Dict[str, Any]]) -> None:
             _log.warning("No se pudo crear índice en '%s' (%s): %s", name, keys, e)
 
 
+def _drop_indexes(name: str, index_names: List[str]) -> None:
+    """Elimina índices reemplazados por otros (si existen)."""
+    coll = get_db()[name]
+    try:
+        existing = set(coll.index_information().keys())
+    except PyMongoError as e:
+        _log.warning("No se pudieron listar índices de '%s': %s", name, e)
+        return
+    for ix_name in index_names:
+        if ix_name not in existing:
+            continue
+        try:
+            coll.drop_index(ix_name)
+        except PyMongoError as e:
+            _log.warning("No se pudo eliminar índice '%s' en '%s': %s", ix_name, name, e)
+
+
 def ensure_collections() -> None:
     """
     Garantiza colecciones, validadores e índices mínimos.
@@ -388,11 +406,14 @@ def ensure_collections() -> None:
     _ensure_indexes(
         "messages",
         [
-            {"keys": [("conversation_id", 1), ("created_at", 1)], "name": "ix_msg_conv_created"},
-            {"keys": [("user_id", 1), ("created_at", -1)], "name": "ix_msg_user_created"},
-            {"keys": [("session_id", 1), ("created_at", 1)], "name": "ix_msg_session_created"},
+            # _id desempata created_at (resolución de segundos) en historial y paginación por keyset
+            {"keys": [("conversation_id", 1), ("created_at", 1), ("_id", 1)], "name": "ix_msg_conv_created_id"},
+            {"keys": [("user_id", 1), ("created_at", -1), ("_id", -1)], "name": "ix_msg_user_created_id"},
+            {"keys": [("session_id", 1), ("created_at", 1), ("_id", 1)], "name": "ix_msg_session_created_id"},
         ],
     )
+    # Prefijos de los anteriores (sin _id): redundantes
+    _drop_indexes("messages", ["ix_msg_conv_created", "ix_msg_user_created", "ix_msg_session_created"])
 
     # Note (singular)
     note_validator = {
@@ -498,6 +519,13 @@ def ensure_collections() -> None:
                     "chunk_size": {"bsonType": ["int", "null"], "minimum": 1},
                     "chunk_overlap": {"bsonType": ["int", "null"], "minimum": 0},
                     "last_ingested_at": {"bsonType": ["date", "string", "null"]},
+                    # Ingesta incremental: hash del archivo y ETag de la última descarga
+                    "content_hash": {"bsonType": ["string", "null"]},
+                    # Firma de metadatos/modelo/chunking que también decide si se salta
+                    "signature": {"bsonType": ["string", "null"]},
+                    "embed_dims": {"bsonType": ["int", "null"], "minimum": 1},
+                    "etag": {"bsonType": ["string", "null"]},
+                    "chunks": {"bsonType": ["int", "null"], "minimum": 0},
                     "status": {"bsonType": ["string", "null"], "enum": ["pending", "processing", "done", "error", None]},
                 },
                 "additionalProperties": True,
@@ -581,13 +609,17 @@ def ensure_collections() -> None:
             "chunk_index": {"bsonType": "int", "minimum": 0},
             "page": {"bsonType": ["int", "null"], "minimum": 1},
             "text": {"bsonType": "string", "minLength": 1},
+            # Lista de doubles o binData compacto (float32/float16/int8, ver vector.codec);
+            # minItems/maxItems sólo aplican a la forma de lista
             "embedding": {
-                "bsonType": ["array", "null"],
+                "bsonType": ["array", "binData", "null"],
                 "items": {"bsonType": ["double", "int"]},
                 "minItems": dims,
                 "maxItems": dims,
             },
             "meta": {"bsonType": ["object", "null"]},
+            # sha256 del texto del chunk (permite reutilizar el embedding al re-ingestar)
+            "text_hash": {"bsonType": ["string", "null"]},
             "created_at": {"bsonType": "string", "minLength": 10},
             "updated_at": {"bsonType": "string", "minLength": 10},
         },
@@ -604,9 +636,37 @@ def ensure_collections() -> None:
             {"keys": [("meta.section", 1)], "name": "ix_chunk_meta_section"},
             {"keys": [("meta.tags", 1)], "name": "ix_chunk_meta_tags"},
             {"keys": [("meta.scope.from", 1), ("meta.scope.to", 1)], "name": "ix_chunk_meta_scope"},
+            {"keys": [("meta.kind", 1)], "name": "ix_chunk_meta_kind"},
+        ],
+    )
+
+    # Jobs de ingesta RAG en segundo plano (progreso por documento)
+    _ensure_indexes(
+        "rag_job",
+        [
+            {"keys": [("created_at", -1)], "name": "ix_rag_job_created"},
+            {"keys": [("status", 1), ("created_at", -1)], "name": "ix_rag_job_status"},
         ],
     )
 
+    # Caché de embeddings (opcional): expira por TTL sobre `expires_at`
+    if getattr(settings, "embed_cache_mongo", False):
+        _ensure_indexes(
+            "embedding_cache",
+            [
+                {"keys": [("expires_at", 1)], "name": "ttl_embed_cache_expires", "expireAfterSeconds": 0},
+            ],
+        )
+
+    # Rate limit compartido: cada clave expira cuando su `tat` ya pasó
+    if str(getattr(settings, "rate_limit_backend", "memory")).lower() == "mongo":
+        _ensure_indexes(
+            "rate_limit",
+            [
+                {"keys": [("expires_at", 1)], "name": "ttl_rate_limit_expires", "expireAfterSeconds": 0},
+            ],
+        )
+
     # Intenta crear/actualizar un Search Index de Atlas para vector search.
     # No es crítico para desarrollo local y puede requerir privilegios específicos en Atlas.
     try:
@@ -615,13 +675,25 @@ def ensure_collections() -> None:
         _log.warning("No se pudo asegurar search index vectorial: %s", e)
 
 
+_VECTOR_INDEX = "rag_embedding"
+
+
 def _ensure_vector_search_index(coll_name: str, dims: int) -> None:
-    """Crea/actualiza un Atlas Search Index con campo vectorial `embedding`.
+    """Crea o actualiza el Atlas Search Index `rag_embedding` (campo vectorial `embedding`).
 
-    Usa el comando `createSearchIndexes` cuando esté disponible (Atlas). Ignora errores
-    silenciosamente si el cluster no soporta el comando o faltan permisos.
+    Si `listSearchIndexes` muestra que ya existe con otro mapeo (p. ej. sin los
+    campos `token` que usan los filtros de knnBeta, o con otra dimensión) se manda
+    `updateSearchIndex`; si no existe, `createSearchIndexes`. Fuera de Atlas (el
+    listado falla) no hace nada; si el índice existe pero no se puede actualizar,
+    avisa con warning: los filtros por tags/tipo fallarían contra el mapeo viejo.
     """
-    db = get_db()
+    coll = get_db()[coll_name]
+    try:
+        existing = {ix.get("name"): ix for ix in coll.list_search_indexes()}
+    except Exception as e:  # pragma: no cover
+        # Self-hosted o sin permisos: no hay Atlas Search
+        _log.info("Atlas listSearchIndexes no disponible: %s", e)
+        return
     try:
         # Definición mínima para vector search (cosine) en 'embedding'
         definition = {
@@ -635,11 +707,13 @@ def _ensure_vector_search_index(coll_name: str, dims: int) -> None:
                         "dimensions": int(dims),
                     },
                     "doc_id": {"type": "objectId"},
+                    # token además de string: filtros exactos (`in`) de knnBeta (ver vector.filters)
                     "meta": {
                         "type": "document",
                         "fields": {
-                            "section": {"type": "string"},
-                            "tags": {"type": "string"},
+                            "section": [{"type": "string"}, {"type": "token"}],
+                            "tags": [{"type": "string"}, {"type": "token"}],
+                            "kind": {"type": "token"},
                             "lang": {"type": "string"},
                             "scope": {
                                 "type": "document",
@@ -653,16 +727,41 @@ def _ensure_vector_search_index(coll_name: str, dims: int) -> None:
                 },
             }
         }
-        # Si ya existe un índice llamado 'rag_embedding', Atlas lo reemplaza si soporta upsert;
-        # en otros casos, fallará silenciosamente y no afecta el arranque.
-        db.command({
-            "createSearchIndexes": coll_name,
-            "indexes": [
-                {"name": "rag_embedding", "definition": definition}
-            ],
-        })
+        current = existing.get(_VECTOR_INDEX)
+        if current is None:
+            coll.create_search_index(SearchIndexModel(definition=definition, name=_VECTOR_INDEX))
+            _log.info("Atlas Search: creado %s en %s", _VECTOR_INDEX, coll_name)
+            return
+        live = current.get("latestDefinition") or {}
+        if _search_field_types(live) == _search_field_types(definition):
+            return
+        coll.update_search_index(_VECTOR_INDEX, definition)
+        _log.warning("Atlas Search: %s en %s actualizado al mapeo actual (se reconstruye en segundo plano)", _VECTOR_INDEX, coll_name)
     except Exception as e:  # pragma: no cover
-        # Si el comando no existe (self-hosted o permisos insuficientes), continuamos.
-        _log.info("Atlas createSearchIndexes no disponible: %s", e)
+        _log.warning(
+            "No se pudo crear/actualizar %s en %s: %s. Los filtros por tags/tipo de knnBeta "
+            "necesitan el mapeo nuevo (ver rag/README.md)",
+            _VECTOR_INDEX, coll_name, e,
+        )
+
+
+def _search_field_types(definition: Dict[str, Any]) -> Dict[str, Any]:
+    """Ruta → (tipos, dimensiones) del mapeo; ignora lo que Atlas añade por defecto."""
+    out: Dict[str, Any] = {}
+
+    def walk(fields: Dict[str, Any], prefix: str) -> None:
+        for name, spec in (fields or {}).items():
+            specs = spec if isinstance(spec, list) else [spec]
+            path = f"{prefix}{name}"
+            for sp in specs:
+                if sp.get("type") == "document":
+                    walk(sp.get("fields") or {}, f"{path}.")
+            types = tuple(sorted(str(sp.get("type")) for sp in specs if sp.get("type") != "document"))
+            if types:
+                dims = next((int(sp["dimensions"]) for sp in specs if "dimensions" in sp), None)
+                out[path] = (types, dims)
+
+    walk(((definition or {}).get("mappings") or {}).get("fields") or {}, "")
+    return out
 
     
@@ -1,15 +1,42 @@
-"""Cliente MongoDB y helpers de conexión/estado."""
-from pymongo import MongoClient
+"""Cliente MongoDB y helpers de conexión/estado.
+
+Además del cliente síncrono (repos/CLIs), expone un cliente asíncrono
+(`AsyncMongoClient` de PyMongo) para las rutas async del chat.
+"""
+from pymongo import AsyncMongoClient, MongoClient
 from pymongo.errors import ServerSelectionTimeoutError
 from app.core.config import settings
+from app.core.profiling import MongoTimingListener
 import certifi
 import logging
 
 _client: MongoClient | None = None
 _db = None
+_async_client: AsyncMongoClient | None = None
+_async_db = None
 
 _log = logging.getLogger("aura.mongo")
 
+def _client_kwargs(uri: str) -> dict:
+    # Ajustes conservadores: 15s y CA de certifi incluso con SRV
+    kwargs = dict(serverSelectionTimeoutMS=15000)
+    # Duración de cada comando como etapa `mongo.<comando>` de la petición
+    kwargs["event_listeners"] = [MongoTimingListener()]
+    if uri.startswith("mongodb+srv://"):
+        # SRV ya implica TLS; proveemos CA bundle para robustez
+        kwargs["tlsCAFile"] = certifi.where()
+    else:
+        kwargs["tls"] = True
+        kwargs["tlsCAFile"] = certifi.where()
+        kwargs["tlsAllowInvalidCertificates"] = bool(
+            getattr(settings, "mongo_tls_insecure", False)
+        )
+        kwargs["tlsAllowInvalidHostnames"] = bool(
+            getattr(settings, "mongo_tls_allow_invalid_hostnames", False)
+        )
+    return kwargs
+
+
 def init_mongo():
     """
     Inicializa el cliente y valida conexión (ping).
@@ -18,22 +45,7 @@ def init_mongo():
     global _client, _db
     uri = settings.mongo_uri
     try:
-        # Ajustes conservadores: 15s y CA de certifi incluso con SRV
-        kwargs = dict(serverSelectionTimeoutMS=15000)
-        if uri.startswith("mongodb+srv://"):
-            # SRV ya implica TLS; proveemos CA bundle para robustez
-            kwargs["tlsCAFile"] = certifi.where()
-        else:
-            kwargs["tls"] = True
-            kwargs["tlsCAFile"] = certifi.where()
-            kwargs["tlsAllowInvalidCertificates"] = bool(
-                getattr(settings, "mongo_tls_insecure", False)
-            )
-            kwargs["tlsAllowInvalidHostnames"] = bool(
-                getattr(settings, "mongo_tls_allow_invalid_hostnames", False)
-            )
-
-        _client = MongoClient(uri, **kwargs)
+        _client = MongoClient(uri, **_client_kwargs(uri))
         _client.admin.command("ping")
         _db = _client[settings.mongo_db]
         _log.info("Mongo conectado correctamente")
@@ -58,3 +70,27 @@ def get_db():
 
 def db_ready() -> bool:
     return _db is not None
+
+
+def get_async_db():
+    """
+    Base de datos para código async (mismo URI/DB que `get_db`).
+    El cliente se crea perezosamente y conecta en la primera operación.
+    Requiere que `init_mongo()` haya validado la conexión.
+    """
+    global _async_client, _async_db
+    if _db is None:
+        raise RuntimeError("Mongo no inicializado. Intenta más tarde.")
+    if _async_db is None:
+        uri = settings.mongo_uri
+        _async_client = AsyncMongoClient(uri, **_client_kwargs(uri))
+        _async_db = _async_client[settings.mongo_db]
+    return _async_db
+
+
+async def close_async_mongo() -> None:
+    global _async_client, _async_db
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    _async_db = None
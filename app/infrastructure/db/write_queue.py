@@ -0,0 +1,254 @@
+"""
+Cola de escritura diferida (write-behind) para persistencia fuera del camino de respuesta.
+
+Los repositorios encolan inserts (con `_id` ya generado en el cliente, así el id se
+conoce antes de escribir) y updates; un hilo de fondo los agrupa y escribe con
+`insert_many` / `bulk_write`:
+
+- Vacía al juntar `WRITE_BEHIND_BATCH_SIZE` operaciones o cada `WRITE_BEHIND_FLUSH_MS`,
+  y al apagar la app (`stop()` drena lo pendiente).
+- En cada lote van primero los inserts (por colección) y luego los updates (por
+  colección, en orden de llegada): un update de conversación nunca precede al mensaje
+  que lo originó, y los mensajes conservan su orden por `_id`.
+- Reintentos con backoff; un reintento tras escritura parcial ignora los `_id`
+  duplicados (11000), así que es idempotente.
+- `submit(ops)` encola varias operaciones como una unidad (un turno de chat: dos
+  inserts y el update de la conversación); van juntas a la cola o juntas en línea.
+- Capacidad acotada (`WRITE_BEHIND_CAPACITY`, en envíos): si la cola está llena,
+  deshabilitada o ya cerrada por `stop()`, las operaciones se escriben en línea antes
+  de volver, con los errores al caller (contrapresión, nunca se descarta). Desde el
+  event loop se usa `submit_async`, que espera esa escritura en un hilo.
+
+Consistencia: una lectura inmediatamente posterior puede no ver lo encolado hasta el
+siguiente vaciado (por defecto ≤ 200 ms).
+"""
+from __future__ import annotations
+
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core import metrics
+from app.core.config import settings
+from app.infrastructure.db.mongo import get_db
+
+_log = logging.getLogger("aura.mongo.write_queue")
+
+_OPS = metrics.Counter("aura_write_queue_ops_total", "Operaciones de la cola de escritura diferida.", ("op", "outcome"))
+_FLUSH_SIZE = metrics.Histogram("aura_write_queue_flush_size", "Operaciones por vaciado.", (), buckets=metrics.BATCH_BUCKETS)
+_FLUSH_SECONDS = metrics.Histogram("aura_write_queue_flush_seconds", "Duración de cada vaciado.", ())
+
+# (tipo, colección, payload): insert → doc; update → (filtro, update)
+Op = Tuple[str, str, Any]
+
+_STOP = object()
+
+
+def _only_duplicates(e: BulkWriteError) -> bool:
+    errors = (e.details or {}).get("writeErrors") or []
+    return bool(errors) and all(int(err.get("code", 0)) == 11000 for err in errors)
+
+
+def _write(ops: List[Op]) -> None:
+    """Escribe un lote: inserts agrupados por colección y luego updates en orden."""
+    db = get_db()
+    inserts: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    updates: "OrderedDict[str, List[UpdateOne]]" = OrderedDict()
+    for kind, coll, payload in ops:
+        if kind == "insert":
+            inserts.setdefault(coll, []).append(payload)
+        else:
+            flt, upd = payload
+            updates.setdefault(coll, []).append(UpdateOne(flt, upd))
+    for coll, docs in inserts.items():
+        try:
+            db[coll].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if not _only_duplicates(e):
+                raise
+    for coll, reqs in updates.items():
+        db[coll].bulk_write(reqs, ordered=True)
+
+
+class WriteBehindQueue:
+    def __init__(self) -> None:
+        self._q: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self._inline = 0
+        self._dropped = 0
+        self._flushes = 0
+
+    # --- API -------------------------------------------------------------
+    def insert(self, coll: str, doc: Dict[str, Any]) -> None:
+        """Encola un insert; `doc` debe traer `_id`."""
+        self.submit([("insert", coll, doc)])
+
+    def update(self, coll: str, flt: Dict[str, Any], update: Any) -> None:
+        """Encola un update_one (documento `$set` o pipeline)."""
+        self.submit([("update", coll, (flt, update))])
+
+    def submit(self, ops: List[Op]) -> None:
+        """Encola `ops` como una unidad; si no entra, las escribe en línea (errores al caller)."""
+        if not ops or self._enqueue(ops):
+            return
+        _write(ops)
+
+    async def submit_async(self, ops: List[Op]) -> None:
+        """Variante para el event loop: la escritura en línea (cola llena, deshabilitada
+        o cerrada) se espera en un hilo, así la contrapresión recae en la petición y no
+        bloquea el loop."""
+        if not ops or self._enqueue(ops):
+            return
+        await asyncio.to_thread(_write, ops)
+
+    def depth(self) -> int:
+        return self._q.qsize() if self._q is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            flushes, inline, dropped = self._flushes, self._inline, self._dropped
+        return {
+            "enabled": self._enabled(),
+            "running": bool(self._thread and self._thread.is_alive()),
+            "depth": self.depth(),
+            "capacity": int(settings.write_behind_capacity),
+            "flushes": flushes,
+            "inline_writes": inline,
+            "dropped": dropped,
+        }
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Cierra la entrada, drena lo pendiente y detiene el hilo (shutdown).
+
+        Tras cerrar, lo que se encole se escribe en línea en vez de quedar en una
+        cola que ya nadie vacía.
+        """
+        with self._lock:
+            self._closed = True
+            t, q = self._thread, self._q
+            self._thread = None
+        if t is None or q is None:
+            return
+        q.put(_STOP)
+        t.join(timeout)
+        if t.is_alive():
+            _log.warning("Cola de escritura no terminó de drenar (pendientes=%s)", q.qsize())
+
+    # --- Interno ---------------------------------------------------------
+    @staticmethod
+    def _enabled() -> bool:
+        return bool(getattr(settings, "write_behind_enabled", True))
+
+    def _enqueue(self, ops: List[Op]) -> bool:
+        """True si `ops` quedó en la cola; si no, cuenta la escritura en línea que toca hacer."""
+        if self._enabled():
+            q = self._ensure_started()
+            if q is not None:
+                # Con el lock: `stop()` no puede cerrar entre la comprobación y el put
+                with self._lock:
+                    try:
+                        if not self._closed:
+                            q.put_nowait(ops)
+                            for kind, _c, _p in ops:
+                                _OPS.inc(op=kind, outcome="queued")
+                            return True
+                    except queue.Full:
+                        for kind, _c, _p in ops:
+                            _OPS.inc(op=kind, outcome="inline_full")
+        with self._lock:
+            self._inline += len(ops)
+        return False
+
+    def _ensure_started(self) -> Optional[queue.Queue]:
+        if self._thread is not None and self._q is not None:
+            return self._q
+        with self._lock:
+            if self._closed:
+                return None
+            if self._thread is None:
+                self._q = queue.Queue(maxsize=max(1, int(settings.write_behind_capacity)))
+                self._thread = threading.Thread(target=self._run, args=(self._q,), name="aura-write-behind", daemon=True)
+                self._thread.start()
+        return self._q  # type: ignore[return-value]
+
+    def _run(self, q: queue.Queue) -> None:
+        batch_size = max(1, int(settings.write_behind_batch_size))
+        interval = max(0.0, float(settings.write_behind_flush_ms) / 1000.0)
+        stopping = False
+        while not stopping:
+            first = q.get()
+            if first is _STOP:
+                break
+            batch: List[Op] = list(first)
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = q.get(timeout=remaining) if remaining > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.extend(item)
+            self._flush(batch)
+        # Drena lo que quede tras la señal de parada
+        rest: List[Op] = []
+        while True:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rest.extend(item)
+        for i in range(0, len(rest), batch_size):
+            self._flush(rest[i : i + batch_size])
+
+    def _flush(self, batch: List[Op]) -> None:
+        retries = max(0, int(settings.write_behind_retries))
+        t0 = time.perf_counter()
+        for attempt in range(retries + 1):
+            try:
+                _write(batch)
+                for kind, _c, _p in batch:
+                    _OPS.inc(op=kind, outcome="written")
+                break
+            except Exception as e:
+                if attempt >= retries:
+                    with self._lock:
+                        self._dropped += len(batch)
+                    for kind, _c, _p in batch:
+                        _OPS.inc(op=kind, outcome="failed")
+                    _log.error("Cola de escritura: se descartan %d operaciones tras %d intentos: %s", len(batch), attempt + 1, e)
+                    break
+                time.sleep(min(5.0, 0.2 * (2 ** attempt)))
+        with self._lock:
+            self._flushes += 1
+        _FLUSH_SIZE.observe(len(batch))
+        _FLUSH_SECONDS.observe(time.perf_counter() - t0)
+
+
+write_queue = WriteBehindQueue()
+# Scripts/CLI: drena al salir del intérprete (el hilo es daemon)
+atexit.register(write_queue.stop)
+
+
+def _depth_lines() -> List[str]:
+    return [
+        "# HELP aura_write_queue_depth Operaciones pendientes en la cola de escritura diferida.",
+        "# TYPE aura_write_queue_depth gauge",
+        f"aura_write_queue_depth {write_queue.depth()}",
+    ]
+
+
+metrics.register_collector(_depth_lines)
@@ -0,0 +1,202 @@
+"""
+Capa HTTP compartida: sesiones con pool keep-alive por nombre.
+
+Cada pool (`ollama`, `ingest`, `links`, `default`) es una `requests.Session` con un
+`HTTPAdapter` propio: conexiones persistentes por host (`http_pool_maxsize`), reintentos
+con backoff para errores de conexión y respuestas 429/502/503/504 (sólo en métodos
+idempotentes; en POST únicamente si la conexión no llegó a establecerse) y timeout
+por defecto. Para el camino async existe `get_async_client`, un `httpx.AsyncClient`
+con los mismos límites.
+
+`pool_stats()` expone conexiones activas/ociosas y la tasa de reutilización por host.
+"""
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core.config import settings
+
+
+_log = logging.getLogger("aura.http")
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_async_requests: Dict[str, int] = {}
+
+USER_AGENT = "Mozilla/5.0 (AURA)"
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter que aplica un timeout por defecto cuando la llamada no indica uno."""
+
+    def __init__(self, *args, timeout: Optional[float] = None, **kwargs):
+        self._timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self._timeout
+        return super().send(request, **kwargs)
+
+
+def _retry_policy() -> Retry:
+    return Retry(
+        total=settings.http_retries,
+        connect=settings.http_retries,
+        read=settings.http_retries,
+        status=settings.http_retries,
+        backoff_factor=settings.http_backoff_seconds,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _timeout() -> tuple[float, float]:
+    return (settings.http_connect_timeout_seconds, settings.http_read_timeout_seconds)
+
+
+def _build_session(name: str) -> requests.Session:
+    s = requests.Session()
+    adapter = _TimeoutAdapter(
+        pool_connections=settings.http_pool_hosts,
+        pool_maxsize=settings.http_pool_maxsize,
+        pool_block=settings.http_pool_block,
+        max_retries=_retry_policy(),
+        timeout=_timeout(),
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers["User-Agent"] = USER_AGENT
+    return s
+
+
+def get_session(name: str = "default") -> requests.Session:
+    """Devuelve (creándola la primera vez) la sesión compartida del pool `name`."""
+    s = _sessions.get(name)
+    if s is not None:
+        return s
+    with _lock:
+        s = _sessions.get(name)
+        if s is None:
+            s = _build_session(name)
+            _sessions[name] = s
+    return s
+
+
+def get_async_client(name: str = "default", base_url: str = "") -> httpx.AsyncClient:
+    """Cliente httpx async compartido por nombre (mismos límites de pool y timeouts)."""
+    c = _async_clients.get(name)
+    if c is not None:
+        return c
+
+    async def _count(_request):
+        _async_requests[name] = _async_requests.get(name, 0) + 1
+
+    connect, read = _timeout()
+    c = httpx.AsyncClient(
+        base_url=base_url,
+        headers={"User-Agent": USER_AGENT},
+        timeout=httpx.Timeout(read, connect=connect),
+        limits=httpx.Limits(
+            max_connections=settings.http_pool_maxsize * settings.http_pool_hosts,
+            max_keepalive_connections=settings.http_pool_maxsize,
+        ),
+        # httpx sólo reintenta fallos de conexión (seguro también para POST)
+        transport=httpx.AsyncHTTPTransport(retries=settings.http_retries),
+        event_hooks={"request": [_count]},
+    )
+    _async_clients[name] = c
+    return c
+
+
+def _pool_info(pool: Any) -> Dict[str, Any]:
+    q = getattr(pool, "pool", None)
+    maxsize = getattr(q, "maxsize", 0) or 0
+    queued = list(getattr(q, "queue", []) or [])
+    idle = sum(1 for c in queued if c is not None)
+    # El pool de urllib3 arranca con `maxsize` huecos vacíos; lo que falta está prestado
+    active = max(0, maxsize - len(queued))
+    opened = int(getattr(pool, "num_connections", 0) or 0)
+    reqs = int(getattr(pool, "num_requests", 0) or 0)
+    return {
+        "host": f"{getattr(pool, 'scheme', '')}://{getattr(pool, 'host', '')}:{getattr(pool, 'port', '')}",
+        "active": active,
+        "idle": idle,
+        "maxsize": maxsize,
+        "connections_opened": opened,
+        "requests": reqs,
+        "reuse_ratio": round(1.0 - opened / reqs, 3) if reqs else None,
+    }
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Métricas por pool y host: conexiones activas/ociosas, abiertas, peticiones y reutilización."""
+    out: Dict[str, Any] = {}
+    for name, s in list(_sessions.items()):
+        hosts = []
+        seen = set()
+        for adapter in s.adapters.values():
+            if id(adapter) in seen:
+                continue
+            seen.add(id(adapter))
+            pools = getattr(adapter.poolmanager, "pools", None)
+            if pools is None:
+                continue
+            try:
+                keys = list(pools.keys())
+            except Exception:
+                keys = []
+            for k in keys:
+                p = pools.get(k)
+                if p is not None:
+                    hosts.append(_pool_info(p))
+        opened = sum(h["connections_opened"] for h in hosts)
+        reqs = sum(h["requests"] for h in hosts)
+        out[name] = {
+            "hosts": hosts,
+            "active": sum(h["active"] for h in hosts),
+            "idle": sum(h["idle"] for h in hosts),
+            "requests": reqs,
+            "reuse_ratio": round(1.0 - opened / reqs, 3) if reqs else None,
+        }
+    for name in list(_async_clients.keys()):
+        out.setdefault(f"{name}_async", {})["requests"] = _async_requests.get(name, 0)
+    out["config"] = {
+        "pool_maxsize": settings.http_pool_maxsize,
+        "pool_hosts": settings.http_pool_hosts,
+        "pool_block": settings.http_pool_block,
+        "retries": settings.http_retries,
+        "backoff_seconds": settings.http_backoff_seconds,
+        "connect_timeout_seconds": settings.http_connect_timeout_seconds,
+        "read_timeout_seconds": settings.http_read_timeout_seconds,
+    }
+    return out
+
+
+def close_sessions() -> None:
+    """Cierra las sesiones síncronas (shutdown)."""
+    with _lock:
+        for s in _sessions.values():
+            try:
+                s.close()
+            except Exception:
+                pass
+        _sessions.clear()
+
+
+async def close_async_clients() -> None:
+    """Cierra los clientes httpx async (shutdown)."""
+    for c in list(_async_clients.values()):
+        try:
+            await c.aclose()
+        except Exception as e:
+            _log.warning("No se pudo cerrar cliente HTTP async: %s", e)
+    _async_clients.clear()
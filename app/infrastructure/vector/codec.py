@@ -0,0 +1,106 @@
+"""Codificación compacta de embeddings en BSON `binData`.
+
+Formatos de `library_chunk.embedding`:
+
+- "array": lista de doubles (histórico; ~14 KB por vector de 1536 dims). Es el
+  único que entiende Atlas `$search`/knnBeta.
+- "float32": BSON vector (subtipo 9, dtype FLOAT32): 4 bytes por componente, el
+  formato estándar que también leen otros drivers y Atlas `$vectorSearch`.
+- "float16": subtipo 128 con cabecera de 8 bytes + componentes half float (2 bytes).
+- "int8": subtipo 128, cuantización escalar simétrica por vector
+  (q = round(v / escala), escala = max|v| / 127) con la escala en la cabecera (1 byte).
+  El coseno apenas cambia: la escala es común a todo el vector.
+
+`decode` devuelve un `np.ndarray` sobre el buffer (`np.frombuffer`, sin convertir
+componente a componente en Python); float16/int8 se expanden a float32 al apilar
+la matriz del índice local.
+"""
+from __future__ import annotations
+
+import struct
+from typing import Any, Optional
+
+import numpy as np
+from bson.binary import Binary
+
+from app.core.config import settings
+
+FORMATS = ("array", "float32", "float16", "int8")
+
+VECTOR_SUBTYPE = 9  # BSON binary vector
+_FLOAT32_DTYPE = 0x27
+_INT8_DTYPE = 0x03
+
+_CUSTOM_SUBTYPE = 128  # definido por el usuario
+_F16 = 1
+_I8 = 2
+_HEADER = struct.Struct("<B3xf")  # código de formato, relleno, escala (8 bytes: datos alineados)
+
+
+def storage_format() -> str:
+    """Formato para chunks nuevos según `RAG_EMBEDDING_FORMAT`.
+
+    "auto": float16 con el índice local, "array" con Atlas (knnBeta no indexa binData).
+    """
+    fmt = str(getattr(settings, "rag_embedding_format", "auto") or "auto").strip().lower()
+    if fmt == "auto":
+        backend = str(getattr(settings, "rag_vector_backend", "atlas") or "atlas").strip().lower()
+        return "float16" if backend == "local" else "array"
+    if fmt not in FORMATS:
+        raise ValueError(f"RAG_EMBEDDING_FORMAT desconocido: {fmt}")
+    return fmt
+
+
+def encode(vector: Any, fmt: Optional[str] = None) -> Any:
+    """Codifica un vector (lista o ndarray) en el formato indicado (o el configurado)."""
+    fmt = fmt or storage_format()
+    if fmt == "array":
+        return np.asarray(vector, dtype=np.float64).ravel().tolist()
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    if fmt == "float32":
+        return Binary(bytes((_FLOAT32_DTYPE, 0)) + v.astype("<f4").tobytes(), VECTOR_SUBTYPE)
+    if fmt == "float16":
+        return Binary(_HEADER.pack(_F16, 1.0) + v.astype("<f2").tobytes(), _CUSTOM_SUBTYPE)
+    if fmt == "int8":
+        peak = float(np.max(np.abs(v))) if v.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        q = np.clip(np.rint(v / scale), -127, 127).astype(np.int8)
+        return Binary(_HEADER.pack(_I8, scale) + q.tobytes(), _CUSTOM_SUBTYPE)
+    raise ValueError(f"Formato de embedding desconocido: {fmt}")
+
+
+def decode(value: Any) -> Optional[np.ndarray]:
+    """Vector como ndarray (vista float32/float16 o int8 ya escalado); None si no hay."""
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        return value
+    if isinstance(value, Binary):
+        if value.subtype == VECTOR_SUBTYPE:
+            dtype = value[0]
+            if dtype == _FLOAT32_DTYPE:
+                return np.frombuffer(value, dtype="<f4", offset=2)
+            if dtype == _INT8_DTYPE:
+                return np.frombuffer(value, dtype=np.int8, offset=2).astype(np.float32)
+            raise ValueError(f"BSON vector con dtype no soportado: {dtype:#x}")
+        if value.subtype == _CUSTOM_SUBTYPE:
+            code, scale = _HEADER.unpack_from(value)
+            if code == _F16:
+                return np.frombuffer(value, dtype="<f2", offset=_HEADER.size)
+            if code == _I8:
+                return np.frombuffer(value, dtype=np.int8, offset=_HEADER.size).astype(np.float32) * np.float32(scale)
+        raise ValueError(f"binData no reconocido como embedding (subtipo {value.subtype})")
+    return np.asarray(value, dtype=np.float32)
+
+
+def format_of(value: Any) -> Optional[str]:
+    """Formato de un valor ya almacenado (None si no hay embedding)."""
+    if value is None:
+        return None
+    if isinstance(value, Binary):
+        if value.subtype == VECTOR_SUBTYPE and value[0] == _FLOAT32_DTYPE:
+            return "float32"
+        if value.subtype == _CUSTOM_SUBTYPE:
+            return {_F16: "float16", _I8: "int8"}.get(value[0])
+        return None
+    return "array"
@@ -0,0 +1,114 @@
+"""Filtros de metadatos para la recuperación RAG (antes de puntuar).
+
+`ChunkFilter` describe qué chunks compiten por el top-k y se traduce a:
+
+- `atlas()`: operador `filter` de knnBeta (Atlas Search filtra antes del KNN);
+- `mongo()`: condiciones `find`/`$match` (búsqueda `$text` del híbrido);
+- en el índice local, `LocalVectorIndex.search(where=...)` arma una máscara de
+  filas con índices invertidos por tag/sección/tipo y columnas de vigencia, y
+  sólo multiplica esas filas.
+
+Semántica: cada lista (tags, secciones, tipos) exige al menos una coincidencia;
+`valid_on` deja pasar chunks cuyo `meta.scope` incluye ese día (un extremo
+ausente no limita). Los chunks sin `meta.scope` siempre pasan.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def scope_day(value: Any) -> Optional[datetime]:
+    """Fecha de vigencia (date, datetime o "YYYY-MM-DD...") como datetime a medianoche; None si no hay."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def normalize_scope(scope: Any) -> Optional[Dict[str, Optional[datetime]]]:
+    """`library_doc.scope` ({from, to} en fecha o texto) → {from, to} en BSON date, o None."""
+    if not isinstance(scope, dict):
+        return None
+    out = {"from": scope_day(scope.get("from")), "to": scope_day(scope.get("to"))}
+    return out if out["from"] or out["to"] else None
+
+
+def _clean(values: Any, *, lower: bool = True) -> Tuple[str, ...]:
+    if not values:
+        return ()
+    if isinstance(values, str):
+        values = [values]
+    items = (str(v).strip() for v in values)
+    return tuple(dict.fromkeys((v.lower() if lower else v) for v in items if v))
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    tags: Tuple[str, ...] = ()
+    sections: Tuple[str, ...] = ()
+    kinds: Tuple[str, ...] = ()
+    valid_on: Optional[date] = None
+
+    @classmethod
+    def of(cls, *, tags: Any = None, sections: Any = None, kinds: Any = None, valid_on: Optional[date] = None) -> "ChunkFilter":
+        """Construye el filtro normalizando listas (sin duplicados; tags y tipos en minúsculas)."""
+        return cls(tags=_clean(tags), sections=_clean(sections, lower=False), kinds=_clean(kinds), valid_on=valid_on)
+
+    def __bool__(self) -> bool:
+        return bool(self.tags or self.sections or self.kinds or self.valid_on)
+
+    def without_tags(self) -> "ChunkFilter":
+        return replace(self, tags=())
+
+    def key(self) -> str:
+        """Representación estable para claves de caché."""
+        if not self:
+            return ""
+        return "|".join([
+            ",".join(self.tags),
+            ",".join(self.sections),
+            ",".join(self.kinds),
+            self.valid_on.isoformat() if self.valid_on else "",
+        ])
+
+    def atlas(self) -> Optional[Dict[str, Any]]:
+        """Operador `filter` de knnBeta (compound de Atlas Search) o None sin condiciones."""
+        must: List[Dict[str, Any]] = []
+        for path, values in (("meta.tags", self.tags), ("meta.section", self.sections), ("meta.kind", self.kinds)):
+            if values:
+                must.append({"in": {"path": path, "value": list(values)}})
+        day = scope_day(self.valid_on)
+        if day is not None:
+            for path, op in (("meta.scope.from", "lte"), ("meta.scope.to", "gte")):
+                must.append({
+                    "compound": {
+                        "should": [
+                            {"range": {"path": path, op: day}},
+                            {"compound": {"mustNot": [{"exists": {"path": path}}]}},
+                        ],
+                        "minimumShouldMatch": 1,
+                    }
+                })
+        return {"compound": {"filter": must}} if must else None
+
+    def mongo(self) -> Dict[str, Any]:
+        """Condiciones equivalentes para `find`/`$match` ({} sin condiciones)."""
+        flt: Dict[str, Any] = {}
+        for path, values in (("meta.tags", self.tags), ("meta.section", self.sections), ("meta.kind", self.kinds)):
+            if values:
+                flt[path] = {"$in": list(values)}
+        day = scope_day(self.valid_on)
+        if day is not None:
+            flt["$and"] = [
+                {"$or": [{"meta.scope.from": None}, {"meta.scope.from": {"$lte": day}}]},
+                {"$or": [{"meta.scope.to": None}, {"meta.scope.to": {"$gte": day}}]},
+            ]
+        return flt
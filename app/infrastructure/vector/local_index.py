@@ -0,0 +1,259 @@
+"""Índice vectorial local en memoria (NumPy) para chunks RAG.
+
+Alternativa a Atlas `$search`/knnBeta: mantiene todos los embeddings en una
+matriz float32 contigua con filas normalizadas y responde top-k por coseno con
+un solo producto matriz-vector + `argpartition`.
+
+Las mutaciones construyen un estado nuevo y lo intercambian de forma atómica;
+las búsquedas leen el estado vigente sin tomar el lock.
+
+Con `where` (`ChunkFilter`) la búsqueda arma primero una máscara de filas desde
+columnas de metadatos (índices invertidos por tag/sección/tipo y vigencia como
+ordinales de día) y sólo puntúa esas filas. Las columnas se derivan del estado
+vigente la primera vez que se filtra y se descartan al mutarlo.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.infrastructure.vector.filters import ChunkFilter, scope_day
+
+_log = logging.getLogger("aura.vector")
+
+# (matriz normalizada, metadatos paralelos a las filas)
+_State = Tuple[np.ndarray, List[Dict[str, Any]]]
+
+
+class _Columns:
+    """Metadatos de las filas en forma columnar para enmascarar sin recorrer `metas`."""
+
+    _NO_FROM = np.iinfo(np.int32).min
+    _NO_TO = np.iinfo(np.int32).max
+
+    def __init__(self, metas: List[Dict[str, Any]]) -> None:
+        self.n = len(metas)
+        self.tags: Dict[str, List[int]] = {}
+        self.sections: Dict[str, List[int]] = {}
+        self.kinds: Dict[str, List[int]] = {}
+        self.scope_from = np.full(self.n, self._NO_FROM, dtype=np.int32)
+        self.scope_to = np.full(self.n, self._NO_TO, dtype=np.int32)
+        for i, x in enumerate(metas):
+            meta = x.get("meta") or {}
+            for t in dict.fromkeys(str(t).lower() for t in (meta.get("tags") or [])):
+                self.tags.setdefault(t, []).append(i)
+            if meta.get("section"):
+                self.sections.setdefault(str(meta["section"]), []).append(i)
+            if meta.get("kind"):
+                self.kinds.setdefault(str(meta["kind"]).lower(), []).append(i)
+            scope = meta.get("scope") or {}
+            start, end = scope_day(scope.get("from")), scope_day(scope.get("to"))
+            if start is not None:
+                self.scope_from[i] = start.toordinal()
+            if end is not None:
+                self.scope_to[i] = end.toordinal()
+
+    def _any_of(self, inverted: Dict[str, List[int]], values: Tuple[str, ...]) -> np.ndarray:
+        mask = np.zeros(self.n, dtype=bool)
+        for v in values:
+            rows = inverted.get(v)
+            if rows:
+                mask[rows] = True
+        return mask
+
+    def mask(self, where: ChunkFilter) -> np.ndarray:
+        mask = np.ones(self.n, dtype=bool)
+        if where.tags:
+            mask &= self._any_of(self.tags, where.tags)
+        if where.sections:
+            mask &= self._any_of(self.sections, where.sections)
+        if where.kinds:
+            mask &= self._any_of(self.kinds, where.kinds)
+        day = scope_day(where.valid_on)
+        if day is not None:
+            d = day.toordinal()
+            mask &= (self.scope_from <= d) & (self.scope_to >= d)
+        return mask
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    m /= norms
+    return m
+
+
+class LocalVectorIndex:
+    """Índice coseno exacto sobre una matriz (N x dims) float32."""
+
+    def __init__(self, dims: int | None = None) -> None:
+        self._lock = threading.RLock()
+        self._dims = int(dims or 0)
+        self._state: _State = (np.zeros((0, self._dims), dtype=np.float32), [])
+        self.ready = False
+        self.loaded_at = 0.0
+        self.signature: Any = None
+        # (estado del que se derivaron, columnas) para filtrar por metadatos
+        self._columns: Tuple[Any, Optional[_Columns]] = (None, None)
+
+    # --- Construcción ---
+    def _build(self, rows: Iterable[Dict[str, Any]]) -> _State:
+        metas: List[Dict[str, Any]] = []
+        vecs: List[Any] = []
+        for r in rows:
+            v = r.get("embedding")
+            if v is None or len(v) == 0:
+                continue
+            if not self._dims:
+                self._dims = len(v)
+            if len(v) != self._dims:
+                continue
+            vecs.append(v)
+            metas.append({
+                "doc_id": str(r.get("doc_id")),
+                "chunk_index": int(r.get("chunk_index", 0)),
+                "text": r.get("text") or "",
+                "meta": r.get("meta") or {},
+            })
+        if not vecs:
+            return (np.zeros((0, self._dims), dtype=np.float32), [])
+        # Filas como listas o ndarray (float32/float16 decodificados de binData): se
+        # copian a una matriz float32 preasignada, sin conversión por componente
+        m = np.empty((len(vecs), self._dims), dtype=np.float32)
+        for i, v in enumerate(vecs):
+            m[i] = v
+        return (_normalize_rows(m), metas)
+
+    def load(self, rows: Iterable[Dict[str, Any]], *, signature: Any = None) -> int:
+        """Reemplaza todo el contenido del índice. Devuelve filas cargadas."""
+        t0 = time.perf_counter()
+        state = self._build(rows)
+        with self._lock:
+            self._state = state
+            self.ready = True
+            self.loaded_at = time.time()
+            self.signature = signature
+        n = state[0].shape[0]
+        _log.info("Índice vectorial local cargado: rows=%s dims=%s ms=%s", n, self._dims, int((time.perf_counter() - t0) * 1000))
+        return n
+
+    def replace_doc(self, doc_id: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Sustituye las filas de un documento por `rows` (ingesta incremental)."""
+        did = str(doc_id)
+        new_m, new_meta = self._build({**r, "doc_id": did} for r in rows)
+        with self._lock:
+            m, metas = self._state
+            keep = [i for i, x in enumerate(metas) if x["doc_id"] != did]
+            base_m = m[keep] if len(keep) != len(metas) else m
+            base_meta = [metas[i] for i in keep]
+            if new_m.shape[0]:
+                merged = np.ascontiguousarray(np.vstack([base_m.reshape(-1, self._dims), new_m]))
+            else:
+                merged = np.ascontiguousarray(base_m)
+            self._state = (merged, base_meta + new_meta)
+        return new_m.shape[0]
+
+    def update_meta(self, doc_id: str, fields: Dict[str, Any]) -> int:
+        """Fusiona `fields` en `meta` de las filas de un documento (p.ej. tags editadas)."""
+        did = str(doc_id)
+        n = 0
+        with self._lock:
+            _m, metas = self._state
+            for x in metas:
+                if x["doc_id"] == did:
+                    x["meta"] = {**(x.get("meta") or {}), **fields}
+                    n += 1
+            if n:
+                self._columns = (None, None)
+        return n
+
+    def remove_where(self, pred: Callable[[Dict[str, Any]], bool]) -> int:
+        """Elimina filas cuyo metadato cumple `pred`. Devuelve filas eliminadas."""
+        with self._lock:
+            m, metas = self._state
+            keep = [i for i, x in enumerate(metas) if not pred(x)]
+            removed = len(metas) - len(keep)
+            if removed:
+                self._state = (np.ascontiguousarray(m[keep]), [metas[i] for i in keep])
+        return removed
+
+    def remove_doc(self, doc_id: str) -> int:
+        did = str(doc_id)
+        return self.remove_where(lambda x: x["doc_id"] == did)
+
+    # --- Consulta ---
+    def _columns_for(self, state: _State) -> _Columns:
+        owner, cols = self._columns
+        if owner is state and cols is not None:
+            return cols
+        cols = _Columns(state[1])
+        with self._lock:
+            # Sólo se guarda si el estado no cambió mientras se construía
+            if self._state is state:
+                self._columns = (state, cols)
+        return cols
+
+    def search(self, vector: List[float], k: int = 5, *, where: Optional[ChunkFilter] = None) -> List[Dict[str, Any]]:
+        """Top-k por similitud coseno entre las filas que cumplen `where` (todas si es None).
+
+        `score` se reporta como (1 + cos) / 2, igual que Atlas con similarity=cosine.
+        """
+        return self.search_many([vector], k, where=where)[0]
+
+    def search_many(self, vectors: List[List[float]], k: int = 5, *, where: Optional[ChunkFilter] = None) -> List[List[Dict[str, Any]]]:
+        """Top-k de varias consultas con un solo producto matriz-matriz (una lista por consulta)."""
+        state = self._state
+        m, metas = state
+        n = m.shape[0]
+        if n == 0 or k <= 0 or not vectors:
+            return [[] for _ in vectors]
+        q = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        if q.shape[1] != m.shape[1]:
+            raise ValueError(f"Dimensión de consulta {q.shape[1]} != índice {m.shape[1]}")
+        qn = np.linalg.norm(q, axis=1)
+        live = qn > 0
+        rows: Optional[np.ndarray] = None
+        if where:
+            rows = np.flatnonzero(self._columns_for(state).mask(where))
+            if rows.size == 0:
+                return [[] for _ in vectors]
+            if rows.size < n:
+                m = m[rows]
+            else:
+                rows = None
+        qn[~live] = 1.0
+        sims_all = m @ (q / qn[:, None]).T
+        n = sims_all.shape[0]
+        kk = min(int(k), n)
+        out: List[List[Dict[str, Any]]] = []
+        for j in range(q.shape[0]):
+            if not live[j]:
+                out.append([])
+                continue
+            sims = sims_all[:, j]
+            idx = np.argpartition(sims, n - kk)[n - kk:] if kk < n else np.arange(n)
+            idx = idx[np.argsort(sims[idx])[::-1]]
+            hits: List[Dict[str, Any]] = []
+            for i in idx:
+                row = metas[int(rows[i]) if rows is not None else int(i)]
+                hits.append({**row, "score": float((1.0 + sims[i]) / 2.0)})
+            out.append(hits)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        m, _ = self._state
+        return {
+            "ready": self.ready,
+            "rows": int(m.shape[0]),
+            "dims": int(self._dims),
+            "bytes": int(m.nbytes),
+            "loaded_at": self.loaded_at,
+        }
+
+
+# Instancia de proceso (la usa `library_chunk_repo` cuando RAG_VECTOR_BACKEND=local)
+vector_index = LocalVectorIndex()
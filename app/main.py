@@ -1,7 +1,10 @@
 """Entrada principal de la app FastAPI (configura middlewares, excepciones y routers)."""
+import asyncio
 from fastapi import FastAPI
 from app.core.config import settings
-from app.infrastructure.db.mongo import init_mongo, db_ready
+from app.infrastructure.db.mongo import init_mongo, db_ready, close_async_mongo
+from app.infrastructure.db.write_queue import write_queue
+from app.infrastructure.http.client import close_sessions, close_async_clients
 from app.infrastructure.db.bootstrap import ensure_collections
 from app.api.router import api_router
 from app.core.logging import setup_logging
@@ -30,6 +33,37 @@ def on_startup():
     except Exception as e:
         # No impedir el arranque si fallan validadores/índices
         _log.warning("ensure_collections() falló: %s", e)
+    # Jobs de ingesta que quedaron "running" porque su proceso murió
+    if db_ready():
+        try:
+            from app.services.rag_job_service import recover_stale_jobs
+            recover_stale_jobs()
+        except Exception as e:
+            _log.warning("No se pudieron revisar jobs de ingesta interrumpidos: %s", e)
+    # Índice vectorial local (RAG_VECTOR_BACKEND=local): precarga embeddings
+    if (settings.rag_vector_backend or "").strip().lower() == "local" and db_ready():
+        try:
+            from app.repositories.library_chunk_repo import load_local_index
+            load_local_index()
+        except Exception as e:
+            _log.warning("No se pudo cargar el índice vectorial local: %s", e)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Drena la cola de escritura diferida antes de cerrar conexiones
+    try:
+        await asyncio.to_thread(write_queue.stop)
+    except Exception as e:
+        _log.warning("No se pudo drenar la cola de escritura: %s", e)
+    # Cierra el cliente async de Mongo (rutas async del chat)
+    try:
+        await close_async_mongo()
+    except Exception as e:
+        _log.warning("No se pudo cerrar Mongo async: %s", e)
+    # Libera los pools HTTP compartidos
+    await close_async_clients()
+    close_sessions()
 
 # Monta routers bajo el prefijo configurado
 app.include_router(api_router, prefix=settings.api_prefix_normalized or (settings.api_prefix or ""))
@@ -8,6 +8,7 @@ from datetime import datetime, timezone
 from app.infrastructure.db.mongo import get_db
 from bson import ObjectId
 from .academics_timetables_repo import set_shift_if_missing
+from .app_state_repo import TIMETABLES, bump_version
 
 COLL = "timetable_entry"
 
@@ -53,6 +54,8 @@ def insert_entries_bulk(timetable_id: str, entries: List[Dict[str, Any]]) -> int
         set_shift_if_missing(timetable_id, inferred)
     except Exception:
         pass
+    # Los índices de horarios en memoria se recargan al ver la nueva versión
+    bump_version(TIMETABLES, f"entries:{timetable_id}")
     return len(data)
 
 
@@ -2,6 +2,7 @@
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timezone
 from app.infrastructure.db.mongo import get_db
+from app.repositories.app_state_repo import TIMETABLES, bump_version
 from bson import ObjectId
 
 COLL = "timetable"
@@ -63,6 +64,8 @@ def publish_timetable(timetable_id: str) -> None:
         {"_id": ObjectId(timetable_id)},
         {"$set": {"status": "published", "is_current": True, "published_at": now, "updated_at": now}},
     )
+    # Los índices de horarios en memoria se recargan al ver la nueva versión
+    bump_version(TIMETABLES, f"publish:{timetable_id}")
 
 
 def list_timetables(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
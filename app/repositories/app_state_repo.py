@@ -0,0 +1,83 @@
+"""Contadores de versión de datos de referencia (`app_state`).
+
+Un documento por clave (`_id: "timetables"`, `"holidays"`, `"corpus"`, ...) con
+`version` que se incrementa cada vez que esos datos cambian. Los índices en memoria
+guardan la versión con la que se construyeron y se recargan cuando cambia,
+así una publicación hecha en un worker (o un script) llega a todos.
+
+La versión `corpus` cambia con cada cambio de chunks RAG (ingesta o borrado); las
+cachés de respuestas la incluyen en su clave, así que invalida lo anterior en
+todos los workers.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.infrastructure.db.mongo import get_db
+
+COLL = "app_state"
+
+# Claves conocidas
+TIMETABLES = "timetables"
+HOLIDAYS = "holidays"
+CORPUS = "corpus"
+
+_log = logging.getLogger("aura.app_state")
+_lock = threading.Lock()
+# clave → (versión, instante monotónico de la última lectura)
+_cached: Dict[str, Tuple[int, float]] = {}
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def get_version(key: str, max_age_seconds: float = 5.0) -> int:
+    """Versión de `key`; se relee de Mongo como mucho cada `max_age_seconds`."""
+    now = time.monotonic()
+    version, checked = _cached.get(key, (0, float("-inf")))
+    if max_age_seconds > 0 and now - checked < max_age_seconds:
+        return version
+    try:
+        doc = get_db()[COLL].find_one({"_id": key}, {"version": 1}) or {}
+        version = int(doc.get("version") or 0)
+    except Exception as e:
+        _log.warning("No se pudo leer la versión de %s: %s", key, e)
+    # También tras un error: no reintenta en cada consulta
+    with _lock:
+        _cached[key] = (version, now)
+    return version
+
+
+def bump_version(key: str, reason: str = "") -> int:
+    """Incrementa la versión de `key` y la deja vigente en este proceso."""
+    try:
+        doc = get_db()[COLL].find_one_and_update(
+            {"_id": key},
+            {"$inc": {"version": 1}, "$set": {"updated_at": _now_iso(), "reason": reason}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        ) or {}
+        version = int(doc.get("version") or 0)
+    except Exception as e:
+        _log.warning("No se pudo incrementar la versión de %s: %s", key, e)
+        version = _cached.get(key, (0, 0.0))[0] + 1
+    with _lock:
+        _cached[key] = (version, time.monotonic())
+    return version
+
+
+def get_corpus_version() -> int:
+    """Versión del corpus RAG; se relee como mucho cada `rag_corpus_version_check_seconds`."""
+    return get_version(CORPUS, float(getattr(settings, "rag_corpus_version_check_seconds", 5) or 0))
+
+
+def bump_corpus_version(reason: str = "") -> int:
+    return bump_version(CORPUS, reason)
@@ -5,7 +5,7 @@
 """
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone
-from app.infrastructure.db.mongo import get_db
+from app.infrastructure.db.mongo import get_async_db, get_db
 from bson import ObjectId
 
 COLLECTION = "conversations"
@@ -15,9 +15,7 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def insert_conversation(doc: Dict[str, Any]) -> str:
-    """Inserta conversación con defaults y devuelve id (str)."""
-    db = get_db()
+def _conversation_defaults(doc: Dict[str, Any]) -> Dict[str, Any]:
     data = dict(doc)
     now = _now_iso()
     # Defaults
@@ -29,8 +27,20 @@ def insert_conversation(doc: Dict[str, Any]) -> str:
     data.setdefault("last_message_at", now)
     data.setdefault("created_at", now)
     data["updated_at"] = now
+    return data
+
+
+def insert_conversation(doc: Dict[str, Any]) -> str:
+    """Inserta conversación con defaults y devuelve id (str)."""
+    db = get_db()
+    res = db[COLLECTION].insert_one(_conversation_defaults(doc))
+    return str(res.inserted_id)
+
 
-    res = db[COLLECTION].insert_one(data)
+async def insert_conversation_async(doc: Dict[str, Any]) -> str:
+    """Variante async de `insert_conversation`."""
+    db = get_async_db()
+    res = await db[COLLECTION].insert_one(_conversation_defaults(doc))
     return str(res.inserted_id)
 
 
@@ -1,18 +1,56 @@
 """Repositorio para chunks y embeddings de documentos (RAG).
 
 Guarda los fragmentos de texto por documento y su embedding asociado
-para consulta con Atlas Vector Search.
+para consulta con Atlas Vector Search o con el índice local en memoria
+(`RAG_VECTOR_BACKEND=local`).
+
+`hybrid_search` suma una búsqueda léxica (`$text` sobre el índice
+`txt_chunk_text`) a la vectorial y fusiona ambos rankings con reciprocal rank
+fusion, para que tokens exactos (nombres, correos, siglas como "DASC") suban
+aunque su embedding no quede entre los más cercanos.
+
+Los embeddings se guardan en el formato de `RAG_EMBEDDING_FORMAT` (lista de
+doubles o `binData` float32/float16/int8, ver `vector.codec`); las lecturas los
+decodifican de forma transparente, así conviven chunks en formatos distintos
+(p.ej. durante `scripts/migrate_chunk_embeddings.py`).
+
+Todas las búsquedas aceptan `where` (`ChunkFilter`: tags, sección, tipo de
+documento, vigencia `meta.scope`) que se aplica antes de puntuar: `filter` de
+knnBeta en Atlas, máscara de filas en el índice local y condición adicional en `$text`.
+
+Multi-consulta: `knn_search_many` resuelve varios vectores (la pregunta y sus
+reformulaciones) de una vez —un producto matriz-matriz en el índice local,
+consultas en paralelo en Atlas— y `fuse_by_score` los une quedándose con el
+mejor score de cada chunk (mismo modelo de embeddings: scores comparables).
 """
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 from datetime import datetime, timezone
+import asyncio
+import contextvars
+import logging
+import re
+import threading
+import time
 from bson import ObjectId
 
-from app.infrastructure.db.mongo import get_db
+from app.core.config import settings
+from app.core.profiling import timed
+from app.infrastructure.db.mongo import get_async_db, get_db
+from app.infrastructure.vector import codec
+from app.infrastructure.vector.filters import ChunkFilter
+from app.infrastructure.vector.local_index import vector_index
+from app.repositories.app_state_repo import bump_corpus_version
 
 COLL = "library_chunk"
 
+_log = logging.getLogger("aura.rag.chunks")
+_load_lock = threading.Lock()
+_last_refresh_check = 0.0
+_atlas_pool: Optional[ThreadPoolExecutor] = None
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -23,6 +61,10 @@ def delete_by_doc_id(doc_id: str) -> int:
     db = get_db()
     oid = ObjectId(doc_id)
     res = db[COLL].delete_many({"doc_id": oid})
+    if vector_index.ready:
+        vector_index.remove_doc(doc_id)
+    if res.deleted_count:
+        bump_corpus_version(f"delete:{doc_id}")
     return int(res.deleted_count)
 
 
@@ -37,17 +79,40 @@ def delete_by_title(title: str, *, regex: bool = False) -> int:
         return 0
     filtro = {"meta.title": title} if not regex else {"meta.title": {"$regex": title, "$options": "i"}}
     res = db[COLL].delete_many(filtro)
+    if vector_index.ready:
+        if regex:
+            rx = re.compile(title, re.IGNORECASE)
+            vector_index.remove_where(lambda x: bool(rx.search(str((x.get("meta") or {}).get("title") or ""))))
+        else:
+            vector_index.remove_where(lambda x: (x.get("meta") or {}).get("title") == title)
+    if res.deleted_count:
+        bump_corpus_version(f"delete_title:{title}")
     return int(res.deleted_count)
 
 
+def set_chunks_meta(doc_id: str, fields: Dict[str, Any]) -> int:
+    """Actualiza campos desnormalizados en `meta` de todos los chunks de un documento (p.ej. tags)."""
+    if not fields:
+        return 0
+    db = get_db()
+    res = db[COLL].update_many({"doc_id": ObjectId(doc_id)}, {"$set": {f"meta.{k}": v for k, v in fields.items()}})
+    if vector_index.ready:
+        vector_index.update_meta(doc_id, fields)
+    if res.modified_count:
+        bump_corpus_version(f"meta:{doc_id}")
+    return int(res.modified_count)
+
+
 def bulk_insert_chunks(doc_id: str, chunks: Iterable[Dict[str, Any]]) -> int:
     """Inserta en bloque chunks ya procesados para un documento.
 
     Cada item debe incluir: chunk_index (int), text (str),
     y opcionalmente: page (int), embedding (list[float]), meta (dict).
+    El embedding se codifica según `RAG_EMBEDDING_FORMAT`.
     """
     db = get_db()
     now = _now_iso()
+    fmt = codec.storage_format()
     oid = ObjectId(doc_id)
     docs: List[Dict[str, Any]] = []
     for c in chunks:
@@ -61,9 +126,12 @@ def bulk_insert_chunks(doc_id: str, chunks: Iterable[Dict[str, Any]]) -> int:
         if "page" in c:
             d["page"] = int(c["page"]) if c["page"] is not None else None
         if "embedding" in c:
-            d["embedding"] = [float(x) for x in (c["embedding"] or [])]
+            v = c["embedding"]
+            d["embedding"] = codec.encode(v, fmt) if v is not None and len(v) else None
         if "meta" in c:
             d["meta"] = dict(c["meta"]) if c["meta"] is not None else None
+        if c.get("text_hash"):
+            d["text_hash"] = str(c["text_hash"])
         docs.append(d)
 
     if not docs:
@@ -72,30 +140,133 @@ def bulk_insert_chunks(doc_id: str, chunks: Iterable[Dict[str, Any]]) -> int:
     return len(res.inserted_ids)
 
 
+def replace_chunks(doc_id: str, chunks: List[Dict[str, Any]]) -> int:
+    """Reemplaza los chunks de un documento y sincroniza el índice local.
+
+    El índice en memoria se actualiza de una sola vez tras insertar, para que
+    las consultas concurrentes no vean el documento vacío.
+    """
+    db = get_db()
+    res = db[COLL].delete_many({"doc_id": ObjectId(doc_id)})
+    n = bulk_insert_chunks(doc_id, chunks)
+    if vector_index.ready:
+        vector_index.replace_doc(doc_id, chunks)
+    # Tras sincronizar el índice: una respuesta cacheada con la versión nueva ya ve estos chunks
+    if n or res.deleted_count:
+        bump_corpus_version(f"ingest:{doc_id}")
+    return n
+
+
+def get_embeddings_by_hash(doc_id: str) -> Dict[str, list[float]]:
+    """Devuelve {text_hash: embedding} de los chunks actuales de un documento.
+
+    Permite reutilizar vectores de chunks sin cambios al re-ingestar.
+    """
+    db = get_db()
+    cur = db[COLL].find(
+        {"doc_id": ObjectId(doc_id), "text_hash": {"$exists": True}, "embedding": {"$ne": None}},
+        {"text_hash": 1, "embedding": 1},
+    )
+    out: Dict[str, list[float]] = {}
+    for r in cur:
+        h = r.get("text_hash")
+        if h and h not in out:
+            v = codec.decode(r.get("embedding"))
+            if v is not None:
+                out[str(h)] = v.tolist()
+    return out
+
+
 def count_by_doc_id(doc_id: str) -> int:
     db = get_db()
     oid = ObjectId(doc_id)
     return int(db[COLL].count_documents({"doc_id": oid}))
 
 
-def knn_search(vector: list[float], k: int = 5, index_name: str = "rag_embedding") -> list[dict]:
-    """Consulta vectorial usando Atlas Vector Search ($search knnBeta).
+def iter_chunks_with_embeddings(batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Recorre todos los chunks con embedding (para cargar el índice local).
 
-    Retorna documentos con campos: doc_id (str), chunk_index, text, score.
+    `embedding` sale decodificado como ndarray, cualquiera que sea el formato guardado.
     """
     db = get_db()
-    coll = db[COLL]
-    pipeline = [
-        {
-            "$search": {
-                "index": index_name,
-                "knnBeta": {
-                    "path": "embedding",
-                    "vector": vector,
-                    "k": int(k),
-                },
-            }
-        },
+    projection = {"doc_id": 1, "chunk_index": 1, "text": 1, "meta": 1, "embedding": 1}
+    cur = db[COLL].find({"embedding": {"$ne": None}}, projection).batch_size(int(batch_size))
+    for r in cur:
+        r["embedding"] = codec.decode(r.get("embedding"))
+        yield r
+
+
+def _corpus_signature() -> tuple:
+    """Firma barata del corpus: (conteo, último updated_at)."""
+    db = get_db()
+    n = int(db[COLL].estimated_document_count())
+    last = db[COLL].find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)]) or {}
+    return (n, str(last.get("updated_at") or ""))
+
+
+def load_local_index() -> int:
+    """Carga (o recarga) todos los embeddings en el índice vectorial local."""
+    with _load_lock:
+        sig = _corpus_signature()
+        return vector_index.load(iter_chunks_with_embeddings(), signature=sig)
+
+
+def _maybe_refresh_local_index() -> None:
+    """Recarga en segundo plano si otro proceso/worker cambió el corpus."""
+    global _last_refresh_check
+    every = int(getattr(settings, "rag_local_index_refresh_seconds", 0) or 0)
+    now = time.monotonic()
+    if every <= 0 or now - _last_refresh_check < every:
+        return
+    _last_refresh_check = now
+    try:
+        if _corpus_signature() == vector_index.signature:
+            return
+    except Exception:
+        return
+
+    def _reload() -> None:
+        try:
+            load_local_index()
+        except Exception as e:  # pragma: no cover
+            _log.warning("No se pudo recargar índice local: %s", e)
+
+    threading.Thread(target=_reload, name="aura-vector-reload", daemon=True).start()
+
+
+@timed("rag.knn")
+def knn_search(vector: list[float], k: int = 5, index_name: str = "rag_embedding", *, where: Optional[ChunkFilter] = None) -> list[dict]:
+    """Consulta vectorial top-k según `settings.rag_vector_backend`.
+
+    - "local": índice NumPy en memoria (se carga perezosamente si hace falta).
+    - "atlas": Atlas Vector Search ($search knnBeta).
+    Si el índice local no está disponible y `rag_vector_atlas_fallback` es True, usa Atlas.
+    Con `where` sólo compiten los chunks que cumplen el filtro.
+
+    Retorna documentos con campos: doc_id (str), chunk_index, text, meta, score.
+    """
+    backend = str(getattr(settings, "rag_vector_backend", "atlas") or "atlas").strip().lower()
+    if backend == "local":
+        if not vector_index.ready:
+            try:
+                load_local_index()
+            except Exception as e:
+                _log.warning("Índice local no disponible: %s", e)
+        if vector_index.ready:
+            _maybe_refresh_local_index()
+            return vector_index.search(vector, k=int(k), where=where)
+        if not getattr(settings, "rag_vector_atlas_fallback", True):
+            return []
+    return _knn_atlas(vector, k=k, index_name=index_name, where=where)
+
+
+def _atlas_pipeline(vector: list[float], k: int, index_name: str, where: Optional[ChunkFilter] = None) -> list[dict]:
+    knn: Dict[str, Any] = {"path": "embedding", "vector": vector, "k": int(k)}
+    flt = where.atlas() if where else None
+    if flt:
+        knn["filter"] = flt
+    return [
+        {"$search": {"index": index_name, "knnBeta": knn}},
         {
             "$project": {
                 "doc_id": 1,
@@ -107,19 +278,133 @@ def knn_search(vector: list[float], k: int = 5, index_name: str = "rag_embedding
         },
         {"$limit": int(k)},
     ]
-    rows = list(coll.aggregate(pipeline))
-    out: list[dict] = []
-    for r in rows:
-        out.append(
-            {
-                "doc_id": str(r.get("doc_id")),
-                "chunk_index": int(r.get("chunk_index", 0)),
-                "text": r.get("text") or "",
-                "meta": r.get("meta") or {},
-                "score": float(r.get("score", 0.0)),
-            }
-        )
-    return out
+
+
+def _atlas_row(r: dict) -> dict:
+    return {
+        "doc_id": str(r.get("doc_id")),
+        "chunk_index": int(r.get("chunk_index", 0)),
+        "text": r.get("text") or "",
+        "meta": r.get("meta") or {},
+        "score": float(r.get("score", 0.0)),
+    }
+
+
+def _knn_atlas(vector: list[float], k: int = 5, index_name: str = "rag_embedding", where: Optional[ChunkFilter] = None) -> list[dict]:
+    """Consulta vectorial usando Atlas Vector Search ($search knnBeta)."""
+    db = get_db()
+    rows = list(db[COLL].aggregate(_atlas_pipeline(vector, k, index_name, where)))
+    return [_atlas_row(r) for r in rows]
+
+
+@timed("rag.knn")
+async def knn_search_async(vector: list[float], k: int = 5, index_name: str = "rag_embedding", *, where: Optional[ChunkFilter] = None) -> list[dict]:
+    """Variante async de `knn_search`.
+
+    El índice local es CPU en memoria (se consulta directo); Atlas usa el driver async.
+    La carga inicial del índice local, si hace falta, corre en un hilo.
+    """
+    backend = str(getattr(settings, "rag_vector_backend", "atlas") or "atlas").strip().lower()
+    if backend == "local":
+        if not vector_index.ready:
+            try:
+                await asyncio.to_thread(load_local_index)
+            except Exception as e:
+                _log.warning("Índice local no disponible: %s", e)
+        if vector_index.ready:
+            _maybe_refresh_local_index()
+            return vector_index.search(vector, k=int(k), where=where)
+        if not getattr(settings, "rag_vector_atlas_fallback", True):
+            return []
+    db = get_async_db()
+    cur = await db[COLL].aggregate(_atlas_pipeline(vector, k, index_name, where))
+    rows = await cur.to_list(length=None)
+    return [_atlas_row(r) for r in rows]
+
+
+def _get_atlas_pool() -> ThreadPoolExecutor:
+    global _atlas_pool
+    if _atlas_pool is None:
+        with _load_lock:
+            if _atlas_pool is None:
+                _atlas_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="aura-knn")
+    return _atlas_pool
+
+
+def _local_ready() -> bool:
+    backend = str(getattr(settings, "rag_vector_backend", "atlas") or "atlas").strip().lower()
+    if backend != "local":
+        return False
+    if not vector_index.ready:
+        try:
+            load_local_index()
+        except Exception as e:
+            _log.warning("Índice local no disponible: %s", e)
+    if vector_index.ready:
+        _maybe_refresh_local_index()
+    return vector_index.ready
+
+
+@timed("rag.knn_many")
+def knn_search_many(vectors: Sequence[list[float]], k: int = 5, *, where: Optional[ChunkFilter] = None) -> List[list[dict]]:
+    """Top-k de cada vector (una lista por vector, mismo formato que `knn_search`).
+
+    Índice local: una sola multiplicación para todas las consultas. Atlas: una
+    agregación por vector, en paralelo.
+    """
+    vectors = [v for v in vectors if v is not None and len(v)]
+    if not vectors:
+        return []
+    if _local_ready():
+        return vector_index.search_many(vectors, k=int(k), where=where)
+    if len(vectors) == 1:
+        return [knn_search(vectors[0], k=k, where=where)]
+    pool = _get_atlas_pool()
+    # Cada tarea corre en una copia del contexto de la petición: los hilos del pool no
+    # heredan las ContextVar y sin ella se perderían sus spans y tiempos de Mongo
+    futures = [pool.submit(contextvars.copy_context().run, knn_search, v, k=k, where=where) for v in vectors]
+    return [f.result() for f in futures]
+
+
+@timed("rag.knn_many")
+async def knn_search_many_async(vectors: Sequence[list[float]], k: int = 5, *, where: Optional[ChunkFilter] = None) -> List[list[dict]]:
+    """Variante async de `knn_search_many` (Atlas con `asyncio.gather`)."""
+    vectors = [v for v in vectors if v is not None and len(v)]
+    if not vectors:
+        return []
+    backend = str(getattr(settings, "rag_vector_backend", "atlas") or "atlas").strip().lower()
+    if backend == "local":
+        if not vector_index.ready:
+            try:
+                await asyncio.to_thread(load_local_index)
+            except Exception as e:
+                _log.warning("Índice local no disponible: %s", e)
+        if vector_index.ready:
+            _maybe_refresh_local_index()
+            return vector_index.search_many(vectors, k=int(k), where=where)
+    return list(await asyncio.gather(*(knn_search_async(v, k=k, where=where) for v in vectors)))
+
+
+def fuse_by_score(rankings: Iterable[List[dict]], k: int) -> list[dict]:
+    """Une rankings vectoriales: cada chunk (doc_id, chunk_index) con su mejor score."""
+    best: Dict[Tuple[str, int], dict] = {}
+    for rows in rankings:
+        for r in rows:
+            key = (str(r.get("doc_id")), int(r.get("chunk_index", 0)))
+            cur = best.get(key)
+            if cur is None or float(r.get("score", 0.0)) > float(cur.get("score", 0.0)):
+                best[key] = r
+    out = sorted(best.values(), key=lambda x: float(x.get("score", 0.0)), reverse=True)
+    return out[: int(k)]
+
+
+def multi_knn_search(vectors: Sequence[list[float]], k: int = 5, *, where: Optional[ChunkFilter] = None) -> list[dict]:
+    """Top-k fusionado de varias consultas vectoriales (ver `fuse_by_score`)."""
+    return fuse_by_score(knn_search_many(vectors, k=k, where=where), k)
+
+
+async def multi_knn_search_async(vectors: Sequence[list[float]], k: int = 5, *, where: Optional[ChunkFilter] = None) -> list[dict]:
+    return fuse_by_score(await knn_search_many_async(vectors, k=k, where=where), k)
 
 
 def list_texts_by_doc_id(doc_id: str, limit: int = 200) -> list[str]:
@@ -133,3 +418,133 @@ def list_texts_by_doc_id(doc_id: str, limit: int = 200) -> list[str]:
         return []
     cur = db[COLL].find({"doc_id": oid}, {"text": 1}).sort("chunk_index", 1).limit(int(limit))
     return [str(d.get("text") or "") for d in cur]
+
+
+# --- Búsqueda léxica + fusión (RRF) -----------------------------------------
+
+# Palabras vacías del español que `$text` (idioma por defecto del índice) no descarta
+_STOPWORDS = frozenset("""
+a al algo algun alguna ante como con cual cuales cuando de del desde donde el ella ellas ellos en entre era es esa
+ese eso esta este esto estos hay la las le les lo los mas me mi mis muy no nos o para pero por que quien quienes se
+ser si sin sobre su sus te tiene tu tus un una uno unos y ya
+qué cuál cuáles quién quiénes cómo dónde cuándo más sí está él
+""".split())
+_TERM_RE = re.compile(r"[\w.@-]+", re.UNICODE)
+
+
+def text_query(question: str) -> str:
+    """Términos para `$text`: sin palabras vacías ni tokens de 1–2 letras (salvo siglas o con dígitos)."""
+    seen: List[str] = []
+    for raw in _TERM_RE.findall(question or ""):
+        raw = raw.strip(".-")
+        tok = raw.lower()
+        if not tok or tok in _STOPWORDS or tok in seen:
+            continue
+        if len(tok) < 3 and not (raw.isupper() or any(ch.isdigit() for ch in tok)):
+            continue
+        seen.append(tok)
+    return " ".join(seen)
+
+
+def _text_args(terms: str, where: Optional[ChunkFilter] = None) -> Tuple[dict, dict, list]:
+    flt = {"$text": {"$search": terms}, **(where.mongo() if where else {})}
+    projection = {"doc_id": 1, "chunk_index": 1, "text": 1, "meta": 1, "score": {"$meta": "textScore"}}
+    return flt, projection, [("score", {"$meta": "textScore"})]
+
+
+@timed("rag.text")
+def text_search(question: str, k: int = 30, *, where: Optional[ChunkFilter] = None) -> list[dict]:
+    """Top-k léxico con `$text` (puntaje `textScore`); [] si no hay términos o índice."""
+    terms = text_query(question)
+    if not terms or k <= 0:
+        return []
+    flt, projection, sort = _text_args(terms, where)
+    try:
+        rows = list(get_db()[COLL].find(flt, projection).sort(sort).limit(int(k)))
+    except Exception as e:
+        _log.debug("Búsqueda $text no disponible: %s", e)
+        return []
+    return [_atlas_row(r) for r in rows]
+
+
+@timed("rag.text")
+async def text_search_async(question: str, k: int = 30, *, where: Optional[ChunkFilter] = None) -> list[dict]:
+    terms = text_query(question)
+    if not terms or k <= 0:
+        return []
+    flt, projection, sort = _text_args(terms, where)
+    try:
+        rows = await get_async_db()[COLL].find(flt, projection).sort(sort).limit(int(k)).to_list(length=None)
+    except Exception as e:
+        _log.debug("Búsqueda $text no disponible: %s", e)
+        return []
+    return [_atlas_row(r) for r in rows]
+
+
+def rrf_fuse(rankings: Iterable[List[dict]], k: int, rrf_k: int = 60) -> list[dict]:
+    """Reciprocal rank fusion en una pasada: score = Σ 1 / (rrf_k + rango).
+
+    Cada chunk (doc_id, chunk_index) toma la fila de la primera lista donde
+    aparece; conserva los puntajes originales en `vector_score` / `text_score`.
+    """
+    fused: Dict[Tuple[str, int], dict] = {}
+    for source, rows in zip(("vector_score", "text_score"), rankings):
+        for rank, r in enumerate(rows, start=1):
+            key = (str(r.get("doc_id")), int(r.get("chunk_index", 0)))
+            item = fused.get(key)
+            if item is None:
+                item = fused[key] = {**r, "score": 0.0}
+            item["score"] += 1.0 / (rrf_k + rank)
+            item[source] = float(r.get("score", 0.0))
+    out = sorted(fused.values(), key=lambda x: x["score"], reverse=True)
+    return out[: int(k)]
+
+
+def _hybrid_params(k: int) -> Tuple[int, int]:
+    candidates = max(int(k), int(getattr(settings, "rag_hybrid_candidates", 30) or 0))
+    return candidates, int(getattr(settings, "rag_rrf_k", 60) or 60)
+
+
+def hybrid_search(
+    vector: list[float],
+    question: str,
+    k: int = 5,
+    *,
+    where: Optional[ChunkFilter] = None,
+    extra_vectors: Sequence[list[float]] = (),
+) -> list[dict]:
+    """Vectorial + léxica fusionadas por RRF (ver `rrf_fuse`); top-k con el mismo formato que `knn_search`.
+
+    Con `extra_vectors` (reformulaciones) el lado vectorial es `multi_knn_search`.
+    """
+    candidates, rrf_k = _hybrid_params(k)
+    vectors = [v for v in (vector, *extra_vectors) if v is not None and len(v)]
+    vec = multi_knn_search(vectors, k=candidates, where=where) if vectors else []
+    lex = text_search(question, k=candidates, where=where)
+    if not lex:
+        return vec[: int(k)]
+    return rrf_fuse((vec, lex), k, rrf_k)
+
+
+async def hybrid_search_async(
+    vector: list[float],
+    question: str,
+    k: int = 5,
+    *,
+    where: Optional[ChunkFilter] = None,
+    extra_vectors: Sequence[list[float]] = (),
+) -> list[dict]:
+    """Variante async de `hybrid_search` (ambas búsquedas en paralelo)."""
+    candidates, rrf_k = _hybrid_params(k)
+    vectors = [v for v in (vector, *extra_vectors) if v is not None and len(v)]
+
+    async def _none() -> list[dict]:
+        return []
+
+    vec, lex = await asyncio.gather(
+        multi_knn_search_async(vectors, k=candidates, where=where) if vectors else _none(),
+        text_search_async(question, k=candidates, where=where),
+    )
+    if not lex:
+        return vec[: int(k)]
+    return rrf_fuse((vec, lex), k, rrf_k)
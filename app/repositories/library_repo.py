@@ -8,10 +8,19 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 from bson import ObjectId
 
+from app.core.cache import LRUCache
+from app.core.config import settings
 from app.infrastructure.db.mongo import get_db
 
 COLL = "library_doc"
 
+# Título/tags por documento para el armado de prompts RAG (se invalida al editar tags o re-ingerir)
+_meta_cache = LRUCache(
+    maxsize=max(1, int(getattr(settings, "rag_doc_meta_cache_size", 4096) or 1)),
+    ttl_seconds=(int(getattr(settings, "rag_doc_meta_cache_ttl_seconds", 0) or 0) or None),
+    name="doc_meta",
+)
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
@@ -104,6 +113,43 @@ def get_document(doc_id: str) -> Optional[Dict[str, Any]]:
     return d
 
 
+def get_documents_meta(doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Título y tags de varios documentos: caché de proceso + una sola consulta `$in` para los faltantes.
+
+    Devuelve {doc_id: {"title": str, "tags": [str]}}; los ids inexistentes no aparecen.
+    """
+    out: Dict[str, Dict[str, Any]] = {}
+    missing: Dict[ObjectId, str] = {}
+    for did in dict.fromkeys(str(d) for d in doc_ids if d):
+        hit = _meta_cache.get(did)
+        if hit is not None:
+            out[did] = hit
+            continue
+        try:
+            missing[ObjectId(did)] = did
+        except Exception:
+            continue
+    if missing:
+        db = get_db()
+        for d in db[COLL].find({"_id": {"$in": list(missing)}}, {"title": 1, "tags": 1}):
+            did = str(d["_id"])
+            meta = {
+                "title": str(d.get("title") or ""),
+                "tags": [str(t).lower() for t in (d.get("tags") or [])],
+            }
+            _meta_cache.set(did, meta)
+            out[did] = meta
+    return out
+
+
+def invalidate_document_meta(doc_id: Optional[str] = None) -> None:
+    """Descarta el título/tags cacheados de un documento (o de todos)."""
+    if doc_id is None:
+        _meta_cache.clear()
+    else:
+        _meta_cache.pop(str(doc_id))
+
+
 def update_document_tags(doc_id: str, tags: list[str]) -> bool:
     """Actualiza `tags` en `library_doc`.
 
@@ -116,6 +162,22 @@ def update_document_tags(doc_id: str, tags: list[str]) -> bool:
         return False
     norm = [str(t).strip().lower() for t in (tags or []) if str(t).strip()]
     res = db[COLL].update_one({"_id": oid}, {"$set": {"tags": norm, "updated_at": _now_iso()}})
+    invalidate_document_meta(doc_id)
+    return bool(res.modified_count)
+
+
+def set_ingest_state(doc_id: str, fields: Dict[str, Any]) -> bool:
+    """Actualiza subcampos de `ingest` (p.ej. content_hash, etag, status)."""
+    db = get_db()
+    try:
+        oid = ObjectId(doc_id)
+    except Exception:
+        return False
+    upd = {f"ingest.{k}": v for k, v in (fields or {}).items()}
+    if not upd:
+        return False
+    res = db[COLL].update_one({"_id": oid}, {"$set": upd})
+    invalidate_document_meta(doc_id)
     return bool(res.modified_count)
 
 
@@ -1,11 +1,24 @@
 """Repo de la colección `messages`.
 
-- Inserta mensajes y actualiza `last_message_at`/`updated_at` en la conversación.
+- Inserta mensajes y actualiza `last_message_at`/`updated_at` (y el título si aún es
+  un placeholder) en la conversación con un solo update por pipeline.
+- `append_turn`: guarda usuario + asistente juntos (1 insert_many + 1 update).
+- Variantes `*_deferred`: generan el `_id` en el cliente y encolan la escritura en
+  la cola write-behind (`write_queue`); devuelven el id sin esperar a Mongo.
+  Un turno va como una sola unidad de la cola. Desde el event loop, `*_deferred_async`
+  (si la cola está llena, esperan la escritura en un hilo en vez de bloquear el loop).
+- Lectura acotada: últimos N mensajes con proyección (`list_recent_messages`) y
+  paginación por keyset (`list_messages_page`) sobre (created_at, _id); ambas usan
+  los índices compuestos `(conversation_id|user_id|session_id, created_at, _id)`.
 """
-from typing import Dict, Any, List, Optional
+import base64
+import binascii
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 from datetime import datetime, timezone
-from app.infrastructure.db.mongo import get_db
+from app.infrastructure.db.mongo import get_async_db, get_db
+from app.infrastructure.db.write_queue import Op, write_queue
 from bson import ObjectId
+from bson.errors import InvalidId
 
 COLLECTION = "messages"
 CONV_COLLECTION = "conversations"
@@ -15,11 +28,8 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def insert_message(doc: Dict[str, Any]) -> str:
-    """Inserta mensaje y sincroniza metadatos de la conversación asociada."""
-    db = get_db()
+def _with_defaults(doc: Dict[str, Any], now: str) -> Dict[str, Any]:
     data = dict(doc)
-    now = _now_iso()
     # Defaults opcionales
     data.setdefault("attachments", [])
     data.setdefault("citations", [])
@@ -28,39 +38,197 @@ def insert_message(doc: Dict[str, Any]) -> str:
     data.setdefault("tokens_output", None)
     data.setdefault("error", None)
     data.setdefault("created_at", now)
+    return data
 
-    res = db[COLLECTION].insert_one(data)
 
-    # Actualiza conversación: last_message_at y updated_at
+def _title_from(content: Any) -> str:
+    new_title = (content or "").strip()
+    # Limita longitud del título
+    if len(new_title) > 80:
+        new_title = new_title[:77] + "…"
+    return new_title
+
+
+# Títulos que se reemplazan por el primer mensaje del usuario
+_PLACEHOLDER_TITLES = ["", "nuevo chat", "new chat"]
+
+
+def _conversation_update(now: str, user_content: Any = None) -> List[Dict[str, Any]]:
+    """Pipeline de actualización de la conversación tras insertar mensajes.
+
+    Sella `last_message_at`/`updated_at` y, si hay mensaje de usuario, fija el título
+    sólo cuando está vacío o es un placeholder (la condición se evalúa en el servidor).
+    """
+    stages: List[Dict[str, Any]] = [{"$set": {"last_message_at": now, "updated_at": now}}]
+    new_title = _title_from(user_content) if user_content is not None else ""
+    if new_title:
+        current = {"$toLower": {"$trim": {"input": {"$ifNull": ["$title", ""]}}}}
+        stages.append({"$set": {"title": {"$cond": [
+            {"$in": [current, _PLACEHOLDER_TITLES]},
+            {"$literal": new_title},
+            "$title",
+        ]}}})
+    return stages
+
+
+def _conversation_oid(conversation_id: Any) -> Optional[ObjectId]:
     try:
-        db[CONV_COLLECTION].update_one(
-            {"_id": ObjectId(str(data.get("conversation_id")))},
-            {"$set": {"last_message_at": now, "updated_at": now}},
-        )
-        # Si es el primer mensaje del usuario (o placeholder), usarlo como título
-        if str(data.get("role")) == "user":
-            conv = db[CONV_COLLECTION].find_one({"_id": ObjectId(str(data.get("conversation_id")))}, {"title": 1})
-            cur_title = (conv or {}).get("title") or ""
-            if not cur_title or cur_title.strip().lower() in {"nuevo chat", "new chat"}:
-                new_title = (data.get("content") or "").strip()
-                if new_title:
-                    # Limita longitud del título
-                    if len(new_title) > 80:
-                        new_title = new_title[:77] + "…"
-                    db[CONV_COLLECTION].update_one(
-                        {"_id": ObjectId(str(data.get("conversation_id")))},
-                        {"$set": {"title": new_title, "updated_at": now}},
-                    )
-    except Exception:
-        # No romper la inserción si falla la actualización cruzada
-        pass
+        return ObjectId(str(conversation_id))
+    except (InvalidId, TypeError):
+        return None
+
+
+def insert_message(doc: Dict[str, Any]) -> str:
+    """Inserta mensaje y sincroniza metadatos de la conversación (1 insert + 1 update)."""
+    db = get_db()
+    now = _now_iso()
+    data = _with_defaults(doc, now)
+
+    res = db[COLLECTION].insert_one(data)
+
+    conv_id = _conversation_oid(data.get("conversation_id"))
+    if conv_id is not None:
+        try:
+            user_content = data.get("content") if str(data.get("role")) == "user" else None
+            db[CONV_COLLECTION].update_one({"_id": conv_id}, _conversation_update(now, user_content))
+        except Exception:
+            # No romper la inserción si falla la actualización cruzada
+            pass
 
     return str(res.inserted_id)
 
 
-def list_messages(conversation_id: Optional[str] = None, user_id: Optional[str] = None, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
-    """Lista mensajes por conversación/usuario/sesión (orden cronológico ascendente)."""
+async def insert_message_async(doc: Dict[str, Any]) -> str:
+    """Variante async de `insert_message` (driver async de PyMongo)."""
+    db = get_async_db()
+    now = _now_iso()
+    data = _with_defaults(doc, now)
+
+    res = await db[COLLECTION].insert_one(data)
+
+    conv_id = _conversation_oid(data.get("conversation_id"))
+    if conv_id is not None:
+        try:
+            user_content = data.get("content") if str(data.get("role")) == "user" else None
+            await db[CONV_COLLECTION].update_one({"_id": conv_id}, _conversation_update(now, user_content))
+        except Exception:
+            pass
+
+    return str(res.inserted_id)
+
+
+def _turn_docs(user_doc: Dict[str, Any], assistant_doc: Dict[str, Any], now: str) -> List[Dict[str, Any]]:
+    if str(user_doc.get("conversation_id")) != str(assistant_doc.get("conversation_id")):
+        raise ValueError("Ambos mensajes deben pertenecer a la misma conversación")
+    # Mismo created_at: el orden lo da el _id (insert_many los genera en orden)
+    return [_with_defaults(user_doc, now), _with_defaults(assistant_doc, now)]
+
+
+def append_turn(user_doc: Dict[str, Any], assistant_doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Guarda el turno completo (usuario + asistente) en 1 insert_many + 1 update.
+
+    Devuelve (id del mensaje del usuario, id del mensaje del asistente).
+    """
     db = get_db()
+    now = _now_iso()
+    docs = _turn_docs(user_doc, assistant_doc, now)
+
+    res = db[COLLECTION].insert_many(docs, ordered=True)
+
+    conv_id = _conversation_oid(docs[0].get("conversation_id"))
+    if conv_id is not None:
+        try:
+            db[CONV_COLLECTION].update_one({"_id": conv_id}, _conversation_update(now, docs[0].get("content")))
+        except Exception:
+            pass
+
+    ids = [str(i) for i in res.inserted_ids]
+    return ids[0], ids[1]
+
+
+async def append_turn_async(user_doc: Dict[str, Any], assistant_doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Variante async de `append_turn`."""
+    db = get_async_db()
+    now = _now_iso()
+    docs = _turn_docs(user_doc, assistant_doc, now)
+
+    res = await db[COLLECTION].insert_many(docs, ordered=True)
+
+    conv_id = _conversation_oid(docs[0].get("conversation_id"))
+    if conv_id is not None:
+        try:
+            await db[CONV_COLLECTION].update_one({"_id": conv_id}, _conversation_update(now, docs[0].get("content")))
+        except Exception:
+            pass
+
+    ids = [str(i) for i in res.inserted_ids]
+    return ids[0], ids[1]
+
+
+def _message_ops(doc: Dict[str, Any]) -> Tuple[str, List[Op]]:
+    now = _now_iso()
+    data = _with_defaults(doc, now)
+    data["_id"] = ObjectId()
+    ops: List[Op] = [("insert", COLLECTION, data)]
+    conv_id = _conversation_oid(data.get("conversation_id"))
+    if conv_id is not None:
+        user_content = data.get("content") if str(data.get("role")) == "user" else None
+        ops.append(("update", CONV_COLLECTION, ({"_id": conv_id}, _conversation_update(now, user_content))))
+    return str(data["_id"]), ops
+
+
+def _turn_ops(user_doc: Dict[str, Any], assistant_doc: Dict[str, Any]) -> Tuple[Tuple[str, str], List[Op]]:
+    now = _now_iso()
+    docs = _turn_docs(user_doc, assistant_doc, now)
+    for d in docs:
+        # Generados en orden: el _id mantiene usuario antes que asistente
+        d["_id"] = ObjectId()
+    ops: List[Op] = [("insert", COLLECTION, d) for d in docs]
+    conv_id = _conversation_oid(docs[0].get("conversation_id"))
+    if conv_id is not None:
+        ops.append(("update", CONV_COLLECTION, ({"_id": conv_id}, _conversation_update(now, docs[0].get("content")))))
+    return (str(docs[0]["_id"]), str(docs[1]["_id"])), ops
+
+
+def insert_message_deferred(doc: Dict[str, Any]) -> str:
+    """Como `insert_message`, pero encolado (write-behind); devuelve el id ya asignado."""
+    msg_id, ops = _message_ops(doc)
+    write_queue.submit(ops)
+    return msg_id
+
+
+async def insert_message_deferred_async(doc: Dict[str, Any]) -> str:
+    """Variante para el event loop de `insert_message_deferred` (ver `write_queue.submit_async`)."""
+    msg_id, ops = _message_ops(doc)
+    await write_queue.submit_async(ops)
+    return msg_id
+
+
+def append_turn_deferred(user_doc: Dict[str, Any], assistant_doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Como `append_turn`, pero encolado (write-behind) como una sola unidad; devuelve los ids ya asignados."""
+    ids, ops = _turn_ops(user_doc, assistant_doc)
+    write_queue.submit(ops)
+    return ids
+
+
+async def append_turn_deferred_async(user_doc: Dict[str, Any], assistant_doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Variante para el event loop de `append_turn_deferred`."""
+    ids, ops = _turn_ops(user_doc, assistant_doc)
+    await write_queue.submit_async(ops)
+    return ids
+
+
+# Orden total estable: created_at tiene resolución de segundos, _id desempata
+_ASC = [("created_at", 1), ("_id", 1)]
+_DESC = [("created_at", -1), ("_id", -1)]
+_RECENT_FIELDS = ("role", "content")
+
+
+class InvalidCursor(ValueError):
+    """Cursor de paginación mal formado."""
+
+
+def _owner_filter(conversation_id: Optional[str], user_id: Optional[str], session_id: Optional[str]) -> Dict[str, Any]:
     filtro: Dict[str, Any] = {}
     if conversation_id:
         filtro["conversation_id"] = str(conversation_id)
@@ -68,8 +236,100 @@ def list_messages(conversation_id: Optional[str] = None, user_id: Optional[str]
         filtro["user_id"] = str(user_id)
     if session_id:
         filtro["session_id"] = str(session_id)
-    projection = {"_id": 0}
-    return list(db[COLLECTION].find(filtro, projection).sort("created_at", 1))
+    return filtro
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    raw = f"{doc.get('created_at') or ''}|{doc.get('_id')}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        created_at, _, oid = base64.urlsafe_b64decode(cursor + pad).decode("utf-8").rpartition("|")
+        return created_at, ObjectId(oid)
+    except (binascii.Error, UnicodeDecodeError, InvalidId, TypeError, ValueError):
+        raise InvalidCursor("cursor inválido")
+
+
+def _keyset(cursor: str, op: str) -> Dict[str, Any]:
+    """Filtro estrictamente anterior (`$lt`) o posterior (`$gt`) a la posición del cursor."""
+    created_at, oid = decode_cursor(cursor)
+    return {"$or": [{"created_at": {op: created_at}}, {"created_at": created_at, "_id": {op: oid}}]}
+
+
+def _recent_query(conversation_id: str, fields: Sequence[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    projection: Dict[str, Any] = {f: 1 for f in fields}
+    projection["_id"] = 0
+    return {"conversation_id": str(conversation_id)}, projection
+
+
+def list_recent_messages(conversation_id: str, limit: int, fields: Sequence[str] = _RECENT_FIELDS) -> List[Dict[str, Any]]:
+    """Últimos `limit` mensajes de la conversación (sólo `fields`), en orden cronológico.
+
+    Recorre el índice (conversation_id, created_at, _id) hacia atrás y se detiene en
+    `limit`: el costo no crece con el largo de la conversación.
+    """
+    if limit <= 0:
+        return []
+    filtro, projection = _recent_query(conversation_id, fields)
+    rows = list(get_db()[COLLECTION].find(filtro, projection).sort(_DESC).limit(int(limit)))
+    rows.reverse()
+    return rows
+
+
+async def list_recent_messages_async(conversation_id: str, limit: int, fields: Sequence[str] = _RECENT_FIELDS) -> List[Dict[str, Any]]:
+    """Variante async de `list_recent_messages`."""
+    if limit <= 0:
+        return []
+    filtro, projection = _recent_query(conversation_id, fields)
+    cur = get_async_db()[COLLECTION].find(filtro, projection).sort(_DESC).limit(int(limit))
+    rows = await cur.to_list(length=None)
+    rows.reverse()
+    return rows
+
+
+def list_messages_page(
+    conversation_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    *,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Página de mensajes por keyset, siempre en orden cronológico ascendente.
+
+    - Sin cursores: la página más reciente.
+    - `before`: mensajes anteriores al cursor (página previa).
+    - `after`: mensajes posteriores al cursor (nuevos desde la última lectura).
+
+    Devuelve `{"messages", "before", "after", "has_more"}`: `before`/`after` son los
+    cursores del primer/último mensaje de la página y `has_more` indica si quedan
+    mensajes en la dirección consultada. Lanza `InvalidCursor` si un cursor no es válido.
+    """
+    if before and after:
+        raise InvalidCursor("usa before o after, no ambos")
+    limit = max(1, int(limit))
+    filtro = _owner_filter(conversation_id, user_id, session_id)
+    if after:
+        filtro.update(_keyset(after, "$gt"))
+        sort = _ASC
+    else:
+        if before:
+            filtro.update(_keyset(before, "$lt"))
+        sort = _DESC
+    rows = list(get_db()[COLLECTION].find(filtro).sort(sort).limit(limit + 1))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if sort is _DESC:
+        rows.reverse()
+    page_before = encode_cursor(rows[0]) if rows else before
+    page_after = encode_cursor(rows[-1]) if rows else after
+    for r in rows:
+        r.pop("_id", None)
+    return {"messages": rows, "before": page_before, "after": page_after, "has_more": has_more}
 
 
 def delete_by_conversation(conversation_id: str) -> int:
@@ -1,7 +1,9 @@
 """Repo de la colección"""
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone
+from bson import ObjectId
 from app.infrastructure.db.mongo import get_db
+from app.infrastructure.db.write_queue import write_queue
 
 COLLECTION = "note"
 
@@ -10,9 +12,7 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def insert_note(doc: Dict[str, Any]) -> str:
-    """Inserta nota con defaults y devuelve id (str)."""
-    db = get_db()
+def _note_defaults(doc: Dict[str, Any]) -> Dict[str, Any]:
     data = dict(doc)
     now = _now_iso()
     data.setdefault("status", "active")
@@ -20,10 +20,32 @@ def insert_note(doc: Dict[str, Any]) -> str:
     data.setdefault("tags", [])
     data.setdefault("created_at", now)
     data["updated_at"] = now
-    res = db[COLLECTION].insert_one(data)
+    return data
+
+
+def insert_note(doc: Dict[str, Any]) -> str:
+    """Inserta nota con defaults y devuelve id (str)."""
+    db = get_db()
+    res = db[COLLECTION].insert_one(_note_defaults(doc))
     return str(res.inserted_id)
 
 
+def insert_note_deferred(doc: Dict[str, Any]) -> str:
+    """Como `insert_note`, pero encolada en la cola write-behind; devuelve el id ya asignado."""
+    data = _note_defaults(doc)
+    data["_id"] = ObjectId()
+    write_queue.insert(COLLECTION, data)
+    return str(data["_id"])
+
+
+async def insert_note_deferred_async(doc: Dict[str, Any]) -> str:
+    """Variante para el event loop de `insert_note_deferred` (ver `write_queue.submit_async`)."""
+    data = _note_defaults(doc)
+    data["_id"] = ObjectId()
+    await write_queue.submit_async([("insert", COLLECTION, data)])
+    return str(data["_id"])
+
+
 def list_notes(user_id: Optional[str] = None, status: Optional[str] = None, tag: Optional[str] = None) -> List[Dict[str, Any]]:
     """Lista notas por filtros básicos (ordenadas por updated_at desc)."""
     db = get_db()
@@ -0,0 +1,120 @@
+"""Repositorio de trabajos de ingesta RAG en segundo plano (`rag_job`).
+
+Cada job guarda contadores globales y el progreso por documento en
+`docs.<doc_id>` (etapa, estado, resultado o error). Mientras corre, su hilo
+renueva `updated_at` (latido); al arrancar, `fail_stale_jobs` cierra con error
+los jobs activos sin latido (el proceso que los corría murió).
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+
+from app.infrastructure.db.mongo import get_db
+
+COLL = "rag_job"
+
+TERMINAL = ("done", "error")
+ACTIVE = ("queued", "running")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def create_job(kind: str, params: Dict[str, Any], doc_ids: List[str]) -> str:
+    db = get_db()
+    now = _now_iso()
+    data = {
+        "kind": kind,
+        "status": "queued",
+        "params": dict(params or {}),
+        "total": len(doc_ids),
+        "processed": 0,
+        "failed": 0,
+        "docs": {i: {"status": "queued", "stage": None} for i in doc_ids},
+        "created_at": now,
+        "updated_at": now,
+    }
+    res = db[COLL].insert_one(data)
+    return str(res.inserted_id)
+
+
+def set_job_status(job_id: str, status: str, **extra: Any) -> None:
+    db = get_db()
+    now = _now_iso()
+    upd: Dict[str, Any] = {"status": status, "updated_at": now, **extra}
+    if status == "running":
+        upd.setdefault("started_at", now)
+    if status in TERMINAL:
+        upd.setdefault("finished_at", now)
+    db[COLL].update_one({"_id": ObjectId(job_id)}, {"$set": upd})
+
+
+def touch_job(job_id: str) -> None:
+    """Latido de un job activo."""
+    db = get_db()
+    db[COLL].update_one({"_id": ObjectId(job_id), "status": {"$in": list(ACTIVE)}}, {"$set": {"updated_at": _now_iso()}})
+
+
+def fail_stale_jobs(max_age_seconds: float) -> int:
+    """Marca como error los jobs activos sin latido en `max_age_seconds`; devuelve cuántos."""
+    db = get_db()
+    now = datetime.now(timezone.utc)
+    cutoff = (now - timedelta(seconds=float(max_age_seconds))).strftime("%Y-%m-%dT%H:%M:%SZ")
+    stamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    res = db[COLL].update_many(
+        {"status": {"$in": list(ACTIVE)}, "updated_at": {"$lt": cutoff}},
+        {"$set": {
+            "status": "error",
+            "error": "interrumpido: el proceso terminó antes de completar el job",
+            "finished_at": stamp,
+            "updated_at": stamp,
+        }},
+    )
+    return int(res.modified_count)
+
+
+def set_doc_stage(job_id: str, doc_id: str, stage: str) -> None:
+    db = get_db()
+    db[COLL].update_one(
+        {"_id": ObjectId(job_id)},
+        {"$set": {f"docs.{doc_id}.stage": stage, f"docs.{doc_id}.status": "running", "updated_at": _now_iso()}},
+    )
+
+
+def finish_doc(job_id: str, doc_id: str, *, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+    """Marca un documento como terminado (ok o error) e incrementa contadores."""
+    db = get_db()
+    entry: Dict[str, Any] = {f"docs.{doc_id}.status": "error" if error else "done", "updated_at": _now_iso()}
+    if error:
+        entry[f"docs.{doc_id}.error"] = str(error)
+    else:
+        entry[f"docs.{doc_id}.result"] = dict(result or {})
+    inc = {"processed": 1, "failed": 1 if error else 0}
+    db[COLL].update_one({"_id": ObjectId(job_id)}, {"$set": entry, "$inc": inc})
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    db = get_db()
+    try:
+        oid = ObjectId(job_id)
+    except Exception:
+        return None
+    d = db[COLL].find_one({"_id": oid})
+    if not d:
+        return None
+    d["id"] = str(d.pop("_id"))
+    return d
+
+
+def list_jobs(limit: int = 20) -> List[Dict[str, Any]]:
+    db = get_db()
+    projection = {"docs": 0}
+    out: List[Dict[str, Any]] = []
+    for d in db[COLL].find({}, projection).sort("created_at", -1).limit(int(limit)):
+        d["id"] = str(d.pop("_id"))
+        out.append(d)
+    return out
+
@@ -1,11 +1,14 @@
 """Orquestación de preguntas del usuario hacia el asistente (IA + tools)."""
+import asyncio
 import random
-from app.infrastructure.ai.ai_service import ask_llm
+from typing import Any, Awaitable, Callable, Iterator
+from app.infrastructure.ai.ai_service import ask_llm, ask_llm_async, ask_llm_stream
 from app.services.context_service import build_academic_context
 from app.services.schedule_service import try_answer_schedule
-from app.infrastructure.ai.tools.router import answer_with_tools
+from app.infrastructure.ai.tools.router import answer_with_tools, answer_with_tools_async
 import re
-from app.services.rag_search_service import answer_with_rag
+from app.services.rag_search_service import answer_with_rag, answer_with_rag_async
+from app.infrastructure.vector.filters import ChunkFilter
 from app.services.easter_eggs import check_easter_egg
 from app.services.library_service import (
     find_schedule_image_for_user,
@@ -14,12 +17,22 @@ from app.services.library_service import (
     find_campus_map_image_url,
     find_room_image,
 )
-from datetime import datetime
+from calendar import monthrange
+from datetime import date, datetime
 from zoneinfo import ZoneInfo
 from app.core.time import get_user_tz
+from app.services.calendar_service import holidays_between
+from app.services.user_context import request_scope
 from app.core.config import settings
+from app.core.profiling import span
 from app.services.schedule_service import days_for_course, CODE_TO_SPANISH_DAY
 from app.infrastructure.db.mongo import get_db
+from app.services.intent_router import IntentRouter, Query
+from time import perf_counter
+
+# Preguntas de calendario: sólo compiten chunks de documentos etiquetados como calendario
+# (si ninguno cumple, la búsqueda se repite sin tags); con el candidato acotado basta un k menor
+_CALENDAR_CHUNKS = ChunkFilter.of(tags=["calendario"])
 
 # Catálogo cacheado de códigos de programa para validar 'carrera'
 _PROGRAM_CODES_CACHE: set[str] | None = None
@@ -58,995 +71,732 @@ def _extract_program_code(text: str) -> str | None:
     return None
 
 
-def ask(user_email: str, question: str, history: list[dict] | None = None) -> dict:
-    """Construye contexto y responde usando tool‑calling u LLM.
+class _LLMStep:
+    """Paso que requiere al modelo, diferido para que sync y async compartan el ruteo.
 
-    Flujo:
-    1) Construye contexto académico breve
-    2) Intenta tool‑calling (get_schedule/get_now)
-    3) Fallback local de horario
-    4) Fallback LLM (OpenAI→Ollama)
+    `_route` decide la rama (consultas cortas a Mongo) y, si la rama necesita al
+    LLM, devuelve este paso: `ask` lo resuelve en línea y `ask_async` lo espera
+    sin ocupar un hilo. `finish` arma el dict final; `on_error` es el respaldo.
     """
-    # Helpers locales para captura de perfil paso a paso
-    def _get_profile(email: str) -> dict:
+
+    __slots__ = ("run", "run_async", "finish", "on_error")
+
+    def __init__(
+        self,
+        run: Callable[[], Any],
+        run_async: Callable[[], Awaitable[Any]],
+        finish: Callable[[Any], dict],
+        on_error: Callable[[], dict] | None = None,
+    ) -> None:
+        self.run = run
+        self.run_async = run_async
+        self.finish = finish
+        self.on_error = on_error
+
+    def resolve(self) -> dict:
+        try:
+            out = self.run()
+        except Exception:
+            if self.on_error is None:
+                raise
+            return self.on_error()
+        return self.finish(out)
+
+    async def resolve_async(self) -> dict:
         try:
-            db = get_db()
-            u = db["user"].find_one({"email": email.lower()}, {"profile": 1}) or {}
-            return (u or {}).get("profile") or {}
+            out = await self.run_async()
         except Exception:
-            return {}
-
-    def _missing_ordered(p: dict) -> list[str]:
-        order = ["full_name", "major", "shift", "semester"]
-        missing = []
-        for k in order:
-            v = p.get(k)
-            if v is None or (isinstance(v, str) and not v.strip()):
-                missing.append(k)
-        return missing
-
-    def _pretty(k: str) -> str:
-        return {"full_name": "nombre completo", "major": "carrera", "shift": "turno", "semester": "semestre"}.get(k, k)
-
-    def _prompt_for(k: str) -> str:
-        if k == "full_name":
-            return "¿Cuál es tu nombre completo?"
-        if k == "major":
-            return "¿Cuál es tu carrera? (ej. IDS)"
-        if k == "shift":
-            return "¿Cuál es tu turno? (TM matutino o TV vespertino)"
-        if k == "semester":
-            return "¿Qué semestre cursas? (número 1–9 o en palabras)"
-        return f"¿Puedes compartir tu {k}?"
-    # 0) Confirmación sí/no de una oferta del turno anterior
-    if _is_yes_or_no(question):
-        offer = _last_offer(history)
-        if offer:
-            if _is_yes(question):
-                if offer == "offer_exam_dates":
-                    try:
-                        rag = answer_with_rag("Fechas de exámenes ordinarios del semestre actual UABCS", k=10)
-                        ans = str(rag.get("answer") or "Aquí tienes las fechas clave.")
-                        return {
-                            "pregunta": question,
-                            "respuesta": ans,
-                            "contexto_usado": True,
-                            "came_from": "rag-followup",
-                            "citation": "",
-                            "source_chunks": [],
-                            "followup": "",
-                            "attachments": _extract_urls(ans),
-                        }
-                    except Exception:
-                        return {
-                            "pregunta": question,
-                            "respuesta": "Aquí tienes las fechas clave del calendario.",
-                            "contexto_usado": False,
-                            "came_from": "followup",
-                            "citation": "",
-                            "source_chunks": [],
-                            "followup": "",
-                            "attachments": [],
-                        }
-                if offer == "offer_open_pdf":
-                    try:
-                        from app.services.library_service import find_calendar_pdf_url
-                        hit = find_calendar_pdf_url()
-                    except Exception:
-                        hit = None
-                    if hit and hit.get("url"):
-                        url = str(hit.get("url"))
-                        title = str(hit.get("title") or "Calendario escolar")
-                        text = f"Aquí está el PDF del calendario: {url}"
-                        return {
-                            "pregunta": question,
-                            "respuesta": text,
-                            "contexto_usado": True,
-                            "came_from": "asset",
-                            "citation": "",
-                            "source_chunks": [],
-                            "followup": "",
-                            "attachments": [url],
-                        }
-                    # Fallback si no se encuentra en assets
-                    return {
-                        "pregunta": question,
-                        "respuesta": "No encontré el PDF en la biblioteca en este momento.",
-                        "contexto_usado": False,
-                        "came_from": "asset-miss",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "¿Quieres que lo busque por otro nombre?",
-                        "attachments": [],
-                    }
-                if offer == "offer_set_reminder":
-                    return {
-                        "pregunta": question,
-                        "respuesta": "Hecho. Te recordaré tus próximas clases.",
-                        "contexto_usado": False,
-                        "came_from": "followup-local",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
-            # Negación explícita
-            return {
-                "pregunta": question,
-                "respuesta": "Entendido.",
-                "contexto_usado": False,
-                "came_from": "followup-decline",
-                "citation": "",
-                "source_chunks": [],
-                "followup": "",
-                "attachments": [],
-            }
-
-    # 0.2) Easter eggs (divertidos, sin RAG ni LLM)
+            if self.on_error is None:
+                raise
+            return self.on_error()
+        return self.finish(out)
+
+
+def ask(user_email: str, question: str, history: list[dict] | None = None, *, stream: bool = False) -> dict:
+    """Construye contexto y responde usando tool‑calling u LLM.
+
+    Flujo:
+    1) Normaliza la pregunta y despacha por la tabla de intenciones (`_INTENTS`)
+    2) Respuestas locales (enlaces, horarios, assets) si alguna intención aplica
+    3) Si no: tool‑calling (get_schedule/get_now), RAG y LLM (OpenAI→Ollama)
+
+    Con `stream=True`, las ramas RAG y LLM final devuelven `stream` (iterador de
+    texto ya limpio); `respuesta`, `offer_code` y `attachments` se completan al
+    agotarlo. Las demás ramas devuelven la respuesta completa como siempre.
+    """
+    # Usuario/perfil/horario se leen una sola vez para toda la pregunta
+    with request_scope():
+        with span("ask.route"):
+            intent, out = _route(user_email, question, history, stream=stream)
+        if not isinstance(out, _LLMStep):
+            return out
+        t0 = perf_counter()
+        with span("ask.llm"):
+            res = out.resolve()
+    if not stream:
+        _INTENTS.record(f"{intent}.llm", (perf_counter() - t0) * 1000.0)
+    return res
+
+
+async def ask_async(user_email: str, question: str, history: list[dict] | None = None) -> dict:
+    """Variante async de `ask` (modo no-stream).
+
+    El ruteo (reglas locales y consultas cortas a Mongo) corre en un hilo; las
+    llamadas al modelo, embeddings y KNN se esperan en el event loop, de modo
+    que una respuesta lenta del LLM no retiene un hilo del pool.
+    """
+    with request_scope():
+        with span("ask.route"):
+            intent, out = await asyncio.to_thread(_route, user_email, question, history)
+        if not isinstance(out, _LLMStep):
+            return out
+        t0 = perf_counter()
+        with span("ask.llm"):
+            res = await out.resolve_async()
+    _INTENTS.record(f"{intent}.llm", (perf_counter() - t0) * 1000.0)
+    return res
+
+
+def _route(user_email: str, question: str, history: list[dict] | None = None, *, stream: bool = False) -> "tuple[str, dict | _LLMStep]":
+    """Cuerpo de `ask`: normaliza una vez y despacha por la tabla de intenciones.
+
+    Devuelve (intención, respuesta o `_LLMStep` pendiente).
+    """
+    t0 = perf_counter()
+    q = Query(user_email, question, history, stream=stream)
+    _INTENTS.record("normalize", (perf_counter() - t0) * 1000.0)
+    return _INTENTS.dispatch(q)
+
+
+def intent_stats() -> dict:
+    """Aciertos por intención y latencia por etapa (incluye `<intención>.llm`)."""
+    return _INTENTS.stats()
+
+
+def _plain(question: str, respuesta: str, came_from: str, *, contexto_usado: bool = False, followup: str = "", attachments: list | None = None) -> dict:
+    return {
+        "pregunta": question,
+        "respuesta": respuesta,
+        "contexto_usado": contexto_usado,
+        "came_from": came_from,
+        "citation": "",
+        "source_chunks": [],
+        "followup": followup,
+        "attachments": attachments or [],
+    }
+
+
+_WORDS_TO_NUM = {
+    "primero": 1, "segundo": 2, "tercero": 3, "cuarto": 4, "quinto": 5, "sexto": 6,
+    "septimo": 7, "séptimo": 7, "octavo": 8, "noveno": 9,
+}
+
+
+def _schedule_by_params(question: str, prog: str, sem: int, shift: str, group: str | None, suffix: str = "") -> dict | None:
+    """Imagen del horario por parámetros o, si no hay, el horario en texto."""
+    hit = find_schedule_image_by_params(prog, sem, shift, group=group)
+    if hit and hit.get("url"):
+        return _plain(question, "Aquí tienes el horario.", "asset-schedule-params" + suffix, contexto_usado=True, attachments=[hit.get("url")])
+    from app.services.schedule_service import schedule_text_by_params
+    txt = schedule_text_by_params(prog, sem, shift, group=group)
+    if txt:
+        return _plain(question, txt, "schedule-by-params" + suffix, contexto_usado=True)
+    return None
+
+
+# 0) Confirmación sí/no de una oferta del turno anterior
+def _h_offer_reply(q: Query) -> "dict | _LLMStep | None":
+    question, history = q.question, q.history
+    if not _is_yes_or_no(question):
+        return None
+    offer = _last_offer(history)
+    if not offer:
+        return None
+    if _is_yes(question):
+        if offer == "offer_exam_dates":
+            exam_q = "Fechas de exámenes ordinarios del semestre actual UABCS"
+
+            def _exam_dates(rag: dict) -> dict:
+                ans = str(rag.get("answer") or "Aquí tienes las fechas clave.")
+                return _plain(question, ans, "rag-followup", contexto_usado=True, attachments=_extract_urls(ans))
+
+            def _exam_dates_fallback() -> dict:
+                return _plain(question, "Aquí tienes las fechas clave del calendario.", "followup")
+
+            return _LLMStep(
+                lambda: answer_with_rag(exam_q, k=6, where=_CALENDAR_CHUNKS),
+                lambda: answer_with_rag_async(exam_q, k=6, where=_CALENDAR_CHUNKS),
+                _exam_dates,
+                on_error=_exam_dates_fallback,
+            )
+        if offer == "offer_asuetos_next_month":
+            return _holidays_next_month(question, q.user_email)
+        if offer == "offer_open_pdf":
+            try:
+                from app.services.library_service import find_calendar_pdf_url
+                hit = find_calendar_pdf_url()
+            except Exception:
+                hit = None
+            if hit and hit.get("url"):
+                url = str(hit.get("url"))
+                text = f"Aquí está el PDF del calendario: {url}"
+                return _plain(question, text, "asset", contexto_usado=True, attachments=[url])
+            # Fallback si no se encuentra en assets
+            return _plain(
+                question,
+                "No encontré el PDF en la biblioteca en este momento.",
+                "asset-miss",
+                followup="¿Quieres que lo busque por otro nombre?",
+            )
+        if offer == "offer_set_reminder":
+            return _plain(question, "Hecho. Te recordaré tus próximas clases.", "followup-local")
+    # Negación explícita
+    return _plain(question, "Entendido.", "followup-decline")
+
+
+def _holidays_next_month(question: str, user_email: str) -> "dict | _LLMStep":
+    """Asuetos del mes siguiente desde `calendar_holiday`; si no hay registrados, RAG."""
+    now = _now_local(user_email)
+    year, month = (now.year + 1, 1) if now.month == 12 else (now.year, now.month + 1)
+    label = f"{_MONTHS_ES[month]} de {year}"
+    rows = holidays_between(date(year, month, 1), date(year, month, monthrange(year, month)[1]))
+    if rows:
+        lines = []
+        for h in rows:
+            d = date.fromisoformat(h["date"])
+            reason = f" — {h['reason']}" if h.get("reason") else ""
+            lines.append(f"- {d.day} de {_MONTHS_ES[d.month]}{reason}")
+        return _plain(question, f"Asuetos de {label}:\n" + "\n".join(lines), "holidays-next-month", contexto_usado=True)
+    rag_q = f"Días de asueto en {label} UABCS"
+
+    def _from_rag(rag: dict) -> dict:
+        ans = str(rag.get("answer") or f"No tengo asuetos registrados para {label}.")
+        return _plain(question, ans, "rag-followup", contexto_usado=True, attachments=_extract_urls(ans))
+
+    return _LLMStep(
+        lambda: answer_with_rag(rag_q, k=6, where=_CALENDAR_CHUNKS),
+        lambda: answer_with_rag_async(rag_q, k=6, where=_CALENDAR_CHUNKS),
+        _from_rag,
+        on_error=lambda: _plain(question, f"No tengo asuetos registrados para {label}.", "followup"),
+    )
+
+
+# 0.2) Easter eggs (divertidos, sin RAG ni LLM)
+def _h_easter_egg(q: Query) -> dict | None:
     try:
-        egg = check_easter_egg(question, history)
-        if egg:
-            return egg
+        return check_easter_egg(q.question, q.history) or None
     except Exception:
         # No bloquear el flujo si falla algo en eggs
-        pass
+        return None
+
+
+# A) Intención social (saludo/agradecimiento/despedida): no activar RAG ni tools
+def _h_social(q: Query) -> "_LLMStep | None":
+    if _detect_social_intent(q.question):
+        return _social_step(q.question, q.history, "chat-social")
+    return None
 
-    # A) Intención social (saludo/agradecimiento/despedida): no activar RAG ni tools
-    intent = _detect_social_intent(question)
-    if intent:
-        text = _social_llm_reply(question, history)
-        return {
-            "pregunta": question,
-            "respuesta": text,
-            "contexto_usado": False,
-            "came_from": "chat-social",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [],
-        }
 
-    # B0) Seguimiento robusto: acumula carrera/semestre/turno a partir de mensajes recientes
-    # Se ejecuta ANTES del filtro de intención para aceptar entradas como "IDS", "7", "TV".
+def _asked_schedule_params(q: Query) -> bool:
+    return any(w in q.last_assistant for w in ["carrera", "semestre", "turno"])
+
+
+def _looks_like_param_token(s: str) -> bool:
+    t = (s or "").strip().lower()
+    if not t:
+        return False
+    if t in {"tm", "tv", "mt", "vt", "mañana", "manana", "tarde", "matutino", "vespertino", "a", "b"}:
+        return True
+    if re.fullmatch(r"\d{1,2}", t):
+        return True
+    return _extract_program_code(t) is not None
+
+
+# B0) Seguimiento robusto: acumula carrera/semestre/turno a partir de mensajes recientes.
+# Va ANTES del filtro de intención para aceptar entradas como "IDS", "7", "TV".
+def _h_schedule_followup(q: Query) -> dict | None:
+    question, history = q.question, q.history
     try:
-        last_assistant = ""
+        last_assistant = q.last_assistant
+        # Dispara sólo si el usuario pide explícitamente "horario"
+        # o si está respondiendo con tokens de parámetros después de que se lo pedimos.
+        if not (("horario" in q.low) or (_asked_schedule_params(q) and _looks_like_param_token(question))):
+            return None
+        # Reúne los últimos mensajes del usuario para extraer parámetros
+        user_texts: list[str] = [question or ""]
         if history:
+            count = 0
             for m in reversed(history):
-                if str(m.get("role")).lower() == "assistant":
-                    last_assistant = (m.get("content") or "").lower()
+                if str(m.get("role")).lower() != "user":
+                    continue
+                user_texts.append(m.get("content") or "")
+                count += 1
+                if count >= 8:
                     break
-        def _looks_like_param_token(s: str) -> bool:
-            t = (s or "").strip().lower()
-            if not t:
-                return False
-            if t in {"tm","tv","mt","vt","mañana","manana","tarde","matutino","vespertino","a","b"}:
-                return True
-            import re
-            if re.fullmatch(r"\d{1,2}", t):
-                return True
-            return _extract_program_code(t) is not None
-
-        assistant_asked_any = any(w in last_assistant for w in ["carrera", "semestre", "turno"])
-        qlow = (question or "").lower()
-        # Dispara este bloque sólo si el usuario pide explícitamente "horario"
-        # o si está respondiendo con tokens de parámetros después de que se lo pedimos.
-        if ("horario" in qlow) or (assistant_asked_any and _looks_like_param_token(question)):
-            # Reúne los últimos mensajes del usuario para extraer parámetros
-            user_texts: list[str] = [question or ""]
-            if history:
-                count = 0
-                for m in reversed(history):
-                    if str(m.get("role")).lower() != "user":
-                        continue
-                    user_texts.append(m.get("content") or "")
-                    count += 1
-                    if count >= 8:
-                        break
-            s_all = " ".join(reversed(user_texts)).lower()
-            import re
-            # Toma la carrera del agregado o, si no aparece, de la última frase del asistente
-            prog = _extract_program_code(s_all) or _extract_program_code(last_assistant)
-            # Semestre: número o palabra
-            words_to_num = {
-                "primero":1,"segundo":2,"tercero":3,"cuarto":4,"quinto":5,"sexto":6,
-                "septimo":7,"séptimo":7,"octavo":8,"noveno":9,
-            }
-            sem = None
-            mnum = re.search(r"\b(\d{1,2})\b", s_all)
-            if mnum:
-                try:
-                    n = int(mnum.group(1))
-                    if 1 <= n <= 9:
-                        sem = n
-                except Exception:
-                    sem = None
-            if sem is None:
-                for w, n in words_to_num.items():
-                    if w in s_all:
-                        sem = n; break
-            # Turno
-            shift = None
-            if any(w in s_all for w in ["matutino", "tm", "mt", "mañana", "manana"]):
-                shift = "TM"
-            elif any(w in s_all for w in ["vespertino", "tv", "vt", "vp", "tarde"]):
-                shift = "TV"
-            # Grupo (A/B) solo relevante para sem 1 y 3 turno TM
-            group = None
-            mgrp = re.search(r"\bgrupo\s*([ab])\b", s_all)
-            if mgrp:
-                group = mgrp.group(1).upper()
-            elif sem in {1,3}:
-                m2 = re.search(r"\b(?:1|3)\s*([ab])\b", s_all)
-                if m2:
-                    group = m2.group(1).upper()
-                else:
-                    # Acepta 'a' o 'b' como token aislado
-                    m3 = re.search(r"(?i)\b([ab])\b", s_all)
-                    if m3:
-                        group = m3.group(1).upper()
-
-            # Si es 1º o 3º en TM y no hay grupo, pedirlo primero
-            if prog and sem in {1,3} and shift == "TM" and not group:
-                return {
-                    "pregunta": question,
-                    "respuesta": "Para TM en semestres 1 y 3 hay grupos A y B. ¿Cuál es tu grupo? (A o B)",
-                    "contexto_usado": False,
-                    "came_from": "ask-group-needed",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": [],
-                }
-
-            if prog and sem and shift:
-                hit = find_schedule_image_by_params(prog, sem, shift, group=group)
-                if hit and hit.get("url"):
-                    return {
-                        "pregunta": question,
-                        "respuesta": "Aquí tienes el horario.",
-                        "contexto_usado": True,
-                        "came_from": "asset-schedule-params",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [hit.get("url")],
-                    }
-                from app.services.schedule_service import schedule_text_by_params
-                txt = schedule_text_by_params(prog, sem, shift, group=group)
-                if txt:
-                    return {
-                        "pregunta": question,
-                        "respuesta": txt,
-                        "contexto_usado": True,
-                        "came_from": "schedule-by-params",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
-            # Pide solo lo que falte
-            needs: list[str] = []
-            if not prog:
-                needs.append("carrera (ej. IDS)")
-            if not sem:
-                needs.append("semestre (1–9)")
-            if not shift:
-                needs.append("turno (TM o TV)")
-            if sem in {1,3} and shift == "TM" and "grupo" not in needs:
-                needs.append("grupo (A o B)")
-            if needs:
-                return {
-                    "pregunta": question,
-                    "respuesta": "¿Podrías decirme " + " y ".join(needs) + "?",
-                    "contexto_usado": False,
-                    "came_from": "ask-schedule-need-more",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": [],
-                }
+        s_all = " ".join(reversed(user_texts)).lower()
+        # Toma la carrera del agregado o, si no aparece, de la última frase del asistente
+        prog = _extract_program_code(s_all) or _extract_program_code(last_assistant)
+        # Semestre: número o palabra
+        sem = None
+        mnum = re.search(r"\b(\d{1,2})\b", s_all)
+        if mnum:
+            try:
+                n = int(mnum.group(1))
+                if 1 <= n <= 9:
+                    sem = n
+            except Exception:
+                sem = None
+        if sem is None:
+            for w, n in _WORDS_TO_NUM.items():
+                if w in s_all:
+                    sem = n; break
+        # Turno
+        shift = None
+        if any(w in s_all for w in ["matutino", "tm", "mt", "mañana", "manana"]):
+            shift = "TM"
+        elif any(w in s_all for w in ["vespertino", "tv", "vt", "vp", "tarde"]):
+            shift = "TV"
+        # Grupo (A/B) solo relevante para sem 1 y 3 turno TM
+        group = None
+        mgrp = re.search(r"\bgrupo\s*([ab])\b", s_all)
+        if mgrp:
+            group = mgrp.group(1).upper()
+        elif sem in {1, 3}:
+            m2 = re.search(r"\b(?:1|3)\s*([ab])\b", s_all)
+            if m2:
+                group = m2.group(1).upper()
+            else:
+                # Acepta 'a' o 'b' como token aislado
+                m3 = re.search(r"(?i)\b([ab])\b", s_all)
+                if m3:
+                    group = m3.group(1).upper()
+
+        # Si es 1º o 3º en TM y no hay grupo, pedirlo primero
+        if prog and sem in {1, 3} and shift == "TM" and not group:
+            return _plain(question, "Para TM en semestres 1 y 3 hay grupos A y B. ¿Cuál es tu grupo? (A o B)", "ask-group-needed")
+
+        if prog and sem and shift:
+            out = _schedule_by_params(question, prog, sem, shift, group)
+            if out:
+                return out
+        # Pide solo lo que falte
+        needs: list[str] = []
+        if not prog:
+            needs.append("carrera (ej. IDS)")
+        if not sem:
+            needs.append("semestre (1–9)")
+        if not shift:
+            needs.append("turno (TM o TV)")
+        if sem in {1, 3} and shift == "TM" and "grupo" not in needs:
+            needs.append("grupo (A o B)")
+        if needs:
+            return _plain(question, "¿Podrías decirme " + " y ".join(needs) + "?", "ask-schedule-need-more")
     except Exception:
         pass
+    return None
 
-    # C0-pre) Enlaces directos institucionales (evita confusiones con "ahora")
-    sm_hit = _match_social_or_site_link(question)
-    if sm_hit:
-        title, url = sm_hit.get("title"), sm_hit.get("url")
-        msg = title or "Enlace solicitado:"
-        return {
-            "pregunta": question,
-            "respuesta": msg,
-            "contexto_usado": False,
-            "came_from": "link",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [url] if url else [],
-        }
 
-    # B) Si no parece intención académica, conversar sin RAG (permite variación y contexto)
-    if not _is_academic_intent(question):
-        answer = _social_llm_reply(question, history)
-        return {
-            "pregunta": question,
-            "respuesta": answer,
-            "contexto_usado": False,
-            "came_from": "chat-free",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [],
-        }
+# C0-pre) Enlaces directos institucionales (evita confusiones con "ahora")
+def _h_site_link(q: Query) -> dict | None:
+    sm_hit = _match_social_or_site_link(q.question)
+    if not sm_hit:
+        return None
+    title, url = sm_hit.get("title"), sm_hit.get("url")
+    return _plain(q.question, title or "Enlace solicitado:", "link", attachments=[url] if url else [])
 
-    # C) Intención académica → casos directos (calendario)
-    if _is_calendar_request(question):
-        return _answer_calendar_request(question, history)
 
-    # C) Búsqueda directa de documentos/formatos (PDF/Word)
-    if _is_document_request(question):
-        try:
-            from app.services.library_service import search_document_answer
-            txt = search_document_answer(question)
-            if txt:
-                return {
-                    "pregunta": question,
-                    "respuesta": _clean_text(txt),
-                    "contexto_usado": True,
-                    "came_from": "document",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": _extract_urls(txt),
-                }
-        except Exception:
-            pass
+# B) Si no parece intención académica, conversar sin RAG (permite variación y contexto)
+def _h_free_chat(q: Query) -> "_LLMStep | None":
+    if _is_academic_intent(q.question):
+        return None
+    return _social_step(q.question, q.history, "chat-free")
 
-    # C0-ter) Petición de enlace del SGPP → devolver solo el link como adjunto
-    if _is_sgpp_link_request(question):
-        sgpp_url = "https://sgpp-client.vercel.app/"
-        return {
-            "pregunta": question,
-            "respuesta": "Enlace al SGPP:",
-            "contexto_usado": False,
-            "came_from": "link",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [sgpp_url],
-        }
 
-    # C0-ter-1) "¿Qué son las PP?" → PP = Prácticas Profesionales
-    if _is_practicas_pp_request(question):
-        sgpp_url = "https://sgpp-client.vercel.app/"
-        try:
-            rag = answer_with_rag("¿Qué son las Prácticas Profesionales en el DASC (UABCS)?", k=8)
-            if rag and rag.get("answer"):
-                ans = _clean_text(str(rag.get("answer") or ""))
-                ans = ans.rstrip('.') + f".\nMás información y registro: {sgpp_url}"
-                return {
-                    "pregunta": question,
-                    "respuesta": ans,
-                    "contexto_usado": True,
-                    "came_from": rag.get("came_from") or "rag",
-                    "citation": "",
-                    "source_chunks": rag.get("chunks") or [],
-                    "followup": "",
-                    "attachments": [sgpp_url],
-                }
-        except Exception:
-            pass
+# C) Intención académica → casos directos (calendario)
+def _h_calendar(q: Query) -> dict | None:
+    if _is_calendar_request(q.question):
+        return _answer_calendar_request(q.question, q.history)
+    return None
+
+
+# C) Búsqueda directa de documentos/formatos (PDF/Word)
+def _h_document(q: Query) -> dict | None:
+    if not _is_document_request(q.question):
+        return None
+    try:
+        from app.services.library_service import search_document_answer
+        txt = search_document_answer(q.question)
+        if txt:
+            return _plain(q.question, _clean_text(txt), "document", contexto_usado=True, attachments=_extract_urls(txt))
+    except Exception:
+        pass
+    return None
+
+
+_SGPP_URL = "https://sgpp-client.vercel.app/"
+
+
+# C0-ter) Petición de enlace del SGPP → devolver solo el link como adjunto
+def _h_sgpp_link(q: Query) -> dict | None:
+    if _is_sgpp_link_request(q.question):
+        return _plain(q.question, "Enlace al SGPP:", "link", attachments=[_SGPP_URL])
+    return None
+
+
+# C0-ter-1) "¿Qué son las PP?" → PP = Prácticas Profesionales
+def _h_pp(q: Query) -> "_LLMStep | None":
+    question = q.question
+    if not _is_practicas_pp_request(question):
+        return None
+    pp_q = "¿Qué son las Prácticas Profesionales en el DASC (UABCS)?"
+
+    def _pp_template() -> dict:
         text = (
             "PP significa Prácticas Profesionales: actividad curricular que los estudiantes realizan en organizaciones públicas, privadas o sociales para aplicar sus competencias (160 horas, con asesor interno, usualmente en 9º semestre).\n"
-            f"Más información y registro: {sgpp_url}"
+            f"Más información y registro: {_SGPP_URL}"
         )
-        return {
-            "pregunta": question,
-            "respuesta": text,
-            "contexto_usado": False,
-            "came_from": "pp-abbrev",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [sgpp_url],
-        }
+        return _plain(question, text, "pp-abbrev", attachments=[_SGPP_URL])
 
-    # C0-ter-2) Preguntas sobre prácticas + sitio/registro/comenzar → texto breve + link SGPP
-    if _is_practices_linkish_request(question) or _is_practices_registration_request(question):
-        sgpp_url = "https://sgpp-client.vercel.app/"
-        text = (
-            "Para más información y para registrarte/iniciar tus prácticas, usa el Sistema Gestor de Prácticas Profesionales (SGPP)."
-            " Ahí podrás consultar requisitos, fechas y completar tu registro.\n"
-            f"Más información y registro: {sgpp_url}"
-        )
-        return {
-            "pregunta": question,
-            "respuesta": text,
-            "contexto_usado": False,
-            "came_from": "link",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [sgpp_url],
-        }
+    def _pp_answer(rag: dict) -> dict:
+        if rag and rag.get("answer"):
+            ans = _clean_text(str(rag.get("answer") or ""))
+            ans = ans.rstrip('.') + f".\nMás información y registro: {_SGPP_URL}"
+            out = _plain(question, ans, rag.get("came_from") or "rag", contexto_usado=True, attachments=[_SGPP_URL])
+            out["source_chunks"] = rag.get("chunks") or []
+            return out
+        return _pp_template()
+
+    return _LLMStep(
+        lambda: answer_with_rag(pp_q, k=8),
+        lambda: answer_with_rag_async(pp_q, k=8),
+        _pp_answer,
+        on_error=_pp_template,
+    )
 
-    # C0-bis) Petición directa del mapa del campus → adjuntar imagen
-    if _is_campus_map_request(question):
-        try:
-            hit = find_campus_map_image_url()
-        except Exception:
-            hit = None
-        if hit and hit.get("url"):
-            return {
-                "pregunta": question,
-                "respuesta": "Aquí está el mapa del campus.",
-                "contexto_usado": True,
-                "came_from": "campus-map",
-                "citation": "",
-                "source_chunks": [],
-                "followup": "",
-                "attachments": [hit.get("url")],
-            }
-        # Fallback si no hay asset disponible
-        return {
-            "pregunta": question,
-            "respuesta": "No encontré la imagen del mapa ahora mismo.",
-            "contexto_usado": False,
-            "came_from": "campus-map-miss",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "¿Quieres que lo busque con otro nombre?",
-            "attachments": [],
-        }
 
-    # C0-bis-2) Programa de la Semana de Sistemas → adjuntar imagen si existe
-    if _is_semana_sistemas_program_request(question):
-        try:
-            from app.services.library_service import find_semana_sistemas_program_image
-            hit = find_semana_sistemas_program_image()
-        except Exception:
-            hit = None
-        if hit and hit.get("url"):
-            return {
-                "pregunta": question,
-                "respuesta": "Aquí está el programa de actividades de la Semana de Sistemas.",
-                "contexto_usado": True,
-                "came_from": "semana-sistemas-program",
-                "citation": "",
-                "source_chunks": [],
-                "followup": "",
-                "attachments": [hit.get("url")],
-            }
-        return {
-            "pregunta": question,
-            "respuesta": "No encontré ahora mismo el programa de actividades de la Semana de Sistemas.",
-            "contexto_usado": False,
-            "came_from": "semana-sistemas-program-miss",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "¿Quieres que intente con otra palabra clave?",
-            "attachments": [],
-        }
+# C0-ter-2) Preguntas sobre prácticas + sitio/registro/comenzar → texto breve + link SGPP
+def _h_practices_link(q: Query) -> dict | None:
+    if not (_is_practices_linkish_request(q.question) or _is_practices_registration_request(q.question)):
+        return None
+    text = (
+        "Para más información y para registrarte/iniciar tus prácticas, usa el Sistema Gestor de Prácticas Profesionales (SGPP)."
+        " Ahí podrás consultar requisitos, fechas y completar tu registro.\n"
+        f"Más información y registro: {_SGPP_URL}"
+    )
+    return _plain(q.question, text, "link", attachments=[_SGPP_URL])
 
-    # C0-ter) Petición de foto del salón/aula → buscar en assets por tags
+
+# C0-bis) Petición directa del mapa del campus → adjuntar imagen
+def _h_campus_map(q: Query) -> dict | None:
+    if not _is_campus_map_request(q.question):
+        return None
     try:
-        room = _parse_room_request(question)
+        hit = find_campus_map_image_url()
     except Exception:
-        room = None
-    if room and room.get("name"):
         hit = None
-        try:
-            hit = find_room_image(room.get("name"), building=room.get("building"), floor=room.get("floor"))
-        except Exception:
-            hit = None
-        if hit and hit.get("url"):
-            title = hit.get("title") or f"Salón {room.get('name').upper()}"
-            return {
-                "pregunta": question,
-                "respuesta": f"{title}",
-                "contexto_usado": True,
-                "came_from": "room-asset",
-                "citation": "",
-                "source_chunks": [],
-                "followup": "",
-                "attachments": [hit.get("url")],
-            }
-        # Si hay ambigüedad evidente, pide precisión
-        need = []
-        if not room.get("building"):
-            need.append("edificio (AD-46 o DSC-39)")
-        if not room.get("floor"):
-            need.append("planta (PB o PA)")
-        ask = " ¿Puedes indicar " + " y ".join(need) + "?" if need else " ¿Tienes otro nombre o etiqueta?"
-        return {
-            "pregunta": question,
-            "respuesta": "No logré ubicar la foto ahora mismo." + ask,
-            "contexto_usado": False,
-            "came_from": "room-asset-miss",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [],
-        }
+    if hit and hit.get("url"):
+        return _plain(q.question, "Aquí está el mapa del campus.", "campus-map", contexto_usado=True, attachments=[hit.get("url")])
+    # Fallback si no hay asset disponible
+    return _plain(
+        q.question,
+        "No encontré la imagen del mapa ahora mismo.",
+        "campus-map-miss",
+        followup="¿Quieres que lo busque con otro nombre?",
+    )
+
 
-    # C1.52) Captura progresiva ANTES de desambiguar nombres: evita que
-    # frases como "noveno" caigan en el detector de nombres.
+# C0-bis-2) Programa de la Semana de Sistemas → adjuntar imagen si existe
+def _h_semana_sistemas(q: Query) -> dict | None:
+    if not _is_semana_sistemas_program_request(q.question):
+        return None
     try:
-        if user_email:
-            last_assistant = ""
-            if history:
-                for m in reversed(history):
-                    if str(m.get("role")).lower() == "assistant":
-                        last_assistant = (m.get("content") or "").lower()
-                        break
-            if any(pat in last_assistant for pat in [
-                "completar tu perfil",
-                "guardar en tu perfil",
-                "completar el perfil",
-                "aún me falta",
-                "aun me falta",
-                "me falta:",
-            ]):
-                s = (question or "").strip()
-                import re
-                payload: dict = {}
-                m = re.search(r"(?i)(?:me llamo|mi nombre es|nombre\s*:)\s+(.+)$", s)
-                if m:
-                    payload["full_name"] = m.group(1).strip().strip('.')
-                major_code = _extract_program_code(s)
-                if major_code:
-                    payload["major"] = major_code
-                if re.search(r"(?i)\b(matutino|tm|mañana|manana)\b", s):
-                    payload["shift"] = "TM"
-                elif re.search(r"(?i)\b(vespertino|tv|tarde)\b", s):
-                    payload["shift"] = "TV"
-                m = re.search(r"(?i)semestre\s*[:=]?\s*(\d{1,2})\b", s)
-                words_to_num = {
-                    "primero":1,"segundo":2,"tercero":3,"cuarto":4,"quinto":5,"sexto":6,
-                    "septimo":7,"séptimo":7,"octavo":8,"noveno":9,
-                }
-                if m:
-                    payload["semester"] = int(m.group(1))
-                else:
-                    for w, n in words_to_num.items():
-                        if re.search(rf"(?i)\b{w}\b", s):
-                            payload["semester"] = n; break
-                # Registro de perfil por chat desactivado: ignorar autocaptura
-                pass
+        from app.services.library_service import find_semana_sistemas_program_image
+        hit = find_semana_sistemas_program_image()
     except Exception:
-        pass
+        hit = None
+    if hit and hit.get("url"):
+        return _plain(
+            q.question,
+            "Aquí está el programa de actividades de la Semana de Sistemas.",
+            "semana-sistemas-program",
+            contexto_usado=True,
+            attachments=[hit.get("url")],
+        )
+    return _plain(
+        q.question,
+        "No encontré ahora mismo el programa de actividades de la Semana de Sistemas.",
+        "semana-sistemas-program-miss",
+        followup="¿Quieres que intente con otra palabra clave?",
+    )
 
-    # C1.45) Preguntas sobre "AURA" (la asistente) → responde directo con RAG/plantilla
-    if _is_about_aura_request(question):
-        try:
-            rag = answer_with_rag("¿Quién es AURA (asistente virtual UABCS)?", k=8)
-            if rag and rag.get("answer"):
-                ans = _clean_text(str(rag.get("answer") or ""))
-                return {
-                    "pregunta": question,
-                    "respuesta": ans,
-                    "contexto_usado": True,
-                    "came_from": rag.get("came_from") or "rag",
-                    "citation": "",
-                    "source_chunks": rag.get("chunks") or [],
-                    "followup": "",
-                    "attachments": _extract_urls(ans),
-                }
-        except Exception:
-            pass
+
+# C0-ter) Petición de foto del salón/aula → buscar en assets por tags
+def _h_room(q: Query) -> dict | None:
+    try:
+        room = _parse_room_request(q.question)
+    except Exception:
+        room = None
+    if not (room and room.get("name")):
+        return None
+    hit = None
+    try:
+        hit = find_room_image(room.get("name"), building=room.get("building"), floor=room.get("floor"))
+    except Exception:
+        hit = None
+    if hit and hit.get("url"):
+        title = hit.get("title") or f"Salón {room.get('name').upper()}"
+        return _plain(q.question, f"{title}", "room-asset", contexto_usado=True, attachments=[hit.get("url")])
+    # Si hay ambigüedad evidente, pide precisión
+    need = []
+    if not room.get("building"):
+        need.append("edificio (AD-46 o DSC-39)")
+    if not room.get("floor"):
+        need.append("planta (PB o PA)")
+    ask = " ¿Puedes indicar " + " y ".join(need) + "?" if need else " ¿Tienes otro nombre o etiqueta?"
+    return _plain(q.question, "No logré ubicar la foto ahora mismo." + ask, "room-asset-miss")
+
+
+# C1.45) Preguntas sobre "AURA" (la asistente) → responde directo con RAG/plantilla
+def _h_about_aura(q: Query) -> "_LLMStep | None":
+    question = q.question
+    if not _is_about_aura_request(question):
+        return None
+    aura_q = "¿Quién es AURA (asistente virtual UABCS)?"
+
+    def _aura_template() -> dict:
         fallback = (
             "AURA es el asistente virtual de la UABCS. Responde dudas sobre vida universitaria, calendarios, horarios, becas y trámites, y comparte enlaces oficiales cuando aplica."
         )
-        return {
-            "pregunta": question,
-            "respuesta": fallback,
-            "contexto_usado": False,
-            "came_from": "about-aura",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [],
-        }
+        return _plain(question, fallback, "about-aura")
 
-    # C1.5) Desambiguación: nombre suelto sin apellidos → pedir más contexto
-    disamb = _maybe_disambiguate_person(question)
+    def _aura_answer(rag: dict) -> dict:
+        if rag and rag.get("answer"):
+            ans = _clean_text(str(rag.get("answer") or ""))
+            out = _plain(question, ans, rag.get("came_from") or "rag", contexto_usado=True, attachments=_extract_urls(ans))
+            out["source_chunks"] = rag.get("chunks") or []
+            return out
+        return _aura_template()
+
+    return _LLMStep(
+        lambda: answer_with_rag(aura_q, k=8),
+        lambda: answer_with_rag_async(aura_q, k=8),
+        _aura_answer,
+        on_error=_aura_template,
+    )
+
+
+# C1.5) Desambiguación: nombre suelto sin apellidos → pedir más contexto
+def _h_disambiguate(q: Query) -> dict | None:
+    disamb = _maybe_disambiguate_person(q.question)
     if disamb:
-        return {
-            "pregunta": question,
-            "respuesta": disamb,
-            "contexto_usado": False,
-            "came_from": "clarify",
-            "citation": "",
-            "source_chunks": [],
-            "followup": "",
-            "attachments": [],
-        }
+        return _plain(q.question, disamb, "clarify")
+    return None
 
-    # C1.55) Captura progresiva de perfil (usuario autenticado): si el turno previo pidió completar
-    # el perfil, interpreta datos parciales (nombre, carrera, turno, semestre), guarda avances
-    # y pide lo que falte.
+
+def _asked_schedule_details(q: Query) -> bool:
+    la = q.last_assistant
+    return ("horario" in la) and any(w in la for w in ["carrera", "semestre", "turno"])
+
+
+# C1.6) Si el turno previo pidió carrera/semestre/turno y ahora envían esos datos
+# intenta mostrar imagen del horario con esos parámetros (sin requerir guardar perfil).
+def _h_schedule_details(q: Query) -> dict | None:
+    question = q.question
     try:
-        if user_email:
-            last_assistant = ""
-            if history:
-                for m in reversed(history):
-                    if str(m.get("role")).lower() == "assistant":
-                        last_assistant = (m.get("content") or "").lower()
-                        break
-            if any(pat in last_assistant for pat in [
-                "completar tu perfil",
-                "guardar en tu perfil",
-                "completar el perfil",
-                "aún me falta",
-                "aun me falta",
-                "me falta:",
-            ]):
-                s = (question or "").strip()
-                # Detecta campos
-                import re
-                payload: dict = {}
-                # Nombre
-                m = re.search(r"(?i)(?:me llamo|mi nombre es|nombre\s*:)\s+(.+)$", s)
-                if m:
-                    payload["full_name"] = m.group(1).strip().strip('.')
-                # Carrera: valida contra catálogos para evitar capturar 'mi'
-                major_code = _extract_program_code(s)
-                if major_code:
-                    payload["major"] = major_code
-                # Turno
-                if re.search(r"(?i)\b(matutino|tm|mañana|manana)\b", s):
-                    payload["shift"] = "TM"
-                elif re.search(r"(?i)\b(vespertino|tv|tarde)\b", s):
-                    payload["shift"] = "TV"
-                # Semestre
-                m = re.search(r"(?i)semestre\s*[:=]?\s*(\d{1,2})\b", s)
-                words_to_num = {
-                    "primero":1,"segundo":2,"tercero":3,"cuarto":4,"quinto":5,"sexto":6,
-                    "septimo":7,"séptimo":7,"octavo":8,"noveno":9,
-                }
-                if m:
-                    payload["semester"] = int(m.group(1))
-                else:
-                    for w, n in words_to_num.items():
-                        if re.search(rf"(?i)\b{w}\b", s):
-                            payload["semester"] = n; break
-                # Registro de perfil por chat desactivado: ignorar autocaptura
-                pass
+        if not _asked_schedule_details(q):
+            return None
+        s = q.low
+        # Programa (código) validado contra catálogos (evita capturar 'mi')
+        prog = _extract_program_code(s)
+        # Semestre: número o en palabras
+        sem = None
+        m = re.search(r"\b(\d{1,2})\b", s)
+        if m:
+            sem = int(m.group(1))
+        else:
+            for w, n in _WORDS_TO_NUM.items():
+                if w in s:
+                    sem = n; break
+        # Turno
+        shift = None
+        if any(w in s for w in ["matutino", "tm", "mt", "mañana", "manana"]):
+            shift = "TM"
+        elif any(w in s for w in ["vespertino", "tv", "vt", "vp", "tarde"]):
+            shift = "TV"
+        # Grupo (A/B) cuando aplica
+        group = None
+        mg = re.search(r"\bgrupo\s*([ab])\b", s)
+        if mg:
+            group = mg.group(1).upper()
+        elif sem in {1, 3}:
+            mg2 = re.search(r"\b(?:1|3)\s*([ab])\b", s)
+            if mg2:
+                group = mg2.group(1).upper()
+        # Si es 1º/3º TM y sin grupo, pedirlo
+        if prog and sem in {1, 3} and shift == "TM" and not group:
+            return _plain(question, "Para TM en semestres 1 y 3 hay grupos A y B. ¿Cuál es tu grupo? (A o B)", "ask-group-needed")
+        if prog and sem and shift:
+            # Imagen o, en su defecto, horario en texto por parámetros (sin perfil)
+            return _schedule_by_params(question, prog, sem, shift, group)
     except Exception:
         pass
+    return None
+
 
-    # C1.6) Si el turno previo pidió carrera/semestre/turno y ahora envían esos datos
-    # intenta mostrar imagen del horario con esos parámetros (sin requerir guardar perfil).
+# C1.65) Petición directa de horario con parámetros en la misma frase
+# Ej.: "dame el horario IDS 7 TM" o "horario de IDS 7 TV"
+def _h_schedule_inline(q: Query) -> dict | None:
+    question, history = q.question, q.history
     try:
-        last_assistant = ""
-        if history:
+        qlow = q.low
+        if "horario" not in qlow:
+            return None
+        prog = _extract_program_code(qlow)
+        if not prog:
+            # intenta recuperar la carrera desde la última indicación del asistente
+            try:
+                prog = _extract_program_code(q.last_assistant) or prog
+            except Exception:
+                pass
+        if not prog and history:
+            # busca en varios mensajes recientes de usuario/assistant
             for m in reversed(history):
-                if str(m.get("role")).lower() == "assistant":
-                    last_assistant = (m.get("content") or "").lower()
+                cand = _extract_program_code(m.get("content") or "")
+                if cand:
+                    prog = cand
                     break
-        asked_schedule_details = (
-            ("horario" in last_assistant)
-            and any(w in last_assistant for w in ["carrera", "semestre", "turno"])
-        )
-        if asked_schedule_details:
-            s = (question or "").lower()
-            # Programa (código) validado contra catálogos (evita capturar 'mi')
-            import re
-            prog = _extract_program_code(s)
-            # Semestre: número o en palabras
-            words_to_num = {
-                "primero":1,"segundo":2,"tercero":3,"cuarto":4,"quinto":5,"sexto":6,
-                "septimo":7,"séptimo":7,"octavo":8,"noveno":9,
-            }
-            sem = None
-            m = re.search(r"\b(\d{1,2})\b", s)
-            if m:
-                sem = int(m.group(1))
+        sem = None
+        m = re.search(r"\b(\d{1,2})\b", qlow)
+        if m:
+            sem = int(m.group(1))
+        else:
+            for w, n in _WORDS_TO_NUM.items():
+                if w in qlow:
+                    sem = n; break
+        shift = None
+        if any(w in qlow for w in ["matutino", "tm", "mt", "mañana", "manana"]):
+            shift = "TM"
+        elif any(w in qlow for w in ["vespertino", "tv", "vt", "vp", "tarde"]):
+            shift = "TV"
+        # Grupo (A/B) para 1º/3º TM
+        group = None
+        mg = re.search(r"\bgrupo\s*([ab])\b", qlow)
+        if mg:
+            group = mg.group(1).upper()
+        elif sem in {1, 3}:
+            m2 = re.search(r"\b(?:1|3)\s*([ab])\b", qlow)
+            if m2:
+                group = m2.group(1).upper()
             else:
-                for w, n in words_to_num.items():
-                    if w in s:
-                        sem = n; break
-            # Turno
-            shift = None
-            if any(w in s for w in ["matutino", "tm", "mt", "mañana", "manana"]):
-                shift = "TM"
-            elif any(w in s for w in ["vespertino", "tv", "vt", "vp", "tarde"]):
-                shift = "TV"
-            # Grupo (A/B) cuando aplica
-            group = None
-            mg = re.search(r"\bgrupo\s*([ab])\b", s)
-            if mg:
-                group = mg.group(1).upper()
-            elif sem in {1,3}:
-                mg2 = re.search(r"\b(?:1|3)\s*([ab])\b", s)
-                if mg2:
-                    group = mg2.group(1).upper()
-            # Si es 1º/3º TM y sin grupo, pedirlo
-            if prog and sem in {1,3} and shift == "TM" and not group:
-                return {
-                    "pregunta": question,
-                    "respuesta": "Para TM en semestres 1 y 3 hay grupos A y B. ¿Cuál es tu grupo? (A o B)",
-                    "contexto_usado": False,
-                    "came_from": "ask-group-needed",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": [],
-                }
-
-            if prog and sem and shift:
-                # 1) Intenta imagen
-                hit = find_schedule_image_by_params(prog, sem, shift, group=group)
-                if hit and hit.get("url"):
-                    return {
-                        "pregunta": question,
-                        "respuesta": "Aquí tienes el horario.",
-                        "contexto_usado": True,
-                        "came_from": "asset-schedule-params",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [hit.get("url")],
-                    }
-                # 2) Fallback: construir horario en texto por parámetros (sin perfil)
-                from app.services.schedule_service import schedule_text_by_params
-                txt = schedule_text_by_params(prog, sem, shift, group=group)
-                if txt:
-                    return {
-                        "pregunta": question,
-                        "respuesta": txt,
-                        "contexto_usado": True,
-                        "came_from": "schedule-by-params",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
+                m3 = re.search(r"(?i)\b([ab])\b", qlow)
+                if m3:
+                    group = m3.group(1).upper()
+        if prog and sem in {1, 3} and shift == "TM" and not group:
+            return _plain(question, "Para TM en semestres 1 y 3 hay grupos A y B. ¿Cuál es tu grupo? (A o B)", "ask-group-needed-inline")
+        # Prioriza parámetros explícitos sobre "mi horario" si se pudieron extraer
+        if prog and sem and shift:
+            return _schedule_by_params(question, prog, sem, shift, group, suffix="-inline")
+        # Falta información → preguntar por los campos faltantes
+        need = []
+        if not prog:
+            need.append("carrera (ej. IDS)")
+        if not sem:
+            need.append("semestre (1–9)")
+            if sem in {1, 3} and shift == "TM":
+                need.append("grupo (A o B)")
+            if not shift:
+                need.append("turno (TM o TV)")
+            if need:
+                return _plain(question, "¿Podrías decirme " + " y ".join(need) + "?", "ask-schedule-missing-inline")
     except Exception:
         pass
+    return None
 
-    # C1.65) Petición directa de horario con parámetros en la misma frase
-    # Ej.: "dame el horario IDS 7 TM" o "horario de IDS 7 TV"
-    try:
-        qlow = (question or "").lower()
-        if "horario" in qlow:
-            prog = _extract_program_code(qlow)
-            if not prog:
-                # intenta recuperar la carrera desde la última indicación del asistente
-                try:
-                    last_assistant = ""
-                    if history:
-                        for m in reversed(history):
-                            if str(m.get("role")).lower() == "assistant":
-                                last_assistant = (m.get("content") or "").lower()
-                                break
-                    prog = _extract_program_code(last_assistant) or prog
-                except Exception:
-                    pass
-            if not prog and history:
-                # busca en varios mensajes recientes de usuario/assistant
-                for m in reversed(history):
-                    cand = _extract_program_code(m.get("content") or "")
-                    if cand:
-                        prog = cand
-                        break
-            import re
-            sem = None
-            m = re.search(r"\b(\d{1,2})\b", qlow)
-            if m:
-                sem = int(m.group(1))
-            else:
-                words_to_num = {"primero":1,"segundo":2,"tercero":3,"cuarto":4,"quinto":5,"sexto":6,
-                                "septimo":7,"séptimo":7,"octavo":8,"noveno":9,
-                                }
-                for w, n in words_to_num.items():
-                    if w in qlow:
-                        sem = n; break
-            shift = None
-            if any(w in qlow for w in ["matutino", "tm", "mt", "mañana", "manana"]):
-                shift = "TM"
-            elif any(w in qlow for w in ["vespertino", "tv", "vt", "vp", "tarde"]):
-                shift = "TV"
-            # Grupo (A/B) para 1º/3º TM
-            group = None
-            mg = re.search(r"\bgrupo\s*([ab])\b", qlow)
-            if mg:
-                group = mg.group(1).upper()
-            elif sem in {1,3}:
-                m2 = re.search(r"\b(?:1|3)\s*([ab])\b", qlow)
-                if m2:
-                    group = m2.group(1).upper()
-                else:
-                    m3 = re.search(r"(?i)\b([ab])\b", qlow)
-                    if m3:
-                        group = m3.group(1).upper()
-            if prog and sem in {1,3} and shift == "TM" and not group:
-                return {
-                    "pregunta": question,
-                    "respuesta": "Para TM en semestres 1 y 3 hay grupos A y B. ¿Cuál es tu grupo? (A o B)",
-                    "contexto_usado": False,
-                    "came_from": "ask-group-needed-inline",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": [],
-                }
-            # Prioriza parámetros explícitos sobre "mi horario" si se pudieron extraer
-            if prog and sem and shift:
-                hit = find_schedule_image_by_params(prog, sem, shift, group=group)
-                if hit and hit.get("url"):
-                    return {
-                        "pregunta": question,
-                        "respuesta": "Aquí tienes el horario.",
-                        "contexto_usado": True,
-                        "came_from": "asset-schedule-params-inline",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [hit.get("url")],
-                    }
-                from app.services.schedule_service import schedule_text_by_params
-                txt = schedule_text_by_params(prog, sem, shift, group=group)
-                if txt:
-                    return {
-                        "pregunta": question,
-                        "respuesta": txt,
-                        "contexto_usado": True,
-                        "came_from": "schedule-by-params-inline",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
-            else:
-                # Falta información → preguntar por los campos faltantes
-                need = []
-                if not prog:
-                    need.append("carrera (ej. IDS)")
-            if not sem:
-                need.append("semestre (1–9)")
-                if sem in {1,3} and shift == "TM":
-                    need.append("grupo (A o B)")
-                if not shift:
-                    need.append("turno (TM o TV)")
-                if need:
-                    return {
-                        "pregunta": question,
-                        "respuesta": "¿Podrías decirme " + " y ".join(need) + "?",
-                        "contexto_usado": False,
-                        "came_from": "ask-schedule-missing-inline",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
-    except Exception:
-        pass
 
-    # C1.7) "¿qué días ... (me dan|tengo) <materia>?" → respuesta determinista desde timetable
+_COURSE_DAYS_RE = re.compile(r"qu[eé]\s*d[ií]as.*?(me\s+dan|tengo)\s+(.+)$")
+
+
+# C1.7) "¿qué días ... (me dan|tengo) <materia>?" → respuesta determinista desde timetable
+def _h_course_days(q: Query) -> dict | None:
     try:
-        qlow = (question or "").lower()
         # patrón simple: captura lo que sigue a 'que dias' hasta el final
-        m = re.search(r"qu[eé]\s*d[ií]as.*?(me\s+dan|tengo)\s+(.+)$", qlow)
-        if m:
-            course = m.group(3).strip().rstrip('? .!')
-            if course:
-                days = days_for_course(user_email, course)
-                if days:
-                    names = [CODE_TO_SPANISH_DAY.get(d, d).capitalize() for d in days]
-                    return {
-                        "pregunta": question,
-                        "respuesta": f"{', '.join(names)}.",
-                        "contexto_usado": True,
-                        "came_from": "schedule-course-days",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
-                else:
-                    return {
-                        "pregunta": question,
-                        "respuesta": "No encuentro esa materia en tu horario vigente.",
-                        "contexto_usado": True,
-                        "came_from": "schedule-course-days",
-                        "citation": "",
-                        "source_chunks": [],
-                        "followup": "",
-                        "attachments": [],
-                    }
+        m = _COURSE_DAYS_RE.search(q.low)
+        if not m:
+            return None
+        course = m.group(2).strip().rstrip('? .!')
+        if course:
+            days = days_for_course(q.user_email, course)
+            if days:
+                names = [CODE_TO_SPANISH_DAY.get(d, d).capitalize() for d in days]
+                return _plain(q.question, f"{', '.join(names)}.", "schedule-course-days", contexto_usado=True)
+            return _plain(q.question, "No encuentro esa materia en tu horario vigente.", "schedule-course-days", contexto_usado=True)
     except Exception:
         pass
+    return None
+
 
-    # C2) "dame mi horario" → intenta adjuntar imagen del horario vigente
+# C2) "dame mi horario" → intenta adjuntar imagen del horario vigente
+def _h_my_schedule(q: Query) -> dict | None:
+    question, user_email = q.question, q.user_email
     try:
-        qlow = (question or "").lower()
+        qlow = q.low
         # Caso: el usuario pide "la imagen" (con o sin decir "horario") y previamente mostramos el horario en texto
         if any(w in qlow for w in ["dame la imagen", "la imagen", "imagen", "foto"]):
-            last_text = ""
-            try:
-                if history:
-                    for m in reversed(history):
-                        if str(m.get("role")).lower() == "assistant":
-                            last_text = (m.get("content") or "")
-                            break
-            except Exception:
-                last_text = ""
+            last_text = q.last_assistant_raw
             if "Horario vigente:" in last_text:
-                import re
                 m = re.search(r"Horario vigente:\s*(.+)", last_text)
                 title = m.group(1).strip() if m else ""
                 hit = find_schedule_image_by_title(title)
                 if hit and hit.get("url"):
-                    return {"pregunta": question, "respuesta": "Aquí tienes tu horario.", "contexto_usado": True, "came_from": "asset-schedule-title", "citation": "", "source_chunks": [], "followup": "", "attachments": [hit.get("url")]} 
+                    return _plain(question, "Aquí tienes tu horario.", "asset-schedule-title", contexto_usado=True, attachments=[hit.get("url")])
                 # Apología + reutiliza el mismo texto mostrado
                 apology = "Disculpa, no encontré la imagen ahora mismo. Te dejo el horario en texto:"
-                if last_text:
-                    return {"pregunta": question, "respuesta": apology + "\n" + last_text, "contexto_usado": True, "came_from": "schedule-text-repeat", "citation": "", "source_chunks": [], "followup": "", "attachments": []}
-        
+                return _plain(question, apology + "\n" + last_text, "schedule-text-repeat", contexto_usado=True)
+
         if ("horario" in qlow) and any(w in qlow for w in ["mi ", "muestra", "ver", "dame", "foto", "imagen"]):
             hit = find_schedule_image_for_user(user_email)
             if hit and hit.get("url"):
-                return {
-                    "pregunta": question,
-                    "respuesta": "Aquí tienes tu horario.",
-                    "contexto_usado": True,
-                    "came_from": "asset-schedule",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": [hit.get("url")],
-                }
+                return _plain(question, "Aquí tienes tu horario.", "asset-schedule", contexto_usado=True, attachments=[hit.get("url")])
             # Fallback: si está logueado, construye horario en texto; si no, pide datos mínimos
             from app.services.schedule_service import schedule_text_for_user
             txt = schedule_text_for_user(user_email) if user_email else None
             if txt:
-                return {
-                    "pregunta": question,
-                    "respuesta": txt,
-                    "contexto_usado": True,
-                    "came_from": "schedule-text",
-                    "citation": "",
-                    "source_chunks": [],
-                    "followup": "",
-                    "attachments": [],
-                }
+                return _plain(question, txt, "schedule-text", contexto_usado=True)
             # Mensaje de solicitud neutral (sin guardar perfil)
             text = "¿De qué carrera, semestre y turno es el horario que quieres ver? Si es 1º o 3º TM indica grupo A o B."
-            return {
-                "pregunta": question,
-                "respuesta": text,
-                "contexto_usado": False,
-                "came_from": "asset-schedule-missing",
-                "citation": "",
-                "source_chunks": [],
-                "followup": "",
-                "attachments": [],
-            }
+            return _plain(question, text, "asset-schedule-missing")
     except Exception:
         pass
+    return None
+
 
-    # C1.9) Atajo determinista para preguntas de horario (evita hallucinations del LLM)
+# C1.9) Atajo determinista para preguntas de horario (evita hallucinations del LLM)
+def _h_schedule_fastpath(q: Query) -> dict | None:
+    question = q.question
     try:
-        quick = try_answer_schedule(user_email, question)
+        quick = try_answer_schedule(q.user_email, question)
         if quick:
-            return {
-                "pregunta": question,
-                "respuesta": _strip_irrelevant_contact(_clean_text(quick), question),
-                "contexto_usado": True,
-                "came_from": "schedule-fastpath",
-                "citation": "",
-                "source_chunks": [],
-                "followup": ("¿Puedo ayudarte con otra cosa?") if settings.chat_followups_enabled else "",
-                "offer_code": _offer_code_for(question, quick, _detect_topic(question, quick)),
-                "attachments": _extract_urls(quick),
-            }
+            out = _plain(
+                question,
+                _strip_irrelevant_contact(_clean_text(quick), question),
+                "schedule-fastpath",
+                contexto_usado=True,
+                followup=("¿Puedo ayudarte con otra cosa?") if settings.chat_followups_enabled else "",
+                attachments=_extract_urls(quick),
+            )
+            out["offer_code"] = _offer_code_for(question, quick, _detect_topic(question, quick))
+            return out
     except Exception:
         pass
+    return None
+
 
-    # C2) Construye contexto breve
+# Cola: contexto breve + consulta efectiva → tools / RAG / LLM
+def _h_answer(q: Query) -> "_LLMStep":
+    user_email, question, history = q.user_email, q.question, q.history
     ctx = build_academic_context(user_email)
 
-    # 2) RAG primero: si hay evidencia útil, nos quedamos con esa respuesta
+    # Consulta efectiva para RAG (sesgos temporales/personas a partir del historial)
     try:
         q_eff = _rewrite_temporal_phrases(question, user_email)
         q_eff = _bias_asueto_query(q_eff)
@@ -1058,26 +808,87 @@ def ask(user_email: str, question: str, history: list[dict] | None = None) -> di
         q_eff = _bias_people_query(q_eff, history)
         # Si el usuario usa pronombres ("su correo"), agrega la última persona del historial
         q_eff = _augment_query_with_last_person(q_eff, history)
-        rag = answer_with_rag(q_eff, k=30, continuation_person=_last_person_from_history(history))
-        if rag and rag.get("used_context") and rag.get("answer"):
-            ans = _clean_text(str(rag.get("answer") or ""))
-            ans = _strip_irrelevant_contact(ans, question)
-            return {
-                "pregunta": question,
-                "respuesta": ans,
-                "contexto_usado": True,
-                "came_from": rag.get("came_from") or "rag",
-                "citation": rag.get("citation") or "",
-                "source_chunks": rag.get("source_chunks") or [],
-                "followup": ("¿Puedo ayudarte con otra cosa?") if settings.chat_followups_enabled else "",
-                "offer_code": _offer_code_for(question, ans, _detect_topic(question, ans)),
-                "attachments": _extract_urls(ans),
-            }
+        person = _last_person_from_history(history)
+        variants = _query_variants(question, user_email, history)
     except Exception:
-        pass
+        q_eff, person, variants = None, None, None
 
-    # 2b) Si no hubo contexto del RAG, dejamos que el modelo decida tool/respuesta
-    oa_answer = answer_with_tools(user_email, question, ctx, history=history)
+    stream = q.stream
+    return _LLMStep(
+        lambda: _answer_tail(user_email, question, history, ctx, q_eff, person, stream=stream, variants=variants),
+        lambda: _answer_tail_async(user_email, question, history, ctx, q_eff, person, variants=variants),
+        lambda out: out,
+    )
+
+
+def _query_variants(question: str, user_email: str, history: list[dict] | None) -> list[str]:
+    """Variantes para RAG multi-consulta: la pregunta reescrita y, por separado,
+    cada sesgo que aplique (asueto, exámenes, próxima fecha, personas) en lugar de
+    acumularlos en una sola cadena como `q_eff`.
+    """
+    base = _rewrite_temporal_phrases(question, user_email)
+    base = _infer_followup_attribute(base, history)
+    base = _augment_query_with_last_person(base, history)
+    variants = [base]
+    for bias in (
+        _bias_asueto_query,
+        _bias_exam_query,
+        lambda s: _bias_upcoming_query(s, user_email),
+        lambda s: _bias_people_query(s, history),
+    ):
+        v = bias(base)
+        if v and v not in variants:
+            variants.append(v)
+    return variants
+
+
+# Tabla de intenciones, en orden de prioridad. `signals` son las señales de `Query`
+# sin las cuales la verificación fina del handler no puede cumplirse (se omite);
+# `when` cubre condiciones que dependen del historial.
+_INTENTS = IntentRouter()
+_INTENTS.add("offer_reply", _h_offer_reply, signals=("yesno",))
+_INTENTS.add("easter_egg", _h_easter_egg)
+_INTENTS.add("social", _h_social, signals=("social",))
+_INTENTS.add("schedule_followup", _h_schedule_followup, signals=("horario",), when=_asked_schedule_params)
+_INTENTS.add("site_link", _h_site_link, signals=("link_entity",))
+_INTENTS.add("free_chat", _h_free_chat)
+_INTENTS.add("calendar", _h_calendar, signals=("calendar",))
+_INTENTS.add("document", _h_document, signals=("document",))
+_INTENTS.add("sgpp_link", _h_sgpp_link, signals=("sgpp",))
+_INTENTS.add("pp", _h_pp, signals=("pp",))
+_INTENTS.add("practices_link", _h_practices_link, signals=("practices",))
+_INTENTS.add("campus_map", _h_campus_map, signals=("campus",))
+_INTENTS.add("semana_sistemas", _h_semana_sistemas, signals=("semana_sistemas",))
+_INTENTS.add("room", _h_room, signals=("room",))
+_INTENTS.add("about_aura", _h_about_aura, signals=("aura",))
+_INTENTS.add("disambiguate", _h_disambiguate)
+_INTENTS.add("schedule_details", _h_schedule_details, when=_asked_schedule_details)
+_INTENTS.add("schedule_inline", _h_schedule_inline, signals=("horario",))
+_INTENTS.add("course_days", _h_course_days, signals=("days",))
+_INTENTS.add("my_schedule", _h_my_schedule, signals=("image", "horario"))
+_INTENTS.add("schedule_fastpath", _h_schedule_fastpath)
+_INTENTS.add("answer", _h_answer)
+
+
+def _rag_result(question: str, rag: dict) -> dict | None:
+    if rag and rag.get("used_context") and rag.get("answer"):
+        ans = _clean_text(str(rag.get("answer") or ""))
+        ans = _strip_irrelevant_contact(ans, question)
+        return {
+            "pregunta": question,
+            "respuesta": ans,
+            "contexto_usado": True,
+            "came_from": rag.get("came_from") or "rag",
+            "citation": rag.get("citation") or "",
+            "source_chunks": rag.get("source_chunks") or [],
+            "followup": ("¿Puedo ayudarte con otra cosa?") if settings.chat_followups_enabled else "",
+            "offer_code": _offer_code_for(question, ans, _detect_topic(question, ans)),
+            "attachments": _extract_urls(ans),
+        }
+    return None
+
+
+def _tools_result(question: str, oa_answer: dict | None) -> dict | None:
     if oa_answer and isinstance(oa_answer, dict) and (oa_answer.get("answer") or "").strip():
         return {
             "pregunta": question,
@@ -1090,9 +901,10 @@ def ask(user_email: str, question: str, history: list[dict] | None = None) -> di
             "offer_code": oa_answer.get("offer_code") or _offer_code_for(question, oa_answer.get("answer") or "", _detect_topic(question, oa_answer.get("answer") or "")),
             "attachments": _extract_urls(str(oa_answer.get("answer") or "")),
         }
+    return None
 
-    # 3) Fallback local: detector simple de horario
-    tool_answer = try_answer_schedule(user_email, question)
+
+def _schedule_result(question: str, tool_answer: str | None) -> dict | None:
     if tool_answer:
         return {
             "pregunta": question,
@@ -1105,9 +917,10 @@ def ask(user_email: str, question: str, history: list[dict] | None = None) -> di
             "offer_code": _offer_code_for(question, tool_answer, _detect_topic(question, tool_answer)),
             "attachments": _extract_urls(tool_answer),
         }
+    return None
 
-    # 4) Último recurso: pipeline LLM clásico (OpenAI→Ollama)
-    answer = ask_llm(question, ctx, history=history)
+
+def _llm_result(question: str, ctx: str, answer: str) -> dict:
     answer = _strip_irrelevant_contact(answer, question)
     return {
         "pregunta": question,
@@ -1122,6 +935,91 @@ def ask(user_email: str, question: str, history: list[dict] | None = None) -> di
     }
 
 
+def _answer_tail(
+    user_email: str,
+    question: str,
+    history: list[dict] | None,
+    ctx: str,
+    q_eff: str | None,
+    person: str | None,
+    *,
+    stream: bool = False,
+    variants: list[str] | None = None,
+) -> dict:
+    """Tramo final de `ask`: RAG → tool-calling → horario local → LLM."""
+    # 2) RAG primero: si hay evidencia útil, nos quedamos con esa respuesta
+    if q_eff is not None:
+        try:
+            rag = answer_with_rag(q_eff, k=30, continuation_person=person, stream=stream, queries=variants)
+            if stream and rag and rag.get("used_context") and rag.get("answer_stream") is not None:
+                return _streamed_result(question, rag["answer_stream"], {
+                    "pregunta": question,
+                    "contexto_usado": True,
+                    "came_from": rag.get("came_from") or "rag",
+                    "citation": rag.get("citation") or "",
+                    "source_chunks": rag.get("source_chunks") or [],
+                    "followup": ("¿Puedo ayudarte con otra cosa?") if settings.chat_followups_enabled else "",
+                })
+            out = _rag_result(question, rag)
+            if out:
+                return out
+        except Exception:
+            pass
+
+    # 2b) Si no hubo contexto del RAG, dejamos que el modelo decida tool/respuesta
+    out = _tools_result(question, answer_with_tools(user_email, question, ctx, history=history))
+    if out:
+        return out
+
+    # 3) Fallback local: detector simple de horario
+    out = _schedule_result(question, try_answer_schedule(user_email, question))
+    if out:
+        return out
+
+    # 4) Último recurso: pipeline LLM clásico (OpenAI→Ollama)
+    if stream:
+        return _streamed_result(question, ask_llm_stream(question, ctx, history=history), {
+            "pregunta": question,
+            "contexto_usado": bool(ctx and ctx != "Sin datos académicos del alumno aún."),
+            "came_from": "llm",
+            "citation": "",
+            "source_chunks": [],
+            "followup": ("¿Puedo ayudarte con otra cosa?") if settings.chat_followups_enabled else "",
+        })
+    return _llm_result(question, ctx, ask_llm(question, ctx, history=history))
+
+
+async def _answer_tail_async(
+    user_email: str,
+    question: str,
+    history: list[dict] | None,
+    ctx: str,
+    q_eff: str | None,
+    person: str | None,
+    *,
+    variants: list[str] | None = None,
+) -> dict:
+    """Variante async de `_answer_tail` (mismo orden de respaldos)."""
+    if q_eff is not None:
+        try:
+            rag = await answer_with_rag_async(q_eff, k=30, continuation_person=person, queries=variants)
+            out = _rag_result(question, rag)
+            if out:
+                return out
+        except Exception:
+            pass
+
+    out = _tools_result(question, await answer_with_tools_async(user_email, question, ctx, history=history))
+    if out:
+        return out
+
+    out = _schedule_result(question, await asyncio.to_thread(try_answer_schedule, user_email, question))
+    if out:
+        return out
+
+    return _llm_result(question, ctx, await ask_llm_async(question, ctx, history=history))
+
+
 _URL_RE = re.compile(r"https?://[^\s>]+", re.IGNORECASE)
 
 
@@ -1378,37 +1276,60 @@ SOCIAL_SYSTEM = (
 )
 
 
-def _social_llm_reply(prompt: str, history: list[dict] | None) -> str:
+def _social_postprocess(raw: str) -> str:
+    out = (raw or "").strip() or "Hola, ¿qué necesitas?"
+    # Garantiza cierre orientado a ayuda académica y evita desvíos personales
+    help_re = re.compile(r"(en que puedo (ayudarte|apoyarte)|como puedo ayudarte)", re.IGNORECASE)
+    personal_re = re.compile(r"\b(plan(es)?|\btu d[ií]a\b|como te sientes|que tal tu d[ií]a)\b", re.IGNORECASE)
+    if settings.chat_followups_enabled and not help_re.search(out):
+        # Añade una pregunta genérica de ayuda sólo si está habilitado
+        out = (out.rstrip(" .!") + ". ¿Puedo ayudarte con otra cosa?").strip()
+    if personal_re.search(out):
+        # Sustituye partes personales por orientación útil
+        out = ("¿Puedo ayudarte con otra cosa?" if settings.chat_followups_enabled else "Puedo ayudarte con tus trámites o calendario.")
+    return out
+
+
+def _social_template() -> str:
+    # Fallback a plantillas si falla la API
+    pool = _SOCIAL_GREET
     try:
-        out = (
-            ask_llm(
-                prompt,
-                context="",
-                history=history or [],
-                system=SOCIAL_SYSTEM,
-                temperature=0.6,
-                max_tokens=64,
-            ).strip()
-            or "Hola, ¿qué necesitas?"
-        )
-        # Garantiza cierre orientado a ayuda académica y evita desvíos personales
-        help_re = re.compile(r"(en que puedo (ayudarte|apoyarte)|como puedo ayudarte)", re.IGNORECASE)
-        personal_re = re.compile(r"\b(plan(es)?|\btu d[ií]a\b|como te sientes|que tal tu d[ií]a)\b", re.IGNORECASE)
-        if settings.chat_followups_enabled and not help_re.search(out):
-            # Añade una pregunta genérica de ayuda sólo si está habilitado
-            out = (out.rstrip(" .!") + ". ¿Puedo ayudarte con otra cosa?").strip()
-        if personal_re.search(out):
-            # Sustituye partes personales por orientación útil
-            out = ("¿Puedo ayudarte con otra cosa?" if settings.chat_followups_enabled else "Puedo ayudarte con tus trámites o calendario.")
-        return out
+        import random as _rnd
+        return (_rnd.choice(pool) + " ¿En qué puedo apoyarte con calendario, materias o trámites?").strip()
     except Exception:
-        # Fallback a plantillas si falla la API
-        pool = _SOCIAL_GREET
+        return (pool[0] + " ¿En qué puedo apoyarte con calendario, materias o trámites?").strip()
+
+
+_SOCIAL_LLM_KWARGS = dict(context="", system=SOCIAL_SYSTEM, temperature=0.6, max_tokens=64)
+
+
+def _social_step(question: str, history: list[dict] | None, came_from: str) -> _LLMStep:
+    """Charla social/libre: respuesta breve del LLM sin RAG ni tools."""
+
+    def _wrap(text: str) -> dict:
+        return {
+            "pregunta": question,
+            "respuesta": text,
+            "contexto_usado": False,
+            "came_from": came_from,
+            "citation": "",
+            "source_chunks": [],
+            "followup": "",
+            "attachments": [],
+        }
+
+    def _finish(raw: str) -> dict:
         try:
-            import random as _rnd
-            return (_rnd.choice(pool) + " ¿En qué puedo apoyarte con calendario, materias o trámites?").strip()
+            return _wrap(_social_postprocess(raw))
         except Exception:
-            return (pool[0] + " ¿En qué puedo apoyarte con calendario, materias o trámites?").strip()
+            return _wrap(_social_template())
+
+    return _LLMStep(
+        lambda: ask_llm(question, history=history or [], **_SOCIAL_LLM_KWARGS),
+        lambda: ask_llm_async(question, history=history or [], **_SOCIAL_LLM_KWARGS),
+        _finish,
+        on_error=lambda: _wrap(_social_template()),
+    )
 
 
 def _suggest_followup_tool(question: str, origin: str | None) -> str:
@@ -1873,6 +1794,77 @@ def _clean_text(text: str) -> str:
 _CONTACT_RE = re.compile(r"\b(correo|email|e-?mail|mail)\b", re.IGNORECASE)
 
 
+# Límite de oración para streaming: fin de frase seguido de espacio, o salto de línea
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def _clean_stream(deltas: Iterator[str], question: str) -> Iterator[str]:
+    """Post-proceso incremental equivalente a `_clean_text` + `_strip_irrelevant_contact`.
+
+    Acumula fragmentos hasta completar una oración (fuera de paréntesis) y la
+    emite ya limpia; si la pregunta no es de contacto, descarta las oraciones
+    que mencionan correo. Si todo se descartó, emite el texto original.
+    """
+    keep_contact = bool(_CONTACT_RE.search(question or ""))
+    buf = ""
+    emitted = False
+    dropped: list[str] = []
+
+    def _flush(sentence: str, sep: str) -> str | None:
+        nonlocal emitted
+        if not sentence.strip():
+            return None
+        if not keep_contact and _CONTACT_RE.search(sentence):
+            dropped.append(sentence + sep)
+            return None
+        out = _clean_text(sentence)
+        if not out:
+            return None
+        emitted = True
+        return out + (sep if "\n" in sep else " ")
+
+    for piece in deltas:
+        buf += piece
+        cut = 0
+        for m in _SENTENCE_END_RE.finditer(buf):
+            head = buf[cut:m.start()]
+            # No cortar dentro de un paréntesis abierto (p. ej. "(Calendario 2025-I. UABCS)")
+            if head.count("(") > head.count(")"):
+                continue
+            out = _flush(head, m.group(0))
+            if out:
+                yield out
+            cut = m.end()
+        buf = buf[cut:]
+    out = _flush(buf, "")
+    if out:
+        yield out.rstrip()
+    elif not emitted and dropped:
+        yield _clean_text("".join(dropped).strip())
+
+
+def _streamed_result(question: str, deltas: Iterator[str], base: dict) -> dict:
+    """Envuelve un stream de texto en el dict de respuesta de `ask`.
+
+    `respuesta`, `offer_code` y `attachments` se rellenan al terminar el stream.
+    """
+    result = dict(base)
+    result.update(respuesta="", offer_code=None, attachments=[])
+
+    def _gen() -> Iterator[str]:
+        parts: list[str] = []
+        for piece in _clean_stream(deltas, question):
+            parts.append(piece)
+            yield piece
+        text = "".join(parts).strip()
+        result["respuesta"] = text
+        result["offer_code"] = _offer_code_for(question, text, _detect_topic(question, text))
+        result["attachments"] = _extract_urls(text)
+
+    result["stream"] = _gen()
+    return result
+
+
 def _strip_irrelevant_contact(ans: str, question: str) -> str:
     """Si la pregunta no es sobre correo/email, elimina frases sobre correo.
 
@@ -1,20 +1,104 @@
 """Servicio utilitario de calendario académico (asuetos).
 
-Provee `is_holiday(date)` leyendo de una colección opcional `calendar_holiday`.
-Si la colección no existe o no hay match exacto, retorna False sin fallar.
+Provee `is_holiday(date)` y `holidays_between(inicio, fin)` sobre un índice en
+memoria de la colección opcional `calendar_holiday` (un conjunto de fechas por
+campus más una lista ordenada para rangos). Si la colección no existe o Mongo
+falla, no hay asuetos y nada lanza excepción.
+
+El índice se reconstruye cuando cambia la versión `holidays` de `app_state`
+(la incrementa `scripts/sync_holidays_from_calendar.py`), revisándola como mucho
+cada `HOLIDAY_INDEX_CHECK_SECONDS`.
 """
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Optional
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
+from app.core.config import settings
 from app.infrastructure.db.mongo import get_db
+from app.repositories.app_state_repo import HOLIDAYS, get_version
+
+_log = logging.getLogger("aura.calendar")
 
 
-def _date_key(d: datetime) -> str:
+def _date_key(d: date) -> str:
     return d.strftime("%Y-%m-%d")
 
 
+class HolidayIndex:
+    """Asuetos por fecha: generales (sin campus) y por campus, con búsqueda por rango."""
+
+    def __init__(self, version: int, rows: Iterable[Dict[str, Any]]) -> None:
+        self.version = version
+        # fecha → campus con asueto (None = general)
+        self._by_date: Dict[str, Set[Optional[str]]] = {}
+        items: List[Tuple[str, str, Optional[str]]] = []
+        for r in rows:
+            key = str(r.get("date") or "")
+            if not key:
+                continue
+            campus = r.get("campus") or None
+            self._by_date.setdefault(key, set()).add(campus)
+            items.append((key, str(r.get("reason") or ""), campus))
+        items.sort(key=lambda x: (x[0], x[2] or ""))
+        self._items = items
+        self._dates = [x[0] for x in items]
+
+    @staticmethod
+    def _applies(row_campus: Optional[str], campus: Optional[str]) -> bool:
+        # Sin campus cuenta cualquier asueto; con campus, el suyo o los generales
+        return not campus or row_campus is None or row_campus == campus
+
+    def contains(self, d: date, campus: Optional[str] = None) -> bool:
+        found = self._by_date.get(_date_key(d))
+        if not found:
+            return False
+        return any(self._applies(c, campus) for c in found)
+
+    def between(self, start: date, end: date, campus: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Asuetos con fecha en [start, end] (ambos inclusive), ordenados por fecha."""
+        lo = bisect_left(self._dates, _date_key(start))
+        hi = bisect_right(self._dates, _date_key(end))
+        return [
+            {"date": key, "reason": reason, "campus": c}
+            for key, reason, c in self._items[lo:hi]
+            if self._applies(c, campus)
+        ]
+
+
+_index: Optional[HolidayIndex] = None
+_lock = threading.Lock()
+
+
+def _load(version: int) -> HolidayIndex:
+    rows = get_db()["calendar_holiday"].find({}, {"_id": 0, "date": 1, "reason": 1, "campus": 1})
+    return HolidayIndex(version, rows)
+
+
+def get_index() -> HolidayIndex:
+    """Índice de asuetos vigente (vacío si no se puede leer `calendar_holiday`)."""
+    global _index
+    version = get_version(HOLIDAYS, float(getattr(settings, "holiday_index_check_seconds", 30) or 0))
+    idx = _index
+    if idx is not None and idx.version == version:
+        return idx
+    with _lock:
+        idx = _index
+        if idx is not None and idx.version == version:
+            return idx
+        try:
+            idx = _load(version)
+        except Exception as e:
+            _log.warning("No se pudo cargar calendar_holiday: %s", e)
+            # Conserva el anterior; si no hay, responde vacío y reintenta en la próxima consulta
+            return _index if _index is not None else HolidayIndex(-1, [])
+        _index = idx
+        return idx
+
+
 def is_holiday(d: datetime, campus: Optional[str] = None) -> bool:
     """Devuelve True si `d` aparece en `calendar_holiday.date`.
 
@@ -22,12 +106,19 @@ def is_holiday(d: datetime, campus: Optional[str] = None) -> bool:
       { date: "YYYY-MM-DD", reason: str, campus: null|"La Paz"|... }
     """
     try:
-        db = get_db()
-        q = {"date": _date_key(d)}
-        if campus:
-            q["$or"] = [{"campus": campus}, {"campus": None}, {"campus": {"$exists": False}}]
-        row = db["calendar_holiday"].find_one(q, {"_id": 1})
-        return bool(row)
+        return get_index().contains(d, campus)
     except Exception:
         return False
 
+
+def holidays_between(start: date, end: date, campus: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Asuetos entre `start` y `end` (inclusive): [{date, reason, campus}] ordenados por fecha."""
+    try:
+        return get_index().between(start, end, campus)
+    except Exception:
+        return []
+
+
+def holiday_dates(start: date, end: date, campus: Optional[str] = None) -> Set[str]:
+    """Fechas "YYYY-MM-DD" de asueto en el rango, para descartar días sin consultar uno por uno."""
+    return {h["date"] for h in holidays_between(start, end, campus)}
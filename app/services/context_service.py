@@ -1,10 +1,10 @@
 # app/services/context_builder.py
 """Construye un mini‑contexto académico para enriquecer respuestas del asistente.
 
-Lee perfil, timetable y primeras entradas desde Mongo, y devuelve un texto breve.
+Lee perfil, timetable y primeras entradas (vía `user_context`) y devuelve un texto breve.
 Pensado para usar pocos tokens en prompts.
 """
-from app.infrastructure.db.mongo import get_db
+from app.services.user_context import user_context
 
 def build_academic_context(user_email: str) -> str:
     """Devuelve contexto académico breve para `user_email`.
@@ -12,40 +12,11 @@ def build_academic_context(user_email: str) -> str:
     Incluye: nombre, carrera, semestre, horario vigente (título) y hasta 12 bloques.
     """
     try:
-        db = get_db()
-
-        u = db["user"].find_one({"email": user_email}, {"_id": 0})
-
-        # Deriva contexto de timetable/timetable_entry (nuevo modelo)
-        prof = (u or {}).get("profile") or {}
-        program_code = (prof.get("major") or "").upper() or None
-        semester = prof.get("semester") or None
-        shift = prof.get("shift") or None  # "TM"/"TV" si existe
-        group = prof.get("group") or None
-
-        timetable = None
-        if program_code and semester:
-            q = {
-                "department_code": "DASC",
-                "program_code": program_code,
-                "semester": semester,
-                "period_code": {"$exists": True},
-                "is_current": True,
-            }
-            if shift:
-                q["shift"] = shift
-            if group:
-                q["group"] = group
-            timetable = db["timetable"].find_one(q, {"_id": 1, "title": 1})
-
-        entries = []
-        if timetable:
-            entries = list(
-                db["timetable_entry"].find(
-                    {"timetable_id": str(timetable.get("_id"))},
-                    {"_id": 0}
-                ).sort([("day", 1), ("start_time", 1)])
-            )
+        # Usuario, timetable vigente y bloques compartidos con el resto de la pregunta
+        ctx = user_context(user_email)
+        u = ctx.user
+        timetable = ctx.timetable
+        entries = ctx.entries
 
         partes: list[str] = []
 
@@ -0,0 +1,196 @@
+"""Ruteo de intención en una sola pasada (usado por `ask_service`).
+
+`Query` normaliza la pregunta una sola vez (minúsculas, sin acentos, tokens y
+último mensaje del asistente) y calcula sus *señales* recorriendo los tokens una
+vez: cada palabra, bigrama/trigrama o prefijo del vocabulario marca una o más
+señales (búsqueda O(1) por token, al estilo de un autómata de palabras clave).
+
+`IntentRouter` recorre una tabla ordenada de handlers y sólo evalúa los que
+comparten alguna señal con la pregunta (o no declaran señales, o cuyo `when`
+aplica por historial). Cada handler hace su verificación fina y devuelve la
+respuesta o None. Lleva aciertos por intención y latencia por etapa.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import time
+import unicodedata
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Vocabulario de señales (texto sin acentos, en minúsculas).
+# Palabras/frases exactas → señales
+_WORDS: Dict[str, Tuple[str, ...]] = {}
+# Prefijos de token → señales (p.ej. "horario" cubre "horarios")
+_PREFIXES: Dict[str, Tuple[str, ...]] = {}
+
+
+def _vocab(signal: str, words: Iterable[str] = (), prefixes: Iterable[str] = ()) -> None:
+    for w in words:
+        _WORDS[w] = _WORDS.get(w, ()) + (signal,)
+    for p in prefixes:
+        _PREFIXES[p] = _PREFIXES.get(p, ()) + (signal,)
+
+
+_vocab("yesno", ["si", "va", "ok", "dale", "claro", "acuerdo", "porfa", "favor", "no", "nel", "nop"])
+_vocab("social", [
+    "hola", "holaa", "ola", "buenos", "buenas", "hello", "hi", "hey", "que tal", "buen dia",
+    "gracias", "thanks", "thank you", "agradezco",
+    "adios", "bye", "despido", "nos vemos", "hasta luego", "hasta pronto",
+])
+_vocab("horario", prefixes=["horario"])
+_vocab("link_entity", ["uabcs", "dasc", "dele", "departamento"])
+_vocab("calendar", ["calendario"])
+_vocab("document", [
+    "formato", "plantilla", "documento", "archivo", "pdf", "word", "docx", "doc", "carta",
+    "solicitud", "reporte", "informe", "constancia", "imagen", "foto",
+])
+_vocab("sgpp", ["sgpp", "gestor"])
+_vocab("pp", ["pp", "practicas profesionales"])
+_vocab("practices", ["practica", "practicas", "pp"])
+_vocab("campus", ["campus"])
+_vocab("semana_sistemas", ["semana de sistemas"])
+_vocab("room", ["salon", "aula", "laboratorio", "lab", "servidores", "server", "serverroom", "centro", "redes"])
+_vocab("aura", ["aura"])
+_vocab("days", ["dias"])
+_vocab("image", prefixes=["imagen", "foto"])
+
+_PREFIX_LENS = sorted({len(p) for p in _PREFIXES})
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def strip_accents(text: str) -> str:
+    s = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in s if not unicodedata.combining(ch))
+
+
+def scan_signals(tokens: List[str]) -> frozenset:
+    """Una pasada sobre los tokens: palabras, bigramas, trigramas y prefijos."""
+    found: set = set()
+    n = len(tokens)
+    for i, tok in enumerate(tokens):
+        hit = _WORDS.get(tok)
+        if hit:
+            found.update(hit)
+        if i + 1 < n:
+            hit = _WORDS.get(tok + " " + tokens[i + 1])
+            if hit:
+                found.update(hit)
+            if i + 2 < n:
+                hit = _WORDS.get(tok + " " + tokens[i + 1] + " " + tokens[i + 2])
+                if hit:
+                    found.update(hit)
+        for ln in _PREFIX_LENS:
+            if len(tok) < ln:
+                break
+            hit = _PREFIXES.get(tok[:ln])
+            if hit:
+                found.update(hit)
+    return frozenset(found)
+
+
+class Query:
+    """Pregunta normalizada una sola vez para todos los handlers."""
+
+    def __init__(self, user_email: str, question: str, history: list[dict] | None, *, stream: bool = False) -> None:
+        self.user_email = user_email
+        self.question = question
+        self.history = history
+        self.stream = stream
+        self.low = (question or "").lower()
+        self.norm = strip_accents(self.low)
+        self.tokens = _TOKEN_RE.findall(self.norm)
+        self.signals = scan_signals(self.tokens)
+
+    @cached_property
+    def last_assistant_raw(self) -> str:
+        """Último mensaje del asistente (texto original)."""
+        try:
+            for m in reversed(self.history or []):
+                if str(m.get("role")).lower() == "assistant":
+                    return m.get("content") or ""
+        except Exception:
+            pass
+        return ""
+
+    @cached_property
+    def last_assistant(self) -> str:
+        return self.last_assistant_raw.lower()
+
+
+Handler = Callable[[Query], Any]
+
+
+class _Route:
+    __slots__ = ("intent", "handler", "signals", "when")
+
+    def __init__(self, intent: str, handler: Handler, signals: Iterable[str], when: Optional[Callable[[Query], bool]]) -> None:
+        self.intent = intent
+        self.handler = handler
+        self.signals = frozenset(signals)
+        self.when = when
+
+    def applies(self, q: Query) -> bool:
+        if not self.signals and self.when is None:
+            return True
+        if self.signals & q.signals:
+            return True
+        return bool(self.when and self.when(q))
+
+
+class IntentRouter:
+    """Tabla ordenada de handlers con métricas por intención y etapa."""
+
+    def __init__(self) -> None:
+        self._routes: List[_Route] = []
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._total = 0
+
+    def add(self, intent: str, handler: Handler, *, signals: Iterable[str] = (), when: Optional[Callable[[Query], bool]] = None) -> None:
+        self._routes.append(_Route(intent, handler, signals, when))
+
+    def record(self, stage: str, ms: float, *, hit: bool = False, checked: bool = True) -> None:
+        with self._lock:
+            st = self._stats.setdefault(stage, {"checks": 0, "hits": 0, "skipped": 0, "total_ms": 0.0, "max_ms": 0.0})
+            if not checked:
+                st["skipped"] += 1
+                return
+            st["checks"] += 1
+            st["total_ms"] += ms
+            if ms > st["max_ms"]:
+                st["max_ms"] = ms
+            if hit:
+                st["hits"] += 1
+
+    def dispatch(self, q: Query) -> Tuple[str, Any]:
+        """Devuelve (intención, resultado) del primer handler que responde."""
+        with self._lock:
+            self._total += 1
+        for r in self._routes:
+            if not r.applies(q):
+                self.record(r.intent, 0.0, checked=False)
+                continue
+            t0 = time.perf_counter()
+            out = r.handler(q)
+            self.record(r.intent, (time.perf_counter() - t0) * 1000.0, hit=out is not None)
+            if out is not None:
+                return r.intent, out
+        return "none", None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._total
+            stages = {k: dict(v) for k, v in self._stats.items()}
+        for st in stages.values():
+            st["avg_ms"] = round(st["total_ms"] / st["checks"], 3) if st["checks"] else 0.0
+            st["total_ms"] = round(st["total_ms"], 3)
+            st["max_ms"] = round(st["max_ms"], 3)
+        return {"questions": total, "intents": [r.intent for r in self._routes], "stages": stages}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._total = 0
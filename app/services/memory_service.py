@@ -8,6 +8,7 @@ from __future__ import annotations
 import re
 from typing import Optional, List, Dict
 
+from app.core.metrics import llm_call
 from app.infrastructure.ai.openai_client import get_openai
 
 
@@ -65,11 +66,13 @@ def summarize_incremental(prev_summary: Optional[str], question: str, answer: st
             "Nuevo resumen:"
         )
         try:
-            resp = oa.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-            )
+            with llm_call("openai", "gpt-4o-mini") as call:
+                resp = oa.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.2,
+                )
+                call.usage = getattr(resp, "usage", None)
             out = (resp.choices[0].message.content or "").strip()
             # Limita tamaño por seguridad
             return out[:400]
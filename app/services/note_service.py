@@ -3,6 +3,8 @@ from typing import Dict, Any, List, Optional
 
 from app.repositories.note_repo import (
     insert_note as _insert_note,
+    insert_note_deferred as _insert_note_deferred,
+    insert_note_deferred_async as _insert_note_deferred_async,
     list_notes as _list_notes,
 )
 
@@ -12,6 +14,16 @@ def insert_note(doc: Dict[str, Any]) -> str:
     return _insert_note(doc)
 
 
+def insert_note_deferred(doc: Dict[str, Any]) -> str:
+    """Encola la nota (escritura diferida) y devuelve el id ya asignado."""
+    return _insert_note_deferred(doc)
+
+
+async def insert_note_deferred_async(doc: Dict[str, Any]) -> str:
+    """Variante para el event loop de `insert_note_deferred`."""
+    return await _insert_note_deferred_async(doc)
+
+
 def list_notes(user_id: Optional[str] = None, status: Optional[str] = None, tag: Optional[str] = None) -> List[Dict[str, Any]]:
     """Lista notas filtrando por usuario/estado/tag."""
     return _list_notes(user_id=user_id, status=status, tag=tag)
@@ -3,8 +3,9 @@
 Mantiene la API delgada y centraliza la actualización del subdocumento `profile`.
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from app.repositories.user_repo import update_user_profile as _update_user_profile
+from app.services.user_context import invalidate_user
 
 
 def get_my_profile(user_doc: Dict[str, Any]) -> Dict[str, Any]:
@@ -12,6 +13,11 @@ def get_my_profile(user_doc: Dict[str, Any]) -> Dict[str, Any]:
     return (user_doc or {}).get("profile") or {}
 
 
-def update_my_profile(user_id: str, partial_update: Dict[str, Any]) -> Dict[str, Any]:
-    """Actualiza parcialmente el perfil del usuario y devuelve el perfil actualizado."""
-    return _update_user_profile(user_id, partial_update)
+def update_my_profile(user_id: str, partial_update: Dict[str, Any], *, email: Optional[str] = None) -> Dict[str, Any]:
+    """Actualiza parcialmente el perfil del usuario y devuelve el perfil actualizado.
+
+    Invalida el contexto cacheado de `email` (o de todos los usuarios si no se indica).
+    """
+    profile = _update_user_profile(user_id, partial_update)
+    invalidate_user(email)
+    return profile
@@ -0,0 +1,107 @@
+"""Caché de respuestas RAG (en memoria, LRU + TTL).
+
+Clave: sha256 de (consulta reescrita normalizada, k, persona en contexto,
+si se piden fuentes, versión del corpus, día actual). La versión del corpus
+cambia con cualquier ingesta o borrado de chunks y el día mantiene correcto el
+"Hoy es…" del prompt de sistema, así que no hace falta invalidar a mano.
+
+Sólo se guardan respuestas con contexto (`used_context=True`), no vacías ni con el
+texto de respaldo de un fallo del modelo; un stream cortado tampoco se guarda.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.infrastructure.ai.ai_service import EMPTY_TEXT, UNAVAILABLE_TEXT, LLMUnavailable
+from app.infrastructure.ai.embedding_cache import normalize_text
+from app.repositories.app_state_repo import get_corpus_version
+
+_log = logging.getLogger("aura.rag.answer_cache")
+_mem = LRUCache(
+    maxsize=max(1, int(getattr(settings, "rag_answer_cache_size", 512) or 1)),
+    ttl_seconds=(int(getattr(settings, "rag_answer_cache_ttl_seconds", 0) or 0) or None),
+    name="rag_answer",
+)
+_counters = {"stored": 0, "bypassed": 0}
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "rag_answer_cache_enabled", True))
+
+
+def answer_key(rewritten_query: str, k: int, continuation_person: str | None, return_sources: bool = False, where: str = "") -> str:
+    day = datetime.now().date().isoformat()
+    raw = "|".join([
+        normalize_text(rewritten_query),
+        str(int(k or 0)),
+        normalize_text(continuation_person or ""),
+        "src" if return_sources else "",
+        where,
+        str(get_corpus_version()),
+        day,
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    hit = _mem.get(key)
+    return dict(hit) if hit is not None else None
+
+
+def cacheable(result: Dict[str, Any]) -> bool:
+    """Sólo respuestas con contexto, no vacías y que no sean el texto de respaldo de un fallo."""
+    answer = (result.get("answer") or "").strip()
+    return bool(result.get("used_context")) and bool(answer) and answer not in (EMPTY_TEXT, UNAVAILABLE_TEXT)
+
+
+def put(key: str, result: Dict[str, Any]) -> None:
+    if not cacheable(result):
+        _counters["bypassed"] += 1
+        return
+    _mem.set(key, {k: v for k, v in result.items() if k != "answer_stream"})
+    _counters["stored"] += 1
+
+
+def tee_stream(key: str, deltas: Iterator[str], base: Dict[str, Any], finish, also=None) -> Iterator[str]:
+    """Reemite los fragmentos y, si el stream termina completo, cachea el texto final (`finish(texto)`).
+
+    `also(resultado)` recibe además el resultado final (p. ej. la caché semántica).
+    Si el modelo corta el stream (`LLMUnavailable`) éste termina ahí y no se cachea
+    nada. Sin `key` sólo se llama a `also`.
+    """
+    parts: list[str] = []
+    try:
+        for piece in deltas:
+            parts.append(piece)
+            yield piece
+    except LLMUnavailable as e:
+        _counters["bypassed"] += 1
+        _log.warning("Stream RAG interrumpido, no se cachea: %s", e)
+        return
+    try:
+        res = {**base, "answer": finish("".join(parts))}
+        if key:
+            put(key, res)
+        if also is not None:
+            also(res)
+    except Exception as e:
+        _log.debug("No se pudo cachear respuesta en streaming: %s", e)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": enabled(),
+        "ttl_seconds": _mem.ttl_seconds,
+        "corpus_version": get_corpus_version(),
+        **_mem.stats(),
+        **_counters,
+    }
+
+
+def clear() -> int:
+    return _mem.clear()
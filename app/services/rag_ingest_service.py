@@ -4,23 +4,48 @@ Soporta formatos: txt, md, csv, pdf, docx, xlsx. (Sin imágenes/OCR.)
 """
 from __future__ import annotations
 
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
 from io import BytesIO
+import hashlib
+import json
 import re
-import requests
 
-from app.repositories.library_repo import get_document
-from app.repositories.library_chunk_repo import delete_by_doc_id, bulk_insert_chunks
+from app.repositories.library_repo import get_document, set_ingest_state
+from app.repositories.library_chunk_repo import (
+    count_by_doc_id,
+    delete_by_doc_id,
+    get_embeddings_by_hash,
+    replace_chunks,
+)
 from app.infrastructure.text import extractors
-from app.infrastructure.ai.embeddings import embed_texts
+from app.infrastructure.ai.embeddings import embed_texts_batched
+from app.infrastructure.vector.filters import normalize_scope
+from app.infrastructure.http.client import get_session
 from app.core.config import settings
 
 
-def _http_get(url: str) -> bytes:
-    """Descarga binaria simple con requests."""
-    resp = requests.get(url, timeout=30)
+# Tamaño y solape por defecto de los chunks (`library_doc.ingest.chunk_size/chunk_overlap` los ajustan)
+CHUNK_MAX_CHARS = 1000
+CHUNK_OVERLAP = 200
+
+
+def _http_get_conditional(url: str, etag: Optional[str]) -> Tuple[Optional[bytes], Optional[str]]:
+    """GET condicional: si el servidor responde 304 devuelve (None, etag)."""
+    headers = {"If-None-Match": etag} if etag else {}
+    resp = get_session("ingest").get(url, timeout=30, headers=headers)
+    if resp.status_code == 304:
+        return None, etag
     resp.raise_for_status()
-    return resp.content
+    return resp.content, resp.headers.get("ETag")
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _text_hash(text: str) -> str:
+    return _sha256((text or "").encode("utf-8"))
 
 
 def _normalize_whitespace(text: str) -> str:
@@ -92,6 +117,33 @@ def _split_into_chunks_with_sections(
     return chunks
 
 
+def _chunk_params(doc: Dict[str, Any]) -> Tuple[int, int]:
+    ing = doc.get("ingest") if isinstance(doc.get("ingest"), dict) else {}
+    size = int(ing.get("chunk_size") or CHUNK_MAX_CHARS)
+    overlap = ing.get("chunk_overlap")
+    return size, max(0, int(CHUNK_OVERLAP if overlap is None else overlap))
+
+
+def _ingest_signature(doc: Dict[str, Any], model: str) -> str:
+    """Hash de lo que, además del archivo, determina los chunks guardados.
+
+    Título, tags, tipo y vigencia viajan en `meta` de cada chunk (y en el prompt);
+    modelo y dimensión definen los vectores; tamaño y solape, el corte. Si algo de
+    esto cambia la ingesta no se salta aunque el archivo sea el mismo.
+    """
+    scope = normalize_scope(doc.get("scope")) or {}
+    parts = {
+        "title": str(doc.get("title") or "").strip(),
+        "tags": sorted(str(t).lower() for t in (doc.get("tags") or [])),
+        "kind": str(doc.get("kind") or "").lower(),
+        "scope": {k: (v.date().isoformat() if v else None) for k, v in scope.items()},
+        "embed_model": model,
+        "embed_dims": int(settings.openai_embeddings_dims),
+        "chunking": list(_chunk_params(doc)),
+    }
+    return _sha256(json.dumps(parts, sort_keys=True).encode("utf-8"))
+
+
 def _extract_text_by_mime(data: bytes, content_type: Optional[str], url: Optional[str]) -> str:
     ct = (content_type or "").lower()
     ext = (url or "").lower()
@@ -112,10 +164,13 @@ def _extract_text_by_mime(data: bytes, content_type: Optional[str], url: Optiona
     return extractors.extract_text_from_txt(data)
 
 
-def ingest_document(doc_id: str) -> Dict[str, int | str]:
-    """Ingesta un documento desde library_doc.
+IngestState = Dict[str, Any]
 
-    Flujo: descarga → extrae texto → chunking → embeddings → inserta en library_chunk.
+
+def fetch_document(doc_id: str, *, force: bool = False) -> IngestState:
+    """Etapa 1 (I/O): valida el documento y descarga el archivo.
+
+    Devuelve un estado con `result` ya resuelto si no hay cambios desde la última ingesta.
     """
     d = get_document(doc_id)
     if not d or not d.get("file_url"):
@@ -127,22 +182,55 @@ def ingest_document(doc_id: str) -> Dict[str, int | str]:
         raise ValueError("Documento RAG deshabilitado (enabled=false)")
 
     url = str(d["file_url"])
-    content_type = str(d.get("content_type") or "")
+    model = settings.openai_embeddings_model
+    prev = d.get("ingest") if isinstance(d.get("ingest"), dict) else {}
+    # Vectores reutilizables: mismo modelo y dimensión (ingestas sin `embed_dims` usaban la actual)
+    same_model = prev.get("embed_model") == model and prev.get("embed_dims") in (None, int(settings.openai_embeddings_dims))
+    signature = _ingest_signature(d, model)
+    # Sólo se puede saltar si hay chunks indexados de una ingesta previa con la misma firma
+    can_skip = (
+        not force
+        and same_model
+        and prev.get("signature") == signature
+        and prev.get("status") == "done"
+        and count_by_doc_id(doc_id) > 0
+    )
+    state: IngestState = {
+        "doc_id": doc_id, "doc": d, "url": url, "model": model, "force": force,
+        "same_model": same_model, "signature": signature,
+    }
 
-    data = _http_get(url)
-    text = _extract_text_by_mime(data, content_type, url)
+    data, etag = _http_get_conditional(url, prev.get("etag") if can_skip else None)
+    if data is None:
+        state["result"] = {"chunks": 0, "embeddings": 0, "status": "unchanged"}
+        return state
+    content_hash = _sha256(data)
+    if can_skip and prev.get("content_hash") == content_hash:
+        if etag and etag != prev.get("etag"):
+            set_ingest_state(doc_id, {"etag": etag})
+        state["result"] = {"chunks": 0, "embeddings": 0, "status": "unchanged"}
+        return state
+    state.update(data=data, etag=etag, content_hash=content_hash)
+    return state
+
+
+def extract_chunks(state: IngestState) -> IngestState:
+    """Etapa 2 (CPU): extrae texto y arma chunks con su sección."""
+    d = state["doc"]
+    url = state["url"]
+    content_type = str(d.get("content_type") or "")
+    text = _extract_text_by_mime(state.pop("data"), content_type, url)
     # Remueve front-matter YAML si es Markdown u otro texto con '---' inicial
     if (content_type or "").lower().startswith("text/markdown") or (url or "").lower().endswith(".md"):
         text = _strip_front_matter(text)
-    if not text or len(text.strip()) == 0:
-        # Nada que indexar
-        delete_by_doc_id(doc_id)
-        return {"chunks": 0, "embeddings": 0, "status": "empty"}
-
-    chunks_with_sections = _split_into_chunks_with_sections(text)
+    size, overlap = _chunk_params(d)
+    chunks_with_sections = _split_into_chunks_with_sections(text, max_chars=size, overlap=overlap) if text and text.strip() else []
     if not chunks_with_sections:
-        delete_by_doc_id(doc_id)
-        return {"chunks": 0, "embeddings": 0, "status": "empty"}
+        # Nada que indexar
+        delete_by_doc_id(state["doc_id"])
+        _mark_ingested(state["doc_id"], state["content_hash"], state["etag"], state["model"], 0, state["signature"])
+        state["result"] = {"chunks": 0, "embeddings": 0, "status": "empty"}
+        return state
 
     # Heurística: si un chunk contiene solo (o principalmente) un correo, adjúntalo al chunk previo
     merged: List[Tuple[str, Optional[str]]] = []
@@ -153,26 +241,89 @@ def ingest_document(doc_id: str) -> Dict[str, int | str]:
             merged[-1] = (prev_text.rstrip() + "\n" + c.strip(), prev_sec or sec)
         else:
             merged.append((c, sec))
-    chunks_with_sections = merged
+    state["chunks"] = merged
+    return state
+
+
+def embed_and_store(state: IngestState) -> Dict[str, int | float | str]:
+    """Etapa 3: embebe chunks nuevos/modificados y reemplaza los del documento."""
+    doc_id = state["doc_id"]
+    chunks_with_sections: List[Tuple[str, Optional[str]]] = state["chunks"]
+    # Reutiliza vectores de chunks sin cambios (mismo texto y mismo modelo)
+    hashes = [_text_hash(c) for (c, _sec) in chunks_with_sections]
+    known = get_embeddings_by_hash(doc_id) if (state["same_model"] and not state["force"]) else {}
+    todo = [i for i, h in enumerate(hashes) if h not in known]
 
     # Embeddings por lotes (respetar límites de tokens y tamaño)
-    chunk_texts = [c for (c, _sec) in chunks_with_sections]
-    vectors = embed_texts(chunk_texts)
+    fresh, embed_stats = embed_texts_batched([chunks_with_sections[i][0] for i in todo])
+    vectors: List[list[float]] = [known.get(h) or [] for h in hashes]
+    for i, v in zip(todo, fresh):
+        vectors[i] = v
+
     items = []
-    title = str(d.get("title") or "").strip()
+    title = str(state["doc"].get("title") or "").strip()
+    # Título y tags viajan en `meta` para que la búsqueda no consulte `library_doc` por hit
+    tags = [str(t).lower() for t in (state["doc"].get("tags") or [])]
+    # Tipo y vigencia del documento: filtros previos al KNN (ver vector.filters)
+    kind = str(state["doc"].get("kind") or "").lower() or None
+    scope = normalize_scope(state["doc"].get("scope"))
     for i, ((c, sec), v) in enumerate(zip(chunks_with_sections, vectors)):
         chunk_ref = f"[{title} | {sec}]" if title and sec else (f"[{title}]" if title else None)
         items.append({
             "chunk_index": i,
             "text": c,
+            "text_hash": hashes[i],
             "embedding": v,
             "meta": {
                 "title": title,
+                "tags": tags,
                 "section": sec,
                 "chunk_ref": chunk_ref,
+                "kind": kind,
+                "scope": scope,
             },
         })
 
-    delete_by_doc_id(doc_id)
-    n = bulk_insert_chunks(doc_id, items)
-    return {"chunks": n, "embeddings": n, "status": "ok"}
+    n = replace_chunks(doc_id, items)
+    _mark_ingested(doc_id, state["content_hash"], state["etag"], state["model"], n, state["signature"])
+    return {
+        "chunks": n,
+        "embeddings": len(todo),
+        "reused": n - len(todo),
+        "status": "ok",
+        "batches": int(embed_stats["batches"]),
+        "embed_ms": embed_stats["embed_ms"],
+        "chunks_per_s": embed_stats["chunks_per_s"],
+        "tokens_per_s": embed_stats["tokens_per_s"],
+    }
+
+
+def ingest_document(doc_id: str, *, force: bool = False) -> Dict[str, int | float | str]:
+    """Ingesta un documento desde library_doc.
+
+    Flujo: descarga → extrae texto → chunking → embeddings → inserta en library_chunk.
+    Es incremental: si el contenido (sha256) y la firma de ingesta (título, tags,
+    tipo, vigencia, modelo/dimensión de embeddings y tamaño de chunk) no cambiaron,
+    no hace nada; si cambió, sólo embebe los chunks nuevos/modificados y reutiliza
+    los vectores guardados del resto. `force=True` re-embebe todo.
+    """
+    state = fetch_document(doc_id, force=force)
+    if "result" in state:
+        return state["result"]
+    state = extract_chunks(state)
+    if "result" in state:
+        return state["result"]
+    return embed_and_store(state)
+
+
+def _mark_ingested(doc_id: str, content_hash: str, etag: Optional[str], model: str, chunks: int, signature: str) -> None:
+    set_ingest_state(doc_id, {
+        "content_hash": content_hash,
+        "signature": signature,
+        "etag": etag,
+        "embed_model": model,
+        "embed_dims": int(settings.openai_embeddings_dims),
+        "chunks": int(chunks),
+        "status": "done",
+        "last_ingested_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    })
@@ -0,0 +1,145 @@
+"""Ingesta RAG en segundo plano: jobs con etapas en pipeline.
+
+Un job procesa una lista de documentos con tres etapas encadenadas por colas
+acotadas (descarga → extracción → embeddings/persistencia), cada una con su
+propio grupo de hilos. Así, mientras un documento se embebe, el siguiente ya
+se está descargando. El progreso por documento queda en `rag_job`.
+
+Un hilo de latido renueva el job mientras corre; si el proceso muere, el
+siguiente arranque lo cierra con error (`recover_stale_jobs`) en vez de dejarlo
+en `running` para siempre.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.repositories.library_repo import list_active_documents
+from app.repositories import rag_job_repo
+from app.services.rag_ingest_service import embed_and_store, extract_chunks, fetch_document
+
+_log = logging.getLogger("aura.rag.jobs")
+
+_STOP = object()
+
+
+def _stage(
+    job_id: str,
+    name: str,
+    fn: Callable[[Any], Any],
+    inbox: "queue.Queue[Any]",
+    outbox: Optional["queue.Queue[Any]"],
+) -> None:
+    """Consume estados de `inbox`, aplica `fn` y pasa el resultado a `outbox`.
+
+    Los documentos que terminan antes (sin cambios/vacíos) o fallan se cierran aquí.
+    """
+    while True:
+        item = inbox.get()
+        if item is _STOP:
+            break
+        doc_id = item["doc_id"] if isinstance(item, dict) else str(item)
+        try:
+            rag_job_repo.set_doc_stage(job_id, doc_id, name)
+            out = fn(item)
+            if outbox is None:
+                rag_job_repo.finish_doc(job_id, doc_id, result=out)
+            elif isinstance(out, dict) and "result" in out:
+                rag_job_repo.finish_doc(job_id, doc_id, result=out["result"])
+            else:
+                outbox.put(out)
+        except Exception as e:
+            _log.warning("Job %s: fallo en %s (%s): %s", job_id, name, doc_id, e)
+            try:
+                rag_job_repo.finish_doc(job_id, doc_id, error=str(e))
+            except Exception:
+                pass
+
+
+def _run_pipeline(job_id: str, doc_ids: List[str], force: bool) -> None:
+    workers = max(1, int(settings.rag_job_workers or 1))
+    depth = max(1, int(settings.rag_job_queue_size or 1))
+    q_fetch: "queue.Queue[Any]" = queue.Queue()
+    q_extract: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+    q_embed: "queue.Queue[Any]" = queue.Queue(maxsize=depth)
+
+    stages = [
+        ("download", lambda doc_id: fetch_document(doc_id, force=force), q_fetch, q_extract),
+        ("extract", extract_chunks, q_extract, q_embed),
+        ("embed", embed_and_store, q_embed, None),
+    ]
+    beat = _start_heartbeat(job_id)
+    try:
+        rag_job_repo.set_job_status(job_id, "running")
+        for doc_id in doc_ids:
+            q_fetch.put(doc_id)
+        # Arranca etapas y las cierra en orden: cada una termina cuando la anterior vació su cola
+        groups = []
+        for name, fn, inbox, outbox in stages:
+            threads = [
+                threading.Thread(
+                    target=_stage,
+                    args=(job_id, name, fn, inbox, outbox),
+                    name=f"aura-ingest-{name}-{i}",
+                    daemon=True,
+                )
+                for i in range(workers)
+            ]
+            for t in threads:
+                t.start()
+            groups.append((threads, inbox))
+        for threads, inbox in groups:
+            for _ in threads:
+                inbox.put(_STOP)
+            for t in threads:
+                t.join()
+        rag_job_repo.set_job_status(job_id, "done")
+    except Exception as e:  # pragma: no cover
+        _log.exception("Job %s abortado", job_id)
+        try:
+            rag_job_repo.set_job_status(job_id, "error", error=str(e))
+        except Exception:
+            pass
+    finally:
+        beat.set()
+
+
+def _start_heartbeat(job_id: str) -> threading.Event:
+    """Renueva `updated_at` del job cada fracción de `rag_job_stale_seconds` hasta que se active el evento."""
+    stop = threading.Event()
+    interval = max(5.0, float(settings.rag_job_stale_seconds or 300) / 5.0)
+
+    def _beat() -> None:
+        while not stop.wait(interval):
+            try:
+                rag_job_repo.touch_job(job_id)
+            except Exception as e:
+                _log.debug("Job %s: latido fallido: %s", job_id, e)
+
+    threading.Thread(target=_beat, name=f"aura-ingest-beat-{job_id}", daemon=True).start()
+    return stop
+
+
+def recover_stale_jobs() -> int:
+    """Cierra con error los jobs que quedaron activos sin latido (arranque tras una caída)."""
+    n = rag_job_repo.fail_stale_jobs(float(settings.rag_job_stale_seconds or 300))
+    if n:
+        _log.warning("%d job(s) de ingesta interrumpidos marcados como error", n)
+    return n
+
+
+def start_ingest_job(*, limit: int = 100, force: bool = False) -> Dict[str, Any]:
+    """Crea un job de ingesta para los documentos activos y lo lanza en un hilo.
+
+    Devuelve de inmediato `{job_id, total}`.
+    """
+    docs = list_active_documents(limit=limit)
+    doc_ids = [str(d["id"]) for d in docs if d.get("id")]
+    job_id = rag_job_repo.create_job("ingest_all", {"limit": int(limit), "force": bool(force)}, doc_ids)
+    threading.Thread(
+        target=_run_pipeline, args=(job_id, doc_ids, force), name=f"aura-ingest-job-{job_id}", daemon=True
+    ).start()
+    return {"job_id": job_id, "total": len(doc_ids)}
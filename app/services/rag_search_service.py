@@ -2,19 +2,49 @@
 
 Mejora: enriquece los extractos con metadatos (título/tags) del documento para
 dar más señal al LLM (ej., categoría "docentes", tag "dasc").
+
+La recuperación se restringe con un `ChunkFilter` antes de puntuar: por defecto
+sólo chunks vigentes hoy (`RAG_FILTER_VALID_TODAY`), más los tags/secciones que
+pida el llamador; si un filtro con tags no deja candidatos se reintenta sin tags.
+
+Multi-consulta (`RAG_MULTI_QUERY`): la pregunta y sus reformulaciones (las que
+pase el llamador y las de `_rewrite_query_people`, cada una por separado en vez
+de concatenadas) se embeben en una sola llamada a `embed_texts`, se buscan a la
+vez y se fusionan por score.
+
+Caché semántica (`rag_semantic_cache`): tras fallar la caché exacta, el embedding
+de la pregunta (que se calcula de todos modos) busca una pregunta anterior casi
+idéntica; en modo "on" su respuesta se sirve sin KNN ni LLM y una muestra de
+esos aciertos se audita en segundo plano contra la recuperación real.
 """
 from __future__ import annotations
 
-from typing import List, Dict
+from typing import Any, Iterator, List, Dict, Sequence
+from dataclasses import replace
 from datetime import datetime
+import asyncio
+import itertools
+import logging
+import random
 import re
+import threading
 
-from app.infrastructure.ai.embeddings import embed_texts
-from app.repositories.library_chunk_repo import knn_search
-from app.repositories.library_repo import get_document
-from app.infrastructure.ai.openai_client import get_openai
+from app.infrastructure.ai.embeddings import embed_texts, embed_texts_async
+from app.repositories.library_chunk_repo import (
+    hybrid_search,
+    hybrid_search_async,
+    knn_search,
+    multi_knn_search,
+    multi_knn_search_async,
+)
+from app.repositories.library_repo import get_documents_meta
+from app.infrastructure.vector.filters import ChunkFilter
 from app.core.config import settings
-from app.infrastructure.ai.ai_service import ask_llm
+from app.core.profiling import span, timed
+from app.infrastructure.ai.ai_service import ask_llm, ask_llm_async, ask_llm_stream
+from app.services import rag_answer_cache, rag_semantic_cache
+
+_log = logging.getLogger("aura.rag")
 
 
 SYSTEM = (
@@ -48,19 +78,128 @@ def _strip_markdown_styles(text: str) -> str:
     return out
 
 
-def answer_with_rag(question: str, k: int = 5, *, return_sources: bool = False, continuation_person: str | None = None) -> dict:
-    """Realiza RAG: embedding de pregunta → knn → redacción sin fuentes."""
-    q_for_embed = _rewrite_query_people(question)
-    vectors = embed_texts([q_for_embed])
-    qv = vectors[0] if vectors else []
+def _hybrid() -> bool:
+    return bool(getattr(settings, "rag_hybrid_enabled", True))
+
+
+def _effective_filter(where: ChunkFilter | None) -> ChunkFilter | None:
+    """Filtro del llamador más, salvo que ya traiga fecha, la vigencia a hoy."""
+    if getattr(settings, "rag_filter_valid_today", True) and not (where and where.valid_on):
+        where = replace(where or ChunkFilter(), valid_on=datetime.now().date())
+    return where or None
+
+
+def _multi_query() -> bool:
+    return bool(getattr(settings, "rag_multi_query", True))
+
+
+def _retrieval_texts(question: str, queries: Sequence[str] | None) -> List[str]:
+    """Textos a embeber: uno concatenado, o en multi-consulta cada variante por separado.
+
+    En multi-consulta `queries` (si llegan) reemplazan a `question`, que suele ser
+    su concatenación; primero van las variantes y después las de sinónimos de personas.
+    """
+    if not _multi_query():
+        return [_rewrite_query_people(question)]
+    sources = [q for q in (queries or []) if q] or [question]
+    texts: List[str] = list(sources)
+    for q in sources:
+        texts.extend(_people_variants(q)[1:])
+    limit = max(1, int(getattr(settings, "rag_multi_query_max", 4) or 1))
+    return list(dict.fromkeys(t for t in texts if t.strip()))[:limit]
+
+
+def _search(qvs: List[list[float]], question: str, k: int, where: ChunkFilter | None) -> List[dict]:
+    if not qvs:
+        return []
+    if _hybrid():
+        return hybrid_search(qvs[0], question, k=k, where=where, extra_vectors=qvs[1:])
+    return multi_knn_search(qvs, k=k, where=where)
+
+
+async def _search_async(qvs: List[list[float]], question: str, k: int, where: ChunkFilter | None) -> List[dict]:
+    if not qvs:
+        return []
+    if _hybrid():
+        return await hybrid_search_async(qvs[0], question, k=k, where=where, extra_vectors=qvs[1:])
+    return await multi_knn_search_async(qvs, k=k, where=where)
+
+
+def _embed(question: str, queries: Sequence[str] | None) -> List[list[float]]:
+    # Una sola llamada de embeddings para la pregunta y todas sus variantes
+    with span("rag.embed"):
+        return embed_texts(_retrieval_texts(question, queries))
+
+
+async def _embed_async(question: str, queries: Sequence[str] | None) -> List[list[float]]:
+    with span("rag.embed"):
+        return await embed_texts_async(_retrieval_texts(question, queries))
+
+
+def _prepare_rag(
+    question: str,
+    k: int,
+    continuation_person: str | None,
+    where: ChunkFilter | None = None,
+    queries: Sequence[str] | None = None,
+    qvs: List[list[float]] | None = None,
+) -> Dict[str, Any] | None:
+    """Recuperación + armado de prompt. Devuelve None si no hubo evidencia.
+
+    `qvs` son los embeddings de `_retrieval_texts` si el llamador ya los tiene.
+    """
+    if qvs is None:
+        qvs = _embed(question, queries)
+    qv = qvs[0] if qvs else []
     # Usa k por parámetro o default desde settings
     eff_k = int(k or 0) or settings.rag_k_default
-    hits = knn_search(qv, k=max(eff_k, 5))
+    hits = _search(qvs, question, max(eff_k, 5), where)
+    if not hits and where and where.tags:
+        where = where.without_tags()
+        hits = _search(qvs, question, max(eff_k, 5), where)
     if not hits:
-        # Sin contexto, usar LLM estándar para respuesta general
-        text = ask_llm(question, "")
-        return {"answer": text, "used_context": False}
+        return None
+    return _build_prompt(question, hits, qv, eff_k, continuation_person, fused=_hybrid(), where=where)
+
+
+async def _prepare_rag_async(
+    question: str,
+    k: int,
+    continuation_person: str | None,
+    where: ChunkFilter | None = None,
+    queries: Sequence[str] | None = None,
+    qvs: List[list[float]] | None = None,
+) -> Dict[str, Any] | None:
+    """Variante async: embedding y KNN sin bloquear; el armado (lookups cortos de metadatos) va en un hilo."""
+    if qvs is None:
+        qvs = await _embed_async(question, queries)
+    qv = qvs[0] if qvs else []
+    eff_k = int(k or 0) or settings.rag_k_default
+    hits = await _search_async(qvs, question, max(eff_k, 5), where)
+    if not hits and where and where.tags:
+        where = where.without_tags()
+        hits = await _search_async(qvs, question, max(eff_k, 5), where)
+    if not hits:
+        return None
+    return await asyncio.to_thread(_build_prompt, question, hits, qv, eff_k, continuation_person, fused=_hybrid(), where=where)
+
+
+@timed("rag.prompt")
+def _build_prompt(
+    question: str,
+    hits: List[dict],
+    qv: list[float],
+    eff_k: int,
+    continuation_person: str | None,
+    *,
+    fused: bool = False,
+    where: ChunkFilter | None = None,
+) -> Dict[str, Any]:
+    """Reordena hits, arma extractos con metadatos y el prompt de sistema.
 
+    Con `fused=True` los hits ya vienen ordenados por RRF (léxico + vectorial) y
+    se respetan tal cual; si no, se reordenan con heurísticas de tokens.
+    """
     # Enriquecer con metadatos (título/tags) del documento
     # Permitir varios extractos por documento (configurable) para no perder señales.
     MAX_SNIPPETS_PER_DOC = max(1, int(getattr(settings, "rag_snippets_per_doc", 3)))
@@ -68,22 +207,38 @@ def answer_with_rag(question: str, k: int = 5, *, return_sources: bool = False,
     # Para salida enriquecida (deshabilitado para UI: no citamos fuentes)
     source_chunks: List[Dict[str, str]] = []
     per_doc_count: Dict[str, int] = {}
-    # Prefetch títulos para un reordenamiento ligero por nombre
-    title_cache: Dict[str, str] = {}
+    # Metadatos (título/tags) por documento: primero los desnormalizados en el chunk,
+    # y para chunks antiguos sin ellos, una sola consulta `$in` respaldada por caché.
+    doc_meta: Dict[str, Dict[str, Any]] = {}
+
+    def _load_meta(rows: List[dict]) -> None:
+        pending: List[str] = []
+        for h in rows:
+            did = str(h.get("doc_id") or "")
+            if not did or did in doc_meta:
+                continue
+            m = h.get("meta") or {}
+            if m.get("title") and "tags" in m:
+                doc_meta[did] = {"title": str(m.get("title") or ""), "tags": [str(t).lower() for t in (m.get("tags") or [])]}
+            else:
+                pending.append(did)
+        if pending:
+            try:
+                doc_meta.update(get_documents_meta(pending))
+            except Exception:
+                pass
+            for did in pending:
+                doc_meta.setdefault(did, {"title": "", "tags": []})
+
+    _load_meta(hits)
     q_low = (question or "").lower()
     name_tokens = [t for t in re.findall(r"[a-záéíóúñ]{3,}", q_low) if t not in {"quien", "quién", "que", "qué", "hace", "correo", "email", "de", "la", "el"}]
-    # Obtén títulos y calcula pequeño boost por coincidencia en título
+    # Pequeño boost por coincidencia de tokens de la pregunta en el título
     def _boost(h: dict) -> int:
         did = str(h.get("doc_id") or "")
         if not did:
             return 0
-        if did not in title_cache:
-            try:
-                d = get_document(did)
-                title_cache[did] = (d.get("title") if d else "") or ""
-            except Exception:
-                title_cache[did] = ""
-        title = title_cache.get(did, "").lower()
+        title = (doc_meta.get(did) or {}).get("title", "").lower()
         return sum(1 for t in name_tokens if t and t in title)
 
     wants_email = any(w in q_low for w in ("correo", "email", "e-mail", "mail"))
@@ -100,29 +255,17 @@ def answer_with_rag(question: str, k: int = 5, *, return_sources: bool = False,
             score += 1
         return score
 
-    if name_tokens or wants_email or is_dept_head_query:
+    # Con RRF el orden ya combina coincidencia léxica y semántica
+    if not fused and (name_tokens or wants_email or is_dept_head_query):
         hits.sort(key=lambda h: (_boost(h), _token_score(h), float(h.get("score", 0.0))), reverse=True)
 
     # Si buscamos correo/jefatura y aún no hay candidatos con tokens relevantes, amplía k y reintenta ordenar
-    if (wants_email or is_dept_head_query) and not any(_token_score(h) > 0 for h in hits):
-        extra = knn_search(qv, k=max(eff_k, 100))
+    if not fused and (wants_email or is_dept_head_query) and not any(_token_score(h) > 0 for h in hits):
+        extra = knn_search(qv, k=max(eff_k, 100), where=where)
         if extra:
             hits = extra
-            # recalcular caches
-            title_cache = {}
-            def _boost2(h: dict) -> int:
-                did = str(h.get("doc_id") or "")
-                if not did:
-                    return 0
-                if did not in title_cache:
-                    try:
-                        d = get_document(did)
-                        title_cache[did] = (d.get("title") if d else "") or ""
-                    except Exception:
-                        title_cache[did] = ""
-                title = title_cache.get(did, "").lower()
-                return sum(1 for t in name_tokens if t and t in title)
-            hits.sort(key=lambda h: (_boost2(h), _token_score(h), float(h.get("score", 0.0))), reverse=True)
+            _load_meta(hits)
+            hits.sort(key=lambda h: (_boost(h), _token_score(h), float(h.get("score", 0.0))), reverse=True)
 
     for h in hits:
         doc_id = str(h.get("doc_id"))
@@ -131,17 +274,9 @@ def answer_with_rag(question: str, k: int = 5, *, return_sources: bool = False,
         # Limita a N extractos por documento
         if per_doc_count.get(doc_id, 0) >= MAX_SNIPPETS_PER_DOC:
             continue
-        meta_title = title_cache.get(doc_id, "") if title_cache else ""
-        meta_tags: list[str] = []
-        section = ""
-        if not meta_title:
-            try:
-                d = get_document(doc_id)
-                if d:
-                    meta_title = str(d.get("title") or "")
-                    meta_tags = [str(t).lower() for t in (d.get("tags") or [])]
-            except Exception:
-                pass
+        dm = doc_meta.get(doc_id) or {}
+        meta_title = str(dm.get("title") or "")
+        meta_tags: list[str] = list(dm.get("tags") or [])
         try:
             m = h.get("meta") or {}
             section = str(m.get("section") or "")
@@ -168,7 +303,6 @@ def answer_with_rag(question: str, k: int = 5, *, return_sources: bool = False,
         per_doc_count[doc_id] = per_doc_count.get(doc_id, 0) + 1
     ctx = _build_context(snippets)
 
-    oa = get_openai()
     # Instrucción dinámica de ‘hoy’ para preferir fechas futuras
     months = {
         1: "enero", 2: "febrero", 3: "marzo", 4: "abril", 5: "mayo", 6: "junio",
@@ -211,29 +345,221 @@ def answer_with_rag(question: str, k: int = 5, *, return_sources: bool = False,
             "Si hay varios en el contexto, entrega solo el que corresponda al docente referido en la pregunta. "
             "Si no es posible determinarlo, indica brevemente que necesitas el nombre completo."
         )
-    if oa:
-        resp = oa.chat.completions.create(
-            model=settings.openai_model_primary,
-            messages=[
-                {"role": "system", "content": system_dyn},
-                {"role": "user", "content": f"Contexto:\n{ctx}\n---\nPregunta: {question}"},
-            ],
-            temperature=getattr(settings, "rag_temperature", settings.chat_temperature),
-            top_p=settings.chat_top_p,
-            presence_penalty=settings.chat_presence_penalty,
-            frequency_penalty=settings.chat_frequency_penalty,
-        )
-        out = (resp.choices[0].message.content or "").strip()
-        out = _strip_markdown_styles(out)
+    return {"context": ctx, "system": system_dyn, "source_chunks": source_chunks}
+
+
+@timed("rag.cache")
+def _cache_lookup(
+    question: str,
+    k: int,
+    continuation_person: str | None,
+    return_sources: bool,
+    where: ChunkFilter | None = None,
+    queries: Sequence[str] | None = None,
+) -> tuple[str | None, dict | None]:
+    """Clave de caché de respuesta y acierto (o None). Sin caché habilitada devuelve (None, None)."""
+    if not rag_answer_cache.enabled():
+        return None, None
+    try:
+        eff_k = int(k or 0) or settings.rag_k_default
+        # La pregunta (con la que se arma el prompt) siempre entra en la clave: en
+        # multi-consulta las variantes pueden recortarse y coincidir para dos preguntas
+        retrieval = "||".join([question, *_retrieval_texts(question, queries)])
+        key = rag_answer_cache.answer_key(retrieval, eff_k, continuation_person, return_sources, where.key() if where else "")
+        return key, rag_answer_cache.get(key)
+    except Exception:
+        return None, None
+
+
+@timed("rag.semantic_cache")
+def _semantic_lookup(
+    qvs: List[list[float]],
+    k: int,
+    continuation_person: str | None,
+    return_sources: bool,
+    where: ChunkFilter | None = None,
+) -> tuple[int | None, rag_semantic_cache.SemanticHit | None]:
+    """Partición y acierto semántico para el embedding principal. Apagada devuelve (None, None)."""
+    if not rag_semantic_cache.enabled() or not qvs:
+        return None, None
+    try:
+        eff_k = int(k or 0) or settings.rag_k_default
+        part = rag_semantic_cache.partition(eff_k, continuation_person, return_sources, where.key() if where else "")
+        return part, rag_semantic_cache.lookup(qvs[0], part)
+    except Exception:
+        return None, None
+
+
+def _semantic_entry(part: int | None, qvs: List[list[float]], question: str, prep: Dict[str, Any]) -> tuple | None:
+    """(partición, vector, pregunta, chunks de evidencia) para guardar en la caché semántica."""
+    if part is None or not qvs:
+        return None
+    return (part, qvs[0], question, rag_semantic_cache.chunk_keys(prep.get("source_chunks") or []))
+
+
+def _audit_semantic_hit(
+    hit: rag_semantic_cache.SemanticHit,
+    question: str,
+    k: int,
+    continuation_person: str | None,
+    where: ChunkFilter | None,
+    queries: Sequence[str] | None,
+    qvs: List[list[float]],
+) -> None:
+    """Muestra de aciertos servidos: repite la recuperación (sin LLM) en un hilo y compara evidencia."""
+    if random.random() >= rag_semantic_cache.audit_rate():
+        return
+
+    def _run() -> None:
+        try:
+            prep = _prepare_rag(question, k, continuation_person, where, queries, qvs=qvs)
+            fresh = rag_semantic_cache.chunk_keys(prep["source_chunks"]) if prep else set()
+            rag_semantic_cache.audit(hit, question, fresh)
+        except Exception as e:
+            _log.debug("Auditoría de caché semántica fallida: %s", e)
+
+    threading.Thread(target=_run, name="rag-semantic-audit", daemon=True).start()
+
+
+def _first_then_rest(deltas: Iterator[str]) -> Iterator[str]:
+    """Espera el primer fragmento aquí: un fallo previo a cualquier texto llega al llamador."""
+    first = next(deltas, None)
+    return deltas if first is None else itertools.chain((first,), deltas)
+
+
+def _serve_hit(hit: dict, stream: bool) -> dict:
+    if stream:
+        text = hit.pop("answer", "")
+        return {**hit, "answer_stream": iter([text])}
+    return hit
+
+
+def _cache_store(key: str | None, res: dict, semantic: tuple | None = None) -> dict:
+    if key:
+        rag_answer_cache.put(key, res)
+    if semantic is not None:
+        part, vector, question, chunks = semantic
+        rag_semantic_cache.store(vector, part, question, res, chunks)
+    return res
+
+
+def answer_with_rag(
+    question: str,
+    k: int = 5,
+    *,
+    return_sources: bool = False,
+    continuation_person: str | None = None,
+    stream: bool = False,
+    where: ChunkFilter | None = None,
+    queries: Sequence[str] | None = None,
+) -> dict:
+    """Realiza RAG: embedding de pregunta → knn → redacción sin fuentes.
+
+    `where` restringe los chunks candidatos (tags, sección, tipo); siempre se
+    añade la vigencia a hoy salvo que `RAG_FILTER_VALID_TODAY` esté apagado.
+    `queries` son reformulaciones de `question` que, en modo multi-consulta, se
+    buscan junto con ella (la redacción usa sólo `question`).
+
+    Con `stream=True` la redacción no se ejecuta aquí: se devuelve `answer_stream`
+    (iterador de fragmentos de texto sin post-proceso) en lugar de `answer`.
+
+    Las respuestas con contexto se cachean (ver `rag_answer_cache`); un acierto
+    evita embedding, KNN y la llamada al LLM. Si falla, una pregunta casi igual
+    ya respondida puede servir su respuesta (ver `rag_semantic_cache`).
+
+    Si el modelo no responde (o, en streaming, falla antes del primer fragmento)
+    se lanza `LLMUnavailable` para que el llamador pase a su siguiente respaldo;
+    un stream cortado a medias termina sin cachearse.
+    """
+    where = _effective_filter(where)
+    ckey, hit = _cache_lookup(question, k, continuation_person, return_sources, where, queries)
+    if hit is not None:
+        return _serve_hit(hit, stream)
+    qvs = _embed(question, queries)
+    spart, shit = _semantic_lookup(qvs, k, continuation_person, return_sources, where)
+    if shit is not None and rag_semantic_cache.serving():
+        _audit_semantic_hit(shit, question, k, continuation_person, where, queries, qvs)
+        # No se copia a la caché exacta: un falso acierto quedaría fijado hasta su TTL
+        return _serve_hit(shit.result, stream)
+    prep = _prepare_rag(question, k, continuation_person, where, queries, qvs=qvs)
+    if shit is not None and prep is not None:
+        # Modo sombra: el acierto no se sirvió; se compara con la evidencia real
+        rag_semantic_cache.audit(shit, question, rag_semantic_cache.chunk_keys(prep["source_chunks"]))
+    if prep is None:
+        # Sin contexto, usar LLM estándar para respuesta general
+        if stream:
+            return {"answer_stream": ask_llm_stream(question, ""), "used_context": False}
+        text = ask_llm(question, "")
+        return {"answer": text, "used_context": False}
+    ctx = prep["context"]
+    system_dyn = prep["system"]
+    source_chunks = prep["source_chunks"]
+    sem = _semantic_entry(spart, qvs, question, prep)
+    if stream:
         followup = "¿Puedo ayudarte con otra cosa?" if settings.chat_followups_enabled else ""
-        # Nota: no devolvemos citas ni chunks para evitar paréntesis en UI
-        return {"answer": out or "Sin respuesta.", "used_context": True, "came_from": "rag", "citation": "", "source_chunks": (source_chunks if return_sources else []), "followup": followup}
+        deltas = _first_then_rest(ask_llm_stream(
+            question,
+            ctx,
+            system=system_dyn,
+            temperature=getattr(settings, "rag_temperature", settings.chat_temperature),
+            strict=True,
+        ))
+        base = {"used_context": True, "came_from": "rag", "citation": "", "source_chunks": (source_chunks if return_sources else []), "followup": followup}
+        also = (lambda r: _cache_store(None, r, sem)) if sem else None
+        deltas = rag_answer_cache.tee_stream(ckey, deltas, base, lambda t: _strip_markdown_styles(t.strip()), also)
+        return {"answer_stream": deltas, **base}
 
-    # Fallback al pipeline genérico si no hay OpenAI
-    text = ask_llm(question, ctx, system=system_dyn)
+    # Mismo camino que la variante async: OpenAI primario/fallback y Ollama si falla
+    text = ask_llm(
+        question,
+        ctx,
+        system=system_dyn,
+        temperature=getattr(settings, "rag_temperature", settings.chat_temperature),
+        strict=True,
+    )
     text = _strip_markdown_styles(text)
     followup = "¿Puedo ayudarte con otra cosa?" if settings.chat_followups_enabled else ""
-    return {"answer": text, "used_context": True, "came_from": "rag", "citation": "", "source_chunks": (source_chunks if return_sources else []), "followup": followup}
+    # Nota: no devolvemos citas ni chunks para evitar paréntesis en UI
+    res = {"answer": text or "Sin respuesta.", "used_context": True, "came_from": "rag", "citation": "", "source_chunks": (source_chunks if return_sources else []), "followup": followup}
+    return _cache_store(ckey, res, sem)
+
+
+async def answer_with_rag_async(
+    question: str,
+    k: int = 5,
+    *,
+    return_sources: bool = False,
+    continuation_person: str | None = None,
+    where: ChunkFilter | None = None,
+    queries: Sequence[str] | None = None,
+) -> dict:
+    """Variante async de `answer_with_rag` (misma salida, modo no-stream)."""
+    where = _effective_filter(where)
+    ckey, hit = await asyncio.to_thread(_cache_lookup, question, k, continuation_person, return_sources, where, queries)
+    if hit is not None:
+        return hit
+    qvs = await _embed_async(question, queries)
+    spart, shit = await asyncio.to_thread(_semantic_lookup, qvs, k, continuation_person, return_sources, where)
+    if shit is not None and rag_semantic_cache.serving():
+        _audit_semantic_hit(shit, question, k, continuation_person, where, queries, qvs)
+        return shit.result
+    prep = await _prepare_rag_async(question, k, continuation_person, where, queries, qvs=qvs)
+    if shit is not None and prep is not None:
+        rag_semantic_cache.audit(shit, question, rag_semantic_cache.chunk_keys(prep["source_chunks"]))
+    if prep is None:
+        text = await ask_llm_async(question, "")
+        return {"answer": text, "used_context": False}
+    text = await ask_llm_async(
+        question,
+        prep["context"],
+        system=prep["system"],
+        temperature=getattr(settings, "rag_temperature", settings.chat_temperature),
+        strict=True,
+    )
+    text = _strip_markdown_styles(text)
+    followup = "¿Puedo ayudarte con otra cosa?" if settings.chat_followups_enabled else ""
+    res = {"answer": text or "Sin respuesta.", "used_context": True, "came_from": "rag", "citation": "", "source_chunks": (prep["source_chunks"] if return_sources else []), "followup": followup}
+    return _cache_store(ckey, res, _semantic_entry(spart, qvs, question, prep))
 
 
 def _suggest_followup(question: str) -> str:
@@ -248,9 +574,20 @@ def _suggest_followup(question: str) -> str:
 
 
 def _rewrite_query_people(q: str) -> str:
+    """Pregunta + sinónimos de rol/departamento/correo concatenados en una sola consulta."""
+    return "; ".join([q or "", *_people_expansions(q)])
+
+
+def _people_variants(q: str) -> List[str]:
+    """Multi-consulta: la pregunta sola y una variante por cada grupo de sinónimos."""
+    s = q or ""
+    return [s, *(f"{s}; {extra}" for extra in _people_expansions(s))]
+
+
+def _people_expansions(q: str) -> List[str]:
     s = q or ""
     low = s.lower()
-    parts = [s]
+    parts: List[str] = []
     # Si la consulta parece nombre de persona, añade rol académico para sesgar recuperación
     name_like = len(re.findall(r"[A-Za-zÁÉÍÓÚÑáéíóúñ]{3,}", s)) >= 2
     if name_like and not any(w in low for w in ("profesor", "profesora", "profe", "maestro", "jefe", "doctor", "docente")):
@@ -263,4 +600,4 @@ def _rewrite_query_people(q: str) -> str:
         parts.append("Departamento Académico de Sistemas Computacionales, DASC, Sistemas Computacionales")
     if any(w in low for w in ("correo", "email", "e-mail", "mail")):
         parts.append("correo institucional @uabcs.mx")
-    return "; ".join(parts)
+    return parts
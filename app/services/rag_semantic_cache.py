@@ -0,0 +1,296 @@
+"""Caché semántica de respuestas RAG (preguntas parecidas, misma respuesta).
+
+Complementa a `rag_answer_cache` (clave exacta): guarda el embedding normalizado
+de la pregunta junto con la respuesta y, ante una pregunta nueva, busca el vecino
+más cercano con un producto matriz-vector sobre una matriz float32 preasignada
+(`RAG_SEMANTIC_CACHE_SIZE` filas). Si el coseno supera
+`RAG_SEMANTIC_CACHE_THRESHOLD`, la respuesta guardada sirve para la nueva.
+
+- Sólo compiten entradas de la misma partición: k, persona en contexto, fuentes,
+  filtro, versión del corpus y día (el "Hoy es…" del prompt).
+- Cada entrada expira a los `RAG_SEMANTIC_CACHE_TTL_SECONDS`; al cambiar la
+  versión del corpus (ingesta o borrado de chunks) se vacía entera.
+- Al llenarse se reemplaza la entrada usada hace más tiempo.
+
+Modos (`RAG_SEMANTIC_CACHE`): "off"; "shadow" (por defecto) busca y audita pero
+no sirve, para calibrar el umbral con tráfico real; "on" sirve los aciertos.
+
+Auditoría de falsos aciertos: cada entrada recuerda sus chunks de evidencia. En
+"shadow" cada posible acierto se compara con la recuperación recién hecha; en
+"on" se re-recupera una muestra (`RAG_SEMANTIC_CACHE_AUDIT_RATE`) en segundo
+plano. Si la evidencia compartida queda por debajo de
+`RAG_SEMANTIC_CACHE_AUDIT_MIN_OVERLAP`, se registra como probable falso acierto
+en el logger `aura.rag.semantic_cache.audit`.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core import metrics
+from app.core.config import settings
+from app.infrastructure.ai.embedding_cache import normalize_text
+from app.repositories.app_state_repo import get_corpus_version
+from app.services import rag_answer_cache
+
+_log = logging.getLogger("aura.rag.semantic_cache")
+_audit_log = logging.getLogger("aura.rag.semantic_cache.audit")
+
+_LOOKUPS = metrics.Counter("aura_rag_semantic_cache_lookups_total", "Búsquedas en la caché semántica de respuestas.", ("outcome",))
+_SIMILARITY = metrics.Histogram(
+    "aura_rag_semantic_cache_similarity",
+    "Coseno del vecino más cercano en la caché semántica.",
+    (),
+    buckets=(0.5, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0),
+)
+_AUDITS = metrics.Counter("aura_rag_semantic_cache_audits_total", "Aciertos semánticos auditados contra la recuperación.", ("verdict",))
+
+# Cada cuántas búsquedas se registra la tasa de aciertos acumulada
+_LOG_EVERY = 200
+
+ChunkKey = Tuple[str, int]
+
+
+def mode() -> str:
+    value = str(getattr(settings, "rag_semantic_cache", "shadow") or "off").strip().lower()
+    return value if value in ("off", "shadow", "on") else "off"
+
+
+def enabled() -> bool:
+    return mode() != "off"
+
+
+def serving() -> bool:
+    return mode() == "on"
+
+
+def partition(k: int, continuation_person: str | None, return_sources: bool, where: str = "") -> int:
+    """Identificador de partición: sólo se comparan preguntas con el mismo contexto de respuesta."""
+    raw = "|".join([
+        str(int(k or 0)),
+        normalize_text(continuation_person or ""),
+        "src" if return_sources else "",
+        where,
+        str(get_corpus_version()),
+        datetime.now().date().isoformat(),
+    ])
+    return int.from_bytes(hashlib.blake2b(raw.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def chunk_keys(chunks: Iterable[Dict[str, Any]]) -> Set[ChunkKey]:
+    """Chunks de evidencia como {(doc_id, chunk_index)} (hits o `source_chunks`)."""
+    out: Set[ChunkKey] = set()
+    for c in chunks or []:
+        try:
+            out.add((str(c.get("doc_id")), int(c.get("chunk_index", 0))))
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+class SemanticHit:
+    __slots__ = ("question", "result", "chunks", "similarity", "age_seconds")
+
+    def __init__(self, question: str, result: Dict[str, Any], chunks: Set[ChunkKey], similarity: float, age_seconds: float) -> None:
+        self.question = question
+        self.result = result
+        self.chunks = chunks
+        self.similarity = similarity
+        self.age_seconds = age_seconds
+
+
+class SemanticAnswerCache:
+    """Vecino más cercano exacto sobre una matriz (capacidad x dims) de preguntas normalizadas."""
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, int(capacity))
+        self._lock = threading.Lock()
+        self._dims = 0
+        self._vecs = np.zeros((0, 0), dtype=np.float32)
+        self._part = np.zeros(self.capacity, dtype=np.int64)
+        self._expires = np.zeros(self.capacity, dtype=np.float64)  # 0 = libre
+        self._used = np.zeros(self.capacity, dtype=np.float64)
+        self._created = np.zeros(self.capacity, dtype=np.float64)
+        self._entries: List[Optional[Tuple[str, Dict[str, Any], Set[ChunkKey]]]] = [None] * self.capacity
+        self._version: Optional[int] = None
+        self.counters = {"lookups": 0, "hits": 0, "misses": 0, "stored": 0, "evicted": 0, "invalidated": 0}
+
+    # --- Interno (con lock tomado) -----------------------------------------
+    def _reset(self, dims: int) -> None:
+        self._dims = int(dims)
+        self._vecs = np.zeros((self.capacity, self._dims), dtype=np.float32)
+        self._expires[:] = 0.0
+        self._entries = [None] * self.capacity
+
+    def _check_version(self) -> None:
+        version = get_corpus_version()
+        if self._version is not None and version != self._version:
+            n = int(np.count_nonzero(self._expires))
+            if n:
+                self._expires[:] = 0.0
+                self._entries = [None] * self.capacity
+                self.counters["invalidated"] += n
+                _log.info("Caché semántica invalidada por cambio de corpus (v%s → v%s): %d entradas", self._version, version, n)
+        self._version = version
+
+    @staticmethod
+    def _unit(vector: Any) -> Optional[np.ndarray]:
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(q))
+        return q / norm if norm > 0 else None
+
+    # --- API ---------------------------------------------------------------
+    def lookup(self, vector: Any, part: int, threshold: float) -> Tuple[Optional[SemanticHit], float]:
+        """Mejor entrada vigente de la partición y su coseno (hit sólo si ≥ `threshold`)."""
+        q = self._unit(vector)
+        with self._lock:
+            self._check_version()
+            self.counters["lookups"] += 1
+            if q is None or q.shape[0] != self._dims:
+                self.counters["misses"] += 1
+                return None, 0.0
+            now = time.monotonic()
+            live = (self._expires > now) & (self._part == part)
+            if not live.any():
+                self.counters["misses"] += 1
+                return None, 0.0
+            sims = self._vecs @ q
+            sims[~live] = -2.0
+            i = int(np.argmax(sims))
+            best = float(sims[i])
+            if best < threshold:
+                self.counters["misses"] += 1
+                return None, best
+            self._used[i] = now
+            self.counters["hits"] += 1
+            question, result, chunks = self._entries[i]  # type: ignore[misc]
+            return SemanticHit(question, dict(result), chunks, best, now - self._created[i]), best
+
+    def store(self, vector: Any, part: int, question: str, result: Dict[str, Any], chunks: Set[ChunkKey], ttl_seconds: float) -> bool:
+        q = self._unit(vector)
+        if q is None or ttl_seconds <= 0:
+            return False
+        with self._lock:
+            self._check_version()
+            if q.shape[0] != self._dims:
+                self._reset(q.shape[0])
+            now = time.monotonic()
+            free = np.flatnonzero(self._expires <= now)
+            if free.size:
+                i = int(free[0])
+            else:
+                i = int(np.argmin(self._used))
+                self.counters["evicted"] += 1
+            self._vecs[i] = q
+            self._part[i] = part
+            self._expires[i] = now + ttl_seconds
+            self._used[i] = now
+            self._created[i] = now
+            self._entries[i] = (question, result, set(chunks))
+            self.counters["stored"] += 1
+            return True
+
+    def size(self) -> int:
+        return int(np.count_nonzero(self._expires > time.monotonic()))
+
+    def clear(self) -> int:
+        with self._lock:
+            n = self.size()
+            self._expires[:] = 0.0
+            self._entries = [None] * self.capacity
+            return n
+
+
+_cache = SemanticAnswerCache(int(getattr(settings, "rag_semantic_cache_size", 1024) or 1))
+_audit = {"audited": 0, "false_hits": 0, "shadow_hits": 0}
+
+
+def lookup(vector: Any, part: int) -> Optional[SemanticHit]:
+    """Acierto semántico para `vector` en la partición `part` (None si no hay o está apagada)."""
+    if not enabled() or vector is None or not len(vector):
+        return None
+    threshold = float(getattr(settings, "rag_semantic_cache_threshold", 0.95) or 1.0)
+    try:
+        hit, best = _cache.lookup(vector, part, threshold)
+    except Exception as e:
+        _log.debug("Caché semántica no disponible: %s", e)
+        return None
+    if best > 0:
+        _SIMILARITY.observe(best)
+    _LOOKUPS.inc(outcome=("hit" if hit else "miss") if serving() else ("shadow_hit" if hit else "miss"))
+    c = _cache.counters
+    if c["lookups"] % _LOG_EVERY == 0:
+        _log.info("Caché semántica (%s): %d búsquedas, hit_rate=%.3f, entradas=%d", mode(), c["lookups"], c["hits"] / c["lookups"], _cache.size())
+    if hit is not None and not serving():
+        _audit["shadow_hits"] += 1
+    return hit
+
+
+def store(vector: Any, part: int, question: str, result: Dict[str, Any], chunks: Set[ChunkKey]) -> None:
+    """Guarda una respuesta completa con contexto y evidencia.
+
+    Mismo criterio que la caché exacta (`rag_answer_cache.cacheable`): nada vacío
+    ni con el texto de respaldo de un fallo del modelo. Aquí importa más, porque
+    una entrada se sirve a cualquier pregunta parecida y la auditoría sólo mira la
+    evidencia, no el texto. Los streams cortados no llegan aquí (`tee_stream`).
+    """
+    if not enabled() or vector is None or not len(vector):
+        return
+    if not rag_answer_cache.cacheable(result) or not chunks:
+        return
+    ttl = float(getattr(settings, "rag_semantic_cache_ttl_seconds", 6 * 3600) or 0)
+    payload = {k: v for k, v in result.items() if k != "answer_stream"}
+    try:
+        _cache.store(vector, part, question, payload, chunks, ttl)
+    except Exception as e:
+        _log.debug("No se pudo guardar en la caché semántica: %s", e)
+
+
+def audit_rate() -> float:
+    return min(1.0, max(0.0, float(getattr(settings, "rag_semantic_cache_audit_rate", 0.05) or 0.0)))
+
+
+def audit(hit: SemanticHit, question: str, fresh: Set[ChunkKey]) -> bool:
+    """Compara la evidencia de la entrada con la recuperada para `question`.
+
+    Devuelve True si parece un falso acierto (poca evidencia en común) y lo registra.
+    """
+    min_overlap = float(getattr(settings, "rag_semantic_cache_audit_min_overlap", 0.5) or 0.0)
+    overlap = len(hit.chunks & fresh) / float(len(hit.chunks)) if hit.chunks else 0.0
+    false_hit = overlap < min_overlap
+    _audit["audited"] += 1
+    _AUDITS.inc(verdict="false_hit" if false_hit else "ok")
+    if false_hit:
+        _audit["false_hits"] += 1
+        _audit_log.warning(
+            "Probable falso acierto (%s): sim=%.4f overlap=%.2f edad=%ds pregunta=%r cacheada=%r",
+            mode(), hit.similarity, overlap, int(hit.age_seconds), question, hit.question,
+        )
+    else:
+        _audit_log.info("Acierto semántico verificado (%s): sim=%.4f overlap=%.2f pregunta=%r cacheada=%r", mode(), hit.similarity, overlap, question, hit.question)
+    return false_hit
+
+
+def stats() -> Dict[str, Any]:
+    c = dict(_cache.counters)
+    return {
+        "mode": mode(),
+        "threshold": float(getattr(settings, "rag_semantic_cache_threshold", 0.95) or 1.0),
+        "ttl_seconds": float(getattr(settings, "rag_semantic_cache_ttl_seconds", 6 * 3600) or 0),
+        "capacity": _cache.capacity,
+        "entries": _cache.size(),
+        "hit_rate": (c["hits"] / c["lookups"]) if c["lookups"] else 0.0,
+        **c,
+        **_audit,
+        "false_hit_rate": (_audit["false_hits"] / _audit["audited"]) if _audit["audited"] else 0.0,
+    }
+
+
+def clear() -> int:
+    return _cache.clear()
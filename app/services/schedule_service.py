@@ -2,7 +2,8 @@
 
 Expone funciones puras para:
 - Detectar intención de consulta de horario en español.
-- Resolver "qué clase me toca ahora/hoy/mañana/lunes..." con datos en Mongo.
+- Resolver "qué clase me toca ahora/hoy/mañana/lunes..." con el índice de horarios
+  en memoria (`timetable_index`).
 
 No requiere al LLM: responde de forma determinista si hay datos suficientes.
 """
@@ -12,10 +13,9 @@ from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from typing import Any, Dict, List, Optional, Tuple
 
-from app.infrastructure.db.mongo import get_db
-from app.services.calendar_service import is_holiday
-import unicodedata
-import re
+from app.services.calendar_service import holiday_dates
+from app.services.timetable_index import get_index
+from app.services.user_context import user_context
 
 
 SPANISH_DAY_TO_CODE = {
@@ -55,11 +55,12 @@ def _weekday_code(d: datetime) -> str:
     return ["mon", "tue", "wed", "thu", "fri", "sat", "sun"][d.weekday()]
 
 
-def _time_to_minutes(hhmm: str) -> int:
-    try:
-        return int(hhmm[:2]) * 60 + int(hhmm[3:])
-    except Exception:
-        return 0
+def _upcoming_school_days(now: datetime) -> List[datetime]:
+    """Los 7 días siguientes a `now` sin domingos ni asuetos (una sola consulta de rango)."""
+    days = [now + timedelta(days=i) for i in range(1, 8)]
+    # Si el calendario no está disponible, `holiday_dates` devuelve vacío: no bloquea la respuesta
+    off = holiday_dates(days[0].date(), days[-1].date())
+    return [d for d in days if _weekday_code(d) != "sun" and d.strftime("%Y-%m-%d") not in off]
 
 
 def _fmt_entry(e: Dict[str, Any]) -> str:
@@ -68,63 +69,15 @@ def _fmt_entry(e: Dict[str, Any]) -> str:
     return f"{e['start_time']}-{e['end_time']} {e['course_name']}{room}{teacher}"
 
 
-def _norm_text(s: str) -> str:
-    s = (s or "").strip().lower()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(c for c in s if not unicodedata.combining(c))
-    s = re.sub(r"[^a-z0-9\s]", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
-
 def _get_user_profile(email: str) -> Dict[str, Any]:
-    db = get_db()
-    u = db["user"].find_one({"email": email}, {"_id": 0, "profile": 1}) or {}
-    return u.get("profile") or {}
-
-
-def _get_current_timetable(profile: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    db = get_db()
-    q: Dict[str, Any] = {
-        "department_code": "DASC",
-        "program_code": str(profile.get("major") or "").upper() or None,
-        "semester": profile.get("semester"),
-        "is_current": True,
-    }
-    if profile.get("shift"):
-        q["shift"] = profile.get("shift")
-    if profile.get("group"):
-        q["group"] = profile.get("group")
-    # limpia None
-    q = {k: v for k, v in q.items() if v is not None}
-    if not q.get("program_code") or not q.get("semester"):
-        return None
-    doc = db["timetable"].find_one(q)
-    if not doc:
-        return None
-    doc["id"] = str(doc.pop("_id"))
-    return doc
-
-
-def _list_entries(timetable_id: str) -> List[Dict[str, Any]]:
-    db = get_db()
-    items = list(
-        db["timetable_entry"].find({"timetable_id": str(timetable_id)}).sort([("day", 1), ("start_time", 1)])
-    )
-    for x in items:
-        x.pop("_id", None)
-    return items
+    return user_context(email).profile
 
 
 def classes_for_day(email: str, d: datetime) -> Tuple[str, List[Dict[str, Any]]]:
-    profile = _get_user_profile(email)
-    tt = _get_current_timetable(profile)
-    if not tt:
+    sched = user_context(email).schedule
+    if not sched:
         return ("", [])
-    entries = _list_entries(tt["id"]) 
-    day_code = _weekday_code(d)
-    day_entries = [e for e in entries if e.get("day") == day_code]
-    return (tt.get("title") or "", day_entries)
+    return (sched.title, sched.day(_weekday_code(d)))
 
 
 def days_for_course(email: str, course_query: str) -> List[str]:
@@ -132,19 +85,10 @@ def days_for_course(email: str, course_query: str) -> List[str]:
 
     Coincidencia insensible a acentos/caso y tolerante (substring).
     """
-    profile = _get_user_profile(email)
-    tt = _get_current_timetable(profile)
-    if not tt:
+    sched = user_context(email).schedule
+    if not sched:
         return []
-    entries = _list_entries(tt["id"]) 
-    qn = _norm_text(course_query)
-    found: List[str] = []
-    for e in entries:
-        name_n = _norm_text(e.get("course_name"))
-        if qn and qn in name_n:
-            if e.get("day") not in found:
-                found.append(e.get("day"))
-    return found
+    return sched.days_for_course(course_query)
 
 
 def schedule_text_by_params(program: str, semester: int | str, shift: str | None, group: str | None = None) -> Optional[str]:
@@ -153,22 +97,16 @@ def schedule_text_by_params(program: str, semester: int | str, shift: str | None
     Busca `timetable` vigente por department DASC + program/semester/(shift)/group y
     devuelve un texto ordenado por día y hora.
     """
-    db = get_db()
     try:
-        q: Dict[str, Any] = {
-            "department_code": "DASC",
-            "program_code": str(program or "").upper(),
-            "semester": int(semester),
-            "is_current": True,
-        }
-        if shift:
-            q["shift"] = str(shift).upper()
-        if group:
-            q["group"] = str(group).upper()
-        tt = db["timetable"].find_one(q, {"_id": 1, "title": 1})
-        if not tt:
+        sched = get_index().find(
+            str(program or "").upper(),
+            int(semester),
+            str(shift).upper() if shift else None,
+            str(group).upper() if group else None,
+        )
+        if not sched:
             return None
-        items = list(db["timetable_entry"].find({"timetable_id": str(tt["_id"])}, {"_id": 0}).sort([("day", 1), ("start_time", 1)]))
+        tt, items = sched.doc, sched.entries
         if not items:
             return None
         # Orden agrupado por día con etiquetas en español
@@ -192,12 +130,11 @@ def schedule_text_for_user(email: str) -> Optional[str]:
 
     Devuelve None si no encuentra timetable vigente.
     """
-    prof = _get_user_profile(email)
-    tt = _get_current_timetable(prof)
+    ctx = user_context(email)
+    tt = ctx.timetable
     if not tt:
         return None
-    db = get_db()
-    items = list(db["timetable_entry"].find({"timetable_id": str(tt["id"])}, {"_id": 0}).sort([("day", 1), ("start_time", 1)]))
+    items = ctx.entries
     if not items:
         return None
     by_day: Dict[str, List[Dict[str, Any]]] = {}
@@ -214,23 +151,21 @@ def schedule_text_for_user(email: str) -> Optional[str]:
 
 
 def next_class(email: str, ref: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
-    # Obtén tz del usuario
-    profile = _get_user_profile(email)
-    tz = profile.get("tz")
-    ref = ref or _now_in_tz(tz)
-    title, today = classes_for_day(email, ref)
-    if today:
-        now_m = ref.hour * 60 + ref.minute
-        for e in today:
-            if _time_to_minutes(e["end_time"]) > now_m:
-                return {**e, "timetable_title": title, "day": _weekday_code(ref)}
-    # Si no hay más hoy, probar mañana
+    ctx = user_context(email)
+    ref = ref or _now_in_tz(ctx.tz)
+    sched = ctx.schedule
+    if not sched:
+        return None
+    # Primer bloque de hoy que aún no termina (bisect sobre los fines acumulados)
+    e = sched.next_on(_weekday_code(ref), ref.hour * 60 + ref.minute)
+    if e:
+        return {**e, "timetable_title": sched.title, "day": _weekday_code(ref)}
+    # Si no hay más hoy, probar los días siguientes
     for i in range(1, 7):
         d = ref + timedelta(days=i)
-        _, entries = classes_for_day(email, d)
+        entries = sched.day(_weekday_code(d))
         if entries:
-            e = entries[0]
-            return {**e, "timetable_title": title, "day": _weekday_code(d)}
+            return {**entries[0], "timetable_title": sched.title, "day": _weekday_code(d)}
     return None
 
 
@@ -328,16 +263,7 @@ def try_answer_schedule(email: str, question: str) -> Optional[str]:
 
     if intents["tomorrow"]:
         # Busca el próximo día con clases, evitando domingos y asuetos.
-        for i in range(1, 8):
-            d = now + timedelta(days=i)
-            if _weekday_code(d) == "sun":
-                continue
-            try:
-                if is_holiday(d):
-                    continue
-            except Exception:
-                # Si el calendario no está disponible, no bloqueamos la respuesta.
-                pass
+        for d in _upcoming_school_days(now):
             _, entries = classes_for_day(email, d)
             if entries:
                 items = "; ".join(_fmt_entry(e) for e in entries)
@@ -394,16 +320,7 @@ def get_schedule_answer(email: str, when: str, day_name: Optional[str] = None) -
         # Busca el próximo día hábil con clases, evitando domingos y asuetos registrados
         found_entries: List[Dict[str, Any]] = []
         selected_day: Optional[datetime] = None
-        for i in range(1, 8):
-            d = now + timedelta(days=i)
-            if _weekday_code(d) == "sun":
-                continue
-            try:
-                if is_holiday(d):
-                    continue
-            except Exception:
-                # Si no hay calendario disponible, seguimos sin bloquear la respuesta
-                pass
+        for d in _upcoming_school_days(now):
             _, entries = classes_for_day(email, d)
             if entries:
                 found_entries = entries
@@ -474,15 +391,7 @@ def get_schedule_payload(email: str, when: str, day_name: Optional[str] = None)
         }
 
     if when == "tomorrow":
-        for i in range(1, 8):
-            d = now + timedelta(days=i)
-            if _weekday_code(d) == "sun":
-                continue
-            try:
-                if is_holiday(d):
-                    continue
-            except Exception:
-                pass
+        for d in _upcoming_school_days(now):
             title, entries = classes_for_day(email, d)
             if entries:
                 return {
@@ -494,14 +403,6 @@ def get_schedule_payload(email: str, when: str, day_name: Optional[str] = None)
                 }
         return {"type": "schedule", "when": "tomorrow", "entries": []}
 
-def get_current_timetable_for_user(email: str) -> Optional[Dict[str, Any]]:
-    """Helper público para obtener el timetable vigente del usuario.
-
-    Devuelve el documento con campo `id` (str) si existe.
-    """
-    profile = _get_user_profile(email)
-    return _get_current_timetable(profile)
-
     if when == "day":
         name = (day_name or "").strip().lower()
         code = SPANISH_DAY_TO_CODE.get(name)
@@ -522,3 +423,11 @@ def get_current_timetable_for_user(email: str) -> Optional[Dict[str, Any]]:
         return {"type": "schedule", "when": "day", "day_name": name, "entries": []}
 
     return {"type": "schedule", "when": when or "", "error": "unknown_when"}
+
+
+def get_current_timetable_for_user(email: str) -> Optional[Dict[str, Any]]:
+    """Helper público para obtener el timetable vigente del usuario.
+
+    Devuelve el documento con campo `id` (str) si existe.
+    """
+    return user_context(email).timetable
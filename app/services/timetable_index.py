@@ -0,0 +1,190 @@
+"""Índice en memoria de los horarios vigentes (`timetable` + `timetable_entry`).
+
+Carga todos los timetables `is_current` de DASC y sus bloques con dos consultas y
+los compila:
+
+- Por combinación (programa, semestre) → candidatos; `shift`/`group` filtran igual
+  que la consulta original (sólo si se indican).
+- Por timetable y día: bloques ordenados por minuto de inicio, con el máximo
+  acumulado de los minutos de fin para resolver "siguiente clase" con `bisect`.
+- Nombres de materia normalizados para `days_for_course`.
+
+Los horarios sólo cambian al publicar o cargar bloques; los repos de timetable y
+entries incrementan entonces la versión `timetables` de `app_state` (también desde
+scripts) y cada worker reconstruye su índice cuando la ve cambiar: al instante en
+el proceso que escribió, y en los demás tras a lo sumo
+`TIMETABLE_INDEX_CHECK_SECONDS`. Los documentos son compartidos: solo lectura.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import unicodedata
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.infrastructure.db.mongo import get_db
+from app.repositories.app_state_repo import TIMETABLES, get_version
+
+_log = logging.getLogger("aura.timetable_index")
+
+
+def _minutes(hhmm: Any) -> int:
+    try:
+        s = str(hhmm)
+        return int(s[:2]) * 60 + int(s[3:5])
+    except Exception:
+        return 0
+
+
+def _norm_name(s: Any) -> str:
+    s = str(s or "").strip().lower()
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    s = re.sub(r"[^a-z0-9\s]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def _semester(value: Any) -> Any:
+    try:
+        return int(value)
+    except Exception:
+        return value
+
+
+class TimetableSchedule:
+    """Un timetable vigente compilado para consultas por día y hora."""
+
+    __slots__ = ("doc", "entries", "_days", "_reach", "_courses")
+
+    def __init__(self, doc: Dict[str, Any], entries: Iterable[Dict[str, Any]]) -> None:
+        self.doc = doc
+        # Mismo orden que la consulta original: (day, start_time)
+        self.entries: List[Dict[str, Any]] = sorted(entries, key=lambda e: (str(e.get("day")), str(e.get("start_time"))))
+        self._days: Dict[str, List[Dict[str, Any]]] = {}
+        for e in self.entries:
+            self._days.setdefault(str(e.get("day")), []).append(e)
+        self._reach: Dict[str, List[int]] = {}
+        for day, items in self._days.items():
+            items.sort(key=lambda e: _minutes(e.get("start_time")))
+            reach, top = [], -1
+            for e in items:
+                top = max(top, _minutes(e.get("end_time")))
+                reach.append(top)
+            self._reach[day] = reach
+        self._courses: List[Tuple[str, str]] = [(_norm_name(e.get("course_name")), str(e.get("day"))) for e in self.entries]
+
+    @property
+    def id(self) -> str:
+        return str(self.doc.get("id"))
+
+    @property
+    def title(self) -> str:
+        return self.doc.get("title") or ""
+
+    def day(self, code: str) -> List[Dict[str, Any]]:
+        """Bloques del día (`mon`..`sat`) ordenados por hora de inicio."""
+        return self._days.get(code, [])
+
+    def next_on(self, code: str, minute: int) -> Optional[Dict[str, Any]]:
+        """Primer bloque del día que aún no termina a `minute` (minutos desde 00:00)."""
+        reach = self._reach.get(code)
+        if not reach:
+            return None
+        i = bisect_right(reach, minute)
+        return self._days[code][i] if i < len(reach) else None
+
+    def days_for_course(self, course_query: str) -> List[str]:
+        """Días donde aparece una materia que contiene `course_query` (sin acentos/caso)."""
+        qn = _norm_name(course_query)
+        found: List[str] = []
+        if not qn:
+            return found
+        for name, day in self._courses:
+            if qn in name and day not in found:
+                found.append(day)
+        return found
+
+
+class TimetableIndex:
+    """Timetables vigentes por id y por combinación (programa, semestre)."""
+
+    def __init__(self, version: int, docs: Iterable[Dict[str, Any]], entries: Iterable[Dict[str, Any]]) -> None:
+        self.version = version
+        by_tt: Dict[str, List[Dict[str, Any]]] = {}
+        for e in entries:
+            by_tt.setdefault(str(e.get("timetable_id")), []).append(e)
+        self._by_id: Dict[str, TimetableSchedule] = {}
+        self._by_key: Dict[Tuple[str, Any], List[TimetableSchedule]] = {}
+        for doc in docs:
+            sched = TimetableSchedule(doc, by_tt.get(str(doc.get("id")), []))
+            self._by_id[sched.id] = sched
+            key = (str(doc.get("program_code") or "").upper(), _semester(doc.get("semester")))
+            self._by_key.setdefault(key, []).append(sched)
+
+    def get(self, timetable_id: str) -> Optional[TimetableSchedule]:
+        return self._by_id.get(str(timetable_id))
+
+    def find(self, program: Any, semester: Any, shift: Any = None, group: Any = None) -> Optional[TimetableSchedule]:
+        """Primer timetable vigente de la combinación; `shift`/`group` filtran si se indican."""
+        for sched in self._by_key.get((str(program or "").upper(), _semester(semester)), []):
+            if shift and sched.doc.get("shift") != shift:
+                continue
+            if group and sched.doc.get("group") != group:
+                continue
+            return sched
+        return None
+
+    def for_profile(self, profile: Dict[str, Any]) -> Optional[TimetableSchedule]:
+        """Timetable vigente según carrera/semestre/(turno)/(grupo) del perfil."""
+        profile = profile or {}
+        program = str(profile.get("major") or "").upper()
+        if not program or not profile.get("semester"):
+            return None
+        return self.find(program, profile.get("semester"), profile.get("shift"), profile.get("group"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "timetables": len(self._by_id),
+            "entries": sum(len(s.entries) for s in self._by_id.values()),
+        }
+
+
+def _load(version: int) -> TimetableIndex:
+    db = get_db()
+    docs = list(db["timetable"].find({"department_code": "DASC", "is_current": True}).sort([("_id", 1)]))
+    for d in docs:
+        d["id"] = str(d.pop("_id"))
+    entries = list(db["timetable_entry"].find({"timetable_id": {"$in": [d["id"] for d in docs]}}, {"_id": 0})) if docs else []
+    return TimetableIndex(version, docs, entries)
+
+
+_index: Optional[TimetableIndex] = None
+_lock = threading.Lock()
+
+
+def get_index() -> TimetableIndex:
+    """Índice vigente; lo reconstruye si la versión en `app_state` cambió."""
+    global _index
+    version = get_version(TIMETABLES, float(getattr(settings, "timetable_index_check_seconds", 5) or 0))
+    idx = _index
+    if idx is not None and idx.version == version:
+        return idx
+    with _lock:
+        idx = _index
+        if idx is not None and idx.version == version:
+            return idx
+        try:
+            idx = _load(version)
+        except Exception as e:
+            if _index is None:
+                raise
+            _log.warning("No se pudo recargar el índice de horarios (se conserva v%s): %s", _index.version, e)
+            return _index
+        _index = idx
+        _log.info("Índice de horarios v%s: %s", version, idx.stats())
+        return idx
+
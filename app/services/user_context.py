@@ -0,0 +1,135 @@
+"""Contexto del usuario (perfil, horario vigente y bloques) compartido durante una pregunta.
+
+Una sola pregunta consulta el mismo usuario desde varios sitios (zona horaria para
+frases temporales, atajos de horario, contexto académico, tool `update_profile`,
+imagen del horario). `user_context(email)` los resuelve una vez:
+
+- Dentro de `request_scope()` (abierto por `ask`/`ask_async`) cada email se carga
+  una sola vez por petición; la `ContextVar` se copia a los hilos del ruteo.
+- Debajo, el usuario va en una caché de proceso con TTL corto
+  (`USER_CONTEXT_TTL_SECONDS`; 0 = sin caché) que `invalidate_user` limpia al
+  actualizar el perfil. Timetable y bloques salen del índice en memoria de
+  `timetable_index` (versionado; se recarga al publicar o cargar bloques).
+
+Los documentos devueltos son compartidos: tratarlos como solo lectura.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cached_property
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.infrastructure.db.mongo import get_db
+from app.services import timetable_index
+from app.services.timetable_index import TimetableSchedule
+
+_USER_FIELDS = {"_id": 1, "email": 1, "profile": 1}
+
+_size = max(1, int(getattr(settings, "user_context_cache_size", 1024) or 1))
+_users = LRUCache(maxsize=_size, name="user_context")
+
+_MISSING = object()
+_scope: ContextVar[Optional[Dict[str, "UserContext"]]] = ContextVar("aura_user_scope", default=None)
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "user_context_ttl_seconds", 60) or 0)
+
+
+def _cached(cache: LRUCache, key: Any, load: Any) -> Any:
+    ttl = _ttl()
+    if ttl <= 0:
+        return load()
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = load()
+        cache.set(key, value, ttl_seconds=ttl)
+    return value
+
+
+def _norm_email(email: Optional[str]) -> str:
+    return str(email or "").strip().lower()
+
+
+def _load_user(email: str) -> Dict[str, Any]:
+    if not email:
+        return {}
+    return get_db()["user"].find_one({"email": email}, _USER_FIELDS) or {}
+
+
+class UserContext:
+    """Usuario, perfil, zona horaria, timetable vigente y bloques; cada uno se lee una vez."""
+
+    def __init__(self, email: Optional[str]) -> None:
+        self.email = _norm_email(email)
+
+    @cached_property
+    def user(self) -> Dict[str, Any]:
+        """Documento `user` con `_id`, `email` y `profile` ({} si no existe)."""
+        if not self.email:
+            return {}
+        return _cached(_users, self.email, lambda: _load_user(self.email))
+
+    @cached_property
+    def profile(self) -> Dict[str, Any]:
+        return self.user.get("profile") or {}
+
+    @property
+    def tz(self) -> Optional[str]:
+        return self.profile.get("tz") or None
+
+    @cached_property
+    def schedule(self) -> Optional[TimetableSchedule]:
+        """Timetable vigente compilado (bloques por día, siguiente clase)."""
+        return timetable_index.get_index().for_profile(self.profile)
+
+    @property
+    def timetable(self) -> Optional[Dict[str, Any]]:
+        return self.schedule.doc if self.schedule else None
+
+    @property
+    def entries(self) -> List[Dict[str, Any]]:
+        return self.schedule.entries if self.schedule else []
+
+
+def user_context(email: Optional[str]) -> UserContext:
+    """Contexto de `email`: el de la petición en curso si hay `request_scope`, si no uno nuevo."""
+    key = _norm_email(email)
+    scope = _scope.get()
+    if scope is None:
+        return UserContext(key)
+    ctx = scope.get(key)
+    if ctx is None:
+        ctx = scope[key] = UserContext(key)
+    return ctx
+
+
+@contextmanager
+def request_scope() -> Iterator[None]:
+    """Comparte los `UserContext` durante el bloque (una pregunta); reentrante."""
+    if _scope.get() is not None:
+        yield
+        return
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def invalidate_user(email: Optional[str] = None) -> None:
+    """Olvida el usuario `email` (o todos) en la caché de proceso y en la petición en curso."""
+    scope = _scope.get()
+    if email is None:
+        _users.clear()
+        if scope is not None:
+            scope.clear()
+        return
+    key = _norm_email(email)
+    _users.pop(key)
+    if scope is not None:
+        scope.pop(key, None)
+
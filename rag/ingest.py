@@ -5,19 +5,38 @@ from __future__ import annotations
 Uso:
   python -m rag.ingest --doc-id <id>
   python -m rag.ingest --all --limit 100
+  python -m rag.ingest --all --force   # re-embebe aunque no haya cambios
+  python -m rag.ingest --status <job_id>
 """
 
 import argparse
 import json
+import sys
+import time
 from typing import Any
 
 from app.services.rag_ingest_service import ingest_document
-from app.repositories.library_repo import list_active_documents
+from app.services.rag_job_service import start_ingest_job
+from app.repositories.rag_job_repo import TERMINAL, get_job
 from app.infrastructure.db.mongo import init_mongo
 
 
 def _print(obj: Any) -> None:
-    print(json.dumps(obj, ensure_ascii=False, indent=2))
+    print(json.dumps(obj, ensure_ascii=False, indent=2, default=str))
+
+
+def _poll(job_id: str, every: float) -> dict:
+    """Consulta el job hasta que termine, mostrando progreso en stderr."""
+    last = None
+    while True:
+        job = get_job(job_id) or {}
+        line = f"[{job.get('status')}] {job.get('processed', 0)}/{job.get('total', 0)} (errores: {job.get('failed', 0)})"
+        if line != last:
+            print(line, file=sys.stderr)
+            last = line
+        if job.get("status") in TERMINAL or not job:
+            return job
+        time.sleep(every)
 
 
 def main() -> None:
@@ -26,24 +45,31 @@ def main() -> None:
     p = argparse.ArgumentParser(description="Ingesta RAG (documento o lote)")
     g = p.add_mutually_exclusive_group(required=True)
     g.add_argument("--doc-id", help="ID de documento en library_doc")
-    g.add_argument("--all", action="store_true", help="Ingestar todos los documentos activos")
+    g.add_argument("--all", action="store_true", help="Ingestar todos los documentos activos (job en pipeline)")
+    g.add_argument("--status", metavar="JOB_ID", help="Mostrar el estado de un job de ingesta")
     p.add_argument("--limit", type=int, default=100, help="Límite para --all (1..1000)")
+    p.add_argument("--force", action="store_true", help="Re-embeber aunque el contenido no haya cambiado")
+    p.add_argument("--poll", type=float, default=2.0, help="Segundos entre consultas de progreso")
     args = p.parse_args()
 
     if args.doc_id:
-        res = ingest_document(args.doc_id)
+        res = ingest_document(args.doc_id, force=args.force)
         _print({"message": "ok", "result": res})
         return
 
-    docs = list_active_documents(limit=max(1, min(args.limit, 1000)))
-    results = []
-    for d in docs:
-        try:
-            r = ingest_document(d["id"])  # type: ignore
-            results.append({"id": d["id"], **r})
-        except Exception as e:  # pragma: no cover
-            results.append({"id": d.get("id"), "error": str(e)})
-    _print({"message": "ok", "count": len(results), "results": results})
+    if args.status:
+        job = get_job(args.status)
+        if not job:
+            _print({"message": "not_found", "job_id": args.status})
+            sys.exit(1)
+        _print({"message": "ok", "job": job})
+        return
+
+    # --all: el job corre en este proceso; se espera a que termine
+    started = start_ingest_job(limit=max(1, min(args.limit, 1000)), force=args.force)
+    print(f"job_id={started['job_id']} total={started['total']}", file=sys.stderr)
+    job = _poll(started["job_id"], max(0.2, args.poll))
+    _print({"message": "ok", "job": job})
 
 
 if __name__ == "__main__":
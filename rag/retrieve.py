@@ -4,24 +4,37 @@ from __future__ import annotations
 
 import argparse
 import json
+from datetime import date
 from typing import Any
 
 from app.infrastructure.ai.embeddings import embed_texts
-from app.repositories.library_chunk_repo import knn_search
+from app.infrastructure.vector.filters import ChunkFilter
+from app.repositories.library_chunk_repo import hybrid_search, knn_search
 
 
 def _print(obj: Any) -> None:
-    print(json.dumps(obj, ensure_ascii=False, indent=2))
+    print(json.dumps(obj, ensure_ascii=False, indent=2, default=str))
 
 
 def main() -> None:
     p = argparse.ArgumentParser(description="Retrieve KNN de chunks (RAG)")
     p.add_argument("--q", required=True, help="Pregunta/consulta")
     p.add_argument("--k", type=int, default=5, help="Vecinos a recuperar")
+    p.add_argument("--hybrid", action="store_true", help="Fusiona con búsqueda $text (RRF), como el chat")
+    p.add_argument("--tag", action="append", default=[], help="Sólo chunks con alguno de estos tags (repetible)")
+    p.add_argument("--section", action="append", default=[], help="Sólo chunks de estas secciones (repetible)")
+    p.add_argument("--valid-on", default=None, help="Sólo chunks vigentes en esta fecha (YYYY-MM-DD o 'today')")
     args = p.parse_args()
 
+    valid_on = None
+    if args.valid_on:
+        valid_on = date.today() if args.valid_on == "today" else date.fromisoformat(args.valid_on)
+    where = ChunkFilter.of(tags=args.tag, sections=args.section, valid_on=valid_on) or None
     vec = embed_texts([args.q])[0]
-    hits = knn_search(vec, k=max(1, args.k))
+    if args.hybrid:
+        hits = hybrid_search(vec, args.q, k=max(1, args.k), where=where)
+    else:
+        hits = knn_search(vec, k=max(1, args.k), where=where)
     _print({"message": "ok", "q": args.q, "k": args.k, "hits": hits})
 
 
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Copia `kind` y `scope` de cada `library_doc` a `meta` de sus `library_chunk`.
+
+Los filtros previos al KNN (vigencia `meta.scope`, tipo `meta.kind`) sólo ven
+chunks ingestados con esos campos; este script los completa para lo ya ingestado
+sin volver a embeber.
+
+Uso:
+  PYTHONPATH=. python scripts/backfill_chunk_meta.py          # dry-run
+  PYTHONPATH=. python scripts/backfill_chunk_meta.py --yes
+"""
+from __future__ import annotations
+
+import argparse
+
+from app.infrastructure.db.mongo import get_db, init_mongo
+from app.infrastructure.vector.filters import normalize_scope
+from app.repositories.library_chunk_repo import set_chunks_meta
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--yes", action="store_true", help="Aplicar cambios (por defecto sólo informa)")
+    args = ap.parse_args()
+
+    init_mongo()
+    db = get_db()
+    docs = db["library_doc"].find({"kind": "rag"}, {"title": 1, "kind": 1, "scope": 1})
+    total = 0
+    for d in docs:
+        fields = {
+            "kind": str(d.get("kind") or "").lower() or None,
+            "scope": normalize_scope(d.get("scope")),
+        }
+        doc_id = str(d["_id"])
+        if not args.yes:
+            n = db["library_chunk"].count_documents({"doc_id": d["_id"]})
+            print(f"{doc_id} {d.get('title')!r}: {n} chunks ← {fields}")
+            total += n
+            continue
+        n = set_chunks_meta(doc_id, fields)
+        total += n
+        print(f"{doc_id} {d.get('title')!r}: {n} chunks actualizados")
+    print(f"Total: {total}" + ("" if args.yes else " (dry-run: usa --yes para aplicar)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Compara los formatos de `library_chunk.embedding`: tamaño, carga y recall.
+
+Uso:
+  PYTHONPATH=. python scripts/bench_embedding_formats.py                 # muestra de Mongo
+  PYTHONPATH=. python scripts/bench_embedding_formats.py --synthetic 20000 --dims 1536
+
+Para cada formato (array, float32, float16, int8):
+  - bytes BSON del campo `embedding` por chunk;
+  - tiempo de carga: decodificar los documentos BSON (como los entrega el driver),
+    decodificar el vector y construir el índice local;
+  - recall@k del índice local frente al top-k exacto en float64, con consultas que
+    son vectores del corpus con ruido gaussiano (no llama a OpenAI).
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from typing import List
+
+import bson
+import numpy as np
+
+from app.infrastructure.vector import codec
+from app.infrastructure.vector.local_index import LocalVectorIndex
+
+
+def _sample_mongo(n: int) -> np.ndarray:
+    from app.infrastructure.db.mongo import get_db, init_mongo
+    from app.repositories.library_chunk_repo import COLL
+
+    init_mongo()
+    rows = get_db()[COLL].aggregate([
+        {"$match": {"embedding": {"$ne": None}}},
+        {"$sample": {"size": int(n)}},
+        {"$project": {"embedding": 1}},
+    ])
+    vecs = [codec.decode(r.get("embedding")) for r in rows]
+    vecs = [v for v in vecs if v is not None and len(v)]
+    if not vecs:
+        raise SystemExit("library_chunk no tiene embeddings; usa --synthetic")
+    return np.vstack(vecs).astype(np.float64)
+
+
+def _queries(base: np.ndarray, n: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    picks = base[rng.integers(0, base.shape[0], size=n)]
+    unit = picks / np.linalg.norm(picks, axis=1, keepdims=True)
+    return unit + rng.normal(0.0, noise / np.sqrt(base.shape[1]), size=unit.shape)
+
+
+def _exact_topk(base: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    m = base / np.linalg.norm(base, axis=1, keepdims=True)
+    sims = queries @ m.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in sims]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sample", type=int, default=5000, help="Chunks a muestrear de Mongo")
+    ap.add_argument("--synthetic", type=int, default=0, help="Usar N vectores aleatorios en vez de Mongo")
+    ap.add_argument("--dims", type=int, default=1536, help="Dimensión de los vectores sintéticos")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--noise", type=float, default=0.5, help="Norma relativa del ruido de las consultas")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        base = rng.normal(size=(int(args.synthetic), int(args.dims)))
+    else:
+        base = _sample_mongo(args.sample)
+    queries = _queries(base, args.queries, args.noise, rng)
+    truth = _exact_topk(base, queries, args.k)
+    print(f"vectores={base.shape[0]} dims={base.shape[1]} consultas={len(queries)} k={args.k}")
+    print(f"{'formato':<8} {'bytes/chunk':>12} {'total MB':>9} {'carga ms':>9} {f'recall@{args.k}':>10}")
+
+    for fmt in codec.FORMATS:
+        docs = [bson.encode({"_id": i, "embedding": codec.encode(v, fmt)}) for i, v in enumerate(base)]
+        size = len(bson.encode({"embedding": codec.encode(base[0], fmt)}))
+        total = sum(len(d) for d in docs)
+
+        t0 = time.perf_counter()
+        rows = ({"doc_id": r["_id"], "embedding": codec.decode(r["embedding"])} for r in map(bson.decode, docs))
+        index = LocalVectorIndex()
+        index.load(rows)
+        load_ms = (time.perf_counter() - t0) * 1000
+
+        hits = 0
+        for q, expected in zip(queries, truth):
+            got = {int(r["doc_id"]) for r in index.search(q.tolist(), k=args.k)}
+            hits += len(got & expected)
+        recall = hits / float(len(truth) * args.k)
+        print(f"{fmt:<8} {size:>12} {total / 1e6:>9.1f} {load_ms:>9.0f} {recall:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Recodifica `library_chunk.embedding` al formato compacto indicado.
+
+Uso:
+  PYTHONPATH=. python scripts/migrate_chunk_embeddings.py --format float16
+  PYTHONPATH=. python scripts/migrate_chunk_embeddings.py --format float16 --yes
+
+Características:
+  - Dry-run por defecto: cuenta chunks por formato actual y estima el tamaño final.
+  - Con --yes reescribe por lotes (`bulk_write`) sólo los chunks que no están ya en
+    el formato destino; se puede interrumpir y relanzar.
+  - Al terminar incrementa la versión del corpus: los workers con índice local lo
+    recargan y la caché de respuestas RAG se invalida.
+  - Para volver a Atlas knnBeta: --format array.
+  - Recordar fijar `RAG_EMBEDDING_FORMAT` al mismo formato para lo que se ingeste después.
+"""
+from __future__ import annotations
+
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List
+
+from bson import BSON
+from pymongo import UpdateOne
+
+from app.infrastructure.db.mongo import get_db, init_mongo
+from app.infrastructure.vector import codec
+from app.repositories.library_chunk_repo import COLL
+from app.repositories.app_state_repo import bump_corpus_version
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _size(value) -> int:
+    return len(BSON.encode({"embedding": value}))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--format", required=True, choices=codec.FORMATS, help="Formato destino")
+    ap.add_argument("--batch", type=int, default=500, help="Chunks por bulk_write")
+    ap.add_argument("--yes", action="store_true", help="Aplicar cambios (por defecto sólo informa)")
+    args = ap.parse_args()
+
+    init_mongo()
+    coll = get_db()[COLL]
+    cur = coll.find({"embedding": {"$ne": None}}, {"embedding": 1}).batch_size(int(args.batch))
+
+    formats: Counter = Counter()
+    before = after = 0
+    pending: List[UpdateOne] = []
+    changed = 0
+    for r in cur:
+        value = r.get("embedding")
+        fmt = codec.format_of(value)
+        formats[fmt or "?"] += 1
+        if fmt == args.format:
+            size = _size(value)
+            before += size
+            after += size
+            continue
+        vec = codec.decode(value)
+        if vec is None or not len(vec):
+            continue
+        encoded = codec.encode(vec, args.format)
+        before += _size(value)
+        after += _size(encoded)
+        changed += 1
+        if args.yes:
+            pending.append(UpdateOne({"_id": r["_id"]}, {"$set": {"embedding": encoded, "updated_at": _now_iso()}}))
+            if len(pending) >= args.batch:
+                coll.bulk_write(pending, ordered=False)
+                pending = []
+    if pending:
+        coll.bulk_write(pending, ordered=False)
+
+    total = sum(formats.values())
+    print(f"Chunks con embedding: {total} ({', '.join(f'{k}={v}' for k, v in sorted(formats.items()))})")
+    print(f"A convertir a {args.format}: {changed}")
+    if total:
+        print(f"Tamaño del campo embedding: {before / 1e6:.1f} MB → {after / 1e6:.1f} MB ({after / max(1, before):.0%})")
+    if not args.yes:
+        print("Dry-run: usa --yes para aplicar")
+        return
+    if changed:
+        version = bump_corpus_version(f"migrate_embeddings:{args.format}")
+        print(f"Listo. Versión del corpus: {version}")
+
+
+if __name__ == "__main__":
+    main()
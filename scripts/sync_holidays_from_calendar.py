@@ -21,12 +21,12 @@ import argparse
 import re
 from typing import Dict, List, Tuple
 
-import requests
-
 from app.infrastructure.db.mongo import init_mongo, get_db
 from app.infrastructure.db.bootstrap import ensure_collections
 from app.repositories.library_repo import get_document, search_documents
 from app.infrastructure.text import extractors
+from app.infrastructure.http.client import get_session
+from app.repositories.app_state_repo import HOLIDAYS, bump_version
 
 
 MONTHS = {
@@ -42,7 +42,7 @@ DATE_RE = re.compile(
 
 
 def _http_get(url: str) -> bytes:
-    r = requests.get(url, timeout=30)
+    r = get_session("ingest").get(url, timeout=30)
     r.raise_for_status()
     return r.content
 
@@ -136,6 +136,8 @@ def main() -> None:
             upsert=True,
         )
         n_up += 1
+    # Los workers recargan su índice de asuetos al ver la nueva versión
+    bump_version(HOLIDAYS, "sync_holidays")
     print(f"Holidays upserted: {n_up}")
 
 